@@ -0,0 +1,154 @@
+"""
+Crawl checkpoints for resumable runs (run_crawler.py --checkpoint/--resume).
+
+Every CHECKPOINT_INTERVAL_SECONDS, CheckpointMiddleware saves a checkpoint
+under CHECKPOINT_DIR/{spider}/{run_id}/ with:
+
+- the requests scheduled but not parsed yet (the scheduler queue),
+- the fingerprints of the requests already parsed,
+- the JSONL writer's byte offset and item count.
+
+When CHECKPOINT_S3_PREFIX is set, the checkpoint and the output written since
+the previous checkpoint (one part object per save) are uploaded to S3 as
+well, so a new ECS task can resume a run whose disk is gone.
+
+`--resume RUN_ID` keeps the run id and output file, cuts the output back to
+the checkpointed offset, schedules the pending requests again and drops
+requests parsed before the checkpoint. Rows of responses that were being
+parsed while a checkpoint was taken can appear twice in the output.
+"""
+import gzip
+import logging
+import os
+import pickle
+import shutil
+
+from ecommercecrawl.constants.mastercrawl_constants import CHECKPOINT_DIR
+from ecommercecrawl.s3_utils import split_s3_uri
+
+logger = logging.getLogger(__name__)
+
+# Sent by CheckpointMiddleware. `checkpoint_saving(spider)` handlers return a
+# dict that is merged into the saved state; `checkpoint_restoring(spider,
+# state, checkpoint)` handlers restore their part of a resumed run.
+checkpoint_saving = object()
+checkpoint_restoring = object()
+
+# Request meta key holding the key a request is tracked under; redirects and
+# retries copy meta, so they stay pending under the original request's key.
+CHECKPOINT_META_KEY = "checkpoint_key"
+
+STATE_FILENAME = "checkpoint.pickle"
+OUTPUT_PARTS_DIR = "output_parts"
+
+
+class CrawlCheckpoint:
+    def __init__(self, directory, s3_uri=None):
+        self.directory = directory
+        self.s3_uri = s3_uri
+        # (part name, start offset, end offset) of output uploaded to S3
+        self.output_parts = []
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_settings(cls, settings, spider_name, run_id):
+        directory = settings.get("CHECKPOINT_DIR") or CHECKPOINT_DIR
+        s3_prefix = settings.get("CHECKPOINT_S3_PREFIX")
+        s3_uri = f"{s3_prefix.rstrip('/')}/{spider_name}/{run_id}" if s3_prefix else None
+        return cls(os.path.join(directory, spider_name, run_id), s3_uri=s3_uri)
+
+    @property
+    def state_path(self):
+        return os.path.join(self.directory, STATE_FILENAME)
+
+    def _s3_location(self, name):
+        bucket, prefix = split_s3_uri(self.s3_uri)
+        return bucket, f"{prefix}/{name}" if prefix else name
+
+    def save(self, state):
+        """Write `state` atomically; with S3, upload it after the new output part."""
+        if self.s3_uri:
+            self._upload_output_part(state.get("writer") or {})
+        state = dict(state, output_parts=list(self.output_parts))
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "wb") as handle:
+            pickle.dump(state, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.state_path)
+        if self.s3_uri:
+            import boto3
+
+            bucket, key = self._s3_location(STATE_FILENAME)
+            boto3.client("s3").upload_file(self.state_path, bucket, key)
+
+    def _upload_output_part(self, writer):
+        path = writer.get("output_filepath")
+        end = writer.get("output_offset") or 0
+        start = self.output_parts[-1][2] if self.output_parts else 0
+        if not path or end <= start:
+            return
+        with open(path, "rb") as handle:
+            handle.seek(start)
+            body = handle.read(end - start)
+
+        import boto3
+
+        name = f"{OUTPUT_PARTS_DIR}/{len(self.output_parts):06d}.jsonl"
+        bucket, key = self._s3_location(name)
+        boto3.client("s3").put_object(Bucket=bucket, Key=key, Body=body)
+        self.output_parts.append((name, start, end))
+
+    def _download(self, name, path):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        bucket, key = self._s3_location(name)
+        try:
+            boto3.client("s3").download_file(bucket, key, path)
+        except ClientError as exc:
+            logger.info("No checkpoint object at s3://%s/%s: %s", bucket, key, exc)
+            return False
+        return True
+
+    def load(self):
+        """The saved state, fetched from S3 if it is not on disk; None if there is none."""
+        if not os.path.exists(self.state_path) and self.s3_uri:
+            self._download(STATE_FILENAME, self.state_path)
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, "rb") as handle:
+            state = pickle.load(handle)
+        self.output_parts = list(state.get("output_parts", []))
+        return state
+
+    def restore_output(self, path, offset):
+        """
+        Cut the output file back to `offset` bytes, its size at the checkpoint.
+
+        Rows written after the checkpoint come from requests that are
+        scheduled again on resume. A file that is missing locally is rebuilt
+        from its gzipped copy or the uploaded output parts.
+        """
+        if not os.path.exists(path) or os.path.getsize(path) < offset:
+            self._rebuild_output(path)
+        if os.path.getsize(path) < offset:
+            raise ValueError(f"Cannot resume: {path} is shorter than the checkpointed {offset} bytes")
+        with open(path, "r+b") as handle:
+            handle.truncate(offset)
+
+    def _rebuild_output(self, path):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        # PostCrawlPipeline gzips the output when a crawl is shut down.
+        if os.path.exists(f"{path}.gz"):
+            with gzip.open(f"{path}.gz", "rb") as source, open(path, "wb") as output:
+                shutil.copyfileobj(source, output)
+            return
+        part_path = f"{path}.part"
+        with open(path, "wb") as output:
+            for name, _, _ in self.output_parts:
+                if not self._download(name, part_path):
+                    break
+                with open(part_path, "rb") as part:
+                    shutil.copyfileobj(part, output)
+                os.remove(part_path)
@@ -20,4 +20,13 @@ GROUPID = "1000"
 
 API_BASE_URL = "https://api.levelshoes.digital/catalog"
 API_ENDPOINT = "products/urlPath/v1"
+# PDP enrichment: one call returns a page of a brand's products, matched to
+# pending PDPs by SKU (see LevelSpider._enrich_pdp_requests).
 API_ENDPOINT_PDP = "products/moreFromBrand/v1"
+
+# Fields of a Level PDP item, in parse_pdp order.
+PDP_FIELDS = (
+    'run_id', 'site', 'crawl_date', 'url', 'country', 'portal_itemid', 'product_name', 'gender',
+    'brand', 'category', 'subcategory', 'price', 'currency', 'price_discount', 'primary_label',
+    'image_urls', 'text', 'out_of_stock', 'level_category_id',
+)
@@ -2,4 +2,63 @@
 
 # Defines the standard format for the main part of the datetime string used in run IDs.
 # Example: 2023-10-27T10-00-00
-RUN_ID_DATETIME_FORMAT = '%Y-%m-%dT%H-%M-%S'
\ No newline at end of file
+RUN_ID_DATETIME_FORMAT = '%Y-%m-%dT%H-%M-%S'
+
+# Crawl modes (run_crawler.py --mode / CRAWL_MODE setting).
+# full: fetch every PDP. listing: emit price-refresh items from listing data
+# and fetch PDPs only for products not seen in an earlier run. incremental:
+# fetch PDPs only for products whose listing price/discount/stock changed
+# since the last run and emit "seen" rows for the rest.
+CRAWL_MODE_FULL = 'full'
+CRAWL_MODE_LISTING = 'listing'
+CRAWL_MODE_INCREMENTAL = 'incremental'
+CRAWL_MODES = (CRAWL_MODE_FULL, CRAWL_MODE_LISTING, CRAWL_MODE_INCREMENTAL)
+# Modes that emit rows from listing data instead of fetching every PDP.
+LISTING_DRIVEN_CRAWL_MODES = (CRAWL_MODE_LISTING, CRAWL_MODE_INCREMENTAL)
+
+# Directory of per-spider known product URL files used by listing mode.
+KNOWN_PRODUCTS_DIR = 'output/state/known_products'
+
+# Directory of per-spider SQLite product state stores used by incremental mode.
+PRODUCT_STATE_DIR = 'output/state/product_state'
+
+# Directory of per-run crawl checkpoints used by run_crawler.py --checkpoint/--resume.
+CHECKPOINT_DIR = 'output/state/checkpoints'
+
+# Directory of per-run progress JSON files written by CrawlProgressExtension.
+PROGRESS_DIR = 'output/progress'
+
+# Fields only a PDP provides; rows built from listing data may leave them
+# blank, so the quality gate does not count them in listing-driven runs.
+LISTING_MODE_PDP_ONLY_FIELDS = [
+    'text',
+    'image_url',
+    'image_urls',
+    'out_of_stock',
+    'primary_label',
+    'color',
+    'gender',
+    'category',
+    'subcategory',
+    'language',
+    'level_category_id',
+    'brand_id',
+]
+
+# Fields that differ between country hosts of one SKU. Cross-country
+# coalescing takes them from the country's own listing row and every other
+# field from the PDP fetched once per SKU and language.
+COUNTRY_VARIANT_FIELDS = {
+    'run_id',
+    'site',
+    'crawl_date',
+    'crawl_mode',
+    'url',
+    'country',
+    'price',
+    'currency',
+    'price_discount',
+    'out_of_stock',
+    'sold_out',
+    'primary_label',
+}
@@ -18,4 +18,15 @@ TLD_LANGUAGE_MAP = {
     'ar.ounass.sa': 'AR',
     'en-saudi.ounass.com': 'EN'
 }
+TLD_COUNTRY_MAP = {
+    'www.ounass.ae': 'AE',
+    'saudi.ounass.com': 'SA',
+    'kuwait.ounass.com': 'KW',
+    'www.ounass.qa': 'QA',
+    'ar.ounass.ae': 'AE',
+    'ar-kuwait.ounass.com': 'KW',
+    'ar.ounass.qa': 'QA',
+    'ar.ounass.sa': 'SA',
+    'en-saudi.ounass.com': 'SA'
+}
     
\ No newline at end of file
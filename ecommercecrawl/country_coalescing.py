@@ -0,0 +1,88 @@
+"""
+Cross-country request coalescing for sites that serve one SKU on several
+country hosts (Ounass, Level).
+
+Only price, currency, stock and labels differ between country hosts, so the
+full PDP is fetched once per SKU and language. Listing rows for the same SKU
+on other countries are merged with the country-invariant fields of that PDP
+instead of fetching their own PDP. Rows that arrive before the PDP is parsed
+are parked until it is; if it fails, they fall back to their own PDP fetch.
+"""
+from ecommercecrawl.constants.mastercrawl_constants import COUNTRY_VARIANT_FIELDS
+from ecommercecrawl.known_products import canonical_product_url
+
+
+def coalescing_key(fields):
+    """(portal_itemid, language) of a row, or None when it has no SKU."""
+    sku = fields.get("portal_itemid")
+    if not sku:
+        return None
+    return str(sku), str(fields.get("language") or "")
+
+
+def merge_country_row(row, invariants):
+    """Country row filled with the PDP fields it does not carry itself."""
+    merged = dict(invariants)
+    merged.update({key: value for key, value in row.items() if value is not None})
+    return merged
+
+
+class CountryCoalescer:
+    def __init__(self):
+        # key -> URL of the PDP fetched for it
+        self.primary_urls = {}
+        # canonical primary URL -> key, to resolve a parsed PDP
+        self.claimed = {}
+        # key -> country-invariant fields of the parsed PDP
+        self.invariants = {}
+        # key -> country rows waiting for the PDP
+        self.pending = {}
+
+    def claim(self, key, url):
+        """True if `url` is the first PDP for `key` and should be fetched."""
+        if key in self.primary_urls:
+            return False
+        self.primary_urls[key] = url
+        self.claimed[canonical_product_url(url)] = key
+        return True
+
+    def offer(self, key, row):
+        """Merged rows ready to emit for a country row; parks it if the PDP is in flight."""
+        if key in self.invariants:
+            return [merge_country_row(row, self.invariants[key])]
+        self.pending.setdefault(key, []).append(row)
+        return []
+
+    def resolve(self, url, item):
+        """Store the invariant fields of a parsed PDP and return its parked rows merged."""
+        key = self.claimed.pop(canonical_product_url(url), None)
+        if key is None:
+            return []
+        invariants = {
+            field: value for field, value in item.items()
+            if field not in COUNTRY_VARIANT_FIELDS
+        }
+        invariants["coalesced_from"] = item.get("url") or url
+        self.invariants[key] = invariants
+        return [merge_country_row(row, invariants) for row in self.pending.pop(key, [])]
+
+    def release(self, url):
+        """
+        Give up on a PDP that could not be parsed.
+
+        Returns the parked rows, whose own PDPs must now be fetched; the next
+        listing row for the key claims a new primary PDP.
+        """
+        key = self.claimed.pop(canonical_product_url(url), None)
+        if key is None:
+            return []
+        self.primary_urls.pop(key, None)
+        return self.pending.pop(key, [])
+
+    def drain(self):
+        """All rows still parked, e.g. when the primary PDP download failed."""
+        rows = [row for rows in self.pending.values() for row in rows]
+        for key in self.pending:
+            self.primary_urls.pop(key, None)
+        self.pending = {}
+        return rows
@@ -1,6 +1,10 @@
 DEFAULT_CRAWLER_API_SERVICE = "zyte"
 REQUEST_TYPE_HTTP_RESPONSE = "http_response"
 REQUEST_TYPE_RENDERED_HTML = "rendered_html"
+# Not a provider request type: resolved per URL by an AdaptiveRequestTypePolicy.
+REQUEST_TYPE_ADAPTIVE = "adaptive"
+# Request meta key holding the concrete type picked for an adaptive request.
+ADAPTIVE_REQUEST_TYPE_META_KEY = "crawler_api_adaptive_request_type"
 
 
 def _get_setting(settings, name, default):
@@ -20,6 +24,7 @@ def build_crawler_api_request(
     settings=None,
     request_type=REQUEST_TYPE_HTTP_RESPONSE,
     meta=None,
+    adaptive_policy=None,
     **request_kwargs,
 ):
     """
@@ -27,9 +32,20 @@ def build_crawler_api_request(
 
     The spider layer stays service-agnostic; each service module maps the
     generic request type to provider-specific request parameters.
+
+    `adaptive` request types are resolved through `adaptive_policy` before
+    dispatch, and the chosen type is kept in request meta so the callback can
+    report back whether the response was usable.
     """
     service = get_crawler_api_service(settings)
 
+    if request_type == REQUEST_TYPE_ADAPTIVE:
+        if adaptive_policy is None:
+            raise ValueError("Adaptive crawler API requests require an adaptive_policy")
+        request_type = adaptive_policy.choose(url)
+        meta = dict(meta or {})
+        meta[ADAPTIVE_REQUEST_TYPE_META_KEY] = request_type
+
     if service == "zyte":
         from ecommercecrawl.crawler_api import zyte_api
 
@@ -42,4 +58,16 @@ def build_crawler_api_request(
             **request_kwargs,
         )
 
+    if service == "local":
+        from ecommercecrawl.crawler_api import local_api
+
+        return local_api.build_request(
+            url=url,
+            callback=callback,
+            settings=settings,
+            request_type=request_type,
+            meta=meta,
+            **request_kwargs,
+        )
+
     raise ValueError(f"Unsupported crawler API service: {service}")
@@ -0,0 +1,93 @@
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from ecommercecrawl.crawler_api import (
+    REQUEST_TYPE_HTTP_RESPONSE,
+    REQUEST_TYPE_RENDERED_HTML,
+)
+
+
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_MIN_SUCCESS_RATE = 0.5
+DEFAULT_PROBE_INTERVAL = 50
+
+
+def _get_setting(settings, name, default):
+    if settings is None:
+        return default
+    value = settings.get(name, default)
+    return default if value is None else value
+
+
+class AdaptiveRequestTypePolicy:
+    """
+    Pick the cheapest crawler API request type that works, per hostname.
+
+    Every hostname starts on `http_response`. Callers report whether the cheap
+    response was usable via `record()`. Once a hostname has `min_samples`
+    cheap attempts and its success rate is below `min_success_rate`, requests
+    go straight to `rendered_html`. Every `probe_interval`-th request on such a
+    hostname still tries the cheap type so the policy notices a recovery.
+    """
+
+    def __init__(
+        self,
+        min_samples=DEFAULT_MIN_SAMPLES,
+        min_success_rate=DEFAULT_MIN_SUCCESS_RATE,
+        probe_interval=DEFAULT_PROBE_INTERVAL,
+    ):
+        self.min_samples = max(1, int(min_samples))
+        self.min_success_rate = float(min_success_rate)
+        self.probe_interval = max(0, int(probe_interval))
+
+        # hostname -> counters
+        self.attempts = defaultdict(int)
+        self.successes = defaultdict(int)
+        self.skipped = defaultdict(int)
+
+    @classmethod
+    def from_settings(cls, settings=None):
+        return cls(
+            min_samples=int(float(_get_setting(
+                settings, "CRAWLER_API_ADAPTIVE_MIN_SAMPLES", DEFAULT_MIN_SAMPLES
+            ))),
+            min_success_rate=float(_get_setting(
+                settings, "CRAWLER_API_ADAPTIVE_MIN_SUCCESS_RATE", DEFAULT_MIN_SUCCESS_RATE
+            )),
+            probe_interval=int(float(_get_setting(
+                settings, "CRAWLER_API_ADAPTIVE_PROBE_INTERVAL", DEFAULT_PROBE_INTERVAL
+            ))),
+        )
+
+    @staticmethod
+    def get_hostname(url):
+        return (urlparse(url).hostname or "").lower()
+
+    def success_rate(self, hostname):
+        attempts = self.attempts.get(hostname, 0)
+        if not attempts:
+            return None
+        return self.successes.get(hostname, 0) / attempts
+
+    def _cheap_attempt_is_useless(self, hostname):
+        if self.attempts.get(hostname, 0) < self.min_samples:
+            return False
+        return self.success_rate(hostname) < self.min_success_rate
+
+    def choose(self, url):
+        """Return the request type to use for the next request to `url`."""
+        hostname = self.get_hostname(url)
+        if not self._cheap_attempt_is_useless(hostname):
+            return REQUEST_TYPE_HTTP_RESPONSE
+
+        self.skipped[hostname] += 1
+        if self.probe_interval and self.skipped[hostname] % self.probe_interval == 0:
+            return REQUEST_TYPE_HTTP_RESPONSE
+        return REQUEST_TYPE_RENDERED_HTML
+
+    def record(self, url, success):
+        """Record whether a cheap (`http_response`) attempt was usable."""
+        hostname = self.get_hostname(url)
+        self.attempts[hostname] += 1
+        if success:
+            self.successes[hostname] += 1
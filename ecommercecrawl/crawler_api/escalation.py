@@ -0,0 +1,118 @@
+from collections import deque
+from urllib.parse import urlparse
+
+from ecommercecrawl.crawler_api import (
+    REQUEST_TYPE_HTTP_RESPONSE,
+    REQUEST_TYPE_RENDERED_HTML,
+)
+
+
+DEFAULT_REQUEST_TYPES = (REQUEST_TYPE_HTTP_RESPONSE, REQUEST_TYPE_RENDERED_HTML)
+DEFAULT_BLOCK_THRESHOLD = 5
+DEFAULT_WINDOW_SECONDS = 60
+DEFAULT_COOLDOWN_SECONDS = 900
+
+# Level 0 fetches directly; level N uses request_types[N - 1].
+DIRECT_LEVEL = 0
+
+
+def _get_setting(settings, name, default):
+    if settings is None:
+        return default
+    value = settings.get(name, default)
+    return default if value is None else value
+
+
+class EscalationPolicy:
+    """
+    Per hostname fetch level: direct Scrapy requests first, crawler API
+    request types (cheapest first) once the host blocks.
+
+    Callers report each response with `record()`. When `block_threshold`
+    block signals were seen at the current level within `window_seconds`,
+    the host moves one level up. After `cooldown_seconds` on an escalated
+    level without a new escalation, it moves one level down again, so the
+    API is only paid for while the host is actually blocking.
+    """
+
+    def __init__(
+        self,
+        request_types=DEFAULT_REQUEST_TYPES,
+        block_threshold=DEFAULT_BLOCK_THRESHOLD,
+        window_seconds=DEFAULT_WINDOW_SECONDS,
+        cooldown_seconds=DEFAULT_COOLDOWN_SECONDS,
+    ):
+        self.request_types = tuple(request_types)
+        self.block_threshold = max(1, int(block_threshold))
+        self.window_seconds = float(window_seconds)
+        self.cooldown_seconds = float(cooldown_seconds)
+
+        # hostname -> current level
+        self.levels = {}
+        # hostname -> time the current level was entered
+        self.changed_at = {}
+        # hostname -> times of block signals at the current level
+        self.blocks = {}
+
+    @classmethod
+    def from_settings(cls, settings=None):
+        request_types = DEFAULT_REQUEST_TYPES
+        if settings is not None and settings.get("CRAWLER_API_ESCALATION_REQUEST_TYPES"):
+            request_types = settings.getlist("CRAWLER_API_ESCALATION_REQUEST_TYPES")
+        return cls(
+            request_types=request_types,
+            block_threshold=int(float(_get_setting(
+                settings, "CRAWLER_API_ESCALATION_BLOCK_THRESHOLD", DEFAULT_BLOCK_THRESHOLD
+            ))),
+            window_seconds=float(_get_setting(
+                settings, "CRAWLER_API_ESCALATION_WINDOW_SECONDS", DEFAULT_WINDOW_SECONDS
+            )),
+            cooldown_seconds=float(_get_setting(
+                settings, "CRAWLER_API_ESCALATION_COOLDOWN_SECONDS", DEFAULT_COOLDOWN_SECONDS
+            )),
+        )
+
+    @staticmethod
+    def get_hostname(url):
+        return (urlparse(url).hostname or "").lower()
+
+    @property
+    def max_level(self):
+        return len(self.request_types)
+
+    def request_type(self, level):
+        """Crawler API request type of `level`, or None for direct fetches."""
+        if level == DIRECT_LEVEL:
+            return None
+        return self.request_types[level - 1]
+
+    def _set_level(self, hostname, level, now):
+        self.levels[hostname] = level
+        self.changed_at[hostname] = now
+        self.blocks[hostname] = deque()
+
+    def level(self, hostname, now):
+        """Level for the next request to `hostname`; steps down after the cool-down."""
+        level = self.levels.get(hostname, DIRECT_LEVEL)
+        if level != DIRECT_LEVEL and now - self.changed_at[hostname] >= self.cooldown_seconds:
+            level -= 1
+            self._set_level(hostname, level, now)
+        return level
+
+    def record(self, hostname, level, blocked, now):
+        """
+        Record a response fetched at `level`. Returns the new level when this
+        block signal escalates the host, otherwise None.
+        """
+        current = self.levels.get(hostname, DIRECT_LEVEL)
+        # Answers to requests sent before the last level change are stale.
+        if not blocked or level != current or current >= self.max_level:
+            return None
+        blocks = self.blocks.setdefault(hostname, deque())
+        blocks.append(now)
+        while blocks and blocks[0] < now - self.window_seconds:
+            blocks.popleft()
+        if len(blocks) < self.block_threshold:
+            return None
+        self._set_level(hostname, current + 1, now)
+        return current + 1
@@ -0,0 +1,63 @@
+import json
+from urllib.parse import urlparse
+
+import scrapy
+
+from ecommercecrawl.crawler_api import REQUEST_TYPE_HTTP_RESPONSE
+from ecommercecrawl.crawler_api.zyte_api import build_zyte_api_params
+
+
+DEFAULT_LOCAL_API_ENDPOINT = "http://127.0.0.1:8765/extract"
+# Request meta key holding the Zyte-shaped request body sent to the local API.
+LOCAL_API_META_KEY = "local_crawler_api"
+
+
+def _get_setting(settings, name, default):
+    if settings is None:
+        return default
+    return settings.get(name, default)
+
+
+def get_local_api_endpoint(settings=None):
+    endpoint = _get_setting(settings, "CRAWLER_API_LOCAL_ENDPOINT", None)
+    return str(endpoint).strip() if endpoint else DEFAULT_LOCAL_API_ENDPOINT
+
+
+def build_request(
+    url,
+    callback,
+    settings=None,
+    request_type=REQUEST_TYPE_HTTP_RESPONSE,
+    meta=None,
+    **request_kwargs,
+):
+    """
+    Build a request for the local stand-in crawler API.
+
+    The body uses the same parameter shape as Zyte API requests, so the local
+    server (`scripts/local_crawler_api.py`) can be swapped in for load tests.
+    `LocalCrawlerAPIMiddleware` turns the API answer back into a response for
+    `url`, so spider callbacks see the same thing they would with Zyte.
+
+    Params are kept under their own meta key rather than `zyte_api` so the
+    real Zyte handler never picks these requests up.
+    """
+    api_body = {"url": url, **build_zyte_api_params(settings, request_type)}
+
+    request_meta = dict(meta or {})
+    request_meta[LOCAL_API_META_KEY] = api_body
+    # Keep per-site downloader slots so throttling behaves like a real crawl.
+    request_meta.setdefault("download_slot", urlparse(url).hostname)
+
+    headers = dict(request_kwargs.pop("headers", None) or {})
+    headers["Content-Type"] = "application/json"
+
+    return scrapy.Request(
+        url=get_local_api_endpoint(settings),
+        method="POST",
+        body=json.dumps(api_body),
+        headers=headers,
+        callback=callback,
+        meta=request_meta,
+        **request_kwargs,
+    )
@@ -0,0 +1,66 @@
+"""
+Downloader that shares a concurrency budget between the crawlers of a
+process (GLOBAL_CONCURRENT_REQUESTS, see run_crawler.py --max-concurrency).
+"""
+from scrapy.core.downloader import Downloader
+from twisted.internet.defer import DeferredSemaphore
+
+from ecommercecrawl.middlewares import _reactor
+
+# limit -> DeferredSemaphore shared by every crawler in the process.
+_global_slots = {}
+
+
+class GlobalConcurrencyDownloader(Downloader):
+    """
+    Cap in-flight downloads across all crawlers of the process.
+
+    CONCURRENT_REQUESTS limits each crawler on its own. When run_crawler.py
+    runs several spiders in one reactor, GLOBAL_CONCURRENT_REQUESTS is the
+    budget they share. A request takes a token when its download slot sends
+    it, after DOWNLOAD_DELAY and any Retry-After or AIMD wait, and gives it
+    back when the download finishes. Requests waiting in a slot's queue hold
+    no token, so a site that is idle or backing off leaves its share to the
+    others. Without a limit this is Scrapy's Downloader.
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.stats = crawler.stats
+        self._clock = None
+        self.global_slots = None
+        limit = self.settings.getint("GLOBAL_CONCURRENT_REQUESTS", 0)
+        if limit > 0:
+            self.global_slots = _global_slots.get(limit)
+            if self.global_slots is None:
+                self.global_slots = _global_slots[limit] = DeferredSemaphore(limit)
+
+    @property
+    def clock(self):
+        if self._clock is None:
+            self._clock = _reactor()
+        return self._clock
+
+    def _download(self, slot, request, spider):
+        if self.global_slots is None:
+            return super()._download(slot, request, spider)
+        # The request keeps its place in the slot while it waits for a
+        # token, so the slot sends no more than its own concurrency.
+        slot.transferring.add(request)
+        queued_at = None
+        if not self.global_slots.tokens:
+            self.stats.inc_value("global_concurrency/queued")
+            queued_at = self.clock.seconds()
+        return self.global_slots.acquire().addCallback(self._send, slot, request, spider, queued_at)
+
+    def _send(self, _, slot, request, spider, queued_at):
+        if queued_at is not None:
+            self.stats.max_value(
+                "global_concurrency/max_wait_seconds", round(self.clock.seconds() - queued_at, 3),
+            )
+        slot.transferring.discard(request)
+        return super()._download(slot, request, spider).addBoth(self._release)
+
+    def _release(self, result):
+        self.global_slots.release()
+        return result
@@ -0,0 +1,563 @@
+import json
+import logging
+import os
+import signal
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+from typing import Optional
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet.task import LoopingCall
+from twisted.web.resource import Resource
+
+from ecommercecrawl.constants.mastercrawl_constants import PROGRESS_DIR
+from ecommercecrawl.metrics import CONTENT_TYPE, Histogram, MetricFamily, render
+from ecommercecrawl.middlewares import get_retry_after_seconds, get_target_url
+from ecommercecrawl.progress import CrawlProgress
+from ecommercecrawl.s3_utils import split_s3_uri
+
+logger = logging.getLogger(__name__)
+
+# Spider close reason (and manifest exit_reason) of a drained crawl.
+DRAINED_REASON = "drained"
+
+# Drain extensions of the crawlers running in this process; run_crawler.py
+# can run several spiders in one reactor and one SIGTERM drains them all.
+_drain_extensions = []
+
+# OpenMetrics extensions of the crawlers running in this process; they share
+# one HTTP listener and one metrics file.
+_metrics_extensions = []
+_metrics_listener = None
+
+
+def _handle_sigterm(signum, frame):
+    from twisted.internet import reactor
+
+    for extension in list(_drain_extensions):
+        reactor.callFromThread(extension.drain)
+
+
+class SigtermDrainExtension:
+    """
+    Drain the crawl when the container receives SIGTERM.
+
+    Fargate sends SIGTERM when a task is stopped and SIGKILL stopTimeout
+    seconds later. Scrapy's own shutdown drops in-flight responses; here the
+    engine stops sending requests and seeds, in-flight downloads and parses
+    get DRAIN_TIMEOUT_SECONDS to finish, and the spider is closed with reason
+    "drained", so the pipelines still flush, gzip, write the manifest and
+    upload what was collected. A second SIGTERM closes the spider at once.
+
+    Closing still waits for downloads in progress, which DOWNLOAD_TIMEOUT
+    bounds. Requests left in the scheduler are recorded by crawl checkpoints
+    when they are enabled, so a drained run can be continued with --resume.
+    """
+
+    def __init__(self, crawler, timeout, poll_interval=0.5):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.draining_since = None
+        self._loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("DRAIN_ON_SIGTERM", True):
+            raise NotConfigured("SIGTERM drain is disabled")
+        extension = cls(crawler, crawler.settings.getfloat("DRAIN_TIMEOUT_SECONDS", 25))
+        crawler.signals.connect(extension.engine_started, signal=signals.engine_started)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def engine_started(self):
+        # Replaces the shutdown handler CrawlerProcess installed for SIGTERM;
+        # SIGINT keeps Scrapy's behavior.
+        _drain_extensions.append(self)
+        signal.signal(signal.SIGTERM, _handle_sigterm)
+
+    def drain(self):
+        spider = self.crawler.spider
+        if self.draining_since is not None:
+            logger.info("Received SIGTERM again, closing without waiting for in-flight requests")
+            self._close(spider)
+            return
+
+        logger.info(
+            "Received SIGTERM, draining in-flight requests for up to %.0fs", self.timeout,
+        )
+        self.draining_since = time.monotonic()
+        # Stops seed iteration (see MasterCrawl.is_draining) and downloads of queued requests.
+        spider.draining = True
+        self.crawler.engine.pause()
+        self._loop = LoopingCall(self._check, spider)
+        self._loop.start(self.poll_interval, now=True)
+
+    def _in_flight(self):
+        engine = self.crawler.engine
+        slot = engine.scraper.slot
+        return len(engine.downloader.active) + (len(slot.active) if slot is not None else 0)
+
+    def _check(self, spider):
+        in_flight = self._in_flight()
+        if in_flight and time.monotonic() - self.draining_since < self.timeout:
+            return
+        self.stats.set_value("drain/abandoned_requests", in_flight)
+        self.stats.set_value("drain/duration_seconds", round(time.monotonic() - self.draining_since, 3))
+        self._close(spider)
+
+    def _close(self, spider):
+        self._stop_loop()
+        self.crawler.engine.close_spider(spider, DRAINED_REASON)
+
+    def _stop_loop(self):
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+
+    def spider_closed(self, spider, reason):
+        self._stop_loop()
+        if self in _drain_extensions:
+            _drain_extensions.remove(self)
+
+
+@dataclass
+class _SlotControl:
+    concurrency: int
+    delay: float
+    successes: int = 0
+    min_latency: Optional[float] = None
+    last_decrease: float = float("-inf")
+
+
+class AdaptiveConcurrencyExtension:
+    """
+    AIMD controller for per-domain (downloader slot) concurrency and delay.
+
+    Every downloaded response is an observation for its slot:
+
+    - 429/503 or a Retry-After header: multiplicative decrease. Concurrency
+      is multiplied by AIMD_DECREASE_FACTOR and the delay doubled, or raised
+      to Retry-After if that is longer. Throttled responses of one window of
+      in-flight requests only count once (AIMD_DECREASE_COOLDOWN seconds).
+    - otherwise, after `concurrency` successful responses (one full window)
+      whose latency stayed within AIMD_LATENCY_TOLERANCE times the fastest
+      latency seen on the slot: additive increase, one more concurrent
+      request and AIMD_DELAY_STEP seconds less delay.
+
+    Values stay within AIMD_MIN/MAX_CONCURRENCY and AIMD_MIN/MAX_DELAY, which
+    AIMD_SITE_LIMITS overrides per host suffix. Decisions and current values
+    are kept in stats under aimd/{slot}/.
+    """
+
+    THROTTLE_STATUSES = {429, 503}
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.decrease_factor = settings.getfloat("AIMD_DECREASE_FACTOR", 0.5)
+        self.decrease_cooldown = settings.getfloat("AIMD_DECREASE_COOLDOWN", 2.0)
+        self.latency_tolerance = settings.getfloat("AIMD_LATENCY_TOLERANCE", 2.0)
+        self.delay_step = settings.getfloat("AIMD_DELAY_STEP", 0.1)
+        self.default_limits = {
+            "min_concurrency": settings.getint("AIMD_MIN_CONCURRENCY", 1),
+            "max_concurrency": settings.getint("AIMD_MAX_CONCURRENCY", 8),
+            "min_delay": settings.getfloat("AIMD_MIN_DELAY", 0.0),
+            "max_delay": settings.getfloat("AIMD_MAX_DELAY", 60.0),
+        }
+        self.site_limits = settings.getdict("AIMD_SITE_LIMITS")
+        # slot key -> _SlotControl
+        self.controls = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("AIMD_ENABLED", False):
+            raise NotConfigured("AIMD concurrency control is disabled")
+        extension = cls(crawler)
+        crawler.signals.connect(extension.response_downloaded, signal=signals.response_downloaded)
+        return extension
+
+    def get_limits(self, key):
+        limits = dict(self.default_limits)
+        for suffix, site_limits in self.site_limits.items():
+            if key == suffix or key.endswith(f".{suffix}"):
+                limits.update(site_limits)
+                break
+        return limits
+
+    def _get_control(self, key, slot, limits):
+        control = self.controls.get(key)
+        if control is None:
+            control = _SlotControl(
+                concurrency=min(limits["max_concurrency"], max(limits["min_concurrency"], slot.concurrency)),
+                delay=min(limits["max_delay"], max(limits["min_delay"], slot.delay)),
+            )
+            self.controls[key] = control
+        return control
+
+    def response_downloaded(self, response, request, spider):
+        key = request.meta.get("download_slot")
+        slot = self.crawler.engine.downloader.slots.get(key) if key else None
+        if slot is None:
+            return
+        limits = self.get_limits(key)
+        control = self._get_control(key, slot, limits)
+        latency = request.meta.get("download_latency")
+        self.stats.inc_value(f"aimd/{key}/responses")
+
+        retry_after = get_retry_after_seconds(response)
+        if response.status in self.THROTTLE_STATUSES or retry_after is not None:
+            self._decrease(key, control, limits, retry_after)
+        else:
+            self._observe_success(key, control, limits, latency)
+
+        # Slots are recreated with default values after being idle.
+        slot.concurrency = control.concurrency
+        slot.delay = control.delay
+        self.stats.set_value(f"aimd/{key}/concurrency", control.concurrency)
+        self.stats.set_value(f"aimd/{key}/delay", round(control.delay, 3))
+
+    def _decrease(self, key, control, limits, retry_after):
+        control.successes = 0
+        now = time.monotonic()
+        if now - control.last_decrease < self.decrease_cooldown:
+            return
+        control.last_decrease = now
+        control.concurrency = max(limits["min_concurrency"], int(control.concurrency * self.decrease_factor))
+        delay = max(control.delay * 2, self.delay_step, retry_after or 0.0)
+        control.delay = min(limits["max_delay"], max(limits["min_delay"], delay))
+        self.stats.inc_value(f"aimd/{key}/decrease")
+        logger.info(
+            "[AIMD] Throttled on %s: concurrency=%d delay=%.2fs", key, control.concurrency, control.delay,
+        )
+
+    def _observe_success(self, key, control, limits, latency):
+        if latency is not None:
+            if control.min_latency is None or latency < control.min_latency:
+                control.min_latency = latency
+            if latency > control.min_latency * self.latency_tolerance:
+                # The site slows down under this load: hold the window.
+                control.successes = 0
+                self.stats.inc_value(f"aimd/{key}/hold")
+                return
+        control.successes += 1
+        if control.successes < control.concurrency:
+            return
+        control.successes = 0
+        concurrency = min(limits["max_concurrency"], control.concurrency + 1)
+        delay = max(limits["min_delay"], control.delay - self.delay_step)
+        if (concurrency, delay) != (control.concurrency, control.delay):
+            control.concurrency = concurrency
+            control.delay = delay
+            self.stats.inc_value(f"aimd/{key}/increase")
+
+
+class CrawlProgressExtension:
+    """
+    Report crawl progress, throughput and ETA (see ecommercecrawl.progress).
+
+    Every PROGRESS_INTERVAL_SECONDS, and when the spider closes, expected vs
+    completed listing pages and PDPs (in total and per seed), items/sec and
+    the ETA are logged and written to
+    PROGRESS_DIR/{spider}/{run_id}/progress.json, which is also uploaded to
+    PROGRESS_S3_PREFIX/{spider}/{run_id}/ when that is set. An interval in
+    which nothing completed is logged as a stall.
+    """
+
+    def __init__(self, crawler, interval, directory, s3_prefix=None):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.interval = interval
+        self.directory = directory
+        self.s3_prefix = s3_prefix
+        self.progress = None
+        self._loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("PROGRESS_ENABLED", False):
+            raise NotConfigured("Progress reporting is disabled")
+        extension = cls(
+            crawler,
+            settings.getfloat("PROGRESS_INTERVAL_SECONDS", 60),
+            settings.get("PROGRESS_DIR") or PROGRESS_DIR,
+            s3_prefix=settings.get("PROGRESS_S3_PREFIX"),
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def _filename(self, spider):
+        shard = getattr(spider, "shard", None)
+        return f"progress.{shard.tag}.json" if shard is not None else "progress.json"
+
+    def progress_path(self, spider):
+        return os.path.join(self.directory, spider.name, spider.run_id, self._filename(spider))
+
+    def spider_opened(self, spider):
+        self.progress = CrawlProgress(time.monotonic())
+        # Spiders report listing pages through MasterCrawl.report_listing_page.
+        spider.progress = self.progress
+        self._loop = LoopingCall(self.report, spider)
+        self._loop.start(self.interval, now=False)
+
+    def item_scraped(self, item, response, spider):
+        if self.progress is not None:
+            self.progress.item_scraped(item)
+
+    def spider_closed(self, spider, reason):
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        if self.progress is not None:
+            self.report(spider, reason)
+
+    def report(self, spider, reason=None):
+        snapshot = self.progress.snapshot(time.monotonic())
+        report = {
+            "run_id": spider.run_id,
+            "spider": spider.name,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "finished": reason is not None,
+            "exit_reason": reason,
+            **snapshot,
+        }
+        eta = snapshot["eta_seconds"]
+        logger.info(
+            "[progress] %s: %d/%d listing pages, %d/%d PDPs (%s%%), %.2f items/s, ETA %s",
+            spider.name,
+            snapshot["plp_pages_completed"], snapshot["plp_pages_expected"],
+            snapshot["pdps_completed"], snapshot["pdps_expected"],
+            snapshot["percent_complete"], snapshot["recent_items_per_second"],
+            f"{eta}s" if eta is not None else "unknown",
+        )
+        if snapshot["stalled"] and reason is None:
+            self.stats.inc_value("progress/stalled_intervals")
+            logger.warning("[progress] %s completed nothing in the last %.0fs", spider.name, self.interval)
+        self.stats.set_value("progress/percent_complete", snapshot["percent_complete"])
+        try:
+            self._write(spider, report)
+        except Exception as exc:
+            # Progress reports must not stop the crawl; the next one retries.
+            logger.error("Failed to write crawl progress: %s", exc)
+
+    def _write(self, spider, report):
+        path = self.progress_path(spider)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+        os.replace(tmp_path, path)
+        if self.s3_prefix:
+            import boto3
+
+            bucket, prefix = split_s3_uri(self.s3_prefix)
+            key = "/".join(part for part in (prefix, spider.name, spider.run_id, self._filename(spider)) if part)
+            boto3.client("s3").upload_file(path, bucket, key)
+
+
+def render_metrics():
+    """OpenMetrics text for every crawler of the process that exports metrics."""
+    return render(family for extension in list(_metrics_extensions) for family in extension.collect())
+
+
+class _MetricsResource(Resource):
+    isLeaf = True
+
+    def render_GET(self, request):
+        request.setHeader(b"content-type", CONTENT_TYPE.encode("ascii"))
+        return render_metrics().encode("utf-8")
+
+
+class OpenMetricsExtension:
+    """
+    Export live crawl stats as OpenMetrics text while the crawl runs.
+
+    With METRICS_PORT the text is served over HTTP on METRICS_HOST (any
+    path, e.g. /metrics); with METRICS_FILE it is written there every
+    METRICS_INTERVAL_SECONDS and when the spider closes, for node_exporter's
+    textfile collector or an agent beside the ECS task. Crawlers of one
+    process share the endpoint and the file; samples carry a spider label.
+
+    Exported, besides every numeric Scrapy stat (ecommercecrawl_stat):
+
+    - download latency histograms per target domain,
+    - delay (RetryAfterMiddleware or AIMD), concurrency, active and queued
+      requests per downloader slot,
+    - scheduler, downloader and scraper queue sizes,
+    - items scraped and rows/bytes written by JsonlWriterPipeline, with
+      per-second rates over the last METRICS_RATE_WINDOW_SECONDS.
+    """
+
+    def __init__(self, crawler, host="127.0.0.1", port=None, path=None, interval=15.0, rate_window=60.0):
+        self.crawler = crawler
+        self.host = host
+        self.port = port
+        self.path = path
+        self.interval = interval
+        self.rate_window = rate_window
+        # target domain -> Histogram of download latencies
+        self.latency = {}
+        # (monotonic time, items scraped, bytes written) samples for rates
+        self._samples = deque()
+        self._loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("METRICS_ENABLED", False):
+            raise NotConfigured("Metrics export is disabled")
+        port = settings.get("METRICS_PORT")
+        path = settings.get("METRICS_FILE")
+        if not port and not path:
+            raise NotConfigured("Set METRICS_PORT or METRICS_FILE to export metrics")
+        extension = cls(
+            crawler,
+            host=settings.get("METRICS_HOST") or "127.0.0.1",
+            port=int(port) if port else None,
+            path=path or None,
+            interval=settings.getfloat("METRICS_INTERVAL_SECONDS", 15),
+            rate_window=settings.getfloat("METRICS_RATE_WINDOW_SECONDS", 60),
+        )
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        _metrics_extensions.append(self)
+        if self.port is not None:
+            self._listen()
+        if self.path:
+            self._loop = LoopingCall(self.write_file)
+            self._loop.start(self.interval, now=False)
+
+    def _listen(self):
+        global _metrics_listener
+        if _metrics_listener is not None:
+            return
+        from twisted.internet import reactor
+        from twisted.web.server import Site
+
+        _metrics_listener = reactor.listenTCP(self.port, Site(_MetricsResource()), interface=self.host)
+        logger.info("Serving OpenMetrics on http://%s:%d/metrics", self.host, self.port)
+
+    def spider_closed(self, spider, reason):
+        global _metrics_listener
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        if self.path:
+            self.write_file()
+        if self in _metrics_extensions:
+            _metrics_extensions.remove(self)
+        if not _metrics_extensions and _metrics_listener is not None:
+            _metrics_listener.stopListening()
+            _metrics_listener = None
+
+    def write_file(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                handle.write(render_metrics())
+            # Collectors never read a partly written file.
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            logger.error("Failed to write metrics file %s: %s", self.path, exc)
+
+    def response_downloaded(self, response, request, spider):
+        latency = request.meta.get("download_latency")
+        if latency is None:
+            return
+        domain = urlparse(get_target_url(request)).netloc
+        histogram = self.latency.get(domain)
+        if histogram is None:
+            histogram = self.latency[domain] = Histogram()
+        histogram.observe(latency)
+
+    def _rates(self, now, items, bytes_written):
+        """Items and bytes per second since the oldest sample within the rate window."""
+        self._samples.append((now, items, bytes_written))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.rate_window:
+            self._samples.popleft()
+        since, items_then, bytes_then = self._samples[0]
+        elapsed = now - since
+        if elapsed <= 0:
+            return 0.0, 0.0
+        return round((items - items_then) / elapsed, 3), round((bytes_written - bytes_then) / elapsed, 3)
+
+    def collect(self):
+        """This crawler's metric families."""
+        spider = self.crawler.spider.name
+        stats = self.crawler.stats.get_stats()
+        families = []
+
+        stat_family = MetricFamily("ecommercecrawl_stat", "gauge", "Numeric Scrapy stats by stats key")
+        for key, value in sorted(stats.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                stat_family.add(value, spider=spider, stat=key)
+        families.append(stat_family)
+
+        latency = MetricFamily(
+            "ecommercecrawl_download_latency_seconds", "histogram", "Download latency by target domain",
+        )
+        for domain, histogram in sorted(self.latency.items()):
+            histogram.add_samples(latency, spider=spider, domain=domain)
+        families.append(latency)
+
+        engine = self.crawler.engine
+        slot_delay = MetricFamily("ecommercecrawl_slot_delay_seconds", "gauge", "Downloader slot delay")
+        slot_concurrency = MetricFamily("ecommercecrawl_slot_concurrency", "gauge", "Downloader slot concurrency")
+        slot_active = MetricFamily("ecommercecrawl_slot_active_requests", "gauge", "Requests in flight per slot")
+        slot_queued = MetricFamily("ecommercecrawl_slot_queued_requests", "gauge", "Requests queued per slot")
+        for key, slot in sorted(engine.downloader.slots.items()):
+            slot_delay.add(slot.delay, spider=spider, slot=key)
+            slot_concurrency.add(slot.concurrency, spider=spider, slot=key)
+            slot_active.add(len(slot.active), spider=spider, slot=key)
+            slot_queued.add(len(slot.queue), spider=spider, slot=key)
+        families += [slot_delay, slot_concurrency, slot_active, slot_queued]
+
+        scraper_slot = engine.scraper.slot
+        families += [
+            MetricFamily(
+                "ecommercecrawl_scheduler_pending_requests", "gauge", "Requests waiting in the scheduler",
+            ).add(
+                stats.get("scheduler/enqueued", 0) - stats.get("scheduler/dequeued", 0), spider=spider,
+            ),
+            MetricFamily(
+                "ecommercecrawl_downloader_active_requests", "gauge", "Requests being downloaded",
+            ).add(len(engine.downloader.active), spider=spider),
+            MetricFamily(
+                "ecommercecrawl_scraper_active_responses", "gauge", "Responses being parsed",
+            ).add(len(scraper_slot.active) if scraper_slot is not None else 0, spider=spider),
+        ]
+
+        items = stats.get("item_scraped_count", 0)
+        bytes_written = stats.get("output/bytes_written", 0)
+        items_per_second, bytes_per_second = self._rates(time.monotonic(), items, bytes_written)
+        families += [
+            MetricFamily("ecommercecrawl_items_scraped", "counter", "Items scraped").add(
+                items, "_total", spider=spider,
+            ),
+            MetricFamily("ecommercecrawl_output_rows_written", "counter", "Rows written to the output").add(
+                stats.get("output/rows_written", 0), "_total", spider=spider,
+            ),
+            MetricFamily("ecommercecrawl_output_bytes_written", "counter", "Bytes written to the output").add(
+                bytes_written, "_total", spider=spider,
+            ),
+            MetricFamily("ecommercecrawl_items_per_second", "gauge", "Items scraped per second").add(
+                items_per_second, spider=spider,
+            ),
+            MetricFamily(
+                "ecommercecrawl_output_bytes_per_second", "gauge", "Output bytes written per second",
+            ).add(bytes_per_second, spider=spider),
+        ]
+        return families
@@ -0,0 +1,270 @@
+"""
+Conditional-request HTTP cache (HTTPCACHE_ENABLED).
+
+`ConditionalCachePolicy` keeps every direct GET response that carries an
+ETag or Last-Modified validator and never serves it without asking the
+site: the next run sends If-None-Match / If-Modified-Since, and a 304 is
+answered with the cached body, so an unchanged listing page costs a
+header-only round trip. Cache-Control is ignored; crawler API requests are
+not cached, since the API does not pass validators through.
+
+`LRUFilesystemCacheStorage` is Scrapy's filesystem storage bounded to
+HTTPCACHE_MAX_SIZE_MB per spider, evicting least recently used entries.
+With HTTPCACHE_S3_PREFIX the spider's cache directory is restored from S3
+as a tar.gz when the spider opens and uploaded again when it closes, so
+ECS tasks share validators across runs. Level's catalog API calls, which go
+through `requests` outside the downloader, use the same storage through
+`requests_get()`.
+
+Hit rates are written to stats as httpcache/hit_rate and
+httpcache/requests/hit_rate.
+"""
+import logging
+import os
+import shutil
+import tarfile
+from collections import OrderedDict
+
+import requests
+import scrapy
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+
+from ecommercecrawl.crawler_api.local_api import LOCAL_API_META_KEY
+from ecommercecrawl.s3_utils import split_s3_uri
+
+logger = logging.getLogger(__name__)
+
+# Response headers that describe the transfer, not the body requests decoded.
+_TRANSFER_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+# spider name -> open storage, so spiders can reach the middleware's cache.
+_open_storages = {}
+
+
+def _dir_size(path):
+    return sum(
+        entry.stat().st_size for entry in os.scandir(path) if entry.is_file()
+    )
+
+
+def _has_validators(headers):
+    return b"ETag" in headers or b"Last-Modified" in headers
+
+
+def _hit_rate(stats, prefix):
+    hits = (stats.get_value(f"{prefix}hit") or 0) + (stats.get_value(f"{prefix}revalidate") or 0)
+    lookups = hits + sum(
+        stats.get_value(f"{prefix}{name}") or 0 for name in ("miss", "invalidate")
+    )
+    if lookups:
+        stats.set_value(f"{prefix}hit_rate", round(hits / lookups, 4))
+
+
+class LRUIndex:
+    """Sizes of cache entry directories under `root`, least recently used first."""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        # entry path -> bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self._scan()
+
+    def _scan(self):
+        if not os.path.isdir(self.root):
+            return
+        found = []
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.is_dir():
+                    found.append((entry.stat().st_mtime, entry.path))
+        for _, path in sorted(found):
+            size = _dir_size(path)
+            self.entries[path] = size
+            self.total_bytes += size
+
+    def touch(self, path):
+        if path in self.entries:
+            self.entries.move_to_end(path)
+            os.utime(path)
+
+    def add(self, path):
+        """Account for a written entry; returns the number of entries evicted."""
+        size = _dir_size(path)
+        self.total_bytes += size - self.entries.get(path, 0)
+        self.entries[path] = size
+        self.entries.move_to_end(path)
+        return self.evict()
+
+    def evict(self):
+        evicted = 0
+        # The entry just written always stays.
+        while self.max_bytes and self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            path, size = self.entries.popitem(last=False)
+            shutil.rmtree(path, ignore_errors=True)
+            self.total_bytes -= size
+            evicted += 1
+        return evicted
+
+
+class ConditionalCachePolicy:
+    def __init__(self, settings):
+        self.settings = settings
+
+    def should_cache_request(self, request):
+        if request.method != "GET":
+            return False
+        return "zyte_api" not in request.meta and LOCAL_API_META_KEY not in request.meta
+
+    def should_cache_response(self, response, request):
+        return response.status == 200 and _has_validators(response.headers)
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        # Always revalidate; a 304 costs no body.
+        if b"ETag" in cachedresponse.headers:
+            request.headers[b"If-None-Match"] = cachedresponse.headers[b"ETag"]
+        if b"Last-Modified" in cachedresponse.headers:
+            request.headers[b"If-Modified-Since"] = cachedresponse.headers[b"Last-Modified"]
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return response.status == 304
+
+
+class LRUFilesystemCacheStorage(FilesystemCacheStorage):
+    def __init__(self, settings):
+        super().__init__(settings)
+        # Relative to the working directory like the other state directories,
+        # not to Scrapy's project data dir.
+        self.cachedir = settings.get("HTTPCACHE_DIR") or "output/state/httpcache"
+        self.max_bytes = int(settings.getfloat("HTTPCACHE_MAX_SIZE_MB", 512) * 1024 * 1024)
+        self.s3_prefix = settings.get("HTTPCACHE_S3_PREFIX")
+        self.index = None
+        self.stats = None
+
+    @classmethod
+    def for_spider(cls, spider):
+        """The storage opened for `spider`, or None when the cache is disabled."""
+        return _open_storages.get(spider.name)
+
+    def _spider_dir(self, spider):
+        return os.path.join(self.cachedir, spider.name)
+
+    def _s3_location(self, spider):
+        bucket, prefix = split_s3_uri(self.s3_prefix)
+        key = f"{spider.name}.tar.gz"
+        return bucket, f"{prefix}/{key}" if prefix else key
+
+    def open_spider(self, spider):
+        super().open_spider(spider)
+        self.stats = spider.crawler.stats
+        if self.s3_prefix:
+            self._download(spider)
+        self.index = LRUIndex(self._spider_dir(spider), self.max_bytes)
+        self.stats.set_value("httpcache/entries_at_start", len(self.index.entries))
+        _open_storages[spider.name] = self
+
+    def close_spider(self, spider):
+        _open_storages.pop(spider.name, None)
+        self.stats.set_value("httpcache/size_bytes", self.index.total_bytes)
+        _hit_rate(self.stats, "httpcache/")
+        _hit_rate(self.stats, "httpcache/requests/")
+        if self.s3_prefix:
+            try:
+                self._upload(spider)
+            except Exception as exc:
+                # The crawl output matters more than the cache.
+                spider.logger.error(f"Failed to upload HTTP cache: {exc}")
+
+    def _download(self, spider):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        bucket, key = self._s3_location(spider)
+        archive_path = f"{self._spider_dir(spider)}.tar.gz"
+        os.makedirs(self.cachedir, exist_ok=True)
+        try:
+            boto3.client("s3").download_file(bucket, key, archive_path)
+        except ClientError as exc:
+            logger.info("No HTTP cache at s3://%s/%s: %s", bucket, key, exc)
+            return
+        with tarfile.open(archive_path, "r:gz") as archive:
+            # The "data" filter refuses absolute paths and links out of the cache.
+            extract_kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+            archive.extractall(self.cachedir, **extract_kwargs)
+        os.remove(archive_path)
+        self.stats.set_value("httpcache/s3_restored", 1)
+
+    def _upload(self, spider):
+        import boto3
+
+        archive_path = f"{self._spider_dir(spider)}.tar.gz"
+        with tarfile.open(archive_path, "w:gz") as archive:
+            archive.add(self._spider_dir(spider), arcname=spider.name)
+        bucket, key = self._s3_location(spider)
+        boto3.client("s3").upload_file(archive_path, bucket, key)
+        os.remove(archive_path)
+
+    def retrieve_response(self, spider, request):
+        response = super().retrieve_response(spider, request)
+        if response is not None:
+            self.index.touch(self._get_request_path(spider, request))
+        return response
+
+    def store_response(self, spider, request, response):
+        super().store_response(spider, request, response)
+        evicted = self.index.add(self._get_request_path(spider, request))
+        if evicted:
+            self.stats.inc_value("httpcache/evicted", evicted)
+
+    def requests_get(self, spider, url, params=None, headers=None, **kwargs):
+        """`requests.get` with conditional requests against this cache."""
+        prepared_url = requests.Request("GET", url, params=params).prepare().url
+        cache_request = scrapy.Request(prepared_url)
+        cached = self.retrieve_response(spider, cache_request)
+
+        headers = dict(headers or {})
+        if cached is not None:
+            if b"ETag" in cached.headers:
+                headers["If-None-Match"] = cached.headers[b"ETag"].decode("latin-1")
+            if b"Last-Modified" in cached.headers:
+                headers["If-Modified-Since"] = cached.headers[b"Last-Modified"].decode("latin-1")
+        response = requests.get(prepared_url, headers=headers, **kwargs)
+
+        if cached is None:
+            self.stats.inc_value("httpcache/requests/miss")
+        elif response.status_code == 304:
+            self.stats.inc_value("httpcache/requests/revalidate")
+            return self._requests_response(prepared_url, cached)
+        else:
+            self.stats.inc_value("httpcache/requests/invalidate")
+
+        if response.status_code == 200 and (
+            "ETag" in response.headers or "Last-Modified" in response.headers
+        ):
+            stored_headers = {
+                name: value for name, value in response.headers.items()
+                if name.lower() not in _TRANSFER_HEADERS
+            }
+            self.store_response(
+                spider,
+                cache_request,
+                scrapy.http.Response(prepared_url, status=200, headers=stored_headers, body=response.content),
+            )
+            self.stats.inc_value("httpcache/requests/store")
+        return response
+
+    @staticmethod
+    def _requests_response(url, cached):
+        response = requests.models.Response()
+        response.url = url
+        response.status_code = cached.status
+        response.headers.update({
+            name.decode("latin-1"): values[-1].decode("latin-1")
+            for name, values in cached.headers.items()
+        })
+        response._content = cached.body
+        return response
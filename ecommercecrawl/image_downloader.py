@@ -15,6 +15,7 @@ from ecommercecrawl.constants import farfetch_constants
 from ecommercecrawl.constants import level_constants
 from ecommercecrawl.constants import ounass_constants
 from ecommercecrawl.constants.mastercrawl_constants import RUN_ID_DATETIME_FORMAT
+from ecommercecrawl.fingerprints import FingerprintSet
 
 
 logger = logging.getLogger(__name__)
@@ -435,7 +436,7 @@ def download_jobs(
     s3_client = boto3.client("s3") if storage_mode in ("s3", "both") and s3_bucket else None
     results: List[dict] = []
     deduped: List[dict] = []
-    seen_job_ids = set()
+    seen_job_ids = FingerprintSet()
 
     for job in jobs:
         try:
@@ -455,7 +456,7 @@ def download_jobs(
             )
             continue
 
-        if job_id in seen_job_ids:
+        if not seen_job_ids.add(job_id):
             results.append(
                 _result_blob(
                     status=STATUS_SKIPPED_DUPLICATE,
@@ -471,7 +472,6 @@ def download_jobs(
                 )
             )
             continue
-        seen_job_ids.add(job_id)
         deduped.append(job)
 
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
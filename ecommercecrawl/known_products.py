@@ -0,0 +1,101 @@
+"""
+Per-spider set of product URLs seen in earlier crawls.
+
+Listing mode uses it to decide which PDPs still need a full fetch. The set is
+a plain text file with one canonical product URL per line. It is loaded into a
+FingerprintSet at first use, and URLs added during the crawl are appended when
+the spider closes. When KNOWN_PRODUCTS_S3_PREFIX is set, the file is
+downloaded before the crawl and uploaded again after saving, so ECS tasks
+without a persistent disk keep it between runs.
+"""
+import logging
+import os
+
+from ecommercecrawl.constants.mastercrawl_constants import KNOWN_PRODUCTS_DIR
+from ecommercecrawl.fingerprints import FingerprintSet
+from ecommercecrawl.s3_utils import is_missing_object, split_s3_uri
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_product_url(url):
+    """Product URLs are compared without query string or fragment."""
+    return url.split("#", 1)[0].split("?", 1)[0]
+
+
+class KnownProducts:
+    def __init__(self, path, s3_uri=None):
+        self.path = path
+        self.s3_uri = s3_uri
+        self.urls = FingerprintSet()
+        # URLs added since the last save, in the order they were seen.
+        self.added = []
+        if s3_uri:
+            self._download_snapshot()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self.urls.add(line.strip())
+
+    @classmethod
+    def from_settings(cls, settings, spider_name):
+        """Return the store for `spider_name`, or None when settings are missing."""
+        if settings is None:
+            return None
+        directory = settings.get("KNOWN_PRODUCTS_DIR") or KNOWN_PRODUCTS_DIR
+        filename = f"{spider_name}.txt"
+        s3_prefix = settings.get("KNOWN_PRODUCTS_S3_PREFIX")
+        s3_uri = f"{s3_prefix.rstrip('/')}/{filename}" if s3_prefix else None
+        return cls(os.path.join(directory, filename), s3_uri=s3_uri)
+
+    def _download_snapshot(self):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        bucket, key = split_s3_uri(self.s3_uri)
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        tmp_path = f"{self.path}.download"
+        try:
+            boto3.client("s3").download_file(bucket, key, tmp_path)
+        except ClientError as exc:
+            # Starting empty after any other error would overwrite the
+            # snapshot with a partial set on save.
+            if not is_missing_object(exc):
+                raise
+            # First run for this spider: start from an empty set.
+            logger.info("No known products snapshot at %s: %s", self.s3_uri, exc)
+            return
+        os.replace(tmp_path, self.path)
+
+    def _upload_snapshot(self):
+        import boto3
+
+        bucket, key = split_s3_uri(self.s3_uri)
+        boto3.client("s3").upload_file(self.path, bucket, key)
+
+    def __contains__(self, url):
+        return canonical_product_url(url) in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def add(self, url):
+        url = canonical_product_url(url)
+        if self.urls.add(url):
+            self.added.append(url)
+
+    def save(self):
+        """Append the URLs added since the last save to the file."""
+        if not self.added:
+            return
+        parent = os.path.dirname(self.path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(url + "\n" for url in self.added)
+        self.added = []
+        if self.s3_uri:
+            self._upload_snapshot()
@@ -0,0 +1,92 @@
+"""
+OpenMetrics text for live crawl stats (see OpenMetricsExtension).
+
+Families are built per crawler, merged across the crawlers of the process
+by name and rendered in the OpenMetrics text format, which Prometheus and
+node_exporter's textfile collector also read.
+"""
+import math
+from bisect import bisect_left
+from dataclasses import dataclass, field
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Upper bounds, in seconds, of the download latency histogram buckets.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+@dataclass
+class MetricFamily:
+    name: str
+    type: str
+    help: str
+    # (sample name suffix, labels, value)
+    samples: list = field(default_factory=list)
+
+    def add(self, value, suffix="", **labels):
+        self.samples.append((suffix, labels, value))
+        return self
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+
+    def add_samples(self, family, **labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            cumulative += count
+            family.add(cumulative, "_bucket", **labels, le=_format_value(float(bound)))
+        family.add(self.count, "_bucket", **labels, le="+Inf")
+        family.add(self.count, "_count", **labels)
+        family.add(round(self.sum, 6), "_sum", **labels)
+
+
+def render(families):
+    """OpenMetrics text for `families`; families sharing a name are merged."""
+    merged = {}
+    for family in families:
+        existing = merged.get(family.name)
+        if existing is None:
+            merged[family.name] = MetricFamily(family.name, family.type, family.help, list(family.samples))
+        else:
+            existing.samples.extend(family.samples)
+
+    lines = []
+    for family in merged.values():
+        lines.append(f"# TYPE {family.name} {family.type}")
+        lines.append(f"# HELP {family.name} {_escape(family.help)}")
+        for suffix, labels, value in family.samples:
+            lines.append(f"{family.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
@@ -1,20 +1,86 @@
-from collections import defaultdict
+import base64
+import json
+import pickle
+import random
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
 from urllib.parse import urlparse
 
+import scrapy
+from scrapy import signals
 from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.request import request_from_dict
 from scrapy.utils.response import response_status_message
-from twisted.internet.task import deferLater
+from twisted.internet.defer import Deferred
+from twisted.internet.task import LoopingCall
 
+from ecommercecrawl.checkpoint import (
+    CHECKPOINT_META_KEY,
+    CrawlCheckpoint,
+    checkpoint_restoring,
+    checkpoint_saving,
+)
+from ecommercecrawl.crawler_api import build_crawler_api_request, get_crawler_api_service
+from ecommercecrawl.crawler_api.escalation import DIRECT_LEVEL, EscalationPolicy
+from ecommercecrawl.crawler_api.local_api import LOCAL_API_META_KEY
+from ecommercecrawl.fingerprints import FingerprintSet
+from ecommercecrawl.sharding import ShardFrontier, ShardSpec
 
-def _sleep(seconds):
+
+def get_retry_after_seconds(response, now=None):
     """
-    Async sleep for 'seconds' using Twisted reactor.
-    Unlike time.sleep(), this won’t block the entire Scrapy engine.
+    Seconds asked for by a response's Retry-After header, or None.
+
+    Both forms are accepted: delay-seconds ("120") and an HTTP-date
+    ("Wed, 21 Oct 2015 07:28:00 GMT"), which is counted from `now` (epoch
+    seconds, defaults to the current time). Dates in the past give 0.
     """
+    if response is None:
+        return None
+    retry_after_header = response.headers.get(b"Retry-After")
+    if not retry_after_header:
+        return None
+    value = retry_after_header.decode("latin-1").strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        # RFC 9110 dates are always GMT.
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, retry_at.timestamp() - (time.time() if now is None else now))
+
+
+def _reactor():
     # Import lazily so Scrapy can install the configured asyncio reactor first.
     from twisted.internet import reactor
 
-    return deferLater(reactor, seconds, lambda: None)
+    return reactor
+
+
+# Lowest RETRY_AFTER_RELEASE_RATE, in retries per second.
+MIN_RETRY_RELEASE_RATE = 0.01
+
+
+class _DomainRetryQueue:
+    def __init__(self, burst, now):
+        # (deferred, retry request, time it was parked)
+        self.requests = deque()
+        # No retry is released before this time.
+        self.ready_at = now
+        self.tokens = float(burst)
+        self.last_refill = now
+        self.call = None
 
 
 class RetryAfterMiddleware(RetryMiddleware):
@@ -24,7 +90,7 @@ class RetryAfterMiddleware(RetryMiddleware):
     - Keeps a penalty per domain (www.farfetch.com, etc.)
     - Domain delay grows exponentially with repeated 429/5xx
     - Domain delay is used for:
-        * per-request retry sleep
+        * the wait before a domain's parked retries are released
         * the downloader slot delay (so *all* requests slow down)
     - When responses start succeeding, the penalty decays and the
       domain delay shrinks back toward a base delay.
@@ -35,6 +101,20 @@ class RetryAfterMiddleware(RetryMiddleware):
     RETRY_AFTER_MAX_DELAY    = 180.0 # max domain delay in seconds
     RETRY_AFTER_DECAY        = 1     # how much to reduce penalty on success
     RETRY_AFTER_MAX_SLOT_DELAY = 60.0  # cap for slot.delay
+    RETRY_AFTER_MIN_SLOT_DELAY = None  # floor for slot.delay; defaults to DOWNLOAD_DELAY
+    RETRY_AFTER_RELEASE_RATE   = 1.0   # retries released per second per domain (at least 0.01)
+    RETRY_AFTER_RELEASE_BURST  = 2     # retries released at once when a domain wakes up
+    RETRY_AFTER_JITTER         = 0.5   # random extra wait, as a fraction of each wait
+
+    Retries are not slept one by one: they are parked in a queue per domain
+    that wakes up once the domain delay (or Retry-After) has passed and then
+    releases them through a token bucket with jitter, so a burst of 429s
+    does not come back as a burst of retries. A new throttled answer pushes
+    the wake-up time of the whole queue. Queue depth and wait times are
+    kept in stats under retry_after/{domain}/.
+
+    With AIMD_ENABLED, slot delays are left to AdaptiveConcurrencyExtension;
+    retries still sleep for the domain delay.
     """
 
     def __init__(self, settings):
@@ -52,7 +132,25 @@ class RetryAfterMiddleware(RetryMiddleware):
         dl_delay = settings.getfloat("DOWNLOAD_DELAY", 0.0)
         at_start = settings.getfloat("AUTOTHROTTLE_START_DELAY", 0.0)
         self.min_slot_delay = dl_delay or at_start or 0.25
+        if settings.get("RETRY_AFTER_MIN_SLOT_DELAY") is not None:
+            self.min_slot_delay = settings.getfloat("RETRY_AFTER_MIN_SLOT_DELAY")
         self.max_slot_delay = settings.getfloat("RETRY_AFTER_MAX_SLOT_DELAY", self.max_delay)
+        # AdaptiveConcurrencyExtension owns slot delays when it is enabled.
+        self.manage_slot_delay = not settings.getbool("AIMD_ENABLED", False)
+
+        # A rate of 0 or less would never release parked retries.
+        self.release_rate = max(MIN_RETRY_RELEASE_RATE, settings.getfloat("RETRY_AFTER_RELEASE_RATE", 1.0))
+        self.release_burst = max(1, settings.getint("RETRY_AFTER_RELEASE_BURST", 2))
+        self.jitter = settings.getfloat("RETRY_AFTER_JITTER", 0.5)
+        # domain -> _DomainRetryQueue
+        self.retry_queues = {}
+        self._clock = None
+
+    @property
+    def clock(self):
+        if self._clock is None:
+            self._clock = _reactor()
+        return self._clock
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -61,7 +159,8 @@ class RetryAfterMiddleware(RetryMiddleware):
     # ------------------------------------------------------------------ helpers
 
     def _get_domain(self, request):
-        return urlparse(request.url).netloc
+        # Crawler API requests queue by target site, not by API endpoint.
+        return urlparse(get_target_url(request)).netloc
 
     def _calc_domain_delay_from_penalty(self, penalty):
         """
@@ -79,6 +178,8 @@ class RetryAfterMiddleware(RetryMiddleware):
         Set the downloader slot delay for this domain to the given delay.
         This controls how often *any* request to that domain is fired.
         """
+        if not self.manage_slot_delay:
+            return
         key = request.meta.get("download_slot") or urlparse(request.url).hostname
         slot = spider.crawler.engine.downloader.slots.get(key)
         if not slot:
@@ -104,14 +205,7 @@ class RetryAfterMiddleware(RetryMiddleware):
 
         exp_delay = self._calc_domain_delay_from_penalty(penalty)
 
-        retry_after_delay = None
-        if response is not None:
-            retry_after_header = response.headers.get(b"Retry-After")
-            if retry_after_header:
-                try:
-                    retry_after_delay = float(retry_after_header.decode())
-                except Exception:
-                    retry_after_delay = None
+        retry_after_delay = get_retry_after_seconds(response)
 
         if retry_after_delay is not None:
             # prioritize retry_after_delay
@@ -139,6 +233,60 @@ class RetryAfterMiddleware(RetryMiddleware):
         delay = self._calc_domain_delay_from_penalty(new_penalty)
         return delay, new_penalty
 
+    # -------------------------------------------------------------- retry queue
+
+    def _jittered(self, seconds):
+        return seconds * (1 + random.uniform(0, self.jitter))
+
+    def _enqueue_retry(self, domain, retry_req, delay, spider):
+        """Park `retry_req` until the domain queue releases it; returns a Deferred."""
+        now = self.clock.seconds()
+        queue = self.retry_queues.get(domain)
+        if queue is None:
+            queue = self.retry_queues[domain] = _DomainRetryQueue(self.release_burst, now)
+        queue.ready_at = max(queue.ready_at, now + delay)
+        deferred = Deferred()
+        queue.requests.append((deferred, retry_req, now))
+
+        stats = spider.crawler.stats
+        stats.inc_value(f"retry_after/{domain}/queued")
+        stats.set_value(f"retry_after/{domain}/queue_depth", len(queue.requests))
+        stats.max_value(f"retry_after/{domain}/max_queue_depth", len(queue.requests))
+        if queue.call is None:
+            queue.call = self.clock.callLater(self._jittered(delay), self._release, domain, spider)
+        return deferred
+
+    def _release(self, domain, spider):
+        queue = self.retry_queues[domain]
+        queue.call = None
+        now = self.clock.seconds()
+        if now < queue.ready_at:
+            # Pushed back by a throttled answer while waiting.
+            queue.call = self.clock.callLater(
+                self._jittered(queue.ready_at - now), self._release, domain, spider,
+            )
+            return
+
+        queue.tokens = min(
+            self.release_burst,
+            queue.tokens + (now - queue.last_refill) * self.release_rate,
+        )
+        queue.last_refill = now
+        stats = spider.crawler.stats
+        while queue.requests and queue.tokens >= 1:
+            queue.tokens -= 1
+            deferred, retry_req, parked_at = queue.requests.popleft()
+            waited = now - parked_at
+            stats.inc_value(f"retry_after/{domain}/released")
+            stats.inc_value(f"retry_after/{domain}/wait_seconds", round(waited, 3))
+            stats.max_value(f"retry_after/{domain}/max_wait_seconds", round(waited, 3))
+            deferred.callback(retry_req)
+        stats.set_value(f"retry_after/{domain}/queue_depth", len(queue.requests))
+
+        if queue.requests:
+            wait = (1 - queue.tokens) / self.release_rate
+            queue.call = self.clock.callLater(self._jittered(wait), self._release, domain, spider)
+
     # ---------------------------------------------------------------- middleware
 
     def process_response(self, request, response, spider):
@@ -165,8 +313,8 @@ class RetryAfterMiddleware(RetryMiddleware):
                     f"domain_delay={delay:.2f}s"
                 )
 
-                # Sleep domain_delay before retrying this request
-                return _sleep(delay).addCallback(lambda _: retry_req)
+                # Released by the domain queue once domain_delay has passed
+                return self._enqueue_retry(domain, retry_req, delay, spider)
 
             # Max retries reached → still let domain cool down a bit
             delay, new_penalty = self._decay_penalty_and_get_delay(domain)
@@ -201,4 +349,819 @@ class RetryAfterMiddleware(RetryMiddleware):
             f"domain_delay={delay:.2f}s"
         )
 
-        return _sleep(delay).addCallback(lambda _: retry_req)
+        return self._enqueue_retry(domain, retry_req, delay, spider)
+
+
+class LocalCrawlerAPIMiddleware:
+    """
+    Decode answers from the local stand-in crawler API.
+
+    Requests built by `crawler_api.local_api` are POSTed to the local server
+    with a Zyte-shaped body. A 200 answer carries the target `statusCode` and
+    either `httpResponseBody` (base64) or `browserHtml`; it is rebuilt as a
+    response for the original URL so spider callbacks are unchanged. Other
+    API statuses (injected 429 bursts and errors) pass through untouched so
+    the retry middlewares treat them like real API throttling.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if get_crawler_api_service(crawler.settings) != "local":
+            raise NotConfigured("Crawler API service is not local")
+        return cls()
+
+    def process_response(self, request, response, spider):
+        api_body = request.meta.get(LOCAL_API_META_KEY)
+        if not api_body or response.status != 200:
+            return response
+
+        try:
+            payload = json.loads(response.text)
+        except ValueError:
+            spider.logger.warning(f"[LocalCrawlerAPI] Non-JSON API answer for {api_body.get('url')}")
+            return response
+
+        target_url = api_body["url"]
+        headers = {
+            header["name"]: header["value"]
+            for header in payload.get("httpResponseHeaders") or []
+        }
+        if "browserHtml" in payload:
+            body = (payload.get("browserHtml") or "").encode("utf-8")
+            headers.setdefault("Content-Type", "text/html; charset=utf-8")
+        else:
+            body = base64.b64decode(payload.get("httpResponseBody") or "")
+
+        response_cls = responsetypes.from_args(headers=headers, url=target_url, body=body)
+        return response_cls(
+            url=target_url,
+            status=int(payload.get("statusCode", 200)),
+            headers=headers,
+            body=body,
+            request=request.replace(url=target_url, method="GET", body=b""),
+        )
+
+
+def get_target_url(request):
+    """URL of the page a request fetches, also for local crawler API POSTs."""
+    api_body = request.meta.get(LOCAL_API_META_KEY)
+    if api_body:
+        return api_body["url"]
+    return request.url
+
+
+# Request meta key holding the escalation level a request was sent at.
+ESCALATION_LEVEL_META_KEY = "crawler_api_escalation_level"
+
+
+class CrawlerAPIEscalationMiddleware:
+    """
+    Escalate blocked hosts from direct fetches to the crawler API.
+
+    Every host starts on direct Scrapy requests. Once it answers with
+    CRAWLER_API_ESCALATION_STATUSES often enough (see EscalationPolicy), its
+    direct GET requests are rebuilt with `build_crawler_api_request`, first
+    as `http_response`, then as `rendered_html`, and blocked answers to
+    requests sent below the host's new level are re-issued at that level.
+    After CRAWLER_API_ESCALATION_COOLDOWN_SECONDS the host steps back down.
+
+    Requests the spider already sends through the crawler API (Ounass) and
+    requests with `dont_escalate` in meta are left alone. Levels and
+    escalations are kept in stats under crawler_api/escalation/{host}/.
+    """
+
+    def __init__(self, crawler, policy, statuses, clock=None):
+        self.crawler = crawler
+        self.settings = crawler.settings
+        self.stats = crawler.stats
+        self.policy = policy
+        self.statuses = statuses
+        self._clock = clock
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("CRAWLER_API_ESCALATION_ENABLED", False):
+            raise NotConfigured("Crawler API escalation is disabled")
+        if get_crawler_api_service(settings) == "zyte" and not settings.getbool("ZYTE_API_ENABLED"):
+            raise NotConfigured("Crawler API escalation needs ZYTE_API_ENABLED or CRAWLER_API_SERVICE=local")
+        statuses = {
+            int(status)
+            for status in settings.getlist("CRAWLER_API_ESCALATION_STATUSES", [403, 429, 503])
+        }
+        return cls(crawler, EscalationPolicy.from_settings(settings), statuses)
+
+    @property
+    def clock(self):
+        if self._clock is None:
+            self._clock = _reactor()
+        return self._clock
+
+    @staticmethod
+    def _is_crawler_api_request(request):
+        return "zyte_api" in request.meta or LOCAL_API_META_KEY in request.meta
+
+    def _escalate(self, request, url, level):
+        hostname = self.policy.get_hostname(url)
+        request_type = self.policy.request_type(level)
+        meta = {
+            key: value for key, value in request.meta.items()
+            if key not in ("zyte_api", LOCAL_API_META_KEY)
+        }
+        meta[ESCALATION_LEVEL_META_KEY] = level
+        self.stats.inc_value(f"crawler_api/escalation/{hostname}/requests/{request_type}")
+        return build_crawler_api_request(
+            url=url,
+            callback=request.callback,
+            settings=self.settings,
+            request_type=request_type,
+            meta=meta,
+            errback=request.errback,
+            cb_kwargs=request.cb_kwargs,
+            priority=request.priority,
+            # The escalated request replaces one the dupe filter already saw.
+            dont_filter=True,
+        )
+
+    def process_request(self, request, spider):
+        # Only direct GETs can be rebuilt as crawler API requests.
+        if (
+            self._is_crawler_api_request(request)
+            or request.method != "GET"
+            or request.meta.get("dont_escalate")
+        ):
+            return None
+        hostname = self.policy.get_hostname(request.url)
+        previous = self.policy.levels.get(hostname, DIRECT_LEVEL)
+        level = self.policy.level(hostname, self.clock.seconds())
+        if level < previous:
+            self.stats.inc_value(f"crawler_api/escalation/{hostname}/deescalations")
+            self.stats.set_value(f"crawler_api/escalation/{hostname}/level", level)
+            spider.logger.info(f"[Escalation] Cool-down over, {hostname} steps down to level {level}")
+        if level == DIRECT_LEVEL:
+            request.meta[ESCALATION_LEVEL_META_KEY] = DIRECT_LEVEL
+            return None
+        return self._escalate(request, request.url, level)
+
+    def process_response(self, request, response, spider):
+        level = request.meta.get(ESCALATION_LEVEL_META_KEY)
+        if level is None:
+            return response
+        url = get_target_url(request)
+        hostname = self.policy.get_hostname(url)
+        blocked = response.status in self.statuses
+        now = self.clock.seconds()
+        new_level = self.policy.record(hostname, level, blocked, now)
+        if new_level is not None:
+            self.stats.inc_value(f"crawler_api/escalation/{hostname}/escalations")
+            self.stats.set_value(f"crawler_api/escalation/{hostname}/level", new_level)
+            spider.logger.warning(
+                f"[Escalation] {hostname} is blocking; escalating to "
+                f"{self.policy.request_type(new_level)}"
+            )
+        current = self.policy.level(hostname, now)
+        if blocked and current > level:
+            self.stats.inc_value(f"crawler_api/escalation/{hostname}/reissued")
+            return self._escalate(request, url, current)
+        return response
+
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# Request meta flag of the single request sent while a breaker is half-open.
+CIRCUIT_PROBE_META_KEY = "circuit_breaker_probe"
+
+
+@dataclass
+class _DomainCircuit:
+    state: str = CIRCUIT_CLOSED
+    # (time, failed) of responses within the error-rate window
+    outcomes: deque = field(default_factory=deque)
+    opened_at: Optional[float] = None
+    failed_probes: int = 0
+    probe_in_flight: bool = False
+    given_up: bool = False
+    parked: list = field(default_factory=list)
+
+
+class CircuitBreakerMiddleware:
+    """
+    Downloader middleware with a circuit breaker per target domain.
+
+    Closed: responses are recorded over CIRCUIT_BREAKER_WINDOW_SECONDS. Once
+    the window holds CIRCUIT_BREAKER_MIN_REQUESTS responses and the share of
+    CIRCUIT_BREAKER_STATUSES (403 bans, 429/503 throttling) and download
+    errors reaches CIRCUIT_BREAKER_ERROR_RATE, the breaker opens.
+
+    Open: requests for the domain are parked here instead of downloaded
+    (IgnoreRequest towards the engine), and the spider is kept open while
+    any are parked. After CIRCUIT_BREAKER_OPEN_SECONDS the breaker is
+    half-open and sends a single parked request as a probe. A successful
+    probe closes the breaker and schedules the parked requests again; a
+    failed one reopens it for twice as long, up to
+    CIRCUIT_BREAKER_MAX_OPEN_SECONDS. After CIRCUIT_BREAKER_MAX_PROBES failed
+    probes in a row the domain is given up and its requests are dropped.
+
+    Trips, open time and parked/dropped requests are kept in stats under
+    circuit_breaker/{domain}/ and surface in the manifest.
+    """
+
+    def __init__(self, crawler, clock=None):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.statuses = {int(status) for status in settings.getlist("CIRCUIT_BREAKER_STATUSES", [403, 429, 503])}
+        self.window = settings.getfloat("CIRCUIT_BREAKER_WINDOW_SECONDS", 60)
+        self.min_requests = settings.getint("CIRCUIT_BREAKER_MIN_REQUESTS", 10)
+        self.error_rate = settings.getfloat("CIRCUIT_BREAKER_ERROR_RATE", 0.5)
+        self.open_seconds = settings.getfloat("CIRCUIT_BREAKER_OPEN_SECONDS", 60)
+        self.max_open_seconds = settings.getfloat("CIRCUIT_BREAKER_MAX_OPEN_SECONDS", 600)
+        self.max_probes = settings.getint("CIRCUIT_BREAKER_MAX_PROBES", 5)
+        self._clock = clock
+        # domain -> _DomainCircuit
+        self.circuits = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("CIRCUIT_BREAKER_ENABLED", False):
+            raise NotConfigured("Circuit breaker is disabled")
+        middleware = cls(crawler)
+        crawler.signals.connect(middleware.spider_idle, signal=signals.spider_idle)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    @property
+    def clock(self):
+        if self._clock is None:
+            self._clock = _reactor()
+        return self._clock
+
+    def _get_domain(self, request):
+        return urlparse(get_target_url(request)).hostname or ""
+
+    def _get_circuit(self, domain):
+        circuit = self.circuits.get(domain)
+        if circuit is None:
+            circuit = self.circuits[domain] = _DomainCircuit()
+        return circuit
+
+    # ---------------------------------------------------------------- middleware
+
+    def process_request(self, request, spider):
+        domain = self._get_domain(request)
+        circuit = self._get_circuit(domain)
+        if circuit.given_up:
+            self.stats.inc_value(f"circuit_breaker/{domain}/dropped_requests")
+            raise IgnoreRequest(f"Circuit breaker gave up on {domain}")
+        if circuit.state == CIRCUIT_CLOSED or request.meta.get(CIRCUIT_PROBE_META_KEY):
+            return None
+        if circuit.state == CIRCUIT_HALF_OPEN and not circuit.probe_in_flight:
+            self._mark_probe(domain, circuit, request)
+            return None
+        circuit.parked.append(request)
+        self.stats.inc_value(f"circuit_breaker/{domain}/parked_requests")
+        raise IgnoreRequest(f"Circuit breaker open for {domain}")
+
+    def process_response(self, request, response, spider):
+        self._record(request, failed=response.status in self.statuses)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        # Requests ignored by this or other middlewares were never sent,
+        # but a probe always has to settle the breaker.
+        if not isinstance(exception, IgnoreRequest) or request.meta.get(CIRCUIT_PROBE_META_KEY):
+            self._record(request, failed=True)
+        return None
+
+    # ------------------------------------------------------------------- states
+
+    def _record(self, request, failed):
+        domain = self._get_domain(request)
+        circuit = self._get_circuit(domain)
+        if request.meta.pop(CIRCUIT_PROBE_META_KEY, False):
+            circuit.probe_in_flight = False
+            if failed:
+                self._reopen(domain, circuit)
+            else:
+                self._close(domain, circuit)
+            return
+        if circuit.state != CIRCUIT_CLOSED:
+            return
+
+        now = self.clock.seconds()
+        circuit.outcomes.append((now, failed))
+        while circuit.outcomes and circuit.outcomes[0][0] < now - self.window:
+            circuit.outcomes.popleft()
+        failures = sum(1 for _, outcome in circuit.outcomes if outcome)
+        if len(circuit.outcomes) >= self.min_requests and failures / len(circuit.outcomes) >= self.error_rate:
+            self._open(domain, circuit, failures)
+
+    def _open(self, domain, circuit, failures):
+        circuit.state = CIRCUIT_OPEN
+        circuit.opened_at = self.clock.seconds()
+        circuit.outcomes.clear()
+        circuit.failed_probes = 0
+        self.stats.inc_value(f"circuit_breaker/{domain}/trips")
+        self.crawler.spider.logger.warning(
+            f"[CircuitBreaker] Opened for {domain}: {failures} failed responses "
+            f"in the last {self.window:.0f}s; probing again in {self.open_seconds:.0f}s"
+        )
+        self.clock.callLater(self.open_seconds, self._half_open, domain)
+
+    def _reopen(self, domain, circuit):
+        circuit.state = CIRCUIT_OPEN
+        circuit.failed_probes += 1
+        self.stats.inc_value(f"circuit_breaker/{domain}/failed_probes")
+        if self.max_probes and circuit.failed_probes >= self.max_probes:
+            self._give_up(domain, circuit)
+            return
+        delay = min(self.max_open_seconds, self.open_seconds * 2 ** circuit.failed_probes)
+        self.crawler.spider.logger.warning(
+            f"[CircuitBreaker] Probe failed for {domain}; probing again in {delay:.0f}s"
+        )
+        self.clock.callLater(delay, self._half_open, domain)
+
+    def _half_open(self, domain):
+        circuit = self.circuits[domain]
+        if circuit.state != CIRCUIT_OPEN:
+            return
+        circuit.state = CIRCUIT_HALF_OPEN
+        # Without parked requests, the next request for the domain is the probe.
+        if circuit.parked:
+            request = circuit.parked.pop(0)
+            self._mark_probe(domain, circuit, request)
+            # Parked requests already passed the dupe filter once.
+            self.crawler.engine.crawl(request.replace(dont_filter=True))
+
+    def _mark_probe(self, domain, circuit, request):
+        request.meta[CIRCUIT_PROBE_META_KEY] = True
+        circuit.probe_in_flight = True
+        self.stats.inc_value(f"circuit_breaker/{domain}/probes")
+
+    def _close(self, domain, circuit):
+        self._add_open_time(domain, circuit)
+        circuit.state = CIRCUIT_CLOSED
+        circuit.failed_probes = 0
+        parked, circuit.parked = circuit.parked, []
+        self.crawler.spider.logger.info(
+            f"[CircuitBreaker] Closed for {domain}; rescheduling {len(parked)} parked requests"
+        )
+        for request in parked:
+            self.crawler.engine.crawl(request.replace(dont_filter=True))
+
+    def _give_up(self, domain, circuit):
+        self._add_open_time(domain, circuit)
+        circuit.given_up = True
+        self.stats.inc_value(f"circuit_breaker/{domain}/dropped_requests", len(circuit.parked))
+        self.crawler.spider.logger.error(
+            f"[CircuitBreaker] Giving up on {domain} after {circuit.failed_probes} failed probes; "
+            f"dropping {len(circuit.parked)} parked requests"
+        )
+        circuit.parked = []
+
+    def _add_open_time(self, domain, circuit):
+        if circuit.opened_at is None:
+            return
+        self.stats.inc_value(
+            f"circuit_breaker/{domain}/open_seconds",
+            round(self.clock.seconds() - circuit.opened_at, 3),
+        )
+        circuit.opened_at = None
+
+    # ------------------------------------------------------------------ signals
+
+    def spider_idle(self, spider):
+        # Parked requests are not in the scheduler; wait for their breaker.
+        if any(circuit.parked or circuit.probe_in_flight for circuit in self.circuits.values()):
+            raise DontCloseSpider
+
+    def spider_closed(self, spider, reason):
+        # Runs before PostCrawlPipeline writes the manifest.
+        for domain, circuit in self.circuits.items():
+            self._add_open_time(domain, circuit)
+
+
+class CanonicalPDPDedupeMiddleware:
+    """
+    Spider middleware that drops PDP requests for a product already scheduled.
+
+    PDPs reached from several PLPs (category, designer, sale) differ in query
+    strings and path slugs, so Scrapy's fingerprint dedupe keeps them all.
+    Spiders map a PDP request to its canonical product id through
+    `get_canonical_product_id(request)`; requests without an id and
+    `dont_filter` requests (e.g. rendered_html re-issues) always pass.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.seen_product_ids = FingerprintSet()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("PDP_DEDUPE_ENABLED", False):
+            raise NotConfigured("PDP dedupe is disabled")
+        return cls(crawler)
+
+    def _is_duplicate(self, obj, spider):
+        if not isinstance(obj, scrapy.Request) or obj.dont_filter:
+            return False
+        get_product_id = getattr(spider, "get_canonical_product_id", None)
+        product_id = get_product_id(obj) if get_product_id else None
+        if product_id is None:
+            return False
+        if not self.seen_product_ids.add(product_id):
+            self.stats.inc_value("dedupe/pdp_duplicates")
+            spider.logger.debug(f"Dropping duplicate PDP {product_id}: {get_target_url(obj)}")
+            return True
+        self.stats.inc_value("dedupe/pdp_unique")
+        return False
+
+    def process_spider_output(self, response, result, spider):
+        for obj in result:
+            if not self._is_duplicate(obj, spider):
+                yield obj
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for obj in result:
+            if not self._is_duplicate(obj, spider):
+                yield obj
+
+    # Level schedules its PDPs straight from start requests.
+    async def process_start(self, start):
+        async for obj in start:
+            if not self._is_duplicate(obj, self.crawler.spider):
+                yield obj
+
+    def process_start_requests(self, start_requests, spider):
+        for obj in start_requests:
+            if not self._is_duplicate(obj, spider):
+                yield obj
+
+
+class PDPPriorityMiddleware:
+    """
+    Spider middleware that schedules PDP requests ahead of PLP pagination.
+
+    Every PLP page adds a page's worth of PDPs to the scheduler; raising the
+    priority of PDPs (requests the spider maps to a canonical product id)
+    makes the queue drain before more listing pages expand it.
+    """
+
+    def __init__(self, crawler, priority):
+        self.crawler = crawler
+        self.priority = priority
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        priority = crawler.settings.getint("PDP_REQUEST_PRIORITY", 10)
+        if not priority:
+            raise NotConfigured("PDP request priority is disabled")
+        return cls(crawler, priority)
+
+    def _prioritize(self, obj, spider):
+        if not isinstance(obj, scrapy.Request):
+            return obj
+        get_product_id = getattr(spider, "get_canonical_product_id", None)
+        if get_product_id and get_product_id(obj) is not None:
+            obj.priority += self.priority
+        return obj
+
+    def process_spider_output(self, response, result, spider):
+        for obj in result:
+            yield self._prioritize(obj, spider)
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for obj in result:
+            yield self._prioritize(obj, spider)
+
+    async def process_start(self, start):
+        async for obj in start:
+            yield self._prioritize(obj, self.crawler.spider)
+
+    def process_start_requests(self, start_requests, spider):
+        for obj in start_requests:
+            yield self._prioritize(obj, spider)
+
+
+class CheckpointMiddleware:
+    """
+    Spider middleware that checkpoints a crawl so it can be resumed (see
+    ecommercecrawl.checkpoint).
+
+    A request is pending from the moment it is scheduled until the spider
+    has parsed its response. On resume the pending requests are scheduled
+    again ahead of the start requests, and requests parsed before the
+    checkpoint are dropped wherever the spider yields them again.
+
+    Pending requests are pickled when they are scheduled and only their
+    bytes are kept, so the Request objects can leave memory through the
+    CRAWL_JOBDIR disk queues and a save does not serialize the whole queue
+    on the reactor thread.
+    """
+
+    def __init__(self, crawler, checkpoint, interval, state=None):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.checkpoint = checkpoint
+        self.interval = interval
+        self.state = state
+        # checkpoint key -> pickled to_dict() of a scheduled request not parsed yet
+        self.pending = {}
+        # (key, request) just added to `pending`, in case the scheduler drops it
+        self._last_scheduled = None
+        self.parsed = FingerprintSet.from_bytes(state["parsed"]) if state else FingerprintSet()
+        self.resumed = FingerprintSet()
+        self._loop = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        resume_run_id = settings.get("RESUME_RUN_ID")
+        if not (settings.getbool("CHECKPOINT_ENABLED") or resume_run_id):
+            raise NotConfigured("Crawl checkpoints are disabled")
+        spider = crawler.spider
+        checkpoint = CrawlCheckpoint.from_settings(settings, spider.name, spider.run_id)
+        state = None
+        if resume_run_id:
+            state = checkpoint.load()
+            if state is None:
+                raise ValueError(f"No checkpoint found for {spider.name} run {resume_run_id}")
+        middleware = cls(crawler, checkpoint, settings.getfloat("CHECKPOINT_INTERVAL_SECONDS", 300), state)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(middleware.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(middleware.request_dropped, signal=signals.request_dropped)
+        return middleware
+
+    def _fingerprint(self, request):
+        return self.crawler.request_fingerprinter.fingerprint(request).hex()
+
+    def _key(self, request):
+        return request.meta.get(CHECKPOINT_META_KEY) or self._fingerprint(request)
+
+    def request_scheduled(self, request, spider):
+        key = request.meta.setdefault(CHECKPOINT_META_KEY, self._fingerprint(request))
+        self._last_scheduled = None
+        # Retries and redirects reuse the key; keep the request they replace.
+        if key in self.pending:
+            return
+        try:
+            self.pending[key] = pickle.dumps(request.to_dict(spider=spider), protocol=pickle.HIGHEST_PROTOCOL)
+        except ValueError as exc:
+            # Callbacks that are not spider methods cannot be restored.
+            spider.logger.warning(f"Not checkpointing {request.url}: {exc}")
+            return
+        self._last_scheduled = (key, request)
+
+    def request_dropped(self, request, spider):
+        # The scheduler drops a request right after request_scheduled; a
+        # dropped duplicate leaves the request already pending in place.
+        if self._last_scheduled is not None and self._last_scheduled[1] is request:
+            del self.pending[self._last_scheduled[0]]
+        self._last_scheduled = None
+
+    def _mark_parsed(self, response):
+        request = getattr(response, "request", None)
+        if request is None:
+            return
+        key = self._key(request)
+        self.pending.pop(key, None)
+        self.parsed.add(key)
+        # Redirect targets can also be linked directly.
+        self.parsed.add(self._fingerprint(request))
+
+    def _is_done(self, obj):
+        if not isinstance(obj, scrapy.Request) or obj.dont_filter:
+            return False
+        key = self._key(obj)
+        if key in self.parsed or key in self.resumed:
+            self.stats.inc_value("checkpoint/skipped_requests")
+            return True
+        return False
+
+    def process_spider_output(self, response, result, spider):
+        for obj in result:
+            if not self._is_done(obj):
+                yield obj
+        self._mark_parsed(response)
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for obj in result:
+            if not self._is_done(obj):
+                yield obj
+        self._mark_parsed(response)
+
+    def process_spider_exception(self, response, exception, spider):
+        # Failed parses (including HTTP errors) are not retried on resume.
+        self._mark_parsed(response)
+
+    def _resumed_requests(self, spider):
+        for request_dict in self.state.get("pending", []) if self.state else []:
+            if isinstance(request_dict, bytes):
+                request_dict = pickle.loads(request_dict)
+            request = request_from_dict(request_dict, spider=spider)
+            self.resumed.add(self._key(request))
+            self.stats.inc_value("checkpoint/resumed_requests")
+            yield request
+
+    async def process_start(self, start):
+        for request in self._resumed_requests(self.crawler.spider):
+            yield request
+        async for obj in start:
+            if not self._is_done(obj):
+                yield obj
+
+    def process_start_requests(self, start_requests, spider):
+        yield from self._resumed_requests(spider)
+        for obj in start_requests:
+            if not self._is_done(obj):
+                yield obj
+
+    def spider_opened(self, spider):
+        if self.state:
+            self.crawler.signals.send_catch_log(
+                checkpoint_restoring, spider=spider, state=self.state, checkpoint=self.checkpoint,
+            )
+        self._loop = LoopingCall(self.save, spider)
+        self._loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self._loop is not None and self._loop.running:
+            self._loop.stop()
+        self.save(spider, reason)
+
+    def save(self, spider, reason=None):
+        state = {
+            "run_id": spider.run_id,
+            "spider": spider.name,
+            "reason": reason,
+            "pending": list(self.pending.values()),
+            "parsed": self.parsed.to_bytes(),
+        }
+        for _, result in self.crawler.signals.send_catch_log(checkpoint_saving, spider=spider):
+            if isinstance(result, dict):
+                state.update(result)
+        try:
+            self.checkpoint.save(state)
+        except Exception as exc:
+            # A failed upload must not stop the crawl; the next save retries.
+            spider.logger.error(f"Failed to save crawl checkpoint: {exc}")
+            return
+        self.stats.inc_value("checkpoint/saves")
+        self.stats.set_value("checkpoint/pending_requests", len(state["pending"]))
+
+
+class ShardMiddleware:
+    """
+    Spider middleware that keeps a shard to its share of a sharded crawl
+    (see ecommercecrawl.sharding).
+
+    PDP requests for products owned by another shard are dropped, or pushed
+    onto the owner's frontier queue when there is a frontier. Without a
+    frontier every shard reads every listing, so listing rows are only kept
+    by the shard that owns their product. With a frontier, the shard fetches
+    the requests other shards queued for it while idle, and closes once all
+    shards are idle or after SHARD_IDLE_TIMEOUT_SECONDS of waiting.
+    """
+
+    def __init__(self, crawler, shard, frontier=None, batch_size=100, idle_timeout=1800):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.shard = shard
+        self.frontier = frontier
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.waiting_since = None
+        self._clock = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        shard = ShardSpec.from_settings(settings)
+        if shard is None:
+            raise NotConfigured("Crawl is not sharded")
+        spider = crawler.spider
+        frontier = ShardFrontier.from_settings(settings, spider.name, spider.run_id, shard)
+        # Seeds are split by the spider, which needs to know about the frontier.
+        spider.shard_frontier = frontier
+        middleware = cls(
+            crawler,
+            shard,
+            frontier,
+            batch_size=settings.getint("SHARD_FRONTIER_BATCH_SIZE", 100),
+            idle_timeout=settings.getfloat("SHARD_IDLE_TIMEOUT_SECONDS", 1800),
+        )
+        if frontier is not None:
+            crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+            crawler.signals.connect(middleware.spider_idle, signal=signals.spider_idle)
+        return middleware
+
+    @property
+    def clock(self):
+        if self._clock is None:
+            self._clock = _reactor()
+        return self._clock
+
+    @staticmethod
+    def _product_id(request, spider):
+        get_product_id = getattr(spider, "get_canonical_product_id", None)
+        return get_product_id(request) if get_product_id else None
+
+    def _keep_request(self, request, spider):
+        # dont_filter requests re-issue a PDP this shard already fetched.
+        if request.dont_filter:
+            return True
+        product_id = self._product_id(request, spider)
+        if product_id is None:
+            return True
+        if self.frontier is not None and not self.frontier.claim(product_id):
+            self.stats.inc_value("shard/pdp_claimed_elsewhere")
+            return False
+        owner = self.shard.owner(product_id)
+        if owner == self.shard.index:
+            self.stats.inc_value("shard/pdp_owned")
+            return True
+        if self.frontier is None:
+            self.stats.inc_value("shard/pdp_foreign")
+            return False
+        try:
+            self.frontier.push(owner, request.to_dict(spider=spider))
+        except ValueError as exc:
+            # Callbacks that are not spider methods cannot be handed over.
+            spider.logger.warning(f"Fetching foreign PDP {get_target_url(request)} here: {exc}")
+            return True
+        self.stats.inc_value("shard/pdp_handed_off")
+        return False
+
+    def _keep_item(self, item, spider, response):
+        # Every shard reads every listing without a frontier; PDP responses
+        # and frontier-split listings only produce this shard's rows.
+        if self.frontier is not None:
+            return True
+        request = getattr(response, "request", None)
+        if request is not None and self._product_id(request, spider) is not None:
+            return True
+        url = item.get("url") if isinstance(item, dict) else None
+        if not url:
+            return True
+        get_item_product_id = getattr(spider, "get_item_product_id", None)
+        product_id = get_item_product_id(item) if get_item_product_id else None
+        if self.shard.owns(url if product_id is None else product_id):
+            return True
+        self.stats.inc_value("shard/item_foreign")
+        return False
+
+    def _keep(self, obj, spider, response=None):
+        if isinstance(obj, scrapy.Request):
+            return self._keep_request(obj, spider)
+        return self._keep_item(obj, spider, response)
+
+    def process_spider_output(self, response, result, spider):
+        for obj in result:
+            if self._keep(obj, spider, response):
+                yield obj
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for obj in result:
+            if self._keep(obj, spider, response):
+                yield obj
+
+    # Level schedules its PDPs and listing rows straight from start requests.
+    async def process_start(self, start):
+        async for obj in start:
+            if self._keep(obj, self.crawler.spider):
+                yield obj
+
+    def process_start_requests(self, start_requests, spider):
+        for obj in start_requests:
+            if self._keep(obj, spider):
+                yield obj
+
+    def spider_opened(self, spider):
+        self.frontier.set_idle(False)
+
+    def spider_idle(self, spider):
+        # Marked busy before popping, so no shard sees an empty queue and an
+        # idle flag while requests are on their way here.
+        self.frontier.set_idle(False)
+        request_dicts = self.frontier.pop(self.batch_size)
+        if request_dicts:
+            self.waiting_since = None
+            for request_dict in request_dicts:
+                self.crawler.engine.crawl(request_from_dict(request_dict, spider=spider))
+            self.stats.inc_value("shard/pdp_received", len(request_dicts))
+            raise DontCloseSpider
+        self.frontier.set_idle(True)
+        if self.frontier.all_idle():
+            return
+        now = self.clock.seconds()
+        if self.waiting_since is None:
+            self.waiting_since = now
+        if now - self.waiting_since >= self.idle_timeout:
+            spider.logger.warning("Closing shard: other shards stayed busy past SHARD_IDLE_TIMEOUT_SECONDS")
+            self.stats.set_value("shard/idle_timeout", 1)
+            return
+        raise DontCloseSpider
@@ -16,11 +16,15 @@ import gzip
 import shutil
 import boto3
 from botocore.exceptions import NoCredentialsError
+from ecommercecrawl.checkpoint import checkpoint_restoring, checkpoint_saving
 from ecommercecrawl.quality_gate import QualityGateParams
 from ecommercecrawl.quality_gate import evaluate_fail_quality
 from ecommercecrawl.quality_gate import load_blank_field_exceptions
 from ecommercecrawl.quality_gate import load_jsonl_rows
 from ecommercecrawl.quality_gate import RULE_SET_ID
+from ecommercecrawl.sharding import ShardFrontier, ShardSpec, merge_shard_manifests
+from ecommercecrawl.constants.mastercrawl_constants import LISTING_DRIVEN_CRAWL_MODES
+from ecommercecrawl.constants.mastercrawl_constants import LISTING_MODE_PDP_ONLY_FIELDS
 
 
 class EcommercecrawlPipeline:
@@ -29,7 +33,8 @@ class EcommercecrawlPipeline:
 
 
 class JsonlWriterPipeline:
-    def __init__(self):
+    def __init__(self, stats=None):
+        self.stats = stats
         self.file = None
         self.items_written = 0
         self.output_filepath = None
@@ -37,11 +42,41 @@ class JsonlWriterPipeline:
 
     @classmethod
     def from_crawler(cls, crawler):
-        pipeline = cls()
+        pipeline = cls(crawler.stats)
         crawler.signals.connect(pipeline.spider_opened, signals.spider_opened)
         crawler.signals.connect(pipeline.spider_closed, signals.spider_closed)
+        crawler.signals.connect(pipeline.checkpoint_saving, checkpoint_saving)
+        crawler.signals.connect(pipeline.checkpoint_restoring, checkpoint_restoring)
         return pipeline
 
+    def checkpoint_saving(self, spider):
+        """Output file, byte offset and item count for a crawl checkpoint."""
+        offset = 0
+        if self.file:
+            self.file.flush()
+            offset = self.file.tell()
+        return {
+            "writer": {
+                "output_filepath": self.output_filepath,
+                "output_offset": offset,
+                "items_written": self.items_written,
+            }
+        }
+
+    def checkpoint_restoring(self, spider, state, checkpoint):
+        """Continue the output file of a resumed run from its checkpointed offset."""
+        writer = state.get("writer") or {}
+        output_filepath = writer.get("output_filepath")
+        if not output_filepath:
+            return
+        checkpoint.restore_output(output_filepath, writer.get("output_offset", 0))
+        self.output_filepath = output_filepath
+        self.output_dir = os.path.dirname(output_filepath)
+        self.file = open(output_filepath, 'a', encoding='utf-8')
+        self.items_written = writer.get("items_written", 0)
+        spider.output_dir = self.output_dir
+        spider.output_filepath = self.output_filepath
+
     def spider_opened(self, spider):
         # Create a dummy filepath to establish the output_dir, which is used by other pipelines
         # The final output_filepath will be set in process_item
@@ -81,6 +116,10 @@ class JsonlWriterPipeline:
         line = json.dumps(ItemAdapter(item).asdict(), ensure_ascii=False) + "\n"
         self.file.write(line)
         self.items_written += 1
+        if self.stats is not None:
+            # Write throughput for the metrics export.
+            self.stats.inc_value("output/rows_written")
+            self.stats.inc_value("output/bytes_written", len(line.encode("utf-8")))
         return item
 
     def ensure_dir(self, directory_path):
@@ -89,6 +128,27 @@ class JsonlWriterPipeline:
 
 
 class PostCrawlPipeline:
+    # Manifest stats section -> Scrapy stats key prefix. Sections are only
+    # written when the crawl produced at least one matching stat.
+    OPTIONAL_STATS_SECTIONS = {
+        "crawler_api_adaptive": "crawler_api/adaptive/",
+        "crawler_api_escalation": "crawler_api/escalation/",
+        "listing": "listing/",
+        "incremental": "incremental/",
+        "pagination": "pagination/",
+        "coalesce": "coalesce/",
+        "level_enrichment": "level_enrichment/",
+        "dedupe": "dedupe/",
+        "checkpoint": "checkpoint/",
+        "drain": "drain/",
+        "aimd": "aimd/",
+        "circuit_breaker": "circuit_breaker/",
+        "retry_after": "retry_after/",
+        "httpcache": "httpcache/",
+        "global_concurrency": "global_concurrency/",
+        "shard": "shard/",
+    }
+
     def __init__(self):
         self.output_dir = None
         self.run_id = None
@@ -99,6 +159,8 @@ class PostCrawlPipeline:
         self.stats = None
         self.crawler = None
         self.quality_gate_report = None
+        self.shard = None
+        self.manifest = None
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -120,14 +182,27 @@ class PostCrawlPipeline:
         self.date = spider.date
         self.crawler_name = spider.name
         self.entry_points = spider.entry_points
+        shard = getattr(spider, 'shard', None)
+        # Mocked spiders in tests return other objects.
+        self.shard = shard if isinstance(shard, ShardSpec) else None
         self.stats = self.crawler.stats.get_stats()
         self._sample_output(spider)
         self._run_quality_gate(spider)
         self._gzip_output(spider)
         self._generate_manifest(spider, reason)
         # upload to S3 if in prod environment or S3 upload is enabled
-        if os.environ.get('APP_ENV') == 'prod' or os.environ.get('S3_UPLOAD_ENABLED') == 'true':
+        upload = os.environ.get('APP_ENV') == 'prod' or os.environ.get('S3_UPLOAD_ENABLED') == 'true'
+        if upload:
             self._upload_to_s3(spider)
+        # After the upload, so the merged manifest only lists uploaded parts.
+        self._merge_shard_manifests(spider, upload)
+
+    def _metadata_filename(self, filename):
+        """Shards of a run share its metadata directory; their files are tagged."""
+        if self.shard is None:
+            return filename
+        stem, extension = os.path.splitext(filename)
+        return f"{stem}.{self.shard.tag}{extension}"
 
     def _get_setting(self, key, default):
         """Safely read Scrapy settings while tolerating mocked settings in tests."""
@@ -200,13 +275,16 @@ class PostCrawlPipeline:
 
         metadata_dir = os.path.join(self.output_dir, "metadata")
         os.makedirs(metadata_dir, exist_ok=True)
-        quality_report_path = os.path.join(metadata_dir, "quality_report.json")
+        quality_report_path = os.path.join(metadata_dir, self._metadata_filename("quality_report.json"))
 
         try:
             rows = load_jsonl_rows(self.output_filepath)
             exceptions = load_blank_field_exceptions(
                 exceptions_file=exceptions_file or None,
             )
+            if str(self._get_setting("CRAWL_MODE", "")).strip().lower() in LISTING_DRIVEN_CRAWL_MODES:
+                # Rows built from listing data carry no PDP-only fields by design.
+                exceptions["*"] = set(exceptions.get("*", set())) | set(LISTING_MODE_PDP_ONLY_FIELDS)
             report = evaluate_fail_quality(
                 rows,
                 params=params,
@@ -238,8 +316,8 @@ class PostCrawlPipeline:
             quality_report_path,
         )
 
-    def _upload_to_s3(self, spider):
-        """Uploads the output directory to an S3 bucket."""
+    def _upload_to_s3(self, spider, local_paths=None):
+        """Uploads the output directory, or only `local_paths` in it, to an S3 bucket."""
         s3_bucket = self.crawler.settings.get('S3_BUCKET')
         if not s3_bucket:
             spider.logger.info("S3_BUCKET not set, skipping S3 upload.")
@@ -256,24 +334,29 @@ class PostCrawlPipeline:
         if app_env not in ('dev', 'prod'):
             raise ValueError(f"APP_ENV must be 'dev' or 'prod', got '{app_env}'")
 
+        if local_paths is None:
+            local_paths = [
+                os.path.join(root, filename)
+                for root, _, files in os.walk(self.output_dir)
+                for filename in files
+            ]
+
         try:
-            for root, _, files in os.walk(self.output_dir):
-                for filename in files:
-                    local_path = os.path.join(root, filename)
-                    rel_path = os.path.relpath(local_path, self.output_dir)
-                    rel_parts = rel_path.split(os.sep)
-
-                    if rel_parts[0] == "metadata":
-                        rel_path = os.path.join(*rel_parts[1:]) if len(rel_parts) > 1 else ""
-                        if not rel_path:
-                            spider.logger.warning(f"Skipping unexpected metadata path: {local_path}")
-                            continue
-                        s3_key = os.path.join('bronze', app_env, 'crawls', 'metadata', s3_prefix, rel_path)
-                    else:
-                        s3_key = os.path.join('bronze', app_env, 'crawls', s3_prefix, rel_path)
-
-                    spider.logger.info(f"Uploading {local_path} to s3://{s3_bucket}/{s3_key}")
-                    s3_client.upload_file(local_path, s3_bucket, s3_key)
+            for local_path in local_paths:
+                rel_path = os.path.relpath(local_path, self.output_dir)
+                rel_parts = rel_path.split(os.sep)
+
+                if rel_parts[0] == "metadata":
+                    rel_path = os.path.join(*rel_parts[1:]) if len(rel_parts) > 1 else ""
+                    if not rel_path:
+                        spider.logger.warning(f"Skipping unexpected metadata path: {local_path}")
+                        continue
+                    s3_key = os.path.join('bronze', app_env, 'crawls', 'metadata', s3_prefix, rel_path)
+                else:
+                    s3_key = os.path.join('bronze', app_env, 'crawls', s3_prefix, rel_path)
+
+                spider.logger.info(f"Uploading {local_path} to s3://{s3_bucket}/{s3_key}")
+                s3_client.upload_file(local_path, s3_bucket, s3_key)
 
             spider.logger.info(f"Successfully uploaded output to s3://{s3_bucket}/{s3_key}")
 
@@ -382,9 +465,14 @@ class PostCrawlPipeline:
                 "status": self.quality_gate_report.get("status"),
                 "reason": self.quality_gate_report.get("reason"),
                 "violations_count": self.quality_gate_report.get("violations_count"),
-                "report_path": os.path.join(self.output_dir, "metadata", "quality_report.json"),
+                "report_path": os.path.join(
+                    self.output_dir, "metadata", self._metadata_filename("quality_report.json")
+                ),
             }
 
+        if self.shard is not None:
+            manifest["shard"] = {"index": self.shard.index, "count": self.shard.count}
+
         # add manifest bronze_verification
         manifest["bronze_verification"] = {
             "expected": {
@@ -395,27 +483,52 @@ class PostCrawlPipeline:
 
         metadata_dir = os.path.join(self.output_dir, 'metadata')
         os.makedirs(metadata_dir, exist_ok=True)
-        manifest_path = os.path.join(metadata_dir, 'manifest.json')
+        manifest_path = os.path.join(metadata_dir, self._metadata_filename('manifest.json'))
         with open(manifest_path, 'w', encoding='utf-8') as f:
             json.dump(manifest, f, indent=4)
+        self.manifest = manifest
         spider.logger.info(f"Manifest file created at: {manifest_path}")
 
-    def _build_manifest_stats(self, stats):
-        """Builds the stats dictionary for the manifest."""
-        status_code_prefix = 'downloader/response_status_count/'
-        status_code_counts = {
-            key.removeprefix(status_code_prefix): value
+    def _merge_shard_manifests(self, spider, upload):
+        """The last shard of a frontier-coordinated run writes the run's manifest.json."""
+        frontier = getattr(spider, 'shard_frontier', None)
+        if not isinstance(frontier, ShardFrontier) or self.manifest is None:
+            return
+        manifests = frontier.finish(self.manifest)
+        if manifests is None:
+            return
+        manifest_path = os.path.join(self.output_dir, 'metadata', 'manifest.json')
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(merge_shard_manifests(manifests), f, indent=4)
+        spider.logger.info(f"Merged {len(manifests)} shard manifests into {manifest_path}")
+        if upload:
+            self._upload_to_s3(spider, [manifest_path])
+
+    @staticmethod
+    def _prefixed_stats(stats, prefix):
+        """Returns stats under `prefix`, keyed by the remainder of the stat name."""
+        return {
+            key.removeprefix(prefix): value
             for key, value in stats.items()
-            if key.startswith(status_code_prefix)
+            if key.startswith(prefix)
         }
 
-        return {
+    def _build_manifest_stats(self, stats):
+        """Builds the stats dictionary for the manifest."""
+        manifest_stats = {
             "items_scraped": self.items_written,
             "requests_made": stats.get('downloader/request_count', 0),
             "errors_count": stats.get('log_count/ERROR', 0),
-            "status_code_counts": status_code_counts,
+            "status_code_counts": self._prefixed_stats(stats, 'downloader/response_status_count/'),
         }
 
+        for section, prefix in self.OPTIONAL_STATS_SECTIONS.items():
+            values = self._prefixed_stats(stats, prefix)
+            if values:
+                manifest_stats[section] = values
+
+        return manifest_stats
+
     def _build_manifest_artifacts(self):
         """Builds the artifacts dictionary for the manifest."""
         artifacts_data = {
@@ -0,0 +1,208 @@
+"""
+Persistent per-product state for incremental crawls.
+
+Each spider keeps a SQLite file under PRODUCT_STATE_DIR with one row per
+product, keyed by site, country, language and `portal_itemid`. A row holds the
+last listing signature (price, discount and stock flag as seen on the PLP), the
+last PDP price/discount/stock values and a hash of the last parsed item.
+
+Incremental mode compares the current listing signature with the stored one
+and skips the PDP request when nothing changed. Writes are committed every
+COMMIT_EVERY_ROWS rows and on close. When PRODUCT_STATE_S3_PREFIX is set, the
+file is downloaded before the crawl and uploaded again on close, so ECS tasks
+without a persistent disk keep their state between runs.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+
+from ecommercecrawl.constants.mastercrawl_constants import PRODUCT_STATE_DIR
+from ecommercecrawl.known_products import canonical_product_url
+from ecommercecrawl.s3_utils import is_missing_object, split_s3_uri
+
+logger = logging.getLogger(__name__)
+
+# Item fields that change every run without the product changing.
+VOLATILE_FIELDS = {"run_id", "crawl_date", "crawl_mode", "seen"}
+
+# Rows written between commits, so a killed crawl keeps most of its updates.
+COMMIT_EVERY_ROWS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS product_state (
+    site TEXT NOT NULL,
+    country TEXT NOT NULL,
+    language TEXT NOT NULL,
+    portal_itemid TEXT NOT NULL,
+    url TEXT,
+    price TEXT,
+    discount TEXT,
+    out_of_stock INTEGER,
+    content_hash TEXT,
+    listing_signature TEXT,
+    last_crawled_run_id TEXT,
+    last_seen_run_id TEXT,
+    PRIMARY KEY (site, country, language, portal_itemid)
+)
+"""
+
+
+def _normalize_value(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    try:
+        return f"{float(str(value).replace(',', '')):.2f}"
+    except ValueError:
+        return str(value).strip()
+
+
+def _out_of_stock(fields):
+    value = fields.get("out_of_stock")
+    if value is None:
+        value = fields.get("sold_out")
+    return None if value is None else bool(value)
+
+
+def product_key(site, url, fields):
+    """
+    Store key for a product: (site, country, language, portal_itemid).
+
+    Language storefronts of one country are separate PDPs, so language is
+    part of the key. Products without an id fall back to their canonical URL.
+    """
+    return (
+        site,
+        str(fields.get("country") or ""),
+        str(fields.get("language") or ""),
+        str(fields.get("portal_itemid") or canonical_product_url(url)),
+    )
+
+
+def listing_signature(fields):
+    """Hash of the listing-level price, discount and stock flag."""
+    payload = [
+        _normalize_value(fields.get("price")),
+        _normalize_value(fields.get("price_discount")),
+        _out_of_stock(fields),
+    ]
+    return hashlib.sha1(json.dumps(payload).encode("utf-8")).hexdigest()
+
+
+def content_hash(item):
+    """Hash of a parsed item without per-run fields."""
+    stable = {key: value for key, value in item.items() if key not in VOLATILE_FIELDS}
+    encoded = json.dumps(stable, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+class ProductStateStore:
+    def __init__(self, path, s3_uri=None):
+        self.path = path
+        self.s3_uri = s3_uri
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        if s3_uri:
+            self._download_snapshot()
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(_SCHEMA)
+        self._uncommitted = 0
+
+    @classmethod
+    def from_settings(cls, settings, spider_name):
+        """Return the store for `spider_name`, or None when settings are missing."""
+        if settings is None:
+            return None
+        directory = settings.get("PRODUCT_STATE_DIR") or PRODUCT_STATE_DIR
+        filename = f"{spider_name}.sqlite"
+        s3_prefix = settings.get("PRODUCT_STATE_S3_PREFIX")
+        s3_uri = f"{s3_prefix.rstrip('/')}/{filename}" if s3_prefix else None
+        return cls(os.path.join(directory, filename), s3_uri=s3_uri)
+
+    def _download_snapshot(self):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        bucket, key = split_s3_uri(self.s3_uri)
+        tmp_path = f"{self.path}.download"
+        try:
+            boto3.client("s3").download_file(bucket, key, tmp_path)
+        except ClientError as exc:
+            # An empty store would be uploaded over the real one on close.
+            if not is_missing_object(exc):
+                raise
+            # First run for this spider: start from an empty store.
+            logger.info("No product state snapshot at %s: %s", self.s3_uri, exc)
+            return
+        os.replace(tmp_path, self.path)
+
+    def _upload_snapshot(self):
+        import boto3
+
+        bucket, key = split_s3_uri(self.s3_uri)
+        boto3.client("s3").upload_file(self.path, bucket, key)
+
+    def get(self, key):
+        row = self.connection.execute(
+            "SELECT * FROM product_state "
+            "WHERE site = ? AND country = ? AND language = ? AND portal_itemid = ?",
+            key,
+        ).fetchone()
+        return dict(row) if row is not None else None
+
+    def touch(self, key, run_id):
+        """Mark a product as seen in `run_id` without a PDP fetch."""
+        self.connection.execute(
+            "UPDATE product_state SET last_seen_run_id = ? "
+            "WHERE site = ? AND country = ? AND language = ? AND portal_itemid = ?",
+            (run_id, *key),
+        )
+        self._written()
+
+    def update(self, key, url, item, signature, run_id):
+        """
+        Store the state of a freshly parsed PDP.
+
+        Returns the previous content hash, or None for a new product.
+        """
+        previous = self.get(key)
+        out_of_stock = _out_of_stock(item)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO product_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                *key,
+                url,
+                _normalize_value(item.get("price")),
+                _normalize_value(item.get("price_discount")),
+                None if out_of_stock is None else int(out_of_stock),
+                content_hash(item),
+                signature,
+                run_id,
+                run_id,
+            ),
+        )
+        self._written()
+        return previous["content_hash"] if previous else None
+
+    def _written(self):
+        self._uncommitted += 1
+        if self._uncommitted >= COMMIT_EVERY_ROWS:
+            self.connection.commit()
+            self._uncommitted = 0
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM product_state").fetchone()[0]
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.connection.commit()
+        self.connection.close()
+        self.connection = None
+        if self.s3_uri:
+            self._upload_snapshot()
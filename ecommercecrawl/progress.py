@@ -0,0 +1,127 @@
+"""
+Crawl progress, throughput and ETA (see CrawlProgressExtension).
+
+Spiders report every listing page they parse through
+`MasterCrawl.report_listing_page(seed, total_pages, product_urls)`: the
+seed is the listing URL without its query string, `total_pages` the page
+count the site returned (Farfetch pagination, Ounass totalPages, Level API
+page counts) and `product_urls` the PDPs the page lists. Scraped items are
+matched to the seed that listed their URL.
+
+Expected PDPs of a seed are the PDPs listed so far plus, for pages not
+parsed yet, as many per page as the parsed pages listed. Progress and ETA
+count listing pages and PDPs alike as units of work.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from ecommercecrawl.fingerprints import fingerprint
+from ecommercecrawl.known_products import canonical_product_url
+
+
+@dataclass
+class SeedProgress:
+    seed: str
+    plp_pages_expected: Optional[int] = None
+    plp_pages_completed: int = 0
+    pdps_listed: int = 0
+    pdps_completed: int = 0
+
+    @property
+    def plp_pages_total(self):
+        return max(self.plp_pages_expected or 0, self.plp_pages_completed)
+
+    @property
+    def pdps_expected(self):
+        remaining_pages = self.plp_pages_total - self.plp_pages_completed
+        if not remaining_pages or not self.plp_pages_completed:
+            return self.pdps_listed
+        return self.pdps_listed + round(self.pdps_listed / self.plp_pages_completed * remaining_pages)
+
+    def to_dict(self):
+        return {
+            "seed": self.seed,
+            "plp_pages_expected": self.plp_pages_total,
+            "plp_pages_completed": self.plp_pages_completed,
+            "pdps_expected": self.pdps_expected,
+            "pdps_completed": self.pdps_completed,
+        }
+
+
+class CrawlProgress:
+    def __init__(self, started_at):
+        self.started_at = started_at
+        # canonical seed URL -> SeedProgress
+        self.seeds = {}
+        # fingerprint of a listed product URL -> SeedProgress, until its item is scraped
+        self._listed = {}
+        self.items_scraped = 0
+        # Items of products no parsed listing page listed (PDP seeds).
+        self.unlisted_items = 0
+        self._last_sample = (started_at, 0, 0)
+
+    def listing_page(self, seed, total_pages=None, product_urls=()):
+        seed = canonical_product_url(seed)
+        progress = self.seeds.get(seed)
+        if progress is None:
+            progress = self.seeds[seed] = SeedProgress(seed)
+        progress.plp_pages_completed += 1
+        if total_pages:
+            progress.plp_pages_expected = max(progress.plp_pages_expected or 0, int(total_pages))
+        for url in product_urls:
+            key = fingerprint(canonical_product_url(url))
+            # Products listed under several seeds count for the first one.
+            if key not in self._listed:
+                self._listed[key] = progress
+                progress.pdps_listed += 1
+
+    def item_scraped(self, item):
+        self.items_scraped += 1
+        url = item.get("url") if isinstance(item, dict) else None
+        progress = self._listed.pop(fingerprint(canonical_product_url(url)), None) if url else None
+        if progress is not None:
+            progress.pdps_completed += 1
+        else:
+            self.unlisted_items += 1
+
+    def totals(self):
+        seeds = self.seeds.values()
+        return {
+            "plp_pages_expected": sum(seed.plp_pages_total for seed in seeds),
+            "plp_pages_completed": sum(seed.plp_pages_completed for seed in seeds),
+            "pdps_expected": sum(seed.pdps_expected for seed in seeds) + self.unlisted_items,
+            "pdps_completed": sum(seed.pdps_completed for seed in seeds) + self.unlisted_items,
+        }
+
+    def snapshot(self, now):
+        """
+        Progress at monotonic time `now`. Throughput and ETA use the
+        interval since the previous snapshot, or the whole run when nothing
+        completed in that interval.
+        """
+        totals = self.totals()
+        done = totals["plp_pages_completed"] + totals["pdps_completed"]
+        expected = totals["plp_pages_expected"] + totals["pdps_expected"]
+        last_time, last_done, last_items = self._last_sample
+        self._last_sample = (now, done, self.items_scraped)
+
+        elapsed = now - self.started_at
+        interval = now - last_time
+        interval_rate = (done - last_done) / interval if interval > 0 else 0.0
+        run_rate = done / elapsed if elapsed > 0 else 0.0
+        rate = interval_rate or run_rate
+        remaining = expected - done
+        return {
+            "elapsed_seconds": round(elapsed, 1),
+            "items_scraped": self.items_scraped,
+            "items_per_second": round(self.items_scraped / elapsed, 3) if elapsed > 0 else 0.0,
+            "recent_items_per_second": (
+                round((self.items_scraped - last_items) / interval, 3) if interval > 0 else 0.0
+            ),
+            **totals,
+            "percent_complete": round(100 * done / expected, 1) if expected else None,
+            "eta_seconds": round(remaining / rate) if rate else None,
+            # Nothing completed since the previous snapshot.
+            "stalled": done == last_done and interval > 0,
+            "seeds": [seed.to_dict() for seed in self.seeds.values()],
+        }
@@ -0,0 +1,302 @@
+"""
+Record/replay archive of HTTP responses for offline spider benchmarks.
+
+A live crawl run with `RESPONSE_ARCHIVE_MODE=record` stores every downloaded
+response (URL, status, headers, body) in a single SQLite file with
+zlib-compressed headers and bodies. A later run with
+`RESPONSE_ARCHIVE_MODE=replay` serves the same requests from that file through
+`ReplayDownloadHandler`, without network, so the real spider callbacks and
+item pipelines can be profiled in isolation from site latency.
+
+Level's PLP API calls go through `requests` outside Scrapy's downloader; they
+are archived through `ResponseArchive.requests_get()`.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+
+import requests
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.responsetypes import responsetypes
+from twisted.internet import defer
+
+
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+ARCHIVE_MODES = (MODE_RECORD, MODE_REPLAY)
+
+# Commit recorded rows in batches; the archive is also committed on close.
+COMMIT_EVERY = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    request_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers BLOB NOT NULL,
+    body BLOB NOT NULL
+)
+"""
+
+# path -> ResponseArchive, so middleware, handler and spiders share one connection.
+_open_archives = {}
+
+
+def build_request_key(method, url, body=b"", variant=None):
+    """
+    Stable key for a request: method, full URL, body and an optional variant.
+
+    The variant keeps crawler API request types apart, so a cheap
+    `http_response` attempt and its `rendered_html` retry of the same URL are
+    archived separately.
+    """
+    digest = hashlib.sha1(f"{method.upper()} {url}\n".encode("utf-8"))
+    digest.update(body or b"")
+    if variant:
+        digest.update(json.dumps(variant, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _request_variant(request):
+    return request.meta.get("zyte_api")
+
+
+def _encode_headers(headers):
+    """Scrapy/requests headers -> compressed JSON of {name: [values]}."""
+    if hasattr(headers, "getlist"):
+        decoded = {
+            key.decode("latin-1"): [value.decode("latin-1") for value in headers.getlist(key)]
+            for key in headers.keys()
+        }
+    else:
+        decoded = {str(key): [str(value)] for key, value in dict(headers or {}).items()}
+    return zlib.compress(json.dumps(decoded).encode("utf-8"))
+
+
+def _decode_headers(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class ResponseArchive:
+    def __init__(self, path, mode):
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f"Unsupported response archive mode: {mode}")
+        if mode == MODE_REPLAY and not os.path.exists(path):
+            raise FileNotFoundError(f"Response archive not found: {path}")
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+
+        self.path = path
+        self.mode = mode
+        self.pending_writes = 0
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(_SCHEMA)
+
+    @classmethod
+    def shared(cls, path, mode):
+        archive = _open_archives.get(path)
+        if archive is None:
+            archive = cls(path, mode)
+            _open_archives[path] = archive
+        return archive
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return the shared archive configured in settings, or None."""
+        if settings is None:
+            return None
+        mode = str(settings.get("RESPONSE_ARCHIVE_MODE") or "").strip().lower()
+        path = settings.get("RESPONSE_ARCHIVE_PATH")
+        if not mode or not path:
+            return None
+        return cls.shared(path, mode)
+
+    def put(self, method, url, body, status, headers, response_body, variant=None):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (
+                build_request_key(method, url, body, variant),
+                url,
+                int(status),
+                _encode_headers(headers),
+                zlib.compress(response_body or b""),
+            ),
+        )
+        self.pending_writes += 1
+        if self.pending_writes >= COMMIT_EVERY:
+            self.commit()
+
+    def get(self, method, url, body=b"", variant=None):
+        """Return (status, headers, body) for a recorded request, or None."""
+        row = self.connection.execute(
+            "SELECT status, headers, body FROM responses WHERE request_key = ?",
+            (build_request_key(method, url, body, variant),),
+        ).fetchone()
+        if row is None:
+            return None
+        status, headers, response_body = row
+        return status, _decode_headers(headers), zlib.decompress(response_body)
+
+    def put_response(self, request, response):
+        self.put(
+            request.method,
+            request.url,
+            request.body,
+            response.status,
+            response.headers,
+            response.body,
+            variant=_request_variant(request),
+        )
+
+    def get_response(self, request):
+        """Rebuild a Scrapy response for `request`, or None if not recorded."""
+        recorded = self.get(request.method, request.url, request.body, _request_variant(request))
+        if recorded is None:
+            return None
+        status, headers, body = recorded
+        response_cls = responsetypes.from_args(headers=headers, url=request.url, body=body)
+        return response_cls(
+            url=request.url,
+            status=status,
+            headers=headers,
+            body=body,
+            request=request,
+            flags=["replay"],
+        )
+
+    def requests_get(self, url, params=None, headers=None, **kwargs):
+        """
+        `requests.get` that records or replays through the archive.
+
+        Replay misses raise `requests.exceptions.ConnectionError`, which the
+        spiders already handle as a failed fetch.
+        """
+        prepared_url = requests.Request("GET", url, params=params).prepare().url
+
+        if self.mode == MODE_RECORD:
+            response = requests.get(url, params=params, headers=headers, **kwargs)
+            self.put("GET", prepared_url, b"", response.status_code, response.headers, response.content)
+            return response
+
+        recorded = self.get("GET", prepared_url)
+        if recorded is None:
+            raise requests.exceptions.ConnectionError(f"Not in response archive: {prepared_url}")
+        status, recorded_headers, body = recorded
+        response = requests.models.Response()
+        response.url = prepared_url
+        response.status_code = status
+        response.headers.update({name: values[-1] for name, values in recorded_headers.items()})
+        response._content = body
+        return response
+
+    def commit(self):
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def close(self):
+        # http and https handlers share one archive, so close may run twice.
+        if self.connection is None:
+            return
+        if _open_archives.get(self.path) is self:
+            _open_archives.pop(self.path)
+        self.commit()
+        self.connection.close()
+        self.connection = None
+
+
+class RecordResponsesMiddleware:
+    """
+    Downloader middleware that stores every response in the archive.
+
+    Sits close to the downloader so it records requests exactly as the
+    replay handler will later see them.
+    """
+
+    def __init__(self, archive, stats):
+        self.archive = archive
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        archive = ResponseArchive.from_settings(crawler.settings)
+        if archive is None or archive.mode != MODE_RECORD:
+            raise NotConfigured("Response recording is disabled")
+        middleware = cls(archive, crawler.stats)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_response(self, request, response, spider):
+        self.archive.put_response(request, response)
+        self.stats.inc_value("response_archive/recorded")
+        return response
+
+    def spider_closed(self, spider):
+        self.archive.close()
+
+
+class ReplayDownloadHandler:
+    """Download handler that answers every request from the archive."""
+
+    lazy = False
+
+    def __init__(self, archive, stats):
+        self.archive = archive
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        archive = ResponseArchive.from_settings(crawler.settings)
+        if archive is None or archive.mode != MODE_REPLAY:
+            raise NotConfigured("Response replay is disabled")
+        return cls(archive, crawler.stats)
+
+    def download_request(self, request, spider):
+        response = self.archive.get_response(request)
+        if response is None:
+            self.stats.inc_value("response_archive/replay_miss")
+            return defer.fail(IgnoreRequest(f"Not in response archive: {request.url}"))
+        self.stats.inc_value("response_archive/replayed")
+        return defer.succeed(response)
+
+    def close(self):
+        self.archive.close()
+
+
+def configure_settings(settings, mode, path):
+    """
+    Point Scrapy settings at a response archive for record or replay runs.
+
+    Replay swaps every HTTP(S) download handler for the archive, drops the
+    Zyte middlewares and removes politeness delays so the run measures
+    parsing and pipeline cost only.
+    """
+    if mode not in ARCHIVE_MODES:
+        raise ValueError(f"Unsupported response archive mode: {mode}")
+
+    settings.set("RESPONSE_ARCHIVE_MODE", mode)
+    settings.set("RESPONSE_ARCHIVE_PATH", path)
+    if mode == MODE_RECORD:
+        return settings
+
+    handler = "ecommercecrawl.response_archive.ReplayDownloadHandler"
+    settings.set("DOWNLOAD_HANDLERS", {"http": handler, "https": handler})
+
+    downloader_middlewares = dict(settings.getdict("DOWNLOADER_MIDDLEWARES"))
+    downloader_middlewares.pop("scrapy_zyte_api.ScrapyZyteAPIDownloaderMiddleware", None)
+    settings.set("DOWNLOADER_MIDDLEWARES", downloader_middlewares)
+    spider_middlewares = dict(settings.getdict("SPIDER_MIDDLEWARES"))
+    spider_middlewares.pop("scrapy_zyte_api.ScrapyZyteAPISpiderMiddleware", None)
+    settings.set("SPIDER_MIDDLEWARES", spider_middlewares)
+    settings.set("REQUEST_FINGERPRINTER_CLASS", "scrapy.utils.request.RequestFingerprinter")
+
+    settings.set("DOWNLOAD_DELAY", 0)
+    settings.set("RETRY_AFTER_MIN_SLOT_DELAY", 0)
+    settings.set("AUTOTHROTTLE_ENABLED", False)
+    settings.set("OUNASS_REQUEST_DELAY_SECONDS", "0")
+    settings.set("OUNASS_REQUEST_JITTER_SECONDS", "0")
+    return settings
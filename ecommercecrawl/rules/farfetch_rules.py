@@ -1,9 +1,37 @@
 import re
 import json
+from lxml import etree
 from ecommercecrawl.xpaths import farfetch_xpaths as xpaths
 from ecommercecrawl.constants import farfetch_constants as constants
 
 
+def _compile(expression):
+    return etree.XPath(expression.strip(), smart_strings=False)
+
+
+# PDP XPaths compiled once at import and evaluated against the response's
+# already-parsed lxml tree, instead of re-compiling each string per call.
+_PDP_PROGRAM = {
+    'price': _compile(xpaths.PRICE_XPATH),
+    'breadcrumbs': _compile(xpaths.BREADCRUMBS_XPATH),
+    'product_name': _compile(xpaths.PRODUCT_NAME_XPATH),
+    'image_url': _compile(xpaths.IMAGE_URL_XPATH),
+    'brand': _compile(xpaths.BRAND_XPATH),
+    'discount': _compile(xpaths.DISCOUNT_XPATH),
+    'primary_label': _compile(xpaths.PRIMARY_LABEL_XPATH),
+    'highlights': _compile(xpaths.HIGHLIGHTS_XPATH),
+    'composition': _compile(xpaths.COMPOSITION_XPATH),
+}
+
+
+def _get_tree(response):
+    # Scrapy caches the selector on the response, so the page is parsed once.
+    return response.selector.root
+
+def _first(values):
+    return values[0] if values else None
+
+
 def is_plp(url):
     return url.split('/')[-1].split('?')[0] == 'items.aspx'
 
@@ -89,11 +117,10 @@ def get_price_and_currency(price_str):
     return None, None
 
 def get_product_name(response):
-    product_name_all = response.xpath(xpaths.PRODUCT_NAME_XPATH).getall()[-1]
-    product_name = None if not product_name_all else product_name_all
-    return product_name
+    product_name = _PDP_PROGRAM['product_name'](_get_tree(response))
+    return product_name or None
 
-def get_pdp_urls(response):
+def _get_item_list_elements(response):
     raw = response.xpath(xpaths.PLP_XPATH).get()
     data = json.loads(raw) if raw else {}
 
@@ -101,44 +128,103 @@ def get_pdp_urls(response):
     if isinstance(data, list):
         data = next((d for d in data if isinstance(d, dict) and d.get('@type') == 'ItemList'), {})
 
-    elements = data.get('itemListElement', []) if isinstance(data, dict) else []
+    return data.get('itemListElement', []) if isinstance(data, dict) else []
+
+def _get_offers(element):
+    offers = element.get('offers')
+    if isinstance(offers, dict):
+        return [offers]
+    if isinstance(offers, list):
+        return [o for o in offers if isinstance(o, dict)]
+    return []
 
+def get_pdp_urls(response):
     urls = []
-    for el in elements:
-        offers = el.get('offers')
-        if isinstance(offers, dict):
-            urls.append(offers.get('url'))
-        elif isinstance(offers, list):
-            urls.extend(o.get('url') for o in offers if isinstance(o, dict))
+    for el in _get_item_list_elements(response):
+        urls.extend(o.get('url') for o in _get_offers(el))
     # return site with constant
     pdp_urls = [f'{constants.MAIN_SITE}{u}' for u in urls if u and u.startswith('/')]
     return pdp_urls
 
+def _to_price(value):
+    try:
+        return float(str(value).replace(',', ''))
+    except (TypeError, ValueError):
+        return None
+
+def get_listing_products(response):
+    """
+    Price-refresh fields for every product in the PLP's JSON-LD ItemList.
+
+    Uses the first offer of each element, like get_pdp_urls(). Elements
+    without a relative offer URL are skipped.
+    """
+    products = []
+    for el in _get_item_list_elements(response):
+        offers = _get_offers(el)
+        offer = offers[0] if offers else {}
+        url = offer.get('url')
+        if not url or not url.startswith('/'):
+            continue
+        brand = el.get('brand')
+        if isinstance(brand, dict):
+            brand = brand.get('name')
+        availability = str(offer.get('availability') or '')
+        products.append({
+            'url': f'{constants.MAIN_SITE}{url}',
+            'product_name': el.get('name'),
+            'brand': brand,
+            'price': _to_price(offer.get('price')),
+            'currency': offer.get('priceCurrency'),
+            'sold_out': availability.endswith(('OutOfStock', 'SoldOut')) if availability else None,
+        })
+    return products
+
 def get_price(response):
-    return response.xpath(xpaths.PRICE_XPATH).get()
+    return _PDP_PROGRAM['price'](_get_tree(response))
 
 def get_breadcrumbs(response):
-    return response.xpath(xpaths.BREADCRUMBS_XPATH).getall()
+    return _PDP_PROGRAM['breadcrumbs'](_get_tree(response))
 
 def get_image_url(response):
-    return response.xpath(xpaths.IMAGE_URL_XPATH).get()
+    return _PDP_PROGRAM['image_url'](_get_tree(response))
 
 def get_brand(response):
-    return response.xpath(xpaths.BRAND_XPATH).get()
+    return _first(_PDP_PROGRAM['brand'](_get_tree(response)))
 
 def get_discount(response):
-    return response.xpath(xpaths.DISCOUNT_XPATH).get()
+    return _first(_PDP_PROGRAM['discount'](_get_tree(response)))
 
 def get_primary_label(response):
-    return response.xpath(xpaths.PRIMARY_LABEL_XPATH).get()
+    return _first(_PDP_PROGRAM['primary_label'](_get_tree(response)))
 
 def is_sold_out(primary_label):
     return primary_label == constants.SOLD_OUT_LABEL
 
-def get_text(response):
-    highlights = response.xpath(xpaths.HIGHLIGHTS_XPATH).getall()
-    composition = response.xpath(xpaths.COMPOSITION_XPATH).get()
+def _join_text(highlights, composition):
     return ', '.join([*map(str.strip, highlights), composition]) if composition else ', '.join(map(str.strip, highlights))
 
+def get_text(response):
+    tree = _get_tree(response)
+    return _join_text(_PDP_PROGRAM['highlights'](tree), _PDP_PROGRAM['composition'](tree))
+
+def extract_pdp_fields(response):
+    """
+    Run the whole PDP program against one parsed tree and return the raw
+    page fields the spider needs, with the same values as the single-field
+    getters above.
+    """
+    tree = _get_tree(response)
+    return {
+        'primary_label': _first(_PDP_PROGRAM['primary_label'](tree)),
+        'breadcrumbs': _PDP_PROGRAM['breadcrumbs'](tree),
+        'price': _PDP_PROGRAM['price'](tree),
+        'discount': _first(_PDP_PROGRAM['discount'](tree)),
+        'image_url': _PDP_PROGRAM['image_url'](tree),
+        'product_name': _PDP_PROGRAM['product_name'](tree) or None,
+        'brand': _first(_PDP_PROGRAM['brand'](tree)),
+        'text': _join_text(_PDP_PROGRAM['highlights'](tree), _PDP_PROGRAM['composition'](tree)),
+    }
+
 def get_url_drop_param(url):
     return url.split('?')[0]
\ No newline at end of file
@@ -11,6 +11,12 @@ def get_products(payload: dict):
     v = payload.get('products')
     return v
 
+def get_total_pages(payload: dict):
+    # page count of a PLP API payload, None when the payload has none
+    pagination = payload.get('pagination') or {}
+    total = pagination.get('totalPages', payload.get('totalPages'))
+    return total if isinstance(total, int) and not isinstance(total, bool) and total > 0 else None
+
 def get_country(url: str):
     # return counry by analyzing subdomain or subpath
     subdomain = url.split('/')[2].split('.')[0]
@@ -128,6 +134,31 @@ def get_primary_label_from_item(x):
         return [x['text'] for x in x['badges']]
     return None
 
+# Catalog API product fields that the HTML PDP otherwise provides, read from
+# the moreFromBrand tiles (tests/level_api_fixtures/more_from_brand.json).
+# The getters return None when a field is absent, so callers fall back to HTML.
+def get_details_from_item(x):
+    """Product details as extract_product_details returns them: one entry per bullet."""
+    if not isinstance(x, dict) or not isinstance(x.get('productDetails'), list):
+        return None
+    bullets = [_norm_ws(line) for line in x['productDetails'] if isinstance(line, str) and _norm_ws(line)]
+    return bullets or None
+
+def get_out_of_stock_from_item(x):
+    if not isinstance(x, dict) or not isinstance(x.get('isOutOfStock'), bool):
+        return None
+    return x['isOutOfStock']
+
+def get_level_category_id_from_item(x):
+    if not isinstance(x, dict):
+        return None
+    category_id = x.get('categoryId')
+    if isinstance(category_id, int) and not isinstance(category_id, bool):
+        return category_id
+    if isinstance(category_id, str) and category_id.strip().isdigit():
+        return int(category_id.strip())
+    return None
+
 def _norm_ws(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "")).strip()
 
@@ -1,6 +1,7 @@
 import json
 import re
 import logging
+from ecommercecrawl.constants.ounass_constants import TLD_COUNTRY_MAP
 from ecommercecrawl.constants.ounass_constants import TLD_LANGUAGE_MAP
 from html.parser import HTMLParser
 from urllib.parse import urlparse
@@ -25,8 +26,12 @@ def get_max_pages(response):
     return data['pagination']['totalPages']
 
 
+def get_page_number(response):
+    return json.loads(response.text)['page']
+
+
 def is_first_page(response):
-    return json.loads(response.text)['page'] == 0
+    return get_page_number(response) == 0
 
 def get_pdps(response):
     """
@@ -62,6 +67,39 @@ def get_pdps(response):
     return sorted(urls)
 
 
+def get_listing_items(response):
+    """
+    Price-refresh fields for every hit on a PLP payload.
+
+    PLP hits use the same field names as the PDP state (`name`,
+    `designerCategoryName`, `price`, `discountPercent`, `visibleSku`); any
+    field a hit lacks is left as None. Variation slugs are not listed here,
+    only primary hits.
+    """
+    data = json.loads(response.text)
+    parsed_url = urlparse(response.url)
+    base_address = f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+    items = []
+    for hit in data.get('hits', []):
+        slug = hit.get('slug')
+        if not slug:
+            continue
+        items.append({
+            'url': f'{base_address}/{slug}.html',
+            'portal_itemid': hit.get('visibleSku'),
+            'product_name': hit.get('name'),
+            'brand': hit.get('designerCategoryName'),
+            'price': hit.get('price'),
+            'currency': hit.get('currency') or data.get('currency'),
+            'price_discount': hit.get('discountPercent'),
+            'out_of_stock': get_sold_out({'pdp': hit}),
+            'country': get_country(response.url),
+            'language': get_language(response.url),
+        })
+    return items
+
+
 def is_pdp(response):
     return response.url.split('.')[-1] == 'html'
 
@@ -207,6 +245,9 @@ class HTMLCleaner(HTMLParser):
 def get_language(url):
     return TLD_LANGUAGE_MAP.get(url.split('https://')[-1].split('/')[0], None)
 
+def get_country(url):
+    return TLD_COUNTRY_MAP.get(url.split('https://')[-1].split('/')[0], None)
+
 def extract_product_details(state):
     design_details = [x['html'] for x in state['pdp']['contentTabs'] if x['tabId'] == 'designDetails'][0]
     size_fit = [x['html'] for x in state['pdp']['contentTabs'] if x['tabId'] == 'sizeAndFit'][0]
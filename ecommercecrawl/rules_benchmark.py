@@ -0,0 +1,505 @@
+"""
+Micro-benchmarks for the site rules extractors and spider PDP paths.
+
+Pages come from a fixture corpus: JSONL rows in the local crawler API fixture
+shape ({"url", "status", "headers", "body"}, optional "site") or a response
+archive recorded with `run_crawler.py --record`. Each PDP is benchmarked at
+two levels:
+
+- per field: every rules extractor the spider calls, timed on its own against
+  a response whose selector is already built (the parse is its own field);
+- full path: the spider's PDP-to-item method (`FFSpider._populate_pdp_data`,
+  `OunassSpider.parse_pdp`, `LevelSpider.parse_pdp`) on a fresh response.
+
+Allocations are measured with tracemalloc in a separate pass so they do not
+skew the timings.
+"""
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import time
+import tracemalloc
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+
+from ecommercecrawl.constants import farfetch_constants, level_constants, ounass_constants
+from ecommercecrawl.rules import farfetch_rules, level_rules, ounass_rules
+from ecommercecrawl.xpaths import farfetch_xpaths
+
+
+SCHEMA_VERSION = 1
+
+# Hostname fragment -> site name used in results.
+SITE_HOSTS = {
+    "farfetch.": farfetch_constants.NAME,
+    "ounass.": ounass_constants.NAME,
+    "levelshoes.": level_constants.NAME,
+}
+
+
+@dataclass(frozen=True)
+class Page:
+    site: str
+    url: str
+    body: bytes
+
+
+@dataclass(frozen=True)
+class BenchmarkParams:
+    # Timed runs per page; each run uses a fresh response.
+    iterations: int = 20
+    # Untimed runs per page before measuring, to warm caches and imports.
+    warmup: int = 2
+    # Measure allocations of the full path with tracemalloc.
+    measure_allocations: bool = True
+
+
+def _utc_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def detect_site(url: str) -> Optional[str]:
+    hostname = (urlparse(url).hostname or "").lower()
+    for fragment, site in SITE_HOSTS.items():
+        if fragment in hostname:
+            return site
+    return None
+
+
+def is_pdp_page(page: Page) -> bool:
+    if page.site == farfetch_constants.NAME:
+        return farfetch_rules.is_pdp_url(page.url)
+    if page.site == ounass_constants.NAME:
+        return page.url.split("?")[0].endswith(".html")
+    if page.site == level_constants.NAME:
+        return level_rules.is_pdp(page.url)
+    return False
+
+
+def _page_from_row(url: str, body: Any, site: Optional[str] = None) -> Optional[Page]:
+    site = site or detect_site(url)
+    if not site:
+        return None
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return Page(site=site, url=url, body=body or b"")
+
+
+def load_corpus_jsonl(path: str) -> List[Page]:
+    """Load PDP pages from a fixture JSONL file; non-PDP and non-200 rows are skipped."""
+    pages: List[Page] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, raw_line in enumerate(f, start=1):
+            line = raw_line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as exc:
+                raise ValueError(f"Invalid JSON at line {line_no} in {path}: {exc}") from exc
+            if int(row.get("status", 200)) != 200:
+                continue
+            page = _page_from_row(row["url"], row.get("body"), row.get("site"))
+            if page is not None and is_pdp_page(page):
+                pages.append(page)
+    return pages
+
+
+def load_corpus_archive(path: str) -> List[Page]:
+    """Load PDP pages from a response archive recorded by run_crawler.py --record."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Response archive not found: {path}")
+    pages: List[Page] = []
+    connection = sqlite3.connect(path)
+    try:
+        rows = connection.execute("SELECT url, status, body FROM responses ORDER BY url")
+        for url, status, body in rows:
+            if status != 200:
+                continue
+            page = _page_from_row(url, zlib.decompress(body))
+            if page is not None and is_pdp_page(page):
+                pages.append(page)
+    finally:
+        connection.close()
+    return pages
+
+
+def load_corpus(paths: Iterable[str]) -> List[Page]:
+    """Load a corpus from JSONL files, directories of JSONL files and archives."""
+    pages: List[Page] = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".jsonl"):
+                    pages.extend(load_corpus_jsonl(os.path.join(path, name)))
+        elif path.endswith((".sqlite", ".sqlite3", ".db")):
+            pages.extend(load_corpus_archive(path))
+        else:
+            pages.extend(load_corpus_jsonl(path))
+    return pages
+
+
+def build_response(page: Page) -> HtmlResponse:
+    return HtmlResponse(
+        url=page.url,
+        body=page.body,
+        encoding="utf-8",
+        request=Request(page.url, meta={}),
+    )
+
+
+def _parse_html(response):
+    return response.selector
+
+
+# Per-site field extractors, in the order the spider calls them. Each takes the
+# response and a context dict, so derived values (breadcrumbs, Ounass state)
+# are computed once by their own field and reused like the spider does.
+def _farfetch_fields() -> Dict[str, Callable]:
+    def breadcrumbs(response, ctx):
+        ctx["breadcrumbs"] = farfetch_rules.get_breadcrumbs(response)
+        return ctx["breadcrumbs"]
+
+    def price(response, ctx):
+        return farfetch_rules.get_price_and_currency(farfetch_rules.get_price(response))
+
+    return {
+        "parse": lambda response, ctx: _parse_html(response),
+        "pdp_program": lambda response, ctx: farfetch_rules.extract_pdp_fields(response),
+        "primary_label": lambda response, ctx: farfetch_rules.get_primary_label(response),
+        "breadcrumbs": breadcrumbs,
+        "price": price,
+        "price_discount": lambda response, ctx: farfetch_rules.get_discount(response),
+        "image_url": lambda response, ctx: farfetch_rules.get_image_url(response),
+        "url": lambda response, ctx: farfetch_rules.get_url_drop_param(response.url),
+        "country": lambda response, ctx: farfetch_rules.get_country(response.url),
+        "portal_itemid": lambda response, ctx: farfetch_rules.get_portal_itemid(response.url),
+        "product_name": lambda response, ctx: farfetch_rules.get_product_name(response),
+        "gender": lambda response, ctx: farfetch_rules.get_gender(response.url),
+        "brand": lambda response, ctx: farfetch_rules.get_brand(response),
+        "category": lambda response, ctx: farfetch_rules.get_category_from_breadcrumbs(ctx.get("breadcrumbs")),
+        "subcategory": lambda response, ctx: farfetch_rules.get_subcategory_from_breadcrumbs(ctx.get("breadcrumbs")),
+        "text": lambda response, ctx: farfetch_rules.get_text(response),
+    }
+
+
+def farfetch_string_xpath_fields(response) -> dict:
+    """
+    Farfetch PDP fields via per-call string XPaths, as the rules did before
+    the precompiled program. Kept as the reference the program is timed and
+    checked against.
+    """
+    highlights = response.xpath(farfetch_xpaths.HIGHLIGHTS_XPATH).getall()
+    composition = response.xpath(farfetch_xpaths.COMPOSITION_XPATH).get()
+    return {
+        "primary_label": response.xpath(farfetch_xpaths.PRIMARY_LABEL_XPATH).get(),
+        "breadcrumbs": response.xpath(farfetch_xpaths.BREADCRUMBS_XPATH).getall(),
+        "price": response.xpath(farfetch_xpaths.PRICE_XPATH).get(),
+        "discount": response.xpath(farfetch_xpaths.DISCOUNT_XPATH).get(),
+        "image_url": response.xpath(farfetch_xpaths.IMAGE_URL_XPATH).get(),
+        "product_name": response.xpath(farfetch_xpaths.PRODUCT_NAME_XPATH).getall()[-1] or None,
+        "brand": response.xpath(farfetch_xpaths.BRAND_XPATH).get(),
+        "text": (
+            ", ".join([*map(str.strip, highlights), composition])
+            if composition
+            else ", ".join(map(str.strip, highlights))
+        ),
+    }
+
+
+def _ounass_fields() -> Dict[str, Callable]:
+    def state(response, ctx):
+        ctx["state"] = ounass_rules.get_state(response)
+        return ctx["state"]
+
+    fields = {
+        "parse": lambda response, ctx: _parse_html(response),
+        "state": state,
+    }
+    # get_data() is a flat mapping of state lookups; time each lookup alone.
+    for name, path in (
+        ("country", ["country"]),
+        ("portal_itemid", ["pdp", "visibleSku"]),
+        ("product_name", ["pdp", "name"]),
+        ("gender", ["pdp", "gender"]),
+        ("brand", ["pdp", "designerCategoryName"]),
+        ("category", ["pdp", "department"]),
+        ("subcategory", ["pdp", "class"]),
+        ("price", ["pdp", "price"]),
+        ("currency", ["currency"]),
+    ):
+        fields[name] = lambda response, ctx, path=path: ounass_rules.safe_get(ctx.get("state"), path)
+    fields.update({
+        "price_discount": lambda response, ctx: ounass_rules.get_discount(ctx.get("state")),
+        "primary_label": lambda response, ctx: ounass_rules.get_primary_label(ctx.get("state")),
+        "image_urls": lambda response, ctx: ounass_rules.get_image_url(ctx.get("state")),
+        "out_of_stock": lambda response, ctx: ounass_rules.get_sold_out(ctx.get("state")),
+        "text": lambda response, ctx: ounass_rules.extract_product_details(ctx.get("state")),
+    })
+    return fields
+
+
+def _level_fields() -> Dict[str, Callable]:
+    return {
+        "parse": lambda response, ctx: _parse_html(response),
+        "country": lambda response, ctx: level_rules.get_country(response.url),
+        "portal_itemid": lambda response, ctx: level_rules.extract_sku(response),
+        "product_name": lambda response, ctx: level_rules.extract_product_name(response),
+        "gender": lambda response, ctx: level_rules.extract_gender_from_breadcrumbs(response),
+        "brand": lambda response, ctx: level_rules.extract_product_brand(response),
+        "category": lambda response, ctx: level_rules.extract_category_and_subcategory_from_breadcrumbs(response),
+        "price": lambda response, ctx: level_rules.extract_price(response),
+        "currency": lambda response, ctx: level_rules.extract_currency(response),
+        "price_discount": lambda response, ctx: level_rules.extract_price_discount(response),
+        "primary_label": lambda response, ctx: level_rules.extract_badges(response),
+        "image_urls": lambda response, ctx: level_rules.extract_first_image_url(response),
+        "text": lambda response, ctx: level_rules.extract_product_details(response),
+        "out_of_stock": lambda response, ctx: level_rules.is_out_of_stock(response),
+        "level_category_id": lambda response, ctx: level_rules.extract_level_category_id(response),
+    }
+
+
+def _build_spiders() -> Dict[str, Callable]:
+    """Site -> callable(response) running the spider's PDP-to-item path."""
+    # Imported here so loading the corpus does not pull in every spider.
+    from ecommercecrawl.spiders.farfetch_crawl import FFSpider
+    from ecommercecrawl.spiders.level_crawl import LevelSpider
+    from ecommercecrawl.spiders.ounass_crawl import OunassSpider
+
+    ff_spider = FFSpider()
+    ounass_spider = OunassSpider()
+    level_spider = LevelSpider()
+    return {
+        farfetch_constants.NAME: ff_spider._populate_pdp_data,
+        ounass_constants.NAME: lambda response: list(ounass_spider.parse_pdp(response)),
+        level_constants.NAME: lambda response: list(level_spider.parse_pdp(response)),
+    }
+
+
+SITE_FIELDS = {
+    farfetch_constants.NAME: _farfetch_fields,
+    ounass_constants.NAME: _ounass_fields,
+    level_constants.NAME: _level_fields,
+}
+
+
+def _summarize_us(samples: List[float]) -> dict:
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "mean_us": round(statistics.fmean(ordered), 3),
+        "p50_us": round(statistics.median(ordered), 3),
+        "p95_us": round(ordered[p95_index], 3),
+        "samples": len(ordered),
+    }
+
+
+def _time_fields(pages: List[Page], fields: Dict[str, Callable], params: BenchmarkParams) -> dict:
+    samples: Dict[str, List[float]] = {name: [] for name in fields}
+    errors: Dict[str, int] = {name: 0 for name in fields}
+    clock = time.perf_counter_ns
+
+    for page in pages:
+        for run in range(params.warmup + params.iterations):
+            response = build_response(page)
+            ctx: Dict[str, Any] = {}
+            for name, extractor in fields.items():
+                started = clock()
+                try:
+                    extractor(response, ctx)
+                except Exception:
+                    errors[name] += 1
+                elapsed_us = (clock() - started) / 1000
+                if run >= params.warmup:
+                    samples[name].append(elapsed_us)
+
+    result = {}
+    for name in fields:
+        result[name] = _summarize_us(samples[name])
+        # Count failures per page, not per run; every run of a page behaves the same.
+        result[name]["errors"] = errors[name] // (params.warmup + params.iterations)
+    return result
+
+
+def _time_full_path(pages: List[Page], run_pdp: Callable, params: BenchmarkParams) -> dict:
+    samples: List[float] = []
+    errors = 0
+    clock = time.perf_counter_ns
+
+    for page in pages:
+        for run in range(params.warmup + params.iterations):
+            response = build_response(page)
+            started = clock()
+            try:
+                run_pdp(response)
+            except Exception:
+                errors += 1
+            elapsed_us = (clock() - started) / 1000
+            if run >= params.warmup:
+                samples.append(elapsed_us)
+
+    summary = _summarize_us(samples)
+    summary["pages_per_second"] = round(1_000_000 / summary["mean_us"], 2) if summary["mean_us"] else None
+    summary["errors"] = errors // (params.warmup + params.iterations)
+    return summary
+
+
+def _time_farfetch_xpath_program(pages: List[Page], params: BenchmarkParams) -> dict:
+    """Per-page time of the string XPaths vs the precompiled program, parse excluded."""
+    string_samples: List[float] = []
+    program_samples: List[float] = []
+    mismatched_pages = 0
+    clock = time.perf_counter_ns
+
+    for page in pages:
+        response = build_response(page)
+        _parse_html(response)
+        if farfetch_rules.extract_pdp_fields(response) != farfetch_string_xpath_fields(response):
+            mismatched_pages += 1
+        for run in range(params.warmup + params.iterations):
+            started = clock()
+            farfetch_string_xpath_fields(response)
+            string_us = (clock() - started) / 1000
+            started = clock()
+            farfetch_rules.extract_pdp_fields(response)
+            program_us = (clock() - started) / 1000
+            if run >= params.warmup:
+                string_samples.append(string_us)
+                program_samples.append(program_us)
+
+    string_xpaths = _summarize_us(string_samples)
+    compiled_program = _summarize_us(program_samples)
+    return {
+        "string_xpaths": string_xpaths,
+        "compiled_program": compiled_program,
+        "speedup": (
+            round(string_xpaths["mean_us"] / compiled_program["mean_us"], 2)
+            if compiled_program["mean_us"] else None
+        ),
+        "mismatched_pages": mismatched_pages,
+    }
+
+
+def _measure_allocations(pages: List[Page], run_pdp: Callable) -> dict:
+    """Peak traced memory and allocated block count of one full-path run per page."""
+    peaks: List[int] = []
+    blocks: List[int] = []
+    for page in pages:
+        response = build_response(page)
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            try:
+                run_pdp(response)
+            except Exception:
+                pass
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        peaks.append(peak)
+        blocks.append(sum(max(0, stat.count_diff) for stat in after.compare_to(before, "filename")))
+
+    return {
+        "peak_kb_mean": round(statistics.fmean(peaks) / 1024, 2),
+        "peak_kb_max": round(max(peaks) / 1024, 2),
+        "retained_blocks_mean": round(statistics.fmean(blocks), 1),
+    }
+
+
+def run_benchmark(
+    pages: List[Page],
+    *,
+    params: Optional[BenchmarkParams] = None,
+    sites: Optional[Iterable[str]] = None,
+) -> dict:
+    """Benchmark every site present in `pages` and return a JSON-serializable report."""
+    params = params or BenchmarkParams()
+    if params.iterations < 1:
+        raise ValueError("iterations must be >= 1.")
+    if params.warmup < 0:
+        raise ValueError("warmup must be >= 0.")
+
+    wanted = set(sites) if sites else None
+    spiders = _build_spiders()
+    report_sites = {}
+    for site in sorted({page.site for page in pages}):
+        if wanted is not None and site not in wanted:
+            continue
+        site_pages = [page for page in pages if page.site == site]
+        site_report = {
+            "pages": len(site_pages),
+            "fields": _time_fields(site_pages, SITE_FIELDS[site](), params),
+            "full_path": _time_full_path(site_pages, spiders[site], params),
+        }
+        if site == farfetch_constants.NAME:
+            site_report["xpath_program"] = _time_farfetch_xpath_program(site_pages, params)
+        if params.measure_allocations:
+            site_report["allocations"] = _measure_allocations(site_pages, spiders[site])
+        report_sites[site] = site_report
+
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "created_at_utc": _utc_now_iso(),
+        "python": platform.python_version(),
+        "iterations": params.iterations,
+        "warmup": params.warmup,
+        "sites": report_sites,
+    }
+
+
+def compare_to_baseline(report: dict, baseline: dict, *, tolerance: float = 0.10) -> List[dict]:
+    """
+    List regressions of `report` against `baseline`.
+
+    A field or full path regresses when its mean time grows by more than
+    `tolerance` (0.10 = 10%). Fields that start raising errors are regressions
+    regardless of time. Sites or fields missing from either side are ignored.
+    """
+    if tolerance < 0:
+        raise ValueError("tolerance must be >= 0.")
+
+    regressions = []
+
+    def check(site, name, current, previous):
+        if current.get("errors", 0) > previous.get("errors", 0):
+            regressions.append({
+                "site": site,
+                "name": name,
+                "reason": "errors",
+                "baseline": previous.get("errors", 0),
+                "current": current["errors"],
+            })
+        if not previous.get("mean_us"):
+            return
+        ratio = current["mean_us"] / previous["mean_us"]
+        if ratio > 1 + tolerance:
+            regressions.append({
+                "site": site,
+                "name": name,
+                "reason": "slower",
+                "baseline_mean_us": previous["mean_us"],
+                "current_mean_us": current["mean_us"],
+                "ratio": round(ratio, 3),
+            })
+
+    for site, site_report in sorted(report.get("sites", {}).items()):
+        baseline_site = baseline.get("sites", {}).get(site)
+        if not baseline_site:
+            continue
+        for field, stats in sorted(site_report.get("fields", {}).items()):
+            previous = baseline_site.get("fields", {}).get(field)
+            if previous:
+                check(site, field, stats, previous)
+        if site_report.get("full_path") and baseline_site.get("full_path"):
+            check(site, "full_path", site_report["full_path"], baseline_site["full_path"])
+
+    return regressions
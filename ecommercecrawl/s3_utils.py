@@ -0,0 +1,19 @@
+"""Helpers shared by the modules that snapshot state to S3."""
+from urllib.parse import urlparse
+
+
+def split_s3_uri(uri):
+    """(bucket, key or prefix) of an s3://bucket/key URI."""
+    parsed = urlparse(uri)
+    if parsed.scheme != "s3" or not parsed.netloc:
+        raise ValueError(f"Invalid S3 URI: {uri}")
+    return parsed.netloc, parsed.path.strip("/")
+
+
+# Error codes of a GetObject/HeadObject on an object that was never written.
+_MISSING_OBJECT_CODES = {"404", "NoSuchKey", "NoSuchBucket"}
+
+
+def is_missing_object(exc):
+    """True when a botocore ClientError means the object does not exist."""
+    return str(exc.response.get("Error", {}).get("Code")) in _MISSING_OBJECT_CODES
@@ -0,0 +1,77 @@
+"""
+Lazy seed URL sources for spiders.
+
+Seed CSVs (local paths or s3://bucket/key, optionally gzip-compressed) are
+read line by line and yielded one URL at a time, so `start_requests` pulls
+them at the pace the scheduler accepts requests instead of holding recrawl
+seed lists of hundreds of thousands of URLs in memory. Only the first column
+is used; blank rows and a `url` header are skipped.
+"""
+import csv
+import gzip
+
+from ecommercecrawl.fingerprints import FingerprintSet
+from ecommercecrawl.s3_utils import split_s3_uri
+
+
+def urls_from_csv_lines(lines):
+    """First-column URLs from an iterable of CSV text lines."""
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        first_column = row[0].strip()
+        if not first_column or first_column.lower() == "url":
+            continue
+        yield first_column
+
+
+def _decode_lines(byte_lines):
+    # utf-8-sig drops a byte order mark at the start of the file.
+    for index, line in enumerate(byte_lines):
+        yield line.decode("utf-8-sig" if index == 0 else "utf-8")
+
+
+def _iter_body_lines(body, compressed):
+    if compressed:
+        with gzip.GzipFile(fileobj=body) as stream:
+            yield from stream
+        return
+    # botocore StreamingBody reads in chunks through iter_lines().
+    if hasattr(body, "iter_lines"):
+        yield from body.iter_lines()
+        return
+    yield from body
+
+
+def _iter_local_lines(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as stream:
+        yield from stream
+
+
+def _iter_s3_lines(source):
+    bucket, key = split_s3_uri(source)
+    if not key:
+        raise ValueError(f"Invalid S3 URL source: {source}")
+
+    import boto3
+
+    response = boto3.client("s3").get_object(Bucket=bucket, Key=key)
+    yield from _iter_body_lines(response["Body"], compressed=key.endswith(".gz"))
+
+
+def iter_seed_urls(source):
+    """Stream seed URLs from a local or S3 CSV (`.gz` is decompressed on the fly)."""
+    if source.startswith("s3://"):
+        lines = _iter_s3_lines(source)
+    else:
+        lines = _iter_local_lines(source)
+    yield from urls_from_csv_lines(_decode_lines(lines))
+
+
+def dedupe_urls(urls, seen=None):
+    """Drop repeated URLs while streaming, keeping 8 bytes per URL seen."""
+    seen = FingerprintSet() if seen is None else seen
+    for url in urls:
+        if seen.add(url):
+            yield url
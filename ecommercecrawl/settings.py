@@ -26,6 +26,12 @@ NEWSPIDER_MODULE = 'ecommercecrawl.spiders'
 RETRY_ENABLED = True
 RETRY_TIMES = 5
 RETRY_HTTP_CODES = [429, 500, 502, 503, 504, 522, 524, 408]
+# Parked retries of a domain are released through a token bucket
+# (RETRY_AFTER_RELEASE_RATE per second, bursts of RETRY_AFTER_RELEASE_BURST)
+# with up to RETRY_AFTER_JITTER extra wait, instead of all at once.
+RETRY_AFTER_RELEASE_RATE = os.getenv("RETRY_AFTER_RELEASE_RATE", "1.0")
+RETRY_AFTER_RELEASE_BURST = os.getenv("RETRY_AFTER_RELEASE_BURST", "2")
+RETRY_AFTER_JITTER = os.getenv("RETRY_AFTER_JITTER", "0.5")
 
 
 # Proxy mode
@@ -44,6 +50,13 @@ ROBOTSTXT_OBEY = False
 CONCURRENT_REQUESTS = 16
 CONCURRENT_REQUESTS_PER_DOMAIN = 2
 CONCURRENT_REQUESTS_PER_IP = 8
+# Budget shared by every crawler of the process when run_crawler.py runs
+# several spiders together (see GlobalConcurrencyDownloader). Unset, the
+# crawl keeps Scrapy's own Downloader; run_crawler.py --max-concurrency sets
+# both.
+GLOBAL_CONCURRENT_REQUESTS = os.getenv("GLOBAL_CONCURRENT_REQUESTS", "0")
+if int(GLOBAL_CONCURRENT_REQUESTS) > 0:
+    DOWNLOADER = "ecommercecrawl.downloader.GlobalConcurrencyDownloader"
 DOWNLOAD_DELAY = 1          # add jitter via AutoThrottle below
 RANDOMIZE_DOWNLOAD_DELAY = False
 DOWNLOAD_TIMEOUT = 25           # keep it tight to avoid long hangs
@@ -78,6 +91,11 @@ COOKIES_ENABLED = True
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 DOWNLOADER_MIDDLEWARES = {
     'ecommercecrawl.middlewares.RetryAfterMiddleware': 550,  # after default RetryMiddleware (543)
+    # Sees target statuses before RetryAfterMiddleware retries them.
+    'ecommercecrawl.middlewares.CircuitBreakerMiddleware': 560,
+    # Only active when RESPONSE_ARCHIVE_MODE=record; sits next to the downloader
+    # so it stores requests exactly as the replay handler will see them.
+    'ecommercecrawl.response_archive.RecordResponsesMiddleware': 900,
 }
 
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
@@ -105,11 +123,98 @@ if ZYTE_API_ENABLED:
     }
     REQUEST_FINGERPRINTER_CLASS = "scrapy_zyte_api.ScrapyZyteAPIRequestFingerprinter"
 
+# Drop PDP requests for a product id already scheduled (see
+# CanonicalPDPDedupeMiddleware); duplicates are counted in the manifest.
+# Off by default.
+PDP_DEDUPE_ENABLED = _env_bool("PDP_DEDUPE_ENABLED", False)
+SPIDER_MIDDLEWARES["ecommercecrawl.middlewares.CanonicalPDPDedupeMiddleware"] = 550
+
+# Depth-first scheduling: PDP requests outrank PLP pagination (see
+# PDPPriorityMiddleware), so queued PDPs drain before listings add more.
+# 0 disables the boost.
+PDP_REQUEST_PRIORITY = os.getenv("PDP_REQUEST_PRIORITY", "10")
+SPIDER_MIDDLEWARES["ecommercecrawl.middlewares.PDPPriorityMiddleware"] = 560
+SCHEDULER_MEMORY_QUEUE = "scrapy.squeues.LifoMemoryQueue"
+SCHEDULER_DISK_QUEUE = "scrapy.squeues.PickleLifoDiskQueue"
+# Setting CRAWL_JOBDIR keeps pending requests in pickled disk queues instead
+# of memory, so very large catalogs do not grow the process.
+JOBDIR = os.getenv("CRAWL_JOBDIR") or None
+
+# Per-domain circuit breaker (CircuitBreakerMiddleware): once at least
+# CIRCUIT_BREAKER_ERROR_RATE of the last CIRCUIT_BREAKER_MIN_REQUESTS+
+# responses within CIRCUIT_BREAKER_WINDOW_SECONDS are bans/throttling or
+# download errors, requests for the domain are parked and a single probe is
+# sent every CIRCUIT_BREAKER_OPEN_SECONDS (doubling up to the max) until one
+# succeeds. The domain is given up after CIRCUIT_BREAKER_MAX_PROBES failed
+# probes (0 keeps probing). Off by default.
+CIRCUIT_BREAKER_ENABLED = _env_bool("CIRCUIT_BREAKER_ENABLED", False)
+CIRCUIT_BREAKER_STATUSES = [403, 429, 503]
+CIRCUIT_BREAKER_WINDOW_SECONDS = os.getenv("CIRCUIT_BREAKER_WINDOW_SECONDS", "60")
+CIRCUIT_BREAKER_MIN_REQUESTS = os.getenv("CIRCUIT_BREAKER_MIN_REQUESTS", "10")
+CIRCUIT_BREAKER_ERROR_RATE = os.getenv("CIRCUIT_BREAKER_ERROR_RATE", "0.5")
+CIRCUIT_BREAKER_OPEN_SECONDS = os.getenv("CIRCUIT_BREAKER_OPEN_SECONDS", "60")
+CIRCUIT_BREAKER_MAX_OPEN_SECONDS = os.getenv("CIRCUIT_BREAKER_MAX_OPEN_SECONDS", "600")
+CIRCUIT_BREAKER_MAX_PROBES = os.getenv("CIRCUIT_BREAKER_MAX_PROBES", "5")
+
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 #EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
 #}
+EXTENSIONS = {
+    "ecommercecrawl.extensions.SigtermDrainExtension": 500,
+}
+
+# On SIGTERM (ECS/Fargate task stop) stop sending requests, give in-flight
+# ones DRAIN_TIMEOUT_SECONDS to finish and close with exit_reason "drained".
+# Closing also waits up to DOWNLOAD_TIMEOUT for downloads in progress; keep
+# both well below the task's stopTimeout so finalization and upload fit.
+DRAIN_ON_SIGTERM = _env_bool("DRAIN_ON_SIGTERM", True)
+DRAIN_TIMEOUT_SECONDS = os.getenv("DRAIN_TIMEOUT_SECONDS", "25")
+
+# AIMD per-domain concurrency and delay (AdaptiveConcurrencyExtension):
+# throttling (429/503, Retry-After) multiplies concurrency by
+# AIMD_DECREASE_FACTOR and doubles the delay; a full window of fast
+# responses adds one concurrent request and removes AIMD_DELAY_STEP seconds.
+# AIMD_SITE_LIMITS overrides the floors and ceilings per host suffix.
+AIMD_ENABLED = _env_bool("AIMD_ENABLED", False)
+AIMD_MIN_CONCURRENCY = os.getenv("AIMD_MIN_CONCURRENCY", "1")
+AIMD_MAX_CONCURRENCY = os.getenv("AIMD_MAX_CONCURRENCY", "8")
+AIMD_MIN_DELAY = os.getenv("AIMD_MIN_DELAY", "0.25")
+AIMD_MAX_DELAY = os.getenv("AIMD_MAX_DELAY", "60")
+AIMD_DECREASE_FACTOR = os.getenv("AIMD_DECREASE_FACTOR", "0.5")
+AIMD_DECREASE_COOLDOWN = os.getenv("AIMD_DECREASE_COOLDOWN", "2")
+AIMD_LATENCY_TOLERANCE = os.getenv("AIMD_LATENCY_TOLERANCE", "2")
+AIMD_DELAY_STEP = os.getenv("AIMD_DELAY_STEP", "0.1")
+AIMD_SITE_LIMITS = {
+    "farfetch.com": {"max_concurrency": 4, "min_delay": 0.5},
+    "levelshoes.com": {"max_concurrency": 6},
+}
+EXTENSIONS["ecommercecrawl.extensions.AdaptiveConcurrencyExtension"] = 510
+
+# Crawl progress (CrawlProgressExtension): every PROGRESS_INTERVAL_SECONDS
+# expected vs completed listing pages and PDPs per seed, items/sec and the
+# ETA are logged and written to PROGRESS_DIR/{spider}/{run_id}/progress.json;
+# set PROGRESS_S3_PREFIX (s3://bucket/prefix) to upload it for polling.
+# Off by default; the ECS scraper task turns it on.
+PROGRESS_ENABLED = _env_bool("PROGRESS_ENABLED", False)
+PROGRESS_INTERVAL_SECONDS = os.getenv("PROGRESS_INTERVAL_SECONDS", "60")
+PROGRESS_DIR = os.getenv("PROGRESS_DIR", "output/progress")
+PROGRESS_S3_PREFIX = os.getenv("PROGRESS_S3_PREFIX")
+EXTENSIONS["ecommercecrawl.extensions.CrawlProgressExtension"] = 520
+
+# Live OpenMetrics export (OpenMetricsExtension): Scrapy stats, per-domain
+# download latency histograms, slot delays, queue sizes and throughput.
+# Served on METRICS_HOST:METRICS_PORT (empty disables the endpoint) and/or
+# written to METRICS_FILE every METRICS_INTERVAL_SECONDS, for a Prometheus
+# agent or node_exporter textfile collector beside the ECS task.
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", False)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT", "9410")
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_INTERVAL_SECONDS = os.getenv("METRICS_INTERVAL_SECONDS", "15")
+METRICS_RATE_WINDOW_SECONDS = os.getenv("METRICS_RATE_WINDOW_SECONDS", "60")
+EXTENSIONS["ecommercecrawl.extensions.OpenMetricsExtension"] = 530
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -133,6 +238,16 @@ S3_BUCKET = os.getenv("S3_BUCKET")
 # unless the hostname is explicitly listed in OUNASS_REQUESTS_TLDS.
 CRAWLER_API_SERVICE = os.getenv("CRAWLER_API_SERVICE", "zyte").lower()
 CRAWLER_API_ZYTE_GEOLOCATION = os.getenv("CRAWLER_API_ZYTE_GEOLOCATION")
+# CRAWLER_API_SERVICE=local sends crawler API requests to the stand-in server
+# in scripts/local_crawler_api.py (recorded fixtures, no paid API calls).
+CRAWLER_API_LOCAL_ENDPOINT = os.getenv(
+    "CRAWLER_API_LOCAL_ENDPOINT",
+    "http://127.0.0.1:8765/extract",
+)
+# Only active when CRAWLER_API_SERVICE=local. Runs before RetryAfterMiddleware
+# on the way back so target statuses (not the API's 200) drive retries and
+# backoff.
+DOWNLOADER_MIDDLEWARES["ecommercecrawl.middlewares.LocalCrawlerAPIMiddleware"] = 600
 OUNASS_FETCH_BACKEND = os.getenv("OUNASS_FETCH_BACKEND", "auto").lower()
 # Ounass hostnames allowed to stay on normal requests in auto mode.
 # Empty list means all Ounass hostnames use the configured crawler API.
@@ -141,16 +256,121 @@ OUNASS_CRAWLER_API_PLP_REQUEST_TYPE = os.getenv(
     "OUNASS_CRAWLER_API_PLP_REQUEST_TYPE",
     "http_response",
 )
+# "adaptive" tries http_response first and re-issues as rendered_html only
+# when the PDP state script is missing, learning per hostname when to skip
+# the cheap attempt.
 OUNASS_CRAWLER_API_PDP_REQUEST_TYPE = os.getenv(
     "OUNASS_CRAWLER_API_PDP_REQUEST_TYPE",
     "rendered_html",
 )
+# Adaptive request type policy: after MIN_SAMPLES cheap attempts on a hostname
+# with a success rate below MIN_SUCCESS_RATE, go straight to rendered_html and
+# only probe the cheap type once every PROBE_INTERVAL requests.
+CRAWLER_API_ADAPTIVE_MIN_SAMPLES = os.getenv("CRAWLER_API_ADAPTIVE_MIN_SAMPLES", "20")
+CRAWLER_API_ADAPTIVE_MIN_SUCCESS_RATE = os.getenv("CRAWLER_API_ADAPTIVE_MIN_SUCCESS_RATE", "0.5")
+CRAWLER_API_ADAPTIVE_PROBE_INTERVAL = os.getenv("CRAWLER_API_ADAPTIVE_PROBE_INTERVAL", "50")
+
+# Escalation from direct fetches to the crawler API (Farfetch, Level):
+# after CRAWLER_API_ESCALATION_BLOCK_THRESHOLD blocked answers within
+# CRAWLER_API_ESCALATION_WINDOW_SECONDS a host moves to the next request
+# type (http_response, then rendered_html) and steps back down after
+# CRAWLER_API_ESCALATION_COOLDOWN_SECONDS. Needs Zyte or the local API.
+CRAWLER_API_ESCALATION_ENABLED = _env_bool("CRAWLER_API_ESCALATION_ENABLED", False)
+CRAWLER_API_ESCALATION_STATUSES = [403, 429, 503]
+CRAWLER_API_ESCALATION_REQUEST_TYPES = ["http_response", "rendered_html"]
+CRAWLER_API_ESCALATION_BLOCK_THRESHOLD = os.getenv("CRAWLER_API_ESCALATION_BLOCK_THRESHOLD", "5")
+CRAWLER_API_ESCALATION_WINDOW_SECONDS = os.getenv("CRAWLER_API_ESCALATION_WINDOW_SECONDS", "60")
+CRAWLER_API_ESCALATION_COOLDOWN_SECONDS = os.getenv("CRAWLER_API_ESCALATION_COOLDOWN_SECONDS", "900")
+# Rebuilds requests before they reach the Zyte middleware; sees decoded local
+# API answers before the breaker and retries.
+DOWNLOADER_MIDDLEWARES["ecommercecrawl.middlewares.CrawlerAPIEscalationMiddleware"] = 570
 
 # Used only when Ounass falls back to requests mode.
 OUNASS_REQUEST_DELAY_SECONDS = os.getenv("OUNASS_REQUEST_DELAY_SECONDS", "0.2")
 OUNASS_REQUEST_JITTER_SECONDS = os.getenv("OUNASS_REQUEST_JITTER_SECONDS", "0.1")
 OUNASS_REQUEST_TIMEOUT_SECONDS = os.getenv("OUNASS_REQUEST_TIMEOUT_SECONDS", "20")
 
+# Crawl mode (set by run_crawler.py --mode). "listing" emits price-refresh
+# items from listing data and fetches PDPs only for products missing from
+# the per-spider known products file under KNOWN_PRODUCTS_DIR.
+# "incremental" keeps per-product listing signatures in SQLite files under
+# PRODUCT_STATE_DIR. Set KNOWN_PRODUCTS_S3_PREFIX and PRODUCT_STATE_S3_PREFIX
+# (s3://bucket/prefix) to snapshot them to S3 between runs.
+CRAWL_MODE = os.getenv("CRAWL_MODE", "full").lower()
+KNOWN_PRODUCTS_DIR = os.getenv("KNOWN_PRODUCTS_DIR", "output/state/known_products")
+KNOWN_PRODUCTS_S3_PREFIX = os.getenv("KNOWN_PRODUCTS_S3_PREFIX")
+PRODUCT_STATE_DIR = os.getenv("PRODUCT_STATE_DIR", "output/state/product_state")
+PRODUCT_STATE_S3_PREFIX = os.getenv("PRODUCT_STATE_S3_PREFIX")
+
+# Early-stop pagination for new-arrival discovery on newness-sorted PLPs:
+# pages are requested PLP_PAGE_WINDOW at a time and pagination stops at the
+# first page whose products are all in the known products file. Only
+# spiders whose listings are sorted newest first (Ounass) honour it; Farfetch
+# and Level ignore it with a warning.
+PLP_EARLY_STOP = _env_bool("PLP_EARLY_STOP", False)
+PLP_PAGE_WINDOW = os.getenv("PLP_PAGE_WINDOW", "1")
+
+# Cross-country coalescing for Ounass and Level full crawls (set by
+# run_crawler.py --coalesce-countries): fetch the PDP once per SKU and
+# language and reuse it for the other country hosts with their PLP prices.
+COALESCE_COUNTRIES = _env_bool("COALESCE_COUNTRIES", False)
+
+# Level PDP enrichment (off by default): PDPs listed by the PLP API are
+# completed from the catalog API (one moreFromBrand call serves every
+# product of a brand on a PLP page) instead of their HTML page; products the
+# API does not fully describe keep their HTML PDP request. The calls block
+# the reactor like the PLP API calls, so check the field paths read by
+# level_rules.get_*_from_item against a recorded moreFromBrand response
+# (run_crawler.py level --record) before enabling. Enrichment is switched
+# off for the run when none of the first LEVEL_PDP_API_PROBE_PRODUCTS
+# products could be completed from the API.
+LEVEL_PDP_API_ENRICHMENT = _env_bool("LEVEL_PDP_API_ENRICHMENT", False)
+LEVEL_PDP_API_PROBE_PRODUCTS = os.getenv("LEVEL_PDP_API_PROBE_PRODUCTS", "20")
+
+# Resumable crawls (run_crawler.py --checkpoint / --resume RUN_ID): every
+# CHECKPOINT_INTERVAL_SECONDS the pending requests, parsed request
+# fingerprints and output offset are saved under CHECKPOINT_DIR, and to
+# CHECKPOINT_S3_PREFIX (s3://bucket/prefix) together with the new output.
+# Pending requests are kept pickled in memory (a few hundred bytes each),
+# also when CRAWL_JOBDIR moves the scheduler queue to disk.
+CHECKPOINT_ENABLED = _env_bool("CHECKPOINT_ENABLED", False)
+CHECKPOINT_INTERVAL_SECONDS = os.getenv("CHECKPOINT_INTERVAL_SECONDS", "300")
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "output/state/checkpoints")
+CHECKPOINT_S3_PREFIX = os.getenv("CHECKPOINT_S3_PREFIX")
+RESUME_RUN_ID = os.getenv("RESUME_RUN_ID")
+SPIDER_MIDDLEWARES["ecommercecrawl.middlewares.CheckpointMiddleware"] = 500
+
+# Sharded crawls (run_crawler.py --shard i/N --run-id RUN_ID, see
+# ecommercecrawl.sharding): seeds and PDPs are split by a consistent hash of
+# the canonical product id. SHARD_FRONTIER_URL (redis://host:6379/0, needs
+# the redis package) lets shards hand PDPs to their owner and split listing
+# seeds too; the last shard to finish merges the shard manifests.
+SHARD = os.getenv("SHARD")
+RUN_ID = os.getenv("RUN_ID")
+SHARD_FRONTIER_URL = os.getenv("SHARD_FRONTIER_URL")
+SHARD_FRONTIER_KEY_PREFIX = os.getenv("SHARD_FRONTIER_KEY_PREFIX", "ecommercecrawl:frontier")
+SHARD_FRONTIER_BATCH_SIZE = os.getenv("SHARD_FRONTIER_BATCH_SIZE", "100")
+SHARD_FRONTIER_TTL_SECONDS = os.getenv("SHARD_FRONTIER_TTL_SECONDS", str(7 * 24 * 3600))
+SHARD_IDLE_TIMEOUT_SECONDS = os.getenv("SHARD_IDLE_TIMEOUT_SECONDS", "1800")
+SPIDER_MIDDLEWARES["ecommercecrawl.middlewares.ShardMiddleware"] = 540
+
+# Conditional-request HTTP cache (ecommercecrawl.httpcache): responses with
+# ETag/Last-Modified are kept under HTTPCACHE_DIR (LRU-bounded to
+# HTTPCACHE_MAX_SIZE_MB per spider) and revalidated on the next run, so an
+# unchanged page costs a 304. HTTPCACHE_S3_PREFIX (s3://bucket/prefix)
+# shares the cache between runs.
+HTTPCACHE_ENABLED = _env_bool("HTTPCACHE_ENABLED", False)
+HTTPCACHE_POLICY = "ecommercecrawl.httpcache.ConditionalCachePolicy"
+HTTPCACHE_STORAGE = "ecommercecrawl.httpcache.LRUFilesystemCacheStorage"
+HTTPCACHE_DIR = os.getenv("HTTPCACHE_DIR", "output/state/httpcache")
+HTTPCACHE_GZIP = True
+HTTPCACHE_MAX_SIZE_MB = os.getenv("HTTPCACHE_MAX_SIZE_MB", "512")
+HTTPCACHE_S3_PREFIX = os.getenv("HTTPCACHE_S3_PREFIX")
+
+# Record/replay of downloaded responses (set by run_crawler.py --record/--replay).
+RESPONSE_ARCHIVE_MODE = os.getenv("RESPONSE_ARCHIVE_MODE")
+RESPONSE_ARCHIVE_PATH = os.getenv("RESPONSE_ARCHIVE_PATH")
+
 # Quality gate (executed automatically in PostCrawlPipeline on spider close)
 QUALITY_GATE_ENABLED = os.getenv("QUALITY_GATE_ENABLED", "true")
 QUALITY_GATE_BLANK_THRESHOLD = os.getenv("QUALITY_GATE_BLANK_THRESHOLD", "0.2")
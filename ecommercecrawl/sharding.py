@@ -0,0 +1,240 @@
+"""
+Sharded crawls (run_crawler.py --shard i/N --run-id RUN_ID).
+
+N workers split one crawl under a shared run id. Seed URLs and discovered
+PDPs belong to the shard picked by a jump consistent hash of the spider's
+canonical product id, so going from N to N + 1 workers only moves about
+1/(N + 1) of the products.
+
+Without a frontier every shard reads all listing seeds and pages, keeps the
+PDPs (and listing rows) it owns and drops the others: listings are fetched
+N times, PDPs once. With SHARD_FRONTIER_URL, a Redis-compatible server
+(`make frontier-up` runs one locally), listing seeds are split as well: a
+shard that lists a PDP owned by another shard pushes the request onto the
+owner's queue, and product ids are claimed in a shared set so no PDP is
+queued twice. Shards stay open until every shard is idle and every queue is
+empty.
+
+Each shard writes its own output part and a shard manifest
+(metadata/manifest.shard-{i}-of-{N}.json) under the run id.
+`merge_shard_manifests()` combines them into the run's manifest.json; with
+a frontier the last shard to finish writes it, otherwise
+scripts/merge_shard_manifests.py does.
+"""
+import json
+import pickle
+from dataclasses import dataclass
+from datetime import datetime
+
+from ecommercecrawl.fingerprints import fingerprint
+
+DEFAULT_KEY_PREFIX = "ecommercecrawl:frontier"
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+# Quality gate status of a merged manifest when every shard passed.
+QUALITY_GATE_PASS = "pass"
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping & Veach) of a 64-bit `key` into `buckets`."""
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+@dataclass(frozen=True)
+class ShardSpec:
+    index: int
+    count: int
+
+    @classmethod
+    def parse(cls, value):
+        """Parse "i/N" with a 0-based shard index."""
+        try:
+            index, count = (int(part) for part in str(value).split("/"))
+        except ValueError:
+            raise ValueError(f"Shard must look like i/N, got {value!r}") from None
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Shard index must be within 0..N-1, got {value!r}")
+        return cls(index, count)
+
+    @classmethod
+    def from_settings(cls, settings):
+        value = settings.get("SHARD") if settings is not None else None
+        # Only a string is a shard; mocked settings return other objects.
+        return cls.parse(value) if isinstance(value, str) and value else None
+
+    @property
+    def tag(self):
+        return f"shard-{self.index}-of-{self.count}"
+
+    def owner(self, key):
+        return jump_hash(fingerprint(key), self.count)
+
+    def owns(self, key):
+        return self.owner(key) == self.index
+
+
+class ShardFrontier:
+    """
+    Work queues and product id claims shared by the shards of one run.
+
+    `client` is a redis-py compatible client. Keys live under
+    {prefix}:{spider}:{run_id} and expire `ttl_seconds` after the last
+    shard finished.
+    """
+
+    def __init__(self, client, key_prefix, shard, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.client = client
+        self.key_prefix = key_prefix
+        self.shard = shard
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def from_settings(cls, settings, spider_name, run_id, shard):
+        url = settings.get("SHARD_FRONTIER_URL")
+        if not url:
+            return None
+        import redis
+
+        prefix = settings.get("SHARD_FRONTIER_KEY_PREFIX") or DEFAULT_KEY_PREFIX
+        return cls(
+            redis.Redis.from_url(url),
+            f"{prefix}:{spider_name}:{run_id}",
+            shard,
+            ttl_seconds=settings.getint("SHARD_FRONTIER_TTL_SECONDS", DEFAULT_TTL_SECONDS),
+        )
+
+    def _key(self, *parts):
+        return ":".join([self.key_prefix, *map(str, parts)])
+
+    def claim(self, product_id):
+        """True for the first shard to claim `product_id` in this run."""
+        return bool(self.client.sadd(self._key("claimed"), fingerprint(product_id)))
+
+    def push(self, owner, request_dict):
+        self.client.rpush(self._key("queue", owner), pickle.dumps(request_dict, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def pop(self, count):
+        """Up to `count` request dicts queued for this shard."""
+        requests = []
+        key = self._key("queue", self.shard.index)
+        while len(requests) < count:
+            value = self.client.lpop(key)
+            if value is None:
+                break
+            requests.append(pickle.loads(value))
+        return requests
+
+    def set_idle(self, idle):
+        self.client.hset(self._key("idle"), self.shard.index, int(idle))
+
+    def all_idle(self):
+        """True once every shard reported idle with nothing left in its queue."""
+        idle = {int(index): int(value) for index, value in self.client.hgetall(self._key("idle")).items()}
+        if any(not idle.get(index) for index in range(self.shard.count)):
+            return False
+        return not any(self.client.llen(self._key("queue", index)) for index in range(self.shard.count))
+
+    def finish(self, manifest):
+        """
+        Store this shard's manifest. The last shard to finish gets every
+        shard manifest back, ordered by shard; the others get None.
+        """
+        manifests_key = self._key("manifests")
+        self.client.hset(manifests_key, self.shard.index, json.dumps(manifest))
+        finished = self.client.incr(self._key("finished"))
+        for name in ("claimed", "idle", "manifests", "finished"):
+            self.client.expire(self._key(name), self.ttl_seconds)
+        if finished != self.shard.count:
+            return None
+        stored = self.client.hgetall(manifests_key)
+        return [json.loads(stored[index]) for index in sorted(stored, key=int)]
+
+
+def _sum_counts(values):
+    total = {}
+    for counts in values:
+        for key, count in (counts or {}).items():
+            total[key] = total.get(key, 0) + count
+    return total
+
+
+def _merge_quality_gate(manifests):
+    gates = [manifest.get("quality_gate") for manifest in manifests]
+    if not any(gates):
+        return None
+    failed = next((gate for gate in gates if not gate or gate.get("status") != QUALITY_GATE_PASS), None)
+    return {
+        "status": failed.get("status") if failed else QUALITY_GATE_PASS,
+        "reason": failed.get("reason") if failed else None,
+        "violations_count": sum((gate or {}).get("violations_count") or 0 for gate in gates),
+        "report_paths": [gate.get("report_path") for gate in gates if gate],
+    }
+
+
+def merge_shard_manifests(manifests):
+    """
+    One manifest for a sharded run from its shard manifests.
+
+    Output parts are listed under artifacts.parts (checked one by one by the
+    bronze manifest verifier), top-level counters are summed and each
+    shard's full stats are kept under shards.
+    """
+    manifests = sorted(manifests, key=lambda manifest: manifest["shard"]["index"])
+    first = manifests[0]
+    start_times = [manifest["start_time"] for manifest in manifests if manifest.get("start_time")]
+    start_time = min(start_times) if start_times else None
+    finish_time = max(manifest["finish_time"] for manifest in manifests)
+    reasons = {manifest.get("exit_reason") for manifest in manifests}
+    parts = [manifest["artifacts"] for manifest in manifests if manifest["artifacts"].get("file_path")]
+    stats = [manifest.get("stats", {}) for manifest in manifests]
+
+    merged = {
+        "run_id": first["run_id"],
+        "crawler_name": first["crawler_name"],
+        "exit_reason": reasons.pop() if len(reasons) == 1 else "mixed",
+        "entry_points": first.get("entry_points", {}),
+        "start_time": start_time,
+        "finish_time": finish_time,
+        "duration_seconds": (
+            (datetime.fromisoformat(finish_time) - datetime.fromisoformat(start_time)).total_seconds()
+            if start_time else None
+        ),
+        "stats": {
+            "items_scraped": sum(shard_stats.get("items_scraped", 0) for shard_stats in stats),
+            "requests_made": sum(shard_stats.get("requests_made", 0) for shard_stats in stats),
+            "errors_count": sum(shard_stats.get("errors_count", 0) for shard_stats in stats),
+            "status_code_counts": _sum_counts(shard_stats.get("status_code_counts") for shard_stats in stats),
+        },
+        "artifacts": {
+            "rows": sum(manifest["artifacts"].get("rows", 0) for manifest in manifests),
+            "parts": parts,
+        },
+        "shards": [
+            {
+                "index": manifest["shard"]["index"],
+                "exit_reason": manifest.get("exit_reason"),
+                "stats": manifest.get("stats", {}),
+            }
+            for manifest in manifests
+        ],
+    }
+    quality_gate = _merge_quality_gate(manifests)
+    if quality_gate:
+        merged["quality_gate"] = quality_gate
+    merged["bronze_verification"] = {
+        "expected": {
+            "parts": [
+                {
+                    "file_size_bytes": part.get("file_size_bytes", 0),
+                    "hashes": part.get("hashes", {}).get("sha256", ""),
+                }
+                for part in parts
+            ]
+        }
+    }
+    return merged
@@ -3,6 +3,7 @@ from datetime import date
 from ecommercecrawl.spiders.mastercrawl import MasterCrawl
 from ecommercecrawl.rules import farfetch_rules as rules
 from ecommercecrawl.constants import farfetch_constants as constants
+from ecommercecrawl.middlewares import get_target_url
 
 
 def _slot_delay(url):
@@ -27,24 +28,36 @@ class FFSpider(MasterCrawl):
         req.meta['download_delay'] = _slot_delay(req.url)
         return req
 
+    def get_canonical_product_id(self, request):
+        # The same item id is listed under several slugs and query strings.
+        url = get_target_url(request)
+        if not rules.is_pdp_url(url):
+            return None
+        itemid = rules.get_portal_itemid(url)
+        return f"{rules.get_country(url)}/{itemid}" if itemid else None
+
     # ---------- Pagination helper (returns ONLY pages 2..N) ----------
-    def get_pages(self, response):
-        """
-        Return URLs for remaining pages (2..N) of the current PLP.
-        If no pagination or total_pages <= 1, return [].
-        """
+    def _get_total_pages(self, response):
         pagination = rules.get_pagination(response)
         if not pagination:
-            return []
+            return 0
         try:
             total_pages = rules.get_max_page(pagination)  # e.g., "1 of 51" -> 51
         except (ValueError, AttributeError):
-            return []
-        if total_pages <= 1:
-            return []
-        
+            return 0
         if self.limit:
             total_pages = min(total_pages, self.limit)
+        return total_pages
+
+    def get_pages(self, response, total_pages=None):
+        """
+        Return URLs for remaining pages (2..N) of the current PLP.
+        If no pagination or total_pages <= 1, return [].
+        """
+        if total_pages is None:
+            total_pages = self._get_total_pages(response)
+        if total_pages <= 1:
+            return []
 
         # Prefer rules.get_list_page_urls to generate 2..N; if it returns all pages, filter below.
         urls = rules.get_list_page_urls(response.url, total_pages)
@@ -64,16 +77,39 @@ class FFSpider(MasterCrawl):
 
     # ---------- PLP handler ----------
     def parse_plp(self, response):
+        # Read once; progress, PDP scheduling and pagination all use them.
+        pdp_urls = [response.urljoin(pdp) for pdp in rules.get_pdp_urls(response)]
+        total_pages = self._get_total_pages(response)
+        if self.progress is not None:
+            self.report_listing_page(response.url, total_pages or None, pdp_urls)
         # 1) Always process the current PLP (including page 1)
-        pdps = rules.get_pdp_urls(response)
-        for pdp in pdps:
-            pdp_url = response.urljoin(pdp)
-            yield self._schedule(pdp_url, callback=self.parse)
+        if self.uses_listing_data():
+            yield from self._parse_plp_listing(response)
+        else:
+            for pdp_url in pdp_urls:
+                yield self._schedule(pdp_url, callback=self.parse)
 
         # 2) Only the first page schedules the other pages 2..N
         if rules.is_first_page(response.url):
-            for url in self.get_pages(response):
+            for url in self.get_pages(response, total_pages):
+                yield self._schedule(url, callback=self.parse)
+
+    def _parse_plp_listing(self, response):
+        """
+        Listing and incremental modes: emit rows from the JSON-LD offers and
+        only fetch PDPs that are new (listing) or changed (incremental).
+        """
+        for product in rules.get_listing_products(response):
+            url = product.pop('url')
+            fields = {
+                'country': rules.get_country(url),
+                'portal_itemid': rules.get_portal_itemid(url),
+                **product,
+            }
+            if self.should_fetch_pdp(url, fields):
                 yield self._schedule(url, callback=self.parse)
+                continue
+            yield self.build_listing_item(constants.NAME, url, **fields)
 
     # ---------- PDP handler ----------
     def parse_pdp(self, response):
@@ -81,6 +117,7 @@ class FFSpider(MasterCrawl):
         Orchestrates PDP data extraction, persistence, and image downloading.
         """
         data = self._populate_pdp_data(response)
+        self.remember_product(data.get('url'), data)
         #date_string = data['crawl_date']
         #outfile_base = self.build_output_basename(constants.OUTPUT_DIR, date_string, 'pdps')
 
@@ -97,16 +134,18 @@ class FFSpider(MasterCrawl):
         Extracts all data from a PDP response and returns it as a dictionary.
         """
         today = date.today()
-        primary_label = rules.get_primary_label(response)
-        breadcrumbs = rules.get_breadcrumbs(response)
+        # One pass of the precompiled PDP program over the parsed page.
+        fields = rules.extract_pdp_fields(response)
+        primary_label = fields['primary_label']
+        breadcrumbs = fields['breadcrumbs']
         date_string = today.strftime("%Y-%m-%d")
         sold_out = rules.is_sold_out(primary_label)
         
         if not sold_out:    
-            price_raw = rules.get_price(response)
+            price_raw = fields['price']
             price, currency = rules.get_price_and_currency(price_raw)
-            discount = rules.get_discount(response)
-            image_url = rules.get_image_url(response)
+            discount = fields['discount']
+            image_url = fields['image_url']
         else:
             price_raw = None
             price = None
@@ -121,9 +160,9 @@ class FFSpider(MasterCrawl):
             'url': rules.get_url_drop_param(response.url),
             'country': rules.get_country(response.url),
             'portal_itemid': rules.get_portal_itemid(response.url),
-            'product_name': rules.get_product_name(response),
+            'product_name': fields['product_name'],
             'gender': rules.get_gender(response.url),
-            'brand': rules.get_brand(response),
+            'brand': fields['brand'],
             'category': rules.get_category_from_breadcrumbs(breadcrumbs),
             'subcategory': rules.get_subcategory_from_breadcrumbs(breadcrumbs),
             'price': price,
@@ -132,5 +171,5 @@ class FFSpider(MasterCrawl):
             'sold_out': sold_out,
             'primary_label': primary_label,
             'image_url': image_url,
-            'text': rules.get_text(response),
+            'text': fields['text'],
         }
\ No newline at end of file
@@ -3,6 +3,10 @@ from datetime import date
 from ecommercecrawl.spiders.mastercrawl import MasterCrawl
 from ecommercecrawl.rules import level_rules as rules
 from ecommercecrawl.constants import level_constants as constants
+from ecommercecrawl.response_archive import ResponseArchive
+from ecommercecrawl.httpcache import LRUFilesystemCacheStorage
+from ecommercecrawl.fingerprints import FingerprintSet
+from urllib.parse import urlparse
 import requests
 import re
 
@@ -21,7 +25,16 @@ class LevelSpider(MasterCrawl, scrapy.Spider):
 
     def _get_payload(self, api, params, headers):
         try:
-            response = requests.get(api, params=params, headers=headers)
+            # API calls bypass Scrapy's downloader, so record/replay runs
+            # route them through the response archive explicitly.
+            archive = ResponseArchive.from_settings(getattr(self, "settings", None))
+            cache = LRUFilesystemCacheStorage.for_spider(self)
+            if archive is not None:
+                response = archive.requests_get(api, params=params, headers=headers)
+            elif cache is not None:
+                response = cache.requests_get(self, api, params=params, headers=headers)
+            else:
+                response = requests.get(api, params=params, headers=headers)
             response.raise_for_status()
             payload = response.json()
         except requests.exceptions.RequestException as exc:
@@ -37,8 +50,12 @@ class LevelSpider(MasterCrawl, scrapy.Spider):
         api, params, headers = self.get_api_params_plp(url, page_number)
         return self._get_payload(api, params, headers)
     
-    def _fetch_pdp_via_api(self, sku, language, gender):
-        api, params, headers = self.get_api_params_pdp(sku, language, gender)
+    def _fetch_pdp_via_api(self, sku, country, language, gender):
+        """
+        Fetch a moreFromBrand payload: a page of products of the brand of
+        `sku`, in the PLP API product format.
+        """
+        api, params, headers = self.get_api_params_pdp(sku, country, language, gender)
         return self._get_payload(api, params, headers)
 
     def _handle_seed_url(self, url):
@@ -53,6 +70,23 @@ class LevelSpider(MasterCrawl, scrapy.Spider):
             return
         return None
 
+    def get_item_product_id(self, item):
+        # Rows built from the PLP API carry the SKU their PDP request used.
+        url = item.get('url')
+        if not url:
+            return None
+        return self.get_canonical_product_id(
+            scrapy.Request(url, meta={'data_dict': {'portal_itemid': item.get('portal_itemid')}})
+        )
+
+    def get_canonical_product_id(self, request):
+        # PLP API rows carry the SKU; PDP seeds fall back to their path.
+        if not rules.is_pdp(request.url):
+            return None
+        parsed = urlparse(request.url)
+        sku = request.meta.get('data_dict', {}).get('portal_itemid')
+        return f"{parsed.hostname}/{sku or parsed.path}"
+
     def get_api_params_plp(self, url, page_number=0):
         if rules.is_plp(url):
             country = rules.get_country(url)
@@ -75,16 +109,33 @@ class LevelSpider(MasterCrawl, scrapy.Spider):
             return api, dict(params_base), headers
         else:
             raise ValueError(f'URL {url} is not a PLP URL')
+
+    def get_api_params_pdp(self, sku, country, language, gender):
+        api = f'{constants.API_BASE_URL}/{country}/{language.lower()}/{constants.API_ENDPOINT_PDP}'
+        params_base = {
+            "sku": sku,
+            "groupID": constants.GROUPID,
+            "museTier": constants.MUSETIER,
+            "count": constants.API_COUNT,
+            "genderType": gender,
+            "mediaGender": gender,
+        }
+        return api, dict(params_base), constants.API_HEADERS
   
     def handle_plp_url(self, url):
         page = 0
-        while True:
+        while not self.is_draining():
             payload = self._fetch_plp_via_api(url, page)
             items = rules.get_products(payload) or []
             if not items:
                 break
-            for item in items:
-                yield from self._handle_item(item)
+            if self.progress is not None:
+                self.report_listing_page(
+                    url, rules.get_total_pages(payload), filter(None, map(rules.get_url_from_item, items))
+                )
+            yield from self._enrich_pdp_requests(
+                obj for item in items for obj in self._handle_item(item)
+            )
             page +=1
         
     def _handle_item(self, item):
@@ -114,19 +165,162 @@ class LevelSpider(MasterCrawl, scrapy.Spider):
                 # add stock_info https://www.levelshoes.com/off-white-out-of-office-ooo-sneakers-white-calf-leather-men-low-tops-a8vplk.html
                 # 'stock': rules.get_stock_from_item(item),
             }
+        listing_fields = {
+            key: value for key, value in data_dict.items()
+            if key not in {'run_id', 'site', 'crawl_date', 'url'}
+        }
+        if not self.should_fetch_pdp(url, data_dict):
+            # Listing-driven modes: the PLP API already carries price fields.
+            yield self.build_listing_item(constants.NAME, url, **listing_fields)
+            return
+
+        if self.is_coalescing_enabled():
+            coalesced = self.coalesce_country(constants.NAME, url, listing_fields)
+            if coalesced is not None:
+                yield from coalesced
+                return
+
         yield scrapy.Request(
             url, 
             callback=self.parse_pdp, 
-            meta={"data_dict": data_dict}
+            meta={"data_dict": self._compact_data_dict(url, listing_fields)}
             )
 
+    def is_pdp_api_enrichment_enabled(self):
+        settings = getattr(self, "settings", None)
+        if settings is None or getattr(self, "_pdp_api_disabled", False):
+            return False
+        return settings.getbool("LEVEL_PDP_API_ENRICHMENT", False)
+
+    def _enrich_pdp_requests(self, results):
+        """
+        Complete a PLP page's PDP requests from the catalog API.
+
+        Requests are grouped by country, language, gender and brand; each
+        group is matched by SKU against moreFromBrand pages. A product the
+        API fully describes is emitted as an item without its HTML PDP, the
+        others keep their request.
+        """
+        if not self.is_pdp_api_enrichment_enabled():
+            yield from results
+            return
+        groups = {}
+        for obj in results:
+            product_id = self._enrichable_product_id(obj)
+            if product_id is None:
+                yield obj
+            elif product_id in self._pdp_api_enriched:
+                # Listed again on a later page: the item was already emitted.
+                self._inc_stat("level_enrichment/duplicates")
+            else:
+                data_dict = obj.meta['data_dict']
+                key = (data_dict['country'], data_dict['language'], data_dict['gender'], data_dict['brand'])
+                groups.setdefault(key, []).append(obj)
+        for (country, language, gender, _), pdp_requests in groups.items():
+            yield from self._enrich_brand(country, language, gender, pdp_requests)
+
+    def _enrichable_product_id(self, obj):
+        if not isinstance(obj, scrapy.Request) or obj.callback != self.parse_pdp or obj.dont_filter:
+            return None
+        data_dict = obj.meta.get('data_dict', {})
+        if any(not data_dict.get(key) for key in ('portal_itemid', 'country', 'language', 'gender', 'brand')):
+            return None
+        product_id = self.get_canonical_product_id(obj)
+        # Products of other shards are left to ShardMiddleware.
+        if product_id is None or (self.shard is not None and not self.shard.owns(product_id)):
+            return None
+        if not hasattr(self, "_pdp_api_enriched"):
+            self._pdp_api_enriched = FingerprintSet()
+        return product_id
+
+    def _enrich_brand(self, country, language, gender, pdp_requests):
+        pending = {request.meta['data_dict']['portal_itemid']: request for request in pdp_requests}
+        fallback = []
+        self._pdp_api_attempts = getattr(self, "_pdp_api_attempts", 0) + len(pending)
+        while pending and self.is_pdp_api_enrichment_enabled():
+            anchor = next(iter(pending))
+            payload = self._fetch_pdp_via_api(anchor, country, language, str(gender).lower())
+            self._inc_stat("level_enrichment/api_calls")
+            enriched = 0
+            for product in rules.get_products(payload or {}) or []:
+                request = pending.get(rules.get_id_from_item(product))
+                item = self._build_api_pdp_item(request, product) if request is not None else None
+                if item is None:
+                    continue
+                del pending[item['portal_itemid']]
+                enriched += 1
+                yield from self._emit_api_pdp_item(request, item)
+            # moreFromBrand may leave out the product it was asked about.
+            if anchor in pending:
+                fallback.append(pending.pop(anchor))
+            self._record_enrichment(enriched)
+            if not enriched:
+                break
+        for request in [*fallback, *pending.values()]:
+            self._inc_stat("level_enrichment/html_fallback")
+            yield request
+
+    def _build_api_pdp_item(self, request, product):
+        """The PDP item of `request` from a catalog API product, or None if a PDP field is missing."""
+        pdp_fields = {
+            'text': rules.get_details_from_item(product),
+            'out_of_stock': rules.get_out_of_stock_from_item(product),
+            'level_category_id': rules.get_level_category_id_from_item(product),
+        }
+        if any(value is None for value in pdp_fields.values()):
+            return None
+        data_dict = {
+            'run_id': self.run_id,
+            'site': constants.NAME,
+            'crawl_date': self.date_string,
+            **request.meta['data_dict'],
+            **pdp_fields,
+        }
+        for key in constants.PDP_FIELDS:
+            data_dict.setdefault(key, None)
+        return data_dict
+
+    def _emit_api_pdp_item(self, request, item):
+        product_id = self.get_canonical_product_id(request)
+        self._pdp_api_enriched.add(product_id)
+        # With a shard frontier, another shard that lists this product must not fetch it too.
+        if self.shard_frontier is not None and not self.shard_frontier.claim(product_id):
+            self._inc_stat("level_enrichment/claimed_elsewhere")
+            return
+        self._inc_stat("level_enrichment/api_enriched")
+        self.remember_product(item['url'], item)
+        yield item
+        yield from self.resolve_coalesced(item['url'], item)
+
+    def _record_enrichment(self, enriched):
+        self._pdp_api_hits = getattr(self, "_pdp_api_hits", 0) + enriched
+        probe = self.settings.getint("LEVEL_PDP_API_PROBE_PRODUCTS", 20)
+        if self._pdp_api_hits or self._pdp_api_attempts < probe:
+            return
+        self._pdp_api_disabled = True
+        self._inc_stat("level_enrichment/disabled")
+        self.logger.warning(
+            f"Catalog API enriched none of {self._pdp_api_attempts} products, fetching HTML PDPs for the rest of the run"
+        )
+
+    @staticmethod
+    def _compact_data_dict(url, listing_fields):
+        """
+        Listing fields carried in PDP request meta. Queued requests may be
+        pickled to disk queues, so the per-run fields are left out; parse_pdp
+        puts them back in front.
+        """
+        return {'url': url, **listing_fields}
+
     def parse(self, response):
         if rules.is_pdp(response.url):
             yield from self.parse_pdp(response)
 
     def parse_pdp(self, response):
             # Fill in any missing fields from meta with lightweight placeholders without overwriting provided values.
-            data_dict = dict(response.meta.get('data_dict', {}))
+            # Per-run fields lead the item, as they do in the listing data_dict.
+            data_dict = {'run_id': None, 'site': None, 'crawl_date': None}
+            data_dict.update(response.meta.get('data_dict', {}))
             placeholders = {
                 'run_id': lambda: self.run_id,
                 'site': lambda: constants.NAME,
@@ -157,4 +351,10 @@ class LevelSpider(MasterCrawl, scrapy.Spider):
                     else:
                         data_dict[key] = None
 
-            yield data_dict
\ No newline at end of file
+            self.remember_product(data_dict.get('url'), data_dict)
+            yield data_dict
+            yield from self.resolve_coalesced(data_dict.get('url'), data_dict)
+
+    def fetch_country_pdp(self, row):
+        # Keep the country's API fields, like a normal PLP item would.
+        yield scrapy.Request(row['url'], callback=self.parse_pdp, meta={"data_dict": row})
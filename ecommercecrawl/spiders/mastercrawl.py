@@ -1,11 +1,23 @@
 import os
 import json
-import csv
-from datetime import datetime, timezone
-from scrapy import Spider
+from datetime import date, datetime, timedelta, timezone
+from scrapy import Spider, signals
+from scrapy.exceptions import DontCloseSpider
 import scrapy
 
-from ecommercecrawl.constants.mastercrawl_constants import RUN_ID_DATETIME_FORMAT
+from ecommercecrawl.constants.mastercrawl_constants import (
+    CRAWL_MODE_FULL,
+    CRAWL_MODE_INCREMENTAL,
+    CRAWL_MODE_LISTING,
+    CRAWL_MODES,
+    LISTING_DRIVEN_CRAWL_MODES,
+    RUN_ID_DATETIME_FORMAT,
+)
+from ecommercecrawl.country_coalescing import CountryCoalescer, coalescing_key
+from ecommercecrawl.known_products import KnownProducts, canonical_product_url
+from ecommercecrawl.product_state import ProductStateStore, content_hash, listing_signature, product_key
+from ecommercecrawl.seed_sources import dedupe_urls, iter_seed_urls
+from ecommercecrawl.sharding import ShardSpec
 
 
 def _slot_delay(url):
@@ -16,14 +28,40 @@ class MasterCrawl(Spider):
     name = "mastercrawl"
     default_urls_path_setting = None
     default_urls_path_constant = None
+    # Set by SigtermDrainExtension when the task is being stopped.
+    draining = False
+    # ShardSpec of a sharded crawl (run_crawler.py --shard), and the
+    # ShardFrontier set by ShardMiddleware when SHARD_FRONTIER_URL is set.
+    shard = None
+    shard_frontier = None
+    # CrawlProgress set by CrawlProgressExtension.
+    progress = None
+    # True for spiders whose PLP pagination is sorted newest first, the only
+    # listings PLP_EARLY_STOP can stop early on. Only Ounass implements it.
+    plp_sorted_by_newness = False
+
+    # Run ids handed out in this process; several spiders can start in the
+    # same millisecond when run_crawler.py runs them together.
+    _issued_run_ids = set()
 
     @staticmethod
     def _generate_run_id():
         """Generates a unique run ID with millisecond precision."""
         now = datetime.now(timezone.utc)
-        main_part = now.strftime(RUN_ID_DATETIME_FORMAT)
-        ms_part = f"{now.microsecond // 1000:03d}"
-        return f"{main_part}-{ms_part}"
+        while True:
+            main_part = now.strftime(RUN_ID_DATETIME_FORMAT)
+            ms_part = f"{now.microsecond // 1000:03d}"
+            run_id = f"{main_part}-{ms_part}"
+            if run_id not in MasterCrawl._issued_run_ids:
+                MasterCrawl._issued_run_ids.add(run_id)
+                return run_id
+            now += timedelta(milliseconds=1)
+
+    @staticmethod
+    def _get_run_id_setting(settings, name):
+        run_id = settings.get(name) if settings is not None else None
+        # Only a string is a run id; mocked settings return other objects.
+        return run_id if isinstance(run_id, str) and run_id else None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -47,8 +85,15 @@ class MasterCrawl(Spider):
         spider = super(MasterCrawl, cls).from_crawler(crawler, *args, **kwargs)
         
         spider.settings = crawler.settings
-        spider.run_id = MasterCrawl._generate_run_id()
+        # Resumed runs (run_crawler.py --resume) keep their run id and output;
+        # the shards of a sharded run share the one passed with --run-id.
+        spider.run_id = (
+            MasterCrawl._get_run_id_setting(crawler.settings, "RESUME_RUN_ID")
+            or MasterCrawl._get_run_id_setting(crawler.settings, "RUN_ID")
+            or MasterCrawl._generate_run_id()
+        )
         spider.date = spider.run_id.split('T')[0]  # Extract datetime part for manifest
+        spider.shard = ShardSpec.from_settings(crawler.settings)
 
         # Capture entry point arguments for the manifest.
         # This is done here because from_crawler receives all spider arguments.
@@ -59,29 +104,313 @@ class MasterCrawl(Spider):
         
         # Connect the generate_manifest method to the spider_closed signal
         # crawler.signals.connect(spider.post_closure, signal=signals.spider_closed)
+        crawler.signals.connect(spider._fetch_parked_country_rows, signal=signals.spider_idle)
         
         return spider
     
+    def _inc_stat(self, key, count=1):
+        crawler = getattr(self, "crawler", None)
+        stats = getattr(crawler, "stats", None)
+        if stats is not None:
+            stats.inc_value(key, count)
+
+    def get_crawl_mode(self):
+        settings = getattr(self, "settings", None)
+        mode = settings.get("CRAWL_MODE", CRAWL_MODE_FULL) if settings is not None else CRAWL_MODE_FULL
+        mode = str(mode or CRAWL_MODE_FULL).strip().lower()
+        if mode not in CRAWL_MODES:
+            raise ValueError(f"Unsupported crawl mode: {mode}")
+        return mode
+
+    def is_listing_mode(self):
+        return self.get_crawl_mode() == CRAWL_MODE_LISTING
+
+    def uses_listing_data(self):
+        """True when PLP parsing should read listing fields, not just PDP URLs."""
+        return self.get_crawl_mode() in LISTING_DRIVEN_CRAWL_MODES
+
+    def get_state_name(self):
+        """Name of the spider's known products and product state files."""
+        if self.shard is not None:
+            # Shards own disjoint products, so each keeps its own state; the
+            # files only carry over between runs with the same shard count.
+            return f"{self.name}.{self.shard.tag}"
+        return self.name
+
+    def _get_known_products(self):
+        # Built lazily because settings are only attached after from_crawler().
+        if not hasattr(self, "_known_products"):
+            self._known_products = KnownProducts.from_settings(
+                getattr(self, "settings", None), self.get_state_name()
+            )
+        return self._known_products
+
+    def get_canonical_product_id(self, request):
+        """
+        Hook for CanonicalPDPDedupeMiddleware: an id shared by every PDP
+        request for the same product, or None for requests that are not PDPs.
+        """
+        return None
+
+    def report_listing_page(self, seed, total_pages, product_urls):
+        """
+        Hook for CrawlProgressExtension: a listing page of `seed` was parsed;
+        the site reports `total_pages` pages (None if unknown). Spiders only
+        call it when progress is tracked, so extraction costs nothing otherwise.
+        """
+        self.progress.listing_page(seed, total_pages, product_urls)
+
+    def get_item_product_id(self, item):
+        """
+        Hook for ShardMiddleware: the canonical product id of an item, as
+        get_canonical_product_id gives it for the item's PDP request.
+        """
+        url = item.get("url")
+        return self.get_canonical_product_id(scrapy.Request(url)) if url else None
+
+    def is_draining(self):
+        """True once a SIGTERM drain started; seed loops stop producing requests."""
+        return self.draining
+
+    def is_early_stop_enabled(self):
+        settings = getattr(self, "settings", None)
+        if settings is None or not settings.getbool("PLP_EARLY_STOP", False):
+            return False
+        if not self.plp_sorted_by_newness:
+            if not getattr(self, "_early_stop_ignored", False):
+                self._early_stop_ignored = True
+                self.logger.warning(
+                    f"PLP_EARLY_STOP ignored: {self.name} listings are not sorted by newness"
+                )
+            return False
+        return True
+
+    def get_page_window(self):
+        """Number of pages ahead of the current one scheduled in early-stop mode."""
+        settings = getattr(self, "settings", None)
+        window = settings.getint("PLP_PAGE_WINDOW", 1) if settings is not None else 1
+        return max(1, window)
+
+    def page_has_new_products(self, product_urls):
+        """
+        Early-stop pagination check for a newness-sorted PLP page.
+
+        A page whose products were all parsed in earlier runs means the rest
+        of the listing is older still, so no further pages are requested.
+        """
+        known_products = self._get_known_products()
+        if known_products is None:
+            return True
+        if any(url not in known_products for url in product_urls):
+            return True
+        self._inc_stat("pagination/early_stop")
+        return False
+
+    def get_next_page_numbers(self, page, last_page):
+        """Page numbers after `page`, up to `last_page`, to schedule in early-stop mode."""
+        return list(range(page + 1, min(page + self.get_page_window(), last_page) + 1))
+
+    def is_coalescing_enabled(self):
+        """Cross-country coalescing only applies to full crawls."""
+        settings = getattr(self, "settings", None)
+        if settings is None or not settings.getbool("COALESCE_COUNTRIES", False):
+            return False
+        return self.get_crawl_mode() == CRAWL_MODE_FULL
+
+    def _get_coalescer(self):
+        if not hasattr(self, "_coalescer"):
+            self._coalescer = CountryCoalescer()
+        return self._coalescer
+
+    def coalesce_country(self, site, url, fields):
+        """
+        Decide whether a listed product needs its own PDP fetch.
+
+        Returns None when the PDP must be fetched (first country for the SKU
+        and language, or no SKU on the listing row). Otherwise returns the
+        merged items ready to emit, which is empty while the PDP is parsed.
+        """
+        key = coalescing_key(fields)
+        if key is None:
+            return None
+        coalescer = self._get_coalescer()
+        if coalescer.claim(key, url):
+            self._inc_stat("coalesce/pdp_fetched")
+            return None
+        self._inc_stat("coalesce/pdp_saved")
+        row = {
+            'run_id': self.run_id,
+            'site': site,
+            'crawl_date': date.today().strftime("%Y-%m-%d"),
+            'url': url,
+            **fields,
+        }
+        return coalescer.offer(key, row)
+
+    def resolve_coalesced(self, url, item):
+        """Merged items for country rows that waited on this parsed PDP."""
+        if not hasattr(self, "_coalescer"):
+            return []
+        return self._coalescer.resolve(url, item)
+
+    def release_coalesced(self, url):
+        """Fetch the country PDPs that waited on a PDP that failed to parse."""
+        if not hasattr(self, "_coalescer"):
+            return
+        for row in self._coalescer.release(url):
+            self._inc_stat("coalesce/fallback")
+            yield from self.fetch_country_pdp(row)
+
+    def fetch_country_pdp(self, row):
+        """Hook: requests for the PDP of a country row that could not be coalesced."""
+        yield from self._handle_seed_url(row['url'])
+
+    def _fetch_parked_country_rows(self, spider):
+        # Rows still parked when the crawl goes idle lost their PDP to a
+        # download failure; fetch their own PDPs instead.
+        if spider is not self or not hasattr(self, "_coalescer"):
+            return
+        scheduled = False
+        for row in self._coalescer.drain():
+            self._inc_stat("coalesce/fallback")
+            for request in self.fetch_country_pdp(row):
+                if isinstance(request, scrapy.Request):
+                    self.crawler.engine.crawl(request)
+                    scheduled = True
+        if scheduled:
+            raise DontCloseSpider
+
+    def _get_product_state(self):
+        # Built lazily because settings are only attached after from_crawler().
+        if not hasattr(self, "_product_state"):
+            self._product_state = ProductStateStore.from_settings(
+                getattr(self, "settings", None), self.get_state_name()
+            )
+            # canonical URL -> (state key, listing signature) of PDPs in flight.
+            self._pending_product_state = {}
+        return self._product_state
+
+    def remember_product(self, url, item=None):
+        """Record that a full PDP was parsed for `url`."""
+        known_products = self._get_known_products()
+        if known_products is not None and url:
+            known_products.add(url)
+        if item is not None and url and self.get_crawl_mode() == CRAWL_MODE_INCREMENTAL:
+            self._update_product_state(url, item)
+
+    def _update_product_state(self, url, item):
+        store = self._get_product_state()
+        pending = self._pending_product_state.pop(canonical_product_url(url), None)
+        if store is None or pending is None:
+            # PDPs reached without listing data have nothing to compare against.
+            return
+        key, signature = pending
+        previous_hash = store.update(key, url, item, signature, self.run_id)
+        if previous_hash is not None and previous_hash == content_hash(item):
+            # The listing changed but the PDP did not: a wasted fetch.
+            self._inc_stat("incremental/pdp_content_unchanged")
+
+    def should_fetch_pdp(self, url, listing=None):
+        """
+        Full mode fetches every PDP. Listing mode only fetches products that
+        no earlier crawl has parsed; the rest are refreshed from listing data.
+        Incremental mode fetches products whose listing price, discount or
+        stock flag changed since the last run.
+        """
+        mode = self.get_crawl_mode()
+        if mode == CRAWL_MODE_INCREMENTAL:
+            return self._listing_changed(url, listing)
+        if mode != CRAWL_MODE_LISTING:
+            return True
+        known_products = self._get_known_products()
+        if known_products is not None and url in known_products:
+            self._inc_stat("listing/pdp_skipped")
+            return False
+        self._inc_stat("listing/pdp_new")
+        return True
+
+    def _listing_changed(self, url, listing):
+        store = self._get_product_state()
+        if store is None or not listing:
+            self._inc_stat("incremental/pdp_unlisted")
+            return True
+
+        key = product_key(self.name, url, listing)
+        signature = listing_signature(listing)
+        state = store.get(key)
+        if state is not None and state["listing_signature"] == signature:
+            store.touch(key, self.run_id)
+            self._inc_stat("incremental/pdp_skipped")
+            return False
+
+        self._pending_product_state[canonical_product_url(url)] = (key, signature)
+        self._inc_stat("incremental/pdp_changed" if state is not None else "incremental/pdp_new")
+        return True
+
+    def build_listing_item(self, site, url, **fields):
+        """
+        Item emitted from listing data when the PDP is not fetched.
+
+        Listing mode emits price-refresh rows; incremental mode emits "seen"
+        rows so downstream freshness checks still see the product.
+        """
+        mode = self.get_crawl_mode()
+        self._inc_stat(f"{mode}/items")
+        item = {
+            'run_id': self.run_id,
+            'site': site,
+            'crawl_date': date.today().strftime("%Y-%m-%d"),
+            'url': url,
+            'crawl_mode': mode,
+        }
+        if mode == CRAWL_MODE_INCREMENTAL:
+            item['seen'] = True
+        item.update(fields)
+        return item
+
+    def closed(self, reason):
+        known_products = getattr(self, "_known_products", None)
+        if known_products is not None:
+            known_products.save()
+        product_state = getattr(self, "_product_state", None)
+        if product_state is not None:
+            product_state.close()
+
     def _iter_seed_urls(self):
         """
-        Centralized logic to produce the initial list of URLs.
+        Centralized logic to produce the initial URLs.
         Subclasses can override this if they need a different way
         to get URLs, but most spiders can reuse this.
+
+        URLs are yielded lazily and repeated seeds are dropped, so large
+        seed files are never held in memory as a list.
+        """
+        urls = dedupe_urls(self._iter_raw_seed_urls())
+        if self.shard is None:
+            return urls
+        return (url for url in urls if self.owns_seed(url))
+
+    def owns_seed(self, url):
         """
-        urls = []
+        Whether this shard reads seed `url`. PDP seeds go to the owner of
+        their product; listing seeds are split by URL when a frontier hands
+        PDPs between shards, and read by every shard otherwise.
+        """
+        product_id = self.get_canonical_product_id(scrapy.Request(url))
+        if product_id is not None:
+            return self.shard.owns(product_id)
+        return self.shard_frontier is None or self.shard.owns(url)
 
+    def _iter_raw_seed_urls(self):
         if getattr(self, "start_urls", None):
             start_urls = getattr(self, "start_urls")
             if isinstance(start_urls, str):
-                urls = start_urls.split(',')
-            else:
-                urls = start_urls
+                start_urls = start_urls.split(',')
+            yield from start_urls
+        elif getattr(self, "urls_source", None):
+            yield from iter_seed_urls(self.urls_source)
         elif hasattr(self, 'urlpath') and self.urlpath:
-            import csv
-            with open(self.urlpath, newline='') as inputfile:
-                for row in csv.reader(inputfile):
-                    if row:
-                        urls.append(row[0])
+            yield from iter_seed_urls(self.urlpath)
         else:
             # Fallback to default path from settings or constants
             urlpath = self.default_urls_path_constant
@@ -90,13 +419,7 @@ class MasterCrawl(Spider):
                                             self.default_urls_path_constant)
 
             if urlpath:
-                import csv
-                with open(urlpath, newline='') as inputfile:
-                    for row in csv.reader(inputfile):
-                        if row:
-                            urls.append(row[0])
-
-        return urls
+                yield from iter_seed_urls(urlpath)
 
     def _handle_seed_url(self, url):
         """
@@ -116,16 +439,18 @@ class MasterCrawl(Spider):
         - URL loading in `_iter_seed_urls`
         - Per-URL behavior in `_handle_seed_url`
         """
-        urls = self._iter_seed_urls()
-
-        if not urls:
-            self.logger.warning("No URLs found to crawl.")
-            return
-
-        for url in urls:
+        seed_count = 0
+        for url in self._iter_seed_urls():
+            if self.is_draining():
+                self.logger.info("Draining, not reading further seed URLs.")
+                return
+            seed_count += 1
             # `_handle_seed_url` must yield Requests or Items, not generators
             for obj in self._handle_seed_url(url):
                 yield obj
+
+        if not seed_count:
+            self.logger.warning("No URLs found to crawl.")
     
     def save_to_jsonl(self, basename, data):
         """Saves a dictionary to a JSONL file, creating dirs and appending if the file exists."""
@@ -145,4 +470,7 @@ class MasterCrawl(Spider):
 
     def build_output_basename(self, output_dir, date_string: str, filename: str) -> str:
         year, month, day = date_string.split('-')
+        if self.shard is not None:
+            # Shards of a run write their own part next to each other.
+            filename = f"{filename}.{self.shard.tag}"
         return os.path.join(output_dir, year, month, day, self.run_id, filename)
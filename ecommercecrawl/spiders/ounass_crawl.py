@@ -9,10 +9,15 @@ from ecommercecrawl.spiders.mastercrawl import MasterCrawl
 from ecommercecrawl.rules import ounass_rules as rules
 from ecommercecrawl.constants import ounass_constants as constants
 from ecommercecrawl.crawler_api import (
+    ADAPTIVE_REQUEST_TYPE_META_KEY,
+    REQUEST_TYPE_ADAPTIVE,
     REQUEST_TYPE_HTTP_RESPONSE,
     REQUEST_TYPE_RENDERED_HTML,
     build_crawler_api_request,
 )
+from ecommercecrawl.crawler_api.adaptive import AdaptiveRequestTypePolicy
+from ecommercecrawl.fingerprints import FingerprintSet
+from ecommercecrawl.middlewares import get_target_url
 from scrapy.http import HtmlResponse
 
 
@@ -25,6 +30,8 @@ class OunassSpider(MasterCrawl, scrapy.Spider):
     name = constants.NAME
     default_urls_path_setting = 'OUNASS_URLS_PATH'
     default_urls_path_constant = constants.OUNASS_URLS
+    # Sorted pages use constants.PLPSORT.
+    plp_sorted_by_newness = True
 
     def __init__(self, urlpath=None, urls=None, limit=None, *args, **kwargs):
         super(OunassSpider, self).__init__(*args, **kwargs)
@@ -33,7 +40,9 @@ class OunassSpider(MasterCrawl, scrapy.Spider):
         self.limit = limit
         # Ounass can bypass Scrapy's downloader in requests mode, so keep
         # explicit URL-level dedupe for both fetch backends.
-        self._seen_fetch_urls = set()
+        self._seen_fetch_urls = FingerprintSet()
+        # Built lazily because settings are only attached after from_crawler().
+        self._adaptive_policy = None
 
     def _get_setting(self, name, default):
         settings = getattr(self, "settings", None)
@@ -96,6 +105,75 @@ class OunassSpider(MasterCrawl, scrapy.Spider):
             REQUEST_TYPE_HTTP_RESPONSE,
         )
 
+    def _get_adaptive_policy(self):
+        if self._adaptive_policy is None:
+            self._adaptive_policy = AdaptiveRequestTypePolicy.from_settings(
+                getattr(self, "settings", None)
+            )
+        return self._adaptive_policy
+
+    @staticmethod
+    def _get_response_meta(response):
+        # Responses built in requests mode are not tied to a Scrapy request.
+        try:
+            return response.meta
+        except AttributeError:
+            return {}
+
+    def _build_api_request(self, url, request_type, **request_kwargs):
+        adaptive_policy = None
+        if request_type == REQUEST_TYPE_ADAPTIVE:
+            adaptive_policy = self._get_adaptive_policy()
+
+        request = build_crawler_api_request(
+            url=url,
+            callback=self.parse,
+            settings=getattr(self, "settings", None),
+            request_type=request_type,
+            adaptive_policy=adaptive_policy,
+            **request_kwargs,
+        )
+
+        chosen = request.meta.get(ADAPTIVE_REQUEST_TYPE_META_KEY)
+        if chosen:
+            hostname = AdaptiveRequestTypePolicy.get_hostname(url)
+            self._inc_stat(f"crawler_api/adaptive/{hostname}/chosen/{chosen}")
+        return request
+
+    def _handle_adaptive_outcome(self, response, request_type, success):
+        """
+        Feed a PDP parse outcome back into the adaptive policy.
+
+        Returns a `rendered_html` request when a cheap attempt could not be
+        parsed, otherwise None.
+        """
+        url = response.request.url
+        hostname = AdaptiveRequestTypePolicy.get_hostname(url)
+        outcome = "success" if success else "failure"
+        self._inc_stat(f"crawler_api/adaptive/{hostname}/{request_type}/{outcome}")
+
+        if request_type != REQUEST_TYPE_HTTP_RESPONSE:
+            return None
+
+        self._get_adaptive_policy().record(url, success)
+        if success:
+            return None
+
+        self.logger.info(f"Re-issuing Ounass PDP as rendered HTML: {url}")
+        return self._build_api_request(
+            url,
+            REQUEST_TYPE_RENDERED_HTML,
+            meta={ADAPTIVE_REQUEST_TYPE_META_KEY: REQUEST_TYPE_RENDERED_HTML},
+            dont_filter=True,
+        )
+
+    def get_canonical_product_id(self, request):
+        # Slugs are unique per storefront host; variations have their own slug.
+        parsed = urlparse(get_target_url(request))
+        if not parsed.path.endswith(".html"):
+            return None
+        return f"{parsed.hostname}/{parsed.path.rsplit('/', 1)[-1][:-len('.html')]}"
+
     def _get_request_tuning(self):
         delay = float(self._get_setting("OUNASS_REQUEST_DELAY_SECONDS", "0.2"))
         jitter = float(self._get_setting("OUNASS_REQUEST_JITTER_SECONDS", "0.1"))
@@ -116,12 +194,7 @@ class OunassSpider(MasterCrawl, scrapy.Spider):
         backend = self._get_fetch_backend_for_url(url)
         if backend == FETCH_BACKEND_API:
             self._seen_fetch_urls.add(url)
-            yield build_crawler_api_request(
-                url=url,
-                callback=self.parse,
-                settings=getattr(self, "settings", None),
-                request_type=self._get_crawler_api_request_type(url),
-            )
+            yield self._build_api_request(url, self._get_crawler_api_request_type(url))
             return
 
         yield from self._handle_seed_url_via_requests(url)
@@ -156,52 +229,129 @@ class OunassSpider(MasterCrawl, scrapy.Spider):
             self.logger.error(f"Failed to fetch {url} using requests: {e}")
             return
         
+    @staticmethod
+    def _get_page_url(url, page):
+        return url.split("?")[0] + f"?{constants.PLPSORT_KEY}={constants.PLPSORT}&p={page}"
+
     def get_pages(self, response):
         # get total number of pages from plp api
         try:
             total_pages = rules.get_max_pages(response)
             # If the URL is not sorted, we want to get all pages, even if it's just one
             if constants.PLPSORT not in response.url:
-                return [
-                    response.url.split("?")[0] + f"?{constants.PLPSORT_KEY}={constants.PLPSORT}&p={p}"
-                    for p in range(total_pages)
-                ]
+                return [self._get_page_url(response.url, p) for p in range(total_pages)]
 
             # If already sorted, just get the subsequent pages
             if total_pages <= 1:
                 return []
             else:
                 # Assuming the first page is p=0, so we get pages 1 to N-1
-                return [
-                    response.url.split("?")[0] + f"?{constants.PLPSORT_KEY}={constants.PLPSORT}&p={p + 1}"
-                    for p in range(total_pages - 1)
-                ]
+                return [self._get_page_url(response.url, p + 1) for p in range(total_pages - 1)]
 
         except (ValueError, AttributeError) as e:
             return []
+
+    def get_next_pages(self, response):
+        """
+        Early-stop pagination: the next window of sorted pages, or nothing
+        once a page lists only products parsed in earlier runs.
+        """
+        try:
+            page = rules.get_page_number(response)
+            total_pages = rules.get_max_pages(response)
+        except (ValueError, KeyError, TypeError):
+            return []
+        listed_urls = [item['url'] for item in rules.get_listing_items(response)]
+        if not self.page_has_new_products(listed_urls):
+            return []
+        return [
+            self._get_page_url(response.url, p)
+            for p in self.get_next_page_numbers(page, total_pages - 1)
+        ]
     
     def parse_plp(self, response):
         """
         This method parses a product listing page, extracts the product URLs,
         and also handles pagination to scrape all pages.
         """
+        early_stop = self.is_early_stop_enabled()
         if rules.is_first_page(response) and constants.PLPSORT not in response.url:
             plp_urls = self.get_pages(response)
+            if early_stop:
+                # The sorted first page drives pagination from here.
+                plp_urls = plp_urls[:1]
             for url in plp_urls:
                 yield from self._handle_seed_url(url)
             return  # Stop processing this unsorted page
-        
+
+        if self.progress is not None:
+            try:
+                total_pages = rules.get_max_pages(response)
+            except (ValueError, KeyError, TypeError):
+                total_pages = None
+            self.report_listing_page(response.url, total_pages, rules.get_pdps(response))
+
+        if early_stop:
+            # Each sorted page schedules the next window while it still lists new products
+            for url in self.get_next_pages(response):
+                yield from self._handle_seed_url(url)
         # Only the first page schedules the other pages 2..N
-        if rules.is_first_page(response):
+        elif rules.is_first_page(response):
             plp_urls = self.get_pages(response)
             for url in plp_urls:
                 yield from self._handle_seed_url(url)
 
+        if self.uses_listing_data():
+            yield from self._parse_plp_listing(response)
+            return
+
+        if self.is_coalescing_enabled():
+            yield from self._parse_plp_coalesced(response)
+            return
+
         # Always process the current PLP for products
         pdps = rules.get_pdps(response)
         
         for pdp in pdps:
             yield from self._handle_seed_url(pdp)
+
+    def _parse_plp_listing(self, response):
+        """
+        Listing and incremental modes: emit rows from PLP hits and only fetch
+        PDPs that are new (listing) or changed (incremental). Variation slugs
+        have no hit of their own, so incremental mode always fetches them.
+        """
+        listed_urls = set()
+        for item in rules.get_listing_items(response):
+            url = item.pop('url')
+            listed_urls.add(url)
+            if self.should_fetch_pdp(url, item):
+                yield from self._handle_seed_url(url)
+                continue
+            yield self.build_listing_item(constants.NAME, url, **item)
+
+        for pdp in rules.get_pdps(response):
+            if pdp not in listed_urls and self.should_fetch_pdp(pdp):
+                yield from self._handle_seed_url(pdp)
+
+    def _parse_plp_coalesced(self, response):
+        """
+        Cross-country coalescing: fetch the full PDP once per SKU and
+        language; other country hosts reuse it with their own PLP prices.
+        """
+        listed_urls = set()
+        for item in rules.get_listing_items(response):
+            url = item.pop('url')
+            listed_urls.add(url)
+            coalesced = self.coalesce_country(constants.NAME, url, item)
+            if coalesced is None:
+                yield from self._handle_seed_url(url)
+                continue
+            yield from coalesced
+
+        for pdp in rules.get_pdps(response):
+            if pdp not in listed_urls:
+                yield from self._handle_seed_url(pdp)
         
     def parse_pdp(self, response):
         """
@@ -210,6 +360,14 @@ class OunassSpider(MasterCrawl, scrapy.Spider):
         """
         try:
             state = rules.get_state(response)
+
+            adaptive_type = self._get_response_meta(response).get(ADAPTIVE_REQUEST_TYPE_META_KEY)
+            if adaptive_type:
+                retry = self._handle_adaptive_outcome(response, adaptive_type, state is not None)
+                if retry is not None:
+                    yield retry
+                    return
+
             data = rules.get_data(state)
 
             date_string = date.today().strftime("%Y-%m-%d")
@@ -222,10 +380,13 @@ class OunassSpider(MasterCrawl, scrapy.Spider):
                 'language': rules.get_language(response.url)
             }
             merged = data_dict | data
+            self.remember_product(response.url, merged)
             yield merged
         except Exception as e:
             self.logger.error(f"Failed to parse PDP {response.url}: {e}")
+            yield from self.release_coalesced(response.url)
             return
+        yield from self.resolve_coalesced(response.url, merged)
     
     def parse(self, response):
         if rules.is_plp(response):
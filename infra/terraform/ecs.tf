@@ -52,9 +52,13 @@ resource "aws_ecs_task_definition" "scraper" {
       # Use a shell entrypoint so we can chain multiple runs in one task.
       entryPoint = var.ecs_entrypoint
       command    = var.ecs_command
+      # Time between SIGTERM and SIGKILL on task stop; the crawler drains for
+      # DRAIN_TIMEOUT_SECONDS of it and uses the rest to finalize and upload.
+      stopTimeout = var.ecs_stop_timeout
       environment = [
         { name = "S3_BUCKET",         value = var.price_comparison_bucket },
-        { name = "S3_UPLOAD_ENABLED", value = var.s3_upload_enabled }
+        { name = "S3_UPLOAD_ENABLED", value = var.s3_upload_enabled },
+        { name = "PROGRESS_ENABLED",  value = var.progress_enabled }
       ]
       secrets = [
         for key in var.ecs_secret_env_keys : {
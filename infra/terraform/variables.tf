@@ -69,6 +69,14 @@ variable "ecs_entrypoint" {
   default     = ["/bin/sh", "-c"]
 }
 
+# Fargate allows up to 120 seconds. SIGTERM only reaches the crawler if the
+# shell execs it (e.g. "... && exec python run_crawler.py ...").
+variable "ecs_stop_timeout" {
+  description = "Seconds between SIGTERM and SIGKILL when a scraper task is stopped"
+  type        = number
+  default     = 60
+}
+
 # Toggle S3 upload behavior in the pipeline.
 variable "s3_upload_enabled" {
   description = "Enable S3 upload in the scraper pipeline"
@@ -76,6 +84,13 @@ variable "s3_upload_enabled" {
   default     = "true"
 }
 
+# Crawl progress reports (progress.json and log lines) in the scraper task.
+variable "progress_enabled" {
+  description = "Enable crawl progress reporting in the scraper task"
+  type        = string
+  default     = "true"
+}
+
 variable "scraper_env_secret_name" {
   description = "Secrets Manager JSON secret that stores crawler runtime secrets"
   type        = string
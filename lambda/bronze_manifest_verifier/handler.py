@@ -152,23 +152,29 @@ def _verify_manifest_and_write_success(bucket, key):
             quality_gate_reason = quality_gate.get("reason")
 
         artifacts = manifest.get("artifacts", {}) if isinstance(manifest, dict) else {}
-        data_filename = os.path.basename(artifacts.get("file_path", ""))
-        if not data_filename:
+        # Sharded runs list one output part per shard.
+        parts = artifacts.get("parts") if "parts" in artifacts else [artifacts]
+        if not parts:
             raise ValueError("Could not determine data filename from manifest.")
 
-        data_key = f"{run_prefix}/{data_filename}"
-        data = s3.get_object(Bucket=bucket, Key=data_key)["Body"].read()
+        for part in parts:
+            data_filename = os.path.basename(part.get("file_path", ""))
+            if not data_filename:
+                raise ValueError("Could not determine data filename from manifest.")
 
-        calculated_hash = hashlib.sha256(data).hexdigest()
-        expected_hash = manifest["artifacts"]["hashes"]["sha256"]
-        if calculated_hash != expected_hash:
-            raise ValueError("Hash mismatch")
+            data_key = f"{run_prefix}/{data_filename}"
+            data = s3.get_object(Bucket=bucket, Key=data_key)["Body"].read()
 
-        raw = gzip.decompress(data)
-        observed_rowcount = len(raw.splitlines())
-        expected_rows = manifest["artifacts"]["rows"]
-        if observed_rowcount != expected_rows:
-            raise ValueError("Row count mismatch")
+            calculated_hash = hashlib.sha256(data).hexdigest()
+            expected_hash = part["hashes"]["sha256"]
+            if calculated_hash != expected_hash:
+                raise ValueError(f"Hash mismatch for {data_filename}")
+
+            raw = gzip.decompress(data)
+            observed_rowcount = len(raw.splitlines())
+            expected_rows = part["rows"]
+            if observed_rowcount != expected_rows:
+                raise ValueError(f"Row count mismatch for {data_filename}")
 
         verification_ok = True
     except Exception as e:
@@ -1,17 +1,21 @@
 import argparse
-import csv
+import json
 import os
-from io import StringIO
-from urllib.parse import urlparse
+import re
 
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
 from ecommercecrawl.spiders.farfetch_crawl import FFSpider
 from ecommercecrawl.spiders.ounass_crawl import OunassSpider
 from ecommercecrawl.spiders.level_crawl import LevelSpider
+from ecommercecrawl import response_archive
+from ecommercecrawl.constants.mastercrawl_constants import CRAWL_MODES
+from ecommercecrawl.sharding import ShardSpec
 
 
 
+RUN_ID_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-\d{2}-\d{3}")
+
 spider_map = {
         'farfetch': FFSpider,
         'ounass': OunassSpider,
@@ -19,52 +23,32 @@ spider_map = {
     }
 
 
-def _urls_from_csv_text(csv_text):
-    urls = []
-    for row in csv.reader(StringIO(csv_text)):
-        if not row:
-            continue
-        first_column = row[0].strip()
-        if not first_column or first_column.lower() == "url":
-            continue
-        urls.append(first_column)
-    return urls
-
-
-def _read_local_urls_source(source):
-    with open(source, newline='', encoding='utf-8-sig') as inputfile:
-        return _urls_from_csv_text(inputfile.read())
-
-
-def _read_s3_urls_source(source):
-    parsed = urlparse(source)
-    bucket = parsed.netloc
-    key = parsed.path.lstrip("/")
-    if not bucket or not key:
-        raise ValueError(f"Invalid S3 URL source: {source}")
-
-    import boto3
-
-    response = boto3.client("s3").get_object(Bucket=bucket, Key=key)
-    body = response["Body"].read().decode("utf-8-sig")
-    return _urls_from_csv_text(body)
-
-
-def load_urls_source(source):
-    """
-    Load crawl seed URLs from an external source.
-
-    S3 sources keep production URL lists editable without rebuilding the image;
-    local files keep the same path useful for development and tests.
-    """
-    if source.startswith("s3://"):
-        return _read_s3_urls_source(source)
-    return _read_local_urls_source(source)
+def summarize_crawl_throughput(stats):
+    """Pages/sec and items/sec for a finished crawl, used to benchmark replays."""
+    start_time = stats.get("start_time")
+    finish_time = stats.get("finish_time")
+    elapsed = (finish_time - start_time).total_seconds() if start_time and finish_time else None
+    pages = stats.get("response_received_count", 0)
+    items = stats.get("item_scraped_count", 0)
+
+    return {
+        "elapsed_seconds": elapsed,
+        "pages": pages,
+        "items": items,
+        "pages_per_second": round(pages / elapsed, 2) if elapsed else None,
+        "items_per_second": round(items / elapsed, 2) if elapsed else None,
+        "replay_misses": stats.get("response_archive/replay_miss", 0),
+    }
 
 
 def main():
     parser = argparse.ArgumentParser(description="E-commerce scraper CLI.")
-    parser.add_argument('spider', choices=list(spider_map.keys()), help='The spider to run.')
+    parser.add_argument(
+        'spiders',
+        nargs='+',
+        choices=list(spider_map.keys()) + ['all'],
+        help='One or more spiders to run together in one process, or "all".',
+    )
     urls_group = parser.add_mutually_exclusive_group()
     urls_group.add_argument(
         '--urls',
@@ -73,17 +57,98 @@ def main():
     )
     urls_group.add_argument(
         '--urls-source',
-        help='CSV URL source to crawl. Supports local paths and s3://bucket/key.csv.',
+        help='CSV URL source to crawl, streamed lazily. Supports local paths and s3://bucket/key.csv, optionally .gz.',
     )
     parser.add_argument('--env', choices=['dev', 'prod'], default='dev', help='Environment setting (dev or prod).')
     parser.add_argument('--limit', type=int, help='Limit the number of pages to crawl.')
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        metavar='N',
+        help='Requests in flight across all spiders of this process (GLOBAL_CONCURRENT_REQUESTS).',
+    )
+    parser.add_argument(
+        '--mode',
+        choices=list(CRAWL_MODES),
+        help=(
+            'full (default) fetches every PDP; listing refreshes prices from listing pages and only fetches new PDPs; '
+            'incremental only fetches PDPs whose listing price, discount or stock changed since the last run.'
+        ),
+    )
+    parser.add_argument(
+        '--coalesce-countries',
+        action='store_true',
+        help='Fetch each PDP once per SKU and language; other country hosts reuse it with their own listing prices.',
+    )
+    parser.add_argument(
+        '--checkpoint',
+        action='store_true',
+        help='Periodically checkpoint the crawl (pending requests, parsed requests, output offset) so it can be resumed.',
+    )
+    parser.add_argument(
+        '--resume',
+        metavar='RUN_ID',
+        help='Resume a checkpointed run with the same run id and output. Pass the same seed arguments as the original run.',
+    )
+    parser.add_argument(
+        '--shard',
+        metavar='I/N',
+        help='Crawl shard I (0-based) of N workers sharing one run id; see ecommercecrawl.sharding.',
+    )
+    parser.add_argument(
+        '--run-id',
+        metavar='RUN_ID',
+        help='Run id to write under, e.g. 2026-01-01T00-00-00-000. Required with --shard; shards of a run share it.',
+    )
+    archive_group = parser.add_mutually_exclusive_group()
+    archive_group.add_argument(
+        '--record',
+        metavar='ARCHIVE',
+        help='Record every downloaded response into this archive file.',
+    )
+    archive_group.add_argument(
+        '--replay',
+        metavar='ARCHIVE',
+        help='Replay responses from this archive file with no network, then print throughput.',
+    )
 
     args = parser.parse_args()
 
-    spider_class = spider_map.get(args.spider)
-    if not spider_class:
-        print(f"Error: Spider '{args.spider}' not found.")
-        return
+    spider_names = list(spider_map) if 'all' in args.spiders else list(dict.fromkeys(args.spiders))
+    if len(spider_names) > 1:
+        # Seeds are site specific, and a run id or archive belongs to one spider.
+        single_spider_options = {
+            '--urls': args.urls,
+            '--urls-source': args.urls_source,
+            '--resume': args.resume,
+            '--shard': args.shard,
+            '--run-id': args.run_id,
+            '--record': args.record,
+            '--replay': args.replay,
+        }
+        for option, value in single_spider_options.items():
+            if value:
+                parser.error(f"{option} can only be used with a single spider")
+
+    if args.run_id and not RUN_ID_PATTERN.fullmatch(args.run_id):
+        parser.error("--run-id must look like 2026-01-01T00-00-00-000")
+    if args.run_id and args.resume:
+        parser.error("--resume already sets the run id")
+    if args.shard:
+        try:
+            ShardSpec.parse(args.shard)
+        except ValueError as exc:
+            parser.error(str(exc))
+        if not args.run_id:
+            parser.error("--shard needs the --run-id shared by all shards")
+        # Checkpoints and coalesced country rows are kept per process.
+        for option, value in {
+            '--checkpoint': args.checkpoint,
+            '--resume': args.resume,
+            '--coalesce-countries': args.coalesce_countries,
+        }.items():
+            if value:
+                parser.error(f"{option} cannot be used with --shard")
 
     # Set the environment variable for settings
     os.environ['APP_ENV'] = args.env
@@ -98,6 +163,30 @@ def main():
             os.makedirs(log_dir)
         settings.set('LOG_FILE', log_file)
 
+    if args.mode:
+        settings.set('CRAWL_MODE', args.mode)
+    if args.coalesce_countries:
+        settings.set('COALESCE_COUNTRIES', True)
+
+    if args.checkpoint or args.resume:
+        settings.set('CHECKPOINT_ENABLED', True)
+    if args.resume:
+        settings.set('RESUME_RUN_ID', args.resume)
+
+    if args.run_id:
+        settings.set('RUN_ID', args.run_id)
+    if args.shard:
+        settings.set('SHARD', args.shard)
+
+    if args.max_concurrency:
+        settings.set('GLOBAL_CONCURRENT_REQUESTS', args.max_concurrency)
+        settings.set('DOWNLOADER', 'ecommercecrawl.downloader.GlobalConcurrencyDownloader')
+
+    if args.record:
+        response_archive.configure_settings(settings, response_archive.MODE_RECORD, args.record)
+    elif args.replay:
+        response_archive.configure_settings(settings, response_archive.MODE_REPLAY, args.replay)
+
     process = CrawlerProcess(settings)
 
     spider_kwargs = {}
@@ -108,14 +197,24 @@ def main():
         else:
             spider_kwargs['urls'] = args.urls
     elif args.urls_source:
-        spider_kwargs['urls'] = load_urls_source(args.urls_source)
+        # Spiders stream the source from start_requests instead of
+        # materializing every seed URL here.
         spider_kwargs['urls_source'] = args.urls_source
 
     if args.limit:
         spider_kwargs['limit'] = args.limit
-    
-    process.crawl(spider_class, **spider_kwargs)
+
+    # Each spider gets its own crawler, run id, output and manifest; they
+    # share the reactor and the GLOBAL_CONCURRENT_REQUESTS budget.
+    crawlers = []
+    for spider_name in spider_names:
+        crawler = process.create_crawler(spider_map[spider_name])
+        process.crawl(crawler, **spider_kwargs)
+        crawlers.append(crawler)
     process.start()
 
+    if args.replay:
+        print(json.dumps(summarize_crawl_throughput(crawlers[0].stats.get_stats()), default=str))
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,93 @@
+import argparse
+import json
+import os
+
+from ecommercecrawl.rules_benchmark import BenchmarkParams
+from ecommercecrawl.rules_benchmark import compare_to_baseline
+from ecommercecrawl.rules_benchmark import load_corpus
+from ecommercecrawl.rules_benchmark import run_benchmark
+
+
+def _default_report_path(output_dir: str) -> str:
+    return os.path.join(output_dir, "rules_benchmark.json")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark rules extractors and spider PDP paths over a fixture corpus."
+    )
+    parser.add_argument(
+        "--corpus",
+        required=True,
+        nargs="+",
+        help="Fixture JSONL files, directories of JSONL files or response archives (.sqlite).",
+    )
+    parser.add_argument("--site", action="append", help="Only benchmark this site (repeatable).")
+    parser.add_argument("--iterations", type=int, default=20, help="Timed runs per page.")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed runs per page before measuring.")
+    parser.add_argument("--no-allocations", action="store_true", help="Skip the tracemalloc pass.")
+    parser.add_argument("--baseline", help="Baseline report JSON to compare against.")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.10,
+        help="Allowed mean-time growth over the baseline before a field counts as regressed.",
+    )
+    parser.add_argument("--report-path", help="Optional output path for the benchmark report JSON.")
+    parser.add_argument(
+        "--report-dir",
+        default="output/benchmarks",
+        help="Directory for report output when --report-path is not provided.",
+    )
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    if not pages:
+        parser.error("No PDP pages found in the corpus.")
+
+    report = run_benchmark(
+        pages,
+        params=BenchmarkParams(
+            iterations=args.iterations,
+            warmup=args.warmup,
+            measure_allocations=not args.no_allocations,
+        ),
+        sites=args.site,
+    )
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, tolerance=args.tolerance)
+        report["baseline_path"] = args.baseline
+        report["tolerance"] = args.tolerance
+        report["regressions"] = regressions
+
+    report_path = args.report_path or _default_report_path(args.report_dir)
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for site, site_report in report["sites"].items():
+        full_path = site_report["full_path"]
+        print(
+            f"{site}: pages={site_report['pages']} "
+            f"full_path_mean_us={full_path['mean_us']} "
+            f"pages_per_second={full_path['pages_per_second']}"
+        )
+        if "xpath_program" in site_report:
+            program = site_report["xpath_program"]
+            print(
+                f"{site}: string_xpaths_mean_us={program['string_xpaths']['mean_us']} "
+                f"compiled_program_mean_us={program['compiled_program']['mean_us']} "
+                f"speedup={program['speedup']}x mismatched_pages={program['mismatched_pages']}"
+            )
+    for regression in regressions:
+        print(f"REGRESSION {regression['site']}.{regression['name']}: {regression['reason']}")
+    print(f"Rules benchmark regressions={len(regressions)} report={report_path}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
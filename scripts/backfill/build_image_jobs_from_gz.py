@@ -5,6 +5,8 @@ import os
 from collections import Counter
 from datetime import datetime, timezone
 
+from ecommercecrawl.fingerprints import FingerprintSet
+
 
 def _default_output_path() -> str:
     timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
@@ -41,7 +43,7 @@ def _derive_primary_key(payload: dict, site: str):
 
 def build_jobs(input_gz: str, output_jsonl: str, site_override: str | None = None, dedupe: bool = True):
     counts = Counter()
-    seen = set()
+    seen = FingerprintSet()
     jobs_written = 0
 
     output_parent = os.path.dirname(output_jsonl)
@@ -84,11 +86,9 @@ def build_jobs(input_gz: str, output_jsonl: str, site_override: str | None = Non
 
             source_run_id = payload.get("source_run_id") or payload.get("run_id")
             for image_url in image_urls:
-                job_tuple = (site, primary_key, image_url)
-                if dedupe and job_tuple in seen:
+                if dedupe and not seen.add((site, primary_key, image_url)):
                     counts["skipped_duplicate_job"] += 1
                     continue
-                seen.add(job_tuple)
 
                 job = {
                     "site": site,
@@ -0,0 +1,31 @@
+"""
+fingerprint_memory_benchmark.py
+
+Compare the memory a plain Python set and `FingerprintSet` need to dedupe
+a run's worth of URL-like keys, once built and at peak while building.
+
+Usage:
+  python scripts/fingerprint_memory_benchmark.py --keys 1000000
+"""
+import argparse
+import json
+
+from ecommercecrawl.fingerprints import measure_memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure dedupe memory per key: set vs FingerprintSet.")
+    parser.add_argument("--keys", type=int, default=1_000_000, help="Number of generated keys.")
+    args = parser.parse_args()
+
+    results = measure_memory(args.keys)
+    for label, field in (("mib_per_million_keys", "bytes_per_key"), ("peak_mib_per_million_keys", "peak_bytes_per_key")):
+        results[label] = {
+            name: round(results[name][field] * 1_000_000 / (1024 * 1024), 1)
+            for name in ("set", "fingerprint_set")
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
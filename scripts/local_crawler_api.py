@@ -0,0 +1,196 @@
+"""
+local_crawler_api.py
+
+Stand-in crawler API server for offline load tests. Accepts the same request
+body shape as Zyte API (`url`, `httpResponseBody`, `httpResponseHeaders`,
+`browserHtml`) on POST /extract and answers from recorded fixtures, with
+configurable latency, error rate and 429 bursts.
+
+Fixtures are JSONL rows: {"url": ..., "status": 200, "headers": {...}, "body": "..."}.
+URLs are matched exactly first, then without their query string. Unknown
+URLs are answered with statusCode 404, like Zyte does for a missing page.
+
+Point the crawler at it with:
+  CRAWLER_API_SERVICE=local CRAWLER_API_LOCAL_ENDPOINT=http://127.0.0.1:8765/extract
+
+Usage:
+  python scripts/local_crawler_api.py --fixtures output/recorded/ounass_fixtures.jsonl \
+      --latency-ms 400 --latency-jitter-ms 200 --error-rate 0.02 --burst-every 200 --burst-length 20
+"""
+import argparse
+import base64
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+
+def load_fixtures(path):
+    fixtures = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            fixtures[row["url"]] = row
+    return fixtures
+
+
+def find_fixture(fixtures, url):
+    return fixtures.get(url) or fixtures.get(url.split("?", 1)[0])
+
+
+def build_api_answer(api_request, fixture):
+    """Build a Zyte-shaped answer body for a single extract request."""
+    url = api_request["url"]
+    if fixture is None:
+        status, headers, body = 404, {}, ""
+    else:
+        status = int(fixture.get("status", 200))
+        headers = fixture.get("headers") or {}
+        body = fixture.get("body") or ""
+
+    answer = {"url": url, "statusCode": status}
+    if api_request.get("browserHtml"):
+        answer["browserHtml"] = body
+    if api_request.get("httpResponseBody"):
+        answer["httpResponseBody"] = base64.b64encode(body.encode("utf-8")).decode("ascii")
+    if api_request.get("httpResponseHeaders"):
+        answer["httpResponseHeaders"] = [
+            {"name": name, "value": value} for name, value in headers.items()
+        ]
+    return answer
+
+
+class FaultInjector:
+    """
+    Decide per request whether to answer normally, with an error or a 429.
+
+    Every `burst_every` requests, the next `burst_length` requests get 429
+    with Retry-After, which mimics API-level throttling storms.
+    """
+
+    def __init__(self, error_rate=0.0, burst_every=0, burst_length=0, retry_after=1, seed=None):
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    def next_fault(self):
+        with self.lock:
+            self.request_count += 1
+            count = self.request_count
+            roll = self.random.random()
+
+        if self.burst_every and self.burst_length:
+            position = count % self.burst_every
+            if 0 < position <= self.burst_length and count > self.burst_every:
+                return 429
+        if self.error_rate and roll < self.error_rate:
+            return 503
+        return None
+
+
+def make_handler(fixtures, injector, latency_ms=0, latency_jitter_ms=0):
+    class LocalCrawlerAPIHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload, extra_headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (extra_headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/extract":
+                self._send_json(404, {"detail": "Unknown endpoint"})
+                return
+
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                api_request = json.loads(self.rfile.read(length) or b"{}")
+                api_request["url"]
+            except (ValueError, KeyError):
+                self._send_json(400, {"detail": "Request body must be JSON with a url"})
+                return
+
+            delay_ms = latency_ms + (random.uniform(0, latency_jitter_ms) if latency_jitter_ms else 0)
+            if delay_ms > 0:
+                time.sleep(delay_ms / 1000.0)
+
+            fault = injector.next_fault()
+            if fault == 429:
+                self._send_json(
+                    429,
+                    {"detail": "Rate limited"},
+                    {"Retry-After": str(injector.retry_after)},
+                )
+                return
+            if fault is not None:
+                self._send_json(fault, {"detail": "Injected error"})
+                return
+
+            fixture = find_fixture(fixtures, api_request["url"])
+            self._send_json(200, build_api_answer(api_request, fixture))
+
+        def log_message(self, format, *args):
+            logger.debug("%s - %s", self.address_string(), format % args)
+
+    return LocalCrawlerAPIHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded fixtures behind a Zyte-shaped local API.")
+    parser.add_argument("--fixtures", required=True, help="JSONL file of recorded responses.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Base latency added to every answer.")
+    parser.add_argument("--latency-jitter-ms", type=float, default=0.0, help="Uniform random extra latency.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503.")
+    parser.add_argument("--burst-every", type=int, default=0, help="Start a 429 burst every N requests.")
+    parser.add_argument("--burst-length", type=int, default=0, help="Number of 429 answers per burst.")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s.")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible fault injection.")
+    parser.add_argument("--log-level", default="INFO")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=getattr(logging, args.log_level.upper(), logging.INFO),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    fixtures = load_fixtures(args.fixtures)
+    injector = FaultInjector(
+        error_rate=args.error_rate,
+        burst_every=args.burst_every,
+        burst_length=args.burst_length,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    handler = make_handler(fixtures, injector, args.latency_ms, args.latency_jitter_ms)
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+
+    logger.info(
+        "Local crawler API serving %d fixtures on http://%s:%d/extract",
+        len(fixtures), args.host, args.port,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Merge the shard manifests of a sharded crawl (run_crawler.py --shard) into
+the run's manifest.json.
+
+Runs with a shard frontier (SHARD_FRONTIER_URL) merge automatically when
+the last shard finishes; use this for runs without one, once every shard
+task has stopped. Writing manifest.json to S3 triggers the bronze manifest
+verifier, which checks every output part.
+
+Usage:
+    python scripts/merge_shard_manifests.py --run-dir output/2026/01/01/2026-01-01T00-00-00-000
+    python scripts/merge_shard_manifests.py --env prod --bucket price-comparison-bucket-eu-central-1 \\
+        --site level --date 2026-01-01 --run-id 2026-01-01T00-00-00-000
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import boto3
+
+from ecommercecrawl.sharding import merge_shard_manifests
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
+SHARD_MANIFEST_PREFIX = "manifest.shard-"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--run-dir", help="Local run directory holding metadata/manifest.shard-*.json")
+    parser.add_argument("--env", help="APP_ENV value (dev/prod) of the S3 run")
+    parser.add_argument("--bucket", help="S3 bucket name")
+    parser.add_argument("--site", help="Crawler name, e.g. level")
+    parser.add_argument("--date", help="Run date, YYYY-MM-DD")
+    parser.add_argument("--run-id", help="Run id shared by the shards")
+    parser.add_argument("--allow-partial", action="store_true", help="Merge even if shard manifests are missing")
+    args = parser.parse_args()
+    if not args.run_dir and not all((args.env, args.bucket, args.site, args.date, args.run_id)):
+        parser.error("pass --run-dir, or --env, --bucket, --site, --date and --run-id")
+    return args
+
+
+def load_local_manifests(run_dir):
+    paths = sorted(glob.glob(os.path.join(run_dir, "metadata", f"{SHARD_MANIFEST_PREFIX}*.json")))
+    manifests = []
+    for path in paths:
+        with open(path, encoding="utf-8") as handle:
+            manifests.append(json.load(handle))
+    return manifests
+
+
+def metadata_prefix(env, site, dt, run_id):
+    return f"bronze/{env}/crawls/metadata/{site}/{dt}/{run_id}/"
+
+
+def load_s3_manifests(s3_client, bucket, prefix):
+    manifests = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix}{SHARD_MANIFEST_PREFIX}"):
+        for obj in page.get("Contents", []):
+            body = s3_client.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+            manifests.append(json.loads(body))
+    return manifests
+
+
+def check_complete(manifests, allow_partial):
+    """True when there is one manifest per shard of the run."""
+    if not manifests:
+        logger.error("No shard manifests found")
+        return False
+    count = manifests[0]["shard"]["count"]
+    missing = sorted(set(range(count)) - {manifest["shard"]["index"] for manifest in manifests})
+    if missing:
+        logger.log(logging.WARNING if allow_partial else logging.ERROR, "Missing shards: %s", missing)
+        return allow_partial
+    return True
+
+
+def main():
+    args = parse_args()
+    s3_client = None
+    if args.run_dir:
+        manifests = load_local_manifests(args.run_dir)
+    else:
+        s3_client = boto3.client("s3")
+        prefix = metadata_prefix(args.env, args.site, args.date, args.run_id)
+        manifests = load_s3_manifests(s3_client, args.bucket, prefix)
+
+    if not check_complete(manifests, args.allow_partial):
+        sys.exit(1)
+    merged = json.dumps(merge_shard_manifests(manifests), indent=4)
+
+    if args.run_dir:
+        manifest_path = os.path.join(args.run_dir, "metadata", "manifest.json")
+        with open(manifest_path, "w", encoding="utf-8") as handle:
+            handle.write(merged)
+        logger.info("Wrote %s from %d shard manifests", manifest_path, len(manifests))
+    else:
+        key = f"{prefix}manifest.json"
+        s3_client.put_object(Bucket=args.bucket, Key=key, Body=merged.encode("utf-8"))
+        logger.info("Wrote s3://%s/%s from %d shard manifests", args.bucket, key, len(manifests))
+
+
+if __name__ == "__main__":
+    main()
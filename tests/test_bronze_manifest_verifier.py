@@ -172,6 +172,38 @@ def test_verify_manifest_writes_fail_outcome_in_wrapper_raw_json():
     assert inner["verification"]["failure_reason"] == "test_reason"
 
 
+def test_verify_manifest_checks_every_part_of_a_sharded_run():
+    handler = _load_handler_module()
+    bucket = "test-bucket"
+    manifest_key = "bronze/dev/crawls/metadata/level/2026-03-03/run123/manifest.json"
+    objects = {}
+    parts = []
+    for index, raw in enumerate((b'{"a":1}\n', b'{"a":2}\n{"a":3}\n')):
+        filename = f"level.shard-{index}-of-2.jsonl.gz"
+        compressed = gzip.compress(raw)
+        objects[(bucket, f"bronze/dev/crawls/level/2026-03-03/run123/{filename}")] = compressed
+        parts.append({
+            "file_path": f"output/{filename}",
+            "rows": len(raw.splitlines()),
+            "hashes": {"sha256": hashlib.sha256(compressed).hexdigest()},
+        })
+    manifest = {"artifacts": {"rows": 3, "parts": parts}, "quality_gate": {"status": "pass"}}
+    objects[(bucket, manifest_key)] = json.dumps(manifest).encode("utf-8")
+    fake_s3 = _FakeS3(objects)
+    handler.s3 = fake_s3
+
+    assert handler._verify_manifest_and_write_success(bucket, manifest_key)["verification_ok"]
+
+    parts[1]["rows"] = 1
+    objects[(bucket, manifest_key)] = json.dumps(manifest).encode("utf-8")
+    fake_s3 = _FakeS3(objects)
+    handler.s3 = fake_s3
+
+    result = handler._verify_manifest_and_write_success(bucket, manifest_key)
+    assert result["verification_ok"] is False
+    assert "level.shard-1-of-2.jsonl.gz" in result["message"]
+
+
 # ---- partition registration tests ----
 
 def test_register_bronze_partition_reads_from_markers_prefix():
@@ -0,0 +1,170 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from moto import mock_aws
+from scrapy.http import HtmlResponse, Request
+from scrapy.settings import Settings
+from scrapy.utils.request import RequestFingerprinter
+
+from ecommercecrawl.checkpoint import CHECKPOINT_META_KEY, CrawlCheckpoint
+from ecommercecrawl.middlewares import CheckpointMiddleware
+from ecommercecrawl.pipelines import JsonlWriterPipeline
+from ecommercecrawl.spiders.farfetch_crawl import FFSpider
+
+PLP_URL = "https://www.farfetch.com/ae/shopping/women/boots-1/items.aspx"
+PDP_A = "https://www.farfetch.com/ae/shopping/women/a-item-1.aspx"
+PDP_B = "https://www.farfetch.com/ae/shopping/women/b-item-2.aspx"
+
+
+def _crawler(tmp_path, spider, **settings):
+    crawler = MagicMock()
+    crawler.settings = Settings({"CHECKPOINT_DIR": str(tmp_path / "checkpoints"), **settings})
+    crawler.spider = spider
+    crawler.request_fingerprinter = RequestFingerprinter()
+    crawler.signals.send_catch_log.return_value = []
+    return crawler
+
+
+def _spider(run_id="2026-01-01T00-00-00-000"):
+    spider = FFSpider()
+    spider.run_id = run_id
+    return spider
+
+
+def _response(request):
+    return HtmlResponse(url=request.url, body=b"", request=request)
+
+
+def test_checkpoint_middleware_is_disabled_by_default(tmp_path):
+    from scrapy.exceptions import NotConfigured
+
+    with pytest.raises(NotConfigured):
+        CheckpointMiddleware.from_crawler(_crawler(tmp_path, _spider()))
+
+
+def test_resume_without_checkpoint_fails(tmp_path):
+    with pytest.raises(ValueError, match="No checkpoint found"):
+        CheckpointMiddleware.from_crawler(_crawler(tmp_path, _spider(), RESUME_RUN_ID="2026-01-01T00-00-00-000"))
+
+
+def test_checkpoint_saves_pending_requests_and_resumes_them(tmp_path):
+    spider = _spider()
+    crawler = _crawler(tmp_path, spider, CHECKPOINT_ENABLED=True)
+    middleware = CheckpointMiddleware.from_crawler(crawler)
+    plp = Request(PLP_URL, callback=spider.parse)
+    middleware.request_scheduled(plp, spider)
+    pdp_a = Request(PDP_A, callback=spider.parse)
+    pdp_b = Request(PDP_B, callback=spider.parse)
+
+    # The PLP is parsed and schedules both PDPs; only PDP A is parsed before the task dies.
+    kept = list(middleware.process_spider_output(_response(plp), [pdp_a, pdp_b], spider))
+    assert kept == [pdp_a, pdp_b]
+    for request in kept:
+        middleware.request_scheduled(request, spider)
+    list(middleware.process_spider_output(_response(pdp_a), [{"url": PDP_A}], spider))
+    middleware.save(spider)
+
+    resumed_crawler = _crawler(tmp_path, spider, RESUME_RUN_ID=spider.run_id)
+    resumed = CheckpointMiddleware.from_crawler(resumed_crawler)
+    seeds = [Request(PLP_URL, callback=spider.parse), Request(PDP_A, callback=spider.parse)]
+    start = list(resumed.process_start_requests(seeds, spider))
+
+    assert [request.url for request in start] == [PDP_B]
+    assert start[0].callback == spider.parse
+    assert start[0].meta[CHECKPOINT_META_KEY]
+    # A re-parsed PLP does not schedule the resumed PDP a second time.
+    assert list(resumed.process_spider_output(None, [Request(PDP_B)], spider)) == []
+
+
+def test_checkpoint_process_start_yields_pending_before_seeds(tmp_path):
+    spider = _spider()
+    middleware = CheckpointMiddleware.from_crawler(_crawler(tmp_path, spider, CHECKPOINT_ENABLED=True))
+    middleware.request_scheduled(Request(PDP_B, callback=spider.parse), spider)
+    middleware.save(spider)
+    resumed = CheckpointMiddleware.from_crawler(_crawler(tmp_path, spider, RESUME_RUN_ID=spider.run_id))
+
+    async def seeds():
+        yield Request(PLP_URL, callback=spider.parse)
+
+    async def collect():
+        return [request.url async for request in resumed.process_start(seeds())]
+
+    assert asyncio.run(collect()) == [PDP_B, PLP_URL]
+
+
+def test_resume_reads_pending_requests_saved_as_dicts(tmp_path):
+    spider = _spider()
+    checkpoint = CrawlCheckpoint.from_settings(
+        Settings({"CHECKPOINT_DIR": str(tmp_path / "checkpoints")}), spider.name, spider.run_id,
+    )
+    pending = Request(PDP_B, callback=spider.parse).to_dict(spider=spider)
+    checkpoint.save({"pending": [pending], "parsed": b""})
+
+    resumed = CheckpointMiddleware.from_crawler(_crawler(tmp_path, spider, RESUME_RUN_ID=spider.run_id))
+
+    assert [request.url for request in resumed.process_start_requests([], spider)] == [PDP_B]
+
+
+def test_dropped_duplicate_keeps_pending_request(tmp_path):
+    spider = _spider()
+    middleware = CheckpointMiddleware.from_crawler(_crawler(tmp_path, spider, CHECKPOINT_ENABLED=True))
+    first, duplicate = Request(PDP_A), Request(PDP_A)
+
+    middleware.request_scheduled(first, spider)
+    middleware.request_scheduled(duplicate, spider)
+    middleware.request_dropped(duplicate, spider)
+
+    assert list(middleware.pending) == [first.meta[CHECKPOINT_META_KEY]]
+
+    # A request the scheduler drops right away is not pending.
+    dropped = Request(PDP_B)
+    middleware.request_scheduled(dropped, spider)
+    middleware.request_dropped(dropped, spider)
+    assert len(middleware.pending) == 1
+
+
+def test_writer_restores_output_to_checkpointed_offset(tmp_path):
+    spider = _spider()
+    output = tmp_path / "ounass.jsonl"
+    writer = JsonlWriterPipeline()
+    writer.output_filepath = str(output)
+    writer.file = open(output, "a", encoding="utf-8")
+    writer.file.write('{"a": 1}\n')
+    writer.items_written = 1
+    state = writer.checkpoint_saving(spider)
+    writer.file.write('{"b": 2}\n')
+    writer.file.close()
+
+    resumed = JsonlWriterPipeline()
+    resumed.checkpoint_restoring(spider, state, CrawlCheckpoint(str(tmp_path / "checkpoint")))
+    resumed.file.close()
+
+    assert output.read_text(encoding="utf-8") == '{"a": 1}\n'
+    assert resumed.items_written == 1
+    assert spider.output_filepath == str(output)
+
+
+@mock_aws
+def test_checkpoint_rebuilds_output_from_s3_parts(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    boto3.client("s3").create_bucket(Bucket="crawl-state")
+    output = tmp_path / "task-1" / "ounass.jsonl"
+    output.parent.mkdir()
+    settings = Settings({"CHECKPOINT_DIR": str(tmp_path / "task-1"), "CHECKPOINT_S3_PREFIX": "s3://crawl-state/checkpoints"})
+    checkpoint = CrawlCheckpoint.from_settings(settings, "ounass", "run-1")
+    output.write_text('{"a": 1}\n', encoding="utf-8")
+    checkpoint.save({"writer": {"output_filepath": str(output), "output_offset": 9}})
+    output.write_text('{"a": 1}\n{"b": 2}\n', encoding="utf-8")
+    checkpoint.save({"writer": {"output_filepath": str(output), "output_offset": 18}})
+
+    # A new task starts without the old disk.
+    settings.set("CHECKPOINT_DIR", str(tmp_path / "task-2"))
+    restored = CrawlCheckpoint.from_settings(settings, "ounass", "run-1")
+    state = restored.load()
+    rebuilt = tmp_path / "task-2" / "ounass.jsonl"
+    restored.restore_output(str(rebuilt), state["writer"]["output_offset"])
+
+    assert [part[0] for part in state["output_parts"]] == ["output_parts/000000.jsonl", "output_parts/000001.jsonl"]
+    assert rebuilt.read_text(encoding="utf-8") == '{"a": 1}\n{"b": 2}\n'
@@ -0,0 +1,54 @@
+from ecommercecrawl.country_coalescing import CountryCoalescer, coalescing_key, merge_country_row
+
+
+AE_URL = "https://www.ounass.ae/shop-bag-a.html"
+KW_URL = "https://kuwait.ounass.com/shop-bag-a.html"
+QA_URL = "https://www.ounass.qa/shop-bag-a.html"
+
+
+def _row(url, country, price):
+    return {"url": url, "country": country, "price": price, "portal_itemid": "123", "language": "EN"}
+
+
+def test_coalescing_key_needs_a_sku():
+    assert coalescing_key({"portal_itemid": 123, "language": "AR"}) == ("123", "AR")
+    assert coalescing_key({"language": "EN"}) is None
+
+
+def test_merge_keeps_country_values_over_pdp_fields():
+    merged = merge_country_row(
+        {"url": KW_URL, "price": 390, "out_of_stock": None},
+        {"text": "Leather bag", "out_of_stock": False},
+    )
+
+    assert merged == {"url": KW_URL, "price": 390, "out_of_stock": False, "text": "Leather bag"}
+
+
+def test_parked_rows_merge_when_primary_pdp_resolves():
+    coalescer = CountryCoalescer()
+    key = ("123", "EN")
+
+    assert coalescer.claim(key, AE_URL) is True
+    assert coalescer.claim(key, KW_URL) is False
+    assert coalescer.offer(key, _row(KW_URL, "KW", 390)) == []
+
+    pdp_item = {"url": AE_URL, "country": "AE", "price": 4200, "text": "Leather bag", "portal_itemid": "123"}
+    merged = coalescer.resolve(AE_URL, pdp_item)
+
+    assert merged == [{
+        "url": KW_URL, "country": "KW", "price": 390, "portal_itemid": "123", "language": "EN",
+        "text": "Leather bag", "coalesced_from": AE_URL,
+    }]
+    # Later countries merge immediately.
+    assert coalescer.offer(key, _row(QA_URL, "QA", 4300))[0]["text"] == "Leather bag"
+
+
+def test_release_returns_parked_rows_and_frees_the_key():
+    coalescer = CountryCoalescer()
+    key = ("123", "EN")
+    coalescer.claim(key, AE_URL)
+    coalescer.offer(key, _row(KW_URL, "KW", 390))
+
+    assert [row["url"] for row in coalescer.release(AE_URL)] == [KW_URL]
+    assert coalescer.claim(key, QA_URL) is True
+    assert coalescer.drain() == []
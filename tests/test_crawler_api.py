@@ -1,12 +1,19 @@
+import json
+
 import pytest
 import scrapy
 from scrapy.settings import Settings
 
 from ecommercecrawl.crawler_api import (
+    ADAPTIVE_REQUEST_TYPE_META_KEY,
+    REQUEST_TYPE_ADAPTIVE,
     REQUEST_TYPE_HTTP_RESPONSE,
     REQUEST_TYPE_RENDERED_HTML,
     build_crawler_api_request,
 )
+from ecommercecrawl.crawler_api.adaptive import AdaptiveRequestTypePolicy
+from ecommercecrawl.crawler_api.escalation import EscalationPolicy
+from ecommercecrawl.crawler_api.local_api import LOCAL_API_META_KEY
 from ecommercecrawl.crawler_api.zyte_api import build_zyte_api_params
 
 
@@ -52,3 +59,118 @@ def test_build_zyte_api_params_includes_optional_geolocation():
         "httpResponseHeaders": True,
         "geolocation": "AE",
     }
+
+
+def test_build_crawler_api_request_resolves_adaptive_type_through_policy():
+    policy = AdaptiveRequestTypePolicy()
+
+    request = build_crawler_api_request(
+        url="https://www.ounass.ae/shop-product.html",
+        callback=lambda response: None,
+        settings=Settings({"CRAWLER_API_SERVICE": "zyte"}),
+        request_type=REQUEST_TYPE_ADAPTIVE,
+        adaptive_policy=policy,
+    )
+
+    assert request.meta["zyte_api"] == {
+        "httpResponseBody": True,
+        "httpResponseHeaders": True,
+    }
+    assert request.meta[ADAPTIVE_REQUEST_TYPE_META_KEY] == REQUEST_TYPE_HTTP_RESPONSE
+
+
+def test_build_crawler_api_request_requires_policy_for_adaptive_type():
+    with pytest.raises(ValueError, match="adaptive_policy"):
+        build_crawler_api_request(
+            url="https://www.ounass.ae/shop-product.html",
+            callback=lambda response: None,
+            request_type=REQUEST_TYPE_ADAPTIVE,
+        )
+
+
+def test_adaptive_policy_skips_cheap_attempt_on_failing_hostname():
+    policy = AdaptiveRequestTypePolicy(min_samples=3, min_success_rate=0.5, probe_interval=0)
+    failing = "https://www.ounass.ae/a.html"
+    healthy = "https://kuwait.ounass.com/a.html"
+
+    for _ in range(3):
+        policy.record(failing, success=False)
+        policy.record(healthy, success=True)
+
+    assert policy.choose(failing) == REQUEST_TYPE_RENDERED_HTML
+    assert policy.choose(healthy) == REQUEST_TYPE_HTTP_RESPONSE
+
+
+def test_adaptive_policy_probes_cheap_attempt_periodically():
+    policy = AdaptiveRequestTypePolicy(min_samples=1, min_success_rate=0.5, probe_interval=3)
+    url = "https://www.ounass.ae/a.html"
+    policy.record(url, success=False)
+
+    choices = [policy.choose(url) for _ in range(3)]
+
+    assert choices == [
+        REQUEST_TYPE_RENDERED_HTML,
+        REQUEST_TYPE_RENDERED_HTML,
+        REQUEST_TYPE_HTTP_RESPONSE,
+    ]
+
+
+def test_build_crawler_api_request_dispatches_to_local_api():
+    settings = Settings({
+        "CRAWLER_API_SERVICE": "local",
+        "CRAWLER_API_LOCAL_ENDPOINT": "http://127.0.0.1:9999/extract",
+    })
+    url = "https://www.ounass.ae/shop-product.html"
+
+    request = build_crawler_api_request(
+        url=url,
+        callback=lambda response: None,
+        settings=settings,
+        request_type=REQUEST_TYPE_RENDERED_HTML,
+    )
+
+    assert request.url == "http://127.0.0.1:9999/extract"
+    assert request.method == "POST"
+    assert json.loads(request.body) == {"url": url, "browserHtml": True}
+    assert request.meta[LOCAL_API_META_KEY] == {"url": url, "browserHtml": True}
+    assert request.meta["download_slot"] == "www.ounass.ae"
+    assert "zyte_api" not in request.meta
+
+
+def test_escalation_policy_escalates_after_blocks_within_window():
+    policy = EscalationPolicy(block_threshold=2, window_seconds=60, cooldown_seconds=300)
+
+    assert policy.record("www.farfetch.com", 0, True, now=0) is None
+    # The first block fell out of the window.
+    assert policy.record("www.farfetch.com", 0, True, now=100) is None
+    assert policy.record("www.farfetch.com", 0, False, now=101) is None
+    assert policy.record("www.farfetch.com", 0, True, now=102) == 1
+
+    assert policy.level("www.farfetch.com", now=103) == 1
+    assert policy.request_type(1) == REQUEST_TYPE_HTTP_RESPONSE
+    assert policy.level("www.levelshoes.com", now=103) == 0
+
+
+def test_escalation_policy_ignores_stale_levels_and_steps_down_after_cooldown():
+    policy = EscalationPolicy(block_threshold=1, cooldown_seconds=300)
+    policy.record("www.farfetch.com", 0, True, now=0)
+
+    # Direct requests still in flight do not escalate past http_response.
+    assert policy.record("www.farfetch.com", 0, True, now=1) is None
+    assert policy.record("www.farfetch.com", 1, True, now=2) == 2
+    assert policy.request_type(2) == REQUEST_TYPE_RENDERED_HTML
+    assert policy.record("www.farfetch.com", 2, True, now=3) is None
+
+    assert policy.level("www.farfetch.com", now=301) == 2
+    assert policy.level("www.farfetch.com", now=302) == 1
+    assert policy.level("www.farfetch.com", now=602) == 0
+
+
+def test_escalation_policy_reads_settings():
+    policy = EscalationPolicy.from_settings(Settings({
+        "CRAWLER_API_ESCALATION_REQUEST_TYPES": "rendered_html",
+        "CRAWLER_API_ESCALATION_BLOCK_THRESHOLD": "3",
+    }))
+
+    assert policy.request_types == (REQUEST_TYPE_RENDERED_HTML,)
+    assert policy.block_threshold == 3
@@ -0,0 +1,101 @@
+from unittest.mock import MagicMock
+
+import pytest
+import scrapy.core.downloader as scrapy_downloader
+import twisted.internet
+from scrapy import Spider
+from scrapy.http import Request, Response
+from scrapy.settings import Settings
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+
+from ecommercecrawl import downloader as downloader_module
+from ecommercecrawl.downloader import GlobalConcurrencyDownloader
+
+
+def _downloader(clock, **settings):
+    crawler = MagicMock()
+    crawler.settings = Settings({"GLOBAL_CONCURRENT_REQUESTS": 1, **settings})
+    downloader = GlobalConcurrencyDownloader(crawler)
+    downloader._clock = clock
+    downloader.handlers = MagicMock()
+    # url -> Deferred of a download the handler started
+    downloads = {}
+    downloader.handlers.download_request.side_effect = (
+        lambda request, spider: downloads.setdefault(request.url, Deferred())
+    )
+    return downloader, downloads
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    clock.advance(1000)
+    # Scrapy's slots schedule delays on the reactor and read time().
+    monkeypatch.setattr(twisted.internet, "reactor", clock, raising=False)
+    monkeypatch.setattr(scrapy_downloader, "time", clock.seconds)
+    monkeypatch.setattr(scrapy_downloader.task, "LoopingCall", MagicMock())
+    monkeypatch.setattr(scrapy_downloader, "DownloadHandlers", MagicMock())
+    monkeypatch.setattr(scrapy_downloader, "DownloaderMiddlewareManager", MagicMock())
+    monkeypatch.setattr(downloader_module, "_global_slots", {})
+    return clock
+
+
+def test_requests_waiting_for_a_slot_delay_hold_no_global_slot(clock):
+    slow, slow_downloads = _downloader(clock, DOWNLOAD_DELAY=60, RANDOMIZE_DOWNLOAD_DELAY=False)
+    fast, fast_downloads = _downloader(clock)
+    spider = Spider("test")
+    first, delayed = Request("https://www.ounass.ae/api/a"), Request("https://www.ounass.ae/api/b")
+    other = Request("https://www.levelshoes.com/women/bags")
+
+    slow._enqueue_request(first, spider)
+    slow._enqueue_request(delayed, spider)
+    slow_downloads[first.url].callback(Response(first.url))
+    assert delayed.url not in slow_downloads
+
+    # The delayed request waits in its slot and leaves the budget to others.
+    fast._enqueue_request(other, spider)
+    assert other.url in fast_downloads
+    assert slow.global_slots.tokens == 0
+
+    clock.advance(60)
+    assert delayed.url not in slow_downloads
+    slow.stats.inc_value.assert_called_once_with("global_concurrency/queued")
+
+    clock.advance(2)
+    fast_downloads[other.url].callback(Response(other.url))
+    assert delayed.url in slow_downloads
+    slow.stats.max_value.assert_called_once_with("global_concurrency/max_wait_seconds", 2)
+
+    slow_downloads[delayed.url].callback(Response(delayed.url))
+    assert slow.global_slots.tokens == 1
+    assert not any(slot.transferring for slot in slow.slots.values())
+
+
+def test_global_concurrency_is_shared_between_crawlers(clock):
+    first, first_downloads = _downloader(clock)
+    second, second_downloads = _downloader(clock)
+    spider = Spider("test")
+    ounass = Request("https://www.ounass.ae/api/women/bags")
+    level = Request("https://www.levelshoes.com/women/bags")
+
+    failed = first._enqueue_request(ounass, spider)
+    failed.addErrback(lambda failure: None)
+    second._enqueue_request(level, spider)
+    assert first.global_slots is second.global_slots
+    assert level.url not in second_downloads
+
+    # A failed download gives its slot back as well.
+    first_downloads[ounass.url].errback(Exception("boom"))
+    assert level.url in second_downloads
+
+
+def test_global_concurrency_is_disabled_without_a_limit(clock):
+    downloader, downloads = _downloader(clock, GLOBAL_CONCURRENT_REQUESTS=0)
+    spider = Spider("test")
+
+    for page in range(3):
+        downloader._enqueue_request(Request(f"https://www.ounass.ae/api/{page}"), spider)
+
+    assert downloader.global_slots is None
+    assert len(downloads) == 3
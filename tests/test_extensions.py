@@ -0,0 +1,233 @@
+import signal
+from unittest.mock import MagicMock
+
+import pytest
+import twisted.internet
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Request, Response
+from scrapy.settings import Settings
+
+from ecommercecrawl.extensions import (
+    DRAINED_REASON,
+    AdaptiveConcurrencyExtension,
+    CrawlProgressExtension,
+    OpenMetricsExtension,
+    SigtermDrainExtension,
+    _handle_sigterm,
+)
+from ecommercecrawl.spiders.mastercrawl import MasterCrawl
+
+
+def _drain_extension(in_flight=(), **settings):
+    crawler = MagicMock()
+    crawler.settings = Settings(settings)
+    crawler.spider = MasterCrawl()
+    crawler.engine.downloader.active = set(in_flight)
+    crawler.engine.scraper.slot.active = set()
+    return SigtermDrainExtension.from_crawler(crawler), crawler
+
+
+def test_drain_can_be_disabled():
+    with pytest.raises(NotConfigured):
+        _drain_extension(DRAIN_ON_SIGTERM=False)
+
+
+def test_drain_pauses_engine_and_closes_when_nothing_is_in_flight():
+    extension, crawler = _drain_extension()
+
+    extension.drain()
+
+    assert crawler.spider.is_draining() is True
+    crawler.engine.pause.assert_called_once()
+    crawler.engine.close_spider.assert_called_once_with(crawler.spider, DRAINED_REASON)
+    crawler.stats.set_value.assert_any_call("drain/abandoned_requests", 0)
+
+
+def test_drain_waits_for_in_flight_requests_until_timeout(monkeypatch):
+    extension, crawler = _drain_extension(in_flight=["request"], DRAIN_TIMEOUT_SECONDS=10)
+    clock = iter([100.0, 105.0, 111.0, 111.0])
+    monkeypatch.setattr("ecommercecrawl.extensions.time.monotonic", lambda: next(clock))
+
+    extension.drain()
+    crawler.engine.close_spider.assert_not_called()
+
+    extension._check(crawler.spider)
+    crawler.engine.close_spider.assert_called_once_with(crawler.spider, DRAINED_REASON)
+    crawler.stats.set_value.assert_any_call("drain/abandoned_requests", 1)
+
+
+def test_second_sigterm_closes_without_waiting():
+    extension, crawler = _drain_extension(in_flight=["request"])
+
+    extension.drain()
+    extension.drain()
+
+    crawler.engine.close_spider.assert_called_once_with(crawler.spider, DRAINED_REASON)
+
+
+def test_draining_spider_stops_reading_seeds():
+    spider = MasterCrawl(start_urls=["https://example.com/a", "https://example.com/b"])
+
+    requests = spider.start_requests()
+    assert next(requests).url == "https://example.com/a"
+    spider.draining = True
+
+    assert list(requests) == []
+
+
+def test_sigterm_drains_every_crawler_in_the_process(monkeypatch):
+    reactor = MagicMock()
+    reactor.callFromThread.side_effect = lambda function, *args: function(*args)
+    monkeypatch.setattr(twisted.internet, "reactor", reactor, raising=False)
+    monkeypatch.setattr("ecommercecrawl.extensions.signal.signal", MagicMock())
+    extensions = [_drain_extension(in_flight=["request"])[0] for _ in range(2)]
+    for extension in extensions:
+        extension.engine_started()
+
+    _handle_sigterm(signal.SIGTERM, None)
+
+    for extension in extensions:
+        assert extension.crawler.spider.is_draining() is True
+        extension.spider_closed(extension.crawler.spider, DRAINED_REASON)
+
+
+def _aimd_extension(**settings):
+    crawler = MagicMock()
+    crawler.settings = Settings({"AIMD_ENABLED": True, **settings})
+    slot = MagicMock(concurrency=2, delay=1.0)
+    crawler.engine.downloader.slots = {"www.farfetch.com": slot}
+    return AdaptiveConcurrencyExtension.from_crawler(crawler), crawler, slot
+
+
+def _downloaded(extension, status=200, latency=0.2, headers=None):
+    request = Request(
+        "https://www.farfetch.com/ae/shopping/women/items.aspx",
+        meta={"download_slot": "www.farfetch.com", "download_latency": latency},
+    )
+    response = Response(request.url, status=status, headers=headers, request=request)
+    extension.response_downloaded(response, request, None)
+
+
+def test_aimd_is_disabled_by_default():
+    crawler = MagicMock()
+    crawler.settings = Settings()
+
+    with pytest.raises(NotConfigured):
+        AdaptiveConcurrencyExtension.from_crawler(crawler)
+
+
+def test_aimd_increases_after_a_full_window_of_fast_responses():
+    extension, crawler, slot = _aimd_extension(AIMD_DELAY_STEP=0.25, AIMD_MIN_DELAY=0.5)
+
+    _downloaded(extension)
+    assert (slot.concurrency, slot.delay) == (2, 1.0)
+    _downloaded(extension)
+
+    assert (slot.concurrency, slot.delay) == (3, 0.75)
+    crawler.stats.inc_value.assert_any_call("aimd/www.farfetch.com/increase")
+    crawler.stats.set_value.assert_any_call("aimd/www.farfetch.com/concurrency", 3)
+
+
+def test_aimd_holds_when_latency_grows():
+    extension, _, slot = _aimd_extension()
+
+    _downloaded(extension, latency=0.2)
+    _downloaded(extension, latency=1.0)
+    _downloaded(extension, latency=1.0)
+
+    assert slot.concurrency == 2
+
+
+def test_aimd_decreases_once_per_throttled_window_and_honors_retry_after():
+    extension, crawler, slot = _aimd_extension(AIMD_MAX_CONCURRENCY=8)
+    slot.concurrency = 8
+
+    _downloaded(extension, status=429, headers={"Retry-After": "5"})
+    _downloaded(extension, status=429)
+
+    assert (slot.concurrency, slot.delay) == (4, 5.0)
+    crawler.stats.inc_value.assert_any_call("aimd/www.farfetch.com/decrease")
+
+
+def test_aimd_applies_site_limits_by_host_suffix():
+    extension, _, slot = _aimd_extension(AIMD_SITE_LIMITS={"farfetch.com": {"max_concurrency": 2}})
+
+    for _ in range(10):
+        _downloaded(extension)
+
+    assert slot.concurrency == 2
+    assert extension.get_limits("www.ounass.ae")["max_concurrency"] == 8
+
+
+def test_progress_reporting_is_off_by_default():
+    crawler = MagicMock()
+    crawler.settings = Settings()
+    with pytest.raises(NotConfigured):
+        CrawlProgressExtension.from_crawler(crawler)
+
+
+def test_progress_report_is_written_per_run_and_shard(tmp_path, monkeypatch):
+    import json
+
+    from ecommercecrawl.sharding import ShardSpec
+
+    monkeypatch.setattr("ecommercecrawl.extensions.LoopingCall", MagicMock())
+    crawler = MagicMock()
+    crawler.settings = Settings({"PROGRESS_ENABLED": True, "PROGRESS_DIR": str(tmp_path)})
+    extension = CrawlProgressExtension.from_crawler(crawler)
+    spider = MasterCrawl()
+    spider.shard = ShardSpec(1, 2)
+
+    extension.spider_opened(spider)
+    spider.report_listing_page("https://www.ounass.ae/api/women/bags?p=0", 3, ["https://www.ounass.ae/a.html"])
+    extension.item_scraped({"url": "https://www.ounass.ae/a.html"}, None, spider)
+    extension.spider_closed(spider, "finished")
+
+    path = tmp_path / spider.name / spider.run_id / "progress.shard-1-of-2.json"
+    report = json.loads(path.read_text())
+    assert report["finished"] is True
+    assert report["plp_pages_expected"] == 3
+    assert report["pdps_completed"] == 1
+    assert report["seeds"][0]["seed"] == "https://www.ounass.ae/api/women/bags"
+
+
+def test_metrics_export_needs_an_endpoint_or_a_file():
+    crawler = MagicMock()
+    crawler.settings = Settings({"METRICS_ENABLED": True, "METRICS_PORT": ""})
+    with pytest.raises(NotConfigured):
+        OpenMetricsExtension.from_crawler(crawler)
+
+
+def test_metrics_file_has_stats_latency_slots_and_throughput(tmp_path, monkeypatch):
+    monkeypatch.setattr("ecommercecrawl.extensions.LoopingCall", MagicMock())
+    path = tmp_path / "metrics" / "crawl.prom"
+    crawler = MagicMock()
+    crawler.settings = Settings({"METRICS_ENABLED": True, "METRICS_PORT": "", "METRICS_FILE": str(path)})
+    crawler.spider.name = "ounass"
+    crawler.stats.get_stats.return_value = {
+        "item_scraped_count": 4,
+        "output/bytes_written": 2048,
+        "retry_after/www.ounass.ae/queue_depth": 2,
+        "scheduler/enqueued": 10,
+        "scheduler/dequeued": 7,
+        "start_time": "not a number",
+    }
+    slot = MagicMock(delay=2.5, concurrency=4, active={1, 2}, queue=[])
+    crawler.engine.downloader.slots = {"www.ounass.ae": slot}
+    crawler.engine.downloader.active = {1, 2}
+    crawler.engine.scraper.slot.active = set()
+    extension = OpenMetricsExtension.from_crawler(crawler)
+
+    extension.spider_opened(crawler.spider)
+    request = Request("https://www.ounass.ae/women/bags", meta={"download_latency": 0.3})
+    extension.response_downloaded(Response(request.url, request=request), request, crawler.spider)
+    extension.spider_closed(crawler.spider, "finished")
+
+    text = path.read_text()
+    assert 'ecommercecrawl_stat{spider="ounass",stat="retry_after/www.ounass.ae/queue_depth"} 2' in text
+    assert "start_time" not in text
+    assert 'ecommercecrawl_download_latency_seconds_bucket{spider="ounass",domain="www.ounass.ae",le="0.5"} 1' in text
+    assert 'ecommercecrawl_slot_delay_seconds{spider="ounass",slot="www.ounass.ae"} 2.5' in text
+    assert 'ecommercecrawl_scheduler_pending_requests{spider="ounass"} 3' in text
+    assert 'ecommercecrawl_output_bytes_written_total{spider="ounass"} 2048' in text
+    assert text.endswith("# EOF\n")
@@ -1,4 +1,5 @@
 import pytest
+import scrapy
 from scrapy.settings import Settings
 from unittest.mock import MagicMock, patch
 from scrapy.http import HtmlResponse, Request
@@ -128,14 +129,18 @@ class TestFFSpider:
             mock_rules.get_category_from_breadcrumbs.return_value = 'Clothing'
             mock_rules.get_subcategory_from_breadcrumbs.return_value = 'T-Shirts'
             
-            # Make the new rule functions use the mock response
-            mock_rules.get_brand.return_value = "CoolBrand"
-            mock_rules.get_product_name.return_value = "Stylish T-Shirt"
-            mock_rules.get_discount.return_value = "80"
+            # Page fields come from one run of the PDP program
+            mock_rules.extract_pdp_fields.return_value = {
+                'primary_label': "New Season",
+                'breadcrumbs': ["Home", "Men", "Clothing", "T-Shirts"],
+                'price': "USD 100.00",
+                'discount': "80",
+                'image_url': "https://example.com/image.jpg",
+                'product_name': "Stylish T-Shirt",
+                'brand': "CoolBrand",
+                'text': ["Some descriptive text."],
+            }
             mock_rules.is_sold_out.return_value = False
-            mock_rules.get_primary_label.return_value = "New Season"
-            mock_rules.get_image_url.return_value = "https://example.com/image.jpg"
-            mock_rules.get_text.return_value = ["Some descriptive text."]
 
             # Call the method under test
             data = spider._populate_pdp_data(mock_response)
@@ -167,13 +172,17 @@ class TestFFSpider:
             mock_rules.get_price_and_currency.return_value = (None, None)  # No price for sold out
             mock_rules.get_category_from_breadcrumbs.return_value = 'Accessories'
             mock_rules.get_subcategory_from_breadcrumbs.return_value = 'Hats'
-            mock_rules.get_brand.return_value = "SoldOutBrand"
-            mock_rules.get_product_name.return_value = "Rare Hat"
-            mock_rules.get_discount.return_value = None
+            mock_rules.extract_pdp_fields.return_value = {
+                'primary_label': "Sold Out",
+                'breadcrumbs': ["Home", "Men", "Accessories", "Hats"],
+                'price': "",
+                'discount': None,
+                'image_url': "https://example.com/soldout.jpg",
+                'product_name': "Rare Hat",
+                'brand': "SoldOutBrand",
+                'text': ["This item is no longer available."],
+            }
             mock_rules.is_sold_out.return_value = True
-            mock_rules.get_primary_label.return_value = "Sold Out"
-            mock_rules.get_image_url.return_value = "https://example.com/soldout.jpg"
-            mock_rules.get_text.return_value = ["This item is no longer available."]
 
             data = spider._populate_pdp_data(mock_response)
 
@@ -248,4 +257,52 @@ class TestFFSpider:
 
         assert len(requests) == 1
         assert requests[0].url == 'http://example.com/product/3'
-        spider.get_pages.assert_not_called()
\ No newline at end of file
+        spider.get_pages.assert_not_called()
+
+    def test_parse_plp_listing_mode_fetches_only_new_pdps(self, tmp_path):
+        """
+        In listing mode known products become listing items and only new ones get a PDP request.
+        """
+        known_url = 'https://www.farfetch.com/ae/shopping/women/ganni-boots-item-31313703.aspx'
+        new_url = 'https://www.farfetch.com/ae/shopping/women/moon-boot-item-17755852.aspx'
+        (tmp_path / 'farfetch.txt').write_text(known_url + '\n', encoding='utf-8')
+        spider = FFSpider()
+        spider.settings = Settings({'CRAWL_MODE': 'listing', 'KNOWN_PRODUCTS_DIR': str(tmp_path)})
+        mock_response = HtmlResponse(url='https://www.farfetch.com/ae/shopping/women/boots-1/items.aspx?page=2', body=b'')
+
+        with patch('ecommercecrawl.spiders.farfetch_crawl.rules.get_listing_products') as get_listing_products:
+            get_listing_products.return_value = [
+                {'url': known_url, 'product_name': 'Ankle boots', 'price': 2180.0, 'currency': 'AED'},
+                {'url': new_url, 'product_name': 'Snow boots', 'price': 950.0, 'currency': 'AED'},
+            ]
+            results = list(spider.parse_plp(mock_response))
+
+        assert len(results) == 2
+        item, request = results
+        assert item['url'] == known_url
+        assert item['crawl_mode'] == 'listing'
+        assert item['price'] == 2180.0
+        assert item['portal_itemid'] == '31313703'
+        assert isinstance(request, scrapy.Request)
+        assert request.url == new_url
+
+
+    def test_parse_plp_reads_pdp_urls_and_pagination_once(self, tmp_path):
+        """
+        Progress reporting, PDP scheduling and pagination share one read of the page.
+        """
+        spider = FFSpider()
+        spider.settings = Settings({'KNOWN_PRODUCTS_DIR': str(tmp_path)})
+        spider.progress = MagicMock()
+        plp_url = 'https://www.farfetch.com/ae/shopping/women/boots-1/items.aspx'
+        pdp_url = 'https://www.farfetch.com/ae/shopping/women/moon-boot-item-17755852.aspx'
+
+        with patch('ecommercecrawl.spiders.farfetch_crawl.rules.get_pdp_urls', return_value=[pdp_url]) as get_pdp_urls, \
+                patch('ecommercecrawl.spiders.farfetch_crawl.rules.get_pagination', return_value='Page 3 of 10') as get_pagination:
+            urls = [r.url for r in spider.parse_plp(HtmlResponse(url=plp_url, body=b''))]
+
+        assert urls[0] == pdp_url
+        assert urls[-1] == 'https://www.farfetch.com/ae/shopping/women/boots-1/items.aspx?page=10'
+        get_pdp_urls.assert_called_once()
+        get_pagination.assert_called_once()
+        spider.progress.listing_page.assert_called_once_with(plp_url, 10, [pdp_url])
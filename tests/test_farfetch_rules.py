@@ -3,6 +3,7 @@ from ecommercecrawl.rules import farfetch_rules as rules
 from scrapy.http import HtmlResponse
 from farfetch_html_fixtures import pdp, sold_out_pdp, plp
 from ecommercecrawl.constants import farfetch_constants as constants
+from ecommercecrawl.rules_benchmark import farfetch_string_xpath_fields
 
 
 
@@ -163,4 +164,87 @@ def test_get_pdp_subfolder():
     Tests that get_pdp_subfolder correctly extracts the subfolder from a PDP URL.
     """
     assert rules.get_pdp_subfolder(pdp['url']) == pdp['expected_url']
-    assert rules.get_pdp_subfolder(plp['url']) is None
\ No newline at end of file
+    assert rules.get_pdp_subfolder(plp['url']) is None
+
+PROGRAM_PDP_HTML = """
+<html><head>
+<meta property="twitter:data1" content="AED 3,746">
+<meta property="og:image" content="https://cdn-images.farfetch-contents.com/29/39/76/48/29397648_61374872_1000.jpg">
+</head><body>
+<ol>
+<li data-component="BreadcrumbWrapper"><a>Home</a></li>
+<li data-component="BreadcrumbWrapper"><a>Women</a></li>
+<li data-component="BreadcrumbWrapper"><a>Clothing</a></li>
+<li data-component="BreadcrumbWrapper"><a>Day Dresses</a></li>
+</ol>
+<a data-ffref="pp_infobrd">Christopher Esber</a>
+<p data-testid="product-short-description">  Fusion ruched
+  tee gown maxi dress </p>
+<p data-component="LabelPrimary">New Season</p>
+<p data-component="PriceDiscount">-30%</p>
+<h4>Highlights</h4><ul><li> light green </li><li>short sleeves</li></ul>
+<h4>Composition</h4><p>Viscose 97%, Spandex/Elastane 3%</p>
+</body></html>
+"""
+
+
+@pytest.mark.parametrize("html", [PROGRAM_PDP_HTML, "<html><body><p>empty</p></body></html>"])
+def test_extract_pdp_fields_matches_string_xpaths(html):
+    response = HtmlResponse(url=pdp['url'], body=html, encoding='utf-8')
+
+    fields = rules.extract_pdp_fields(response)
+
+    assert fields == farfetch_string_xpath_fields(response)
+    assert fields['product_name'] == rules.get_product_name(response)
+    assert fields['text'] == rules.get_text(response)
+
+
+def test_extract_pdp_fields_values():
+    response = HtmlResponse(url=pdp['url'], body=PROGRAM_PDP_HTML, encoding='utf-8')
+
+    fields = rules.extract_pdp_fields(response)
+
+    assert fields['product_name'] == pdp['product_name']
+    assert fields['brand'] == pdp['brand']
+    assert rules.get_price_and_currency(fields['price']) == (pdp['price'], pdp['currency'])
+    assert fields['text'] == "light green, short sleeves, Viscose 97%, Spandex/Elastane 3%"
+    assert all(type(value) is str for value in fields['breadcrumbs'])
+
+
+LISTING_PLP_HTML = """
+<html><head><script type="application/ld+json">
+{"@type":"ItemList","itemListElement":[
+ {"@type":"Product","name":"Ankle boots","brand":{"@type":"Brand","name":"Ganni"},
+  "offers":{"@type":"Offer","price":"2,180","priceCurrency":"AED","url":"/ae/shopping/women/ganni-boots-item-31313703.aspx","availability":"https://schema.org/InStock"}},
+ {"@type":"Product","name":"Snow boots","brand":"Moon Boot",
+  "offers":[{"@type":"Offer","price":950,"priceCurrency":"AED","url":"/ae/shopping/women/moon-boot-item-17755852.aspx","availability":"https://schema.org/OutOfStock"}]},
+ {"@type":"Product","name":"No offer"}
+]}
+</script></head><body></body></html>
+"""
+
+
+def test_get_listing_products_reads_json_ld_offers():
+    response = HtmlResponse(url=plp['url'], body=LISTING_PLP_HTML, encoding='utf-8')
+
+    products = rules.get_listing_products(response)
+
+    assert products == [
+        {
+            'url': 'https://www.farfetch.com/ae/shopping/women/ganni-boots-item-31313703.aspx',
+            'product_name': 'Ankle boots',
+            'brand': 'Ganni',
+            'price': 2180.0,
+            'currency': 'AED',
+            'sold_out': False,
+        },
+        {
+            'url': 'https://www.farfetch.com/ae/shopping/women/moon-boot-item-17755852.aspx',
+            'product_name': 'Snow boots',
+            'brand': 'Moon Boot',
+            'price': 950.0,
+            'currency': 'AED',
+            'sold_out': True,
+        },
+    ]
+    assert rules.get_pdp_urls(response) == [p['url'] for p in products]
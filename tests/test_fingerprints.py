@@ -0,0 +1,44 @@
+from ecommercecrawl import fingerprints
+from ecommercecrawl.fingerprints import FingerprintSet, fingerprint, measure_memory
+
+
+def test_fingerprint_is_stable_64_bit_and_separates_tuple_parts():
+    assert fingerprint("https://www.ounass.ae/a.html") == fingerprint(b"https://www.ounass.ae/a.html")
+    assert 0 <= fingerprint("x") < 2 ** 64
+    assert fingerprint(("ounass", "ab", "c")) != fingerprint(("ounass", "a", "bc"))
+
+
+def test_fingerprint_set_membership_across_buffer_merges(monkeypatch):
+    monkeypatch.setattr(fingerprints, "MIN_BUFFER_SIZE", 4)
+    seen = FingerprintSet()
+
+    added = [seen.add(f"https://www.ounass.ae/{i}.html") for i in range(50)]
+
+    assert all(added)
+    assert len(seen) == 50
+    assert len(seen._buffer) < 4
+    assert "https://www.ounass.ae/7.html" in seen
+    assert "https://www.ounass.ae/50.html" not in seen
+    assert seen.add("https://www.ounass.ae/7.html") is False
+    assert len(seen) == 50
+
+    seen.clear()
+    assert len(seen) == 0
+    assert "https://www.ounass.ae/7.html" not in seen
+
+
+def test_measure_memory_reports_bytes_per_key():
+    results = measure_memory(2000)
+
+    assert results["keys"] == 2000
+    assert results["fingerprint_set"]["bytes_per_key"] < results["set"]["bytes_per_key"]
+    assert results["fingerprint_set"]["peak_bytes"] >= results["fingerprint_set"]["bytes"]
+
+
+def test_fingerprint_set_round_trips_through_bytes():
+    seen = FingerprintSet(["a", "b"])
+
+    restored = FingerprintSet.from_bytes(seen.to_bytes())
+
+    assert len(restored) == 2
+    assert "a" in restored and "c" not in restored
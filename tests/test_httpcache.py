@@ -0,0 +1,172 @@
+from unittest.mock import MagicMock
+
+import boto3
+import requests
+from moto import mock_aws
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.http import HtmlResponse, Request, Response
+from scrapy.settings import Settings
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.request import RequestFingerprinter
+
+from ecommercecrawl.crawler_api import REQUEST_TYPE_HTTP_RESPONSE, build_crawler_api_request
+from ecommercecrawl.httpcache import ConditionalCachePolicy, LRUFilesystemCacheStorage
+
+
+FF_PLP = "https://www.farfetch.com/ae/shopping/women/items.aspx?page={}"
+
+
+def _settings(tmp_path, **overrides):
+    return Settings({
+        "HTTPCACHE_ENABLED": True,
+        "HTTPCACHE_POLICY": "ecommercecrawl.httpcache.ConditionalCachePolicy",
+        "HTTPCACHE_STORAGE": "ecommercecrawl.httpcache.LRUFilesystemCacheStorage",
+        "HTTPCACHE_DIR": str(tmp_path / "httpcache"),
+        **overrides,
+    })
+
+
+def _spider(name="farfetch"):
+    spider = MagicMock()
+    spider.name = name
+    spider.crawler.request_fingerprinter = RequestFingerprinter()
+    spider.crawler.stats = MemoryStatsCollector(MagicMock())
+    return spider
+
+
+def _page(url, body=b"<html>listing</html>", status=200, etag=b'"v1"'):
+    headers = {"ETag": etag} if etag else {}
+    return HtmlResponse(url, status=status, headers=headers, body=body)
+
+
+def test_policy_revalidates_with_validators_and_skips_crawler_api_requests():
+    policy = ConditionalCachePolicy(Settings())
+    request = Request(FF_PLP.format(0))
+    cached = Response(
+        request.url,
+        headers={"ETag": '"v1"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"},
+    )
+
+    assert policy.is_cached_response_fresh(cached, request) is False
+    assert request.headers[b"If-None-Match"] == b'"v1"'
+    assert request.headers[b"If-Modified-Since"] == b"Wed, 21 Oct 2015 07:28:00 GMT"
+    assert policy.is_cached_response_valid(cached, Response(request.url, status=304), request)
+    assert not policy.should_cache_response(Response(request.url), request)
+
+    api_request = build_crawler_api_request(
+        url="https://www.ounass.ae/api/women/bags",
+        callback=lambda response: None,
+        settings=Settings({"CRAWLER_API_SERVICE": "local"}),
+        request_type=REQUEST_TYPE_HTTP_RESPONSE,
+    )
+    assert not policy.should_cache_request(api_request)
+
+
+def test_cache_middleware_serves_cached_body_on_304(tmp_path):
+    spider = _spider()
+    middleware = HttpCacheMiddleware(_settings(tmp_path), spider.crawler.stats)
+    middleware.spider_opened(spider)
+
+    first = Request(FF_PLP.format(0))
+    assert middleware.process_request(first, spider) is None
+    middleware.process_response(first, _page(first.url), spider)
+
+    second = Request(FF_PLP.format(0))
+    assert middleware.process_request(second, spider) is None
+    assert second.headers[b"If-None-Match"] == b'"v1"'
+    response = middleware.process_response(second, Response(second.url, status=304), spider)
+    middleware.spider_closed(spider)
+
+    assert response.status == 200
+    assert response.body == b"<html>listing</html>"
+    assert "cached" in response.flags
+    stats = spider.crawler.stats
+    assert stats.get_value("httpcache/revalidate") == 1
+    assert stats.get_value("httpcache/hit_rate") == 0.5
+
+
+def test_storage_evicts_least_recently_used_entries(tmp_path):
+    spider = _spider()
+    # Room for about two entries of 1 KB bodies.
+    storage = LRUFilesystemCacheStorage(_settings(tmp_path, HTTPCACHE_MAX_SIZE_MB=3.5 / 1024))
+    storage.open_spider(spider)
+    requests_ = [Request(FF_PLP.format(page)) for page in range(3)]
+    body = b"x" * 1024
+
+    storage.store_response(spider, requests_[0], _page(requests_[0].url, body=body))
+    storage.store_response(spider, requests_[1], _page(requests_[1].url, body=body))
+    assert storage.retrieve_response(spider, requests_[0]) is not None
+    storage.store_response(spider, requests_[2], _page(requests_[2].url, body=body))
+
+    assert storage.retrieve_response(spider, requests_[1]) is None
+    assert storage.retrieve_response(spider, requests_[0]) is not None
+    assert storage.retrieve_response(spider, requests_[2]) is not None
+    assert spider.crawler.stats.get_value("httpcache/evicted") == 1
+
+    # A new run picks the index up from disk.
+    reopened = LRUFilesystemCacheStorage(_settings(tmp_path))
+    reopened.open_spider(spider)
+    assert len(reopened.index.entries) == 2
+
+
+def _requests_response(url, status, body=b"", headers=None):
+    response = requests.models.Response()
+    response.url = url
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = body
+    return response
+
+
+def test_requests_get_sends_conditional_requests(tmp_path, monkeypatch):
+    spider = _spider("level")
+    storage = LRUFilesystemCacheStorage(_settings(tmp_path))
+    storage.open_spider(spider)
+    assert LRUFilesystemCacheStorage.for_spider(spider) is storage
+    api = "https://www.levelshoes.com/api/catalog"
+    sent_headers = []
+
+    def fake_get(url, headers=None, **kwargs):
+        sent_headers.append(headers)
+        if "If-None-Match" in headers:
+            return _requests_response(url, 304)
+        return _requests_response(
+            url, 200, b'{"products": []}', {"ETag": '"abc"', "Content-Encoding": "gzip"},
+        )
+
+    monkeypatch.setattr(requests, "get", fake_get)
+
+    first = storage.requests_get(spider, api, params={"page": 0}, headers={"accept": "application/json"})
+    second = storage.requests_get(spider, api, params={"page": 0}, headers={"accept": "application/json"})
+    storage.close_spider(spider)
+
+    assert first.json() == second.json() == {"products": []}
+    assert second.status_code == 200
+    assert "Content-Encoding" not in second.headers
+    assert sent_headers[1] == {"accept": "application/json", "If-None-Match": '"abc"'}
+    assert spider.crawler.stats.get_value("httpcache/requests/hit_rate") == 0.5
+    assert LRUFilesystemCacheStorage.for_spider(spider) is None
+
+
+@mock_aws
+def test_storage_shares_the_cache_through_s3(tmp_path, monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    boto3.client("s3").create_bucket(Bucket="crawl-state")
+    spider = _spider()
+    request = Request(FF_PLP.format(0))
+
+    first_task = LRUFilesystemCacheStorage(
+        _settings(tmp_path / "task-1", HTTPCACHE_S3_PREFIX="s3://crawl-state/httpcache")
+    )
+    first_task.open_spider(spider)
+    first_task.store_response(spider, request, _page(request.url))
+    first_task.close_spider(spider)
+
+    second_task = LRUFilesystemCacheStorage(
+        _settings(tmp_path / "task-2", HTTPCACHE_S3_PREFIX="s3://crawl-state/httpcache")
+    )
+    second_task.open_spider(spider)
+
+    cached = second_task.retrieve_response(spider, request)
+    assert cached.body == b"<html>listing</html>"
+    assert cached.headers[b"ETag"] == b'"v1"'
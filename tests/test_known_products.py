@@ -0,0 +1,89 @@
+import pytest
+from scrapy.settings import Settings
+
+from ecommercecrawl.known_products import KnownProducts
+
+
+def test_known_products_round_trip_ignores_query_string(tmp_path):
+    path = tmp_path / "state" / "ounass.txt"
+    known = KnownProducts(str(path))
+    known.add("https://www.ounass.ae/shop-a.html?utm=1")
+    known.add("https://www.ounass.ae/shop-a.html")
+    known.save()
+
+    reloaded = KnownProducts(str(path))
+    assert len(reloaded) == 1
+    assert "https://www.ounass.ae/shop-a.html#reviews" in reloaded
+    assert "https://www.ounass.ae/shop-b.html" not in reloaded
+
+
+def test_known_products_from_settings_uses_spider_file(tmp_path):
+    settings = Settings({"KNOWN_PRODUCTS_DIR": str(tmp_path)})
+
+    known = KnownProducts.from_settings(settings, "farfetch")
+
+    assert known.path == str(tmp_path / "farfetch.txt")
+    assert KnownProducts.from_settings(None, "farfetch") is None
+
+
+def test_known_products_save_skips_unchanged_store(tmp_path):
+    path = tmp_path / "level-shoes.txt"
+    KnownProducts(str(path)).save()
+    assert not path.exists()
+
+
+def test_known_products_save_appends_new_urls(tmp_path):
+    path = tmp_path / "ounass.txt"
+    path.write_text("https://www.ounass.ae/shop-a.html\n", encoding="utf-8")
+    known = KnownProducts(str(path))
+    known.add("https://www.ounass.ae/shop-a.html")
+    known.add("https://www.ounass.ae/shop-b.html")
+    known.save()
+    known.add("https://www.ounass.ae/shop-c.html")
+    known.save()
+
+    assert path.read_text(encoding="utf-8").splitlines() == [
+        "https://www.ounass.ae/shop-a.html",
+        "https://www.ounass.ae/shop-b.html",
+        "https://www.ounass.ae/shop-c.html",
+    ]
+
+
+def test_known_products_snapshot_to_s3(monkeypatch, tmp_path):
+    from unittest.mock import MagicMock
+
+    from botocore.exceptions import ClientError
+
+    s3_client = MagicMock()
+    s3_client.download_file.side_effect = ClientError({"Error": {"Code": "404"}}, "HeadObject")
+    monkeypatch.setattr("boto3.client", lambda service: s3_client)
+    settings = Settings({
+        "KNOWN_PRODUCTS_DIR": str(tmp_path),
+        "KNOWN_PRODUCTS_S3_PREFIX": "s3://state-bucket/known_products/",
+    })
+
+    known = KnownProducts.from_settings(settings, "level")
+    known.add("https://www.levelshoes.com/p/sku1.html")
+    known.save()
+    known.save()
+
+    s3_client.download_file.assert_called_once_with(
+        "state-bucket", "known_products/level.txt", str(tmp_path / "level.txt.download"),
+    )
+    s3_client.upload_file.assert_called_once_with(
+        str(tmp_path / "level.txt"), "state-bucket", "known_products/level.txt",
+    )
+
+
+def test_known_products_snapshot_errors_other_than_missing_are_raised(monkeypatch, tmp_path):
+    from unittest.mock import MagicMock
+
+    from botocore.exceptions import ClientError
+
+    s3_client = MagicMock()
+    s3_client.download_file.side_effect = ClientError({"Error": {"Code": "403"}}, "HeadObject")
+    monkeypatch.setattr("boto3.client", lambda service: s3_client)
+
+    with pytest.raises(ClientError):
+        KnownProducts(str(tmp_path / "level.txt"), s3_uri="s3://state-bucket/known_products/level.txt")
+    s3_client.upload_file.assert_not_called()
@@ -1,3 +1,4 @@
+import json
 import pytest
 import requests
 import scrapy
@@ -165,3 +166,215 @@ def test_handle_plp_item_builds_request_with_meta():
     assert meta_item["price_discount"] == 20
     assert meta_item["primary_label"] == ["NEW"]
     assert meta_item["image_urls"] == "https://cdn.levelshoes.com/img.jpg"
+
+
+def test_handle_item_listing_mode_emits_known_products_without_pdp(tmp_path):
+    from scrapy.settings import Settings
+
+    url = "https://www.levelshoes.com/p/sneaker.html"
+    (tmp_path / "level-shoes.txt").write_text(url + "\n", encoding="utf-8")
+    spider = LevelSpider()
+    spider.settings = Settings({"CRAWL_MODE": "listing", "KNOWN_PRODUCTS_DIR": str(tmp_path)})
+    item = {
+        "action": {"url": url},
+        "name": "Sneaker",
+        "analytics": {
+            "item_id": "SKU123",
+            "category1": "Shoes",
+            "category2": "Sneakers",
+            "gender": "men",
+            "price": 99,
+            "brand": "BrandX",
+        },
+        "originalPrice": "123 AED",
+    }
+
+    known_out = list(spider._handle_item(item))
+    item["action"]["url"] = "https://www.levelshoes.com/p/new-sneaker.html"
+    new_out = list(spider._handle_item(item))
+
+    assert known_out[0]["url"] == url
+    assert known_out[0]["crawl_mode"] == "listing"
+    assert known_out[0]["price"] == 99
+    assert known_out[0]["run_id"] == spider.run_id
+    assert isinstance(new_out[0], scrapy.Request)
+
+
+def test_parse_pdp_remembers_product_for_listing_runs(tmp_path):
+    from scrapy.http import HtmlResponse, Request
+    from scrapy.settings import Settings
+
+    url = "https://www.levelshoes.com/p/sneaker.html"
+    spider = LevelSpider()
+    spider.settings = Settings({"KNOWN_PRODUCTS_DIR": str(tmp_path)})
+    data_dict = {key: "x" for key in [
+        "run_id", "site", "crawl_date", "url", "country", "portal_itemid", "product_name", "gender",
+        "brand", "category", "subcategory", "price", "currency", "price_discount", "primary_label",
+        "image_urls", "text", "out_of_stock", "level_category_id",
+    ]}
+    data_dict["url"] = url
+    response = HtmlResponse(url=url, body=b"<html></html>", request=Request(url, meta={"data_dict": data_dict}))
+
+    list(spider.parse_pdp(response))
+    spider.closed("finished")
+
+    assert (tmp_path / "level-shoes.txt").read_text(encoding="utf-8") == url + "\n"
+
+
+
+def test_handle_item_keeps_pdp_meta_compact_and_disk_queue_safe():
+    import pickle
+
+    from scrapy.utils.request import request_from_dict
+
+    spider = LevelSpider()
+    item = {
+        "action": {"url": "https://www.levelshoes.com/p/sneaker.html"},
+        "name": "Sneaker",
+        "analytics": {
+            "item_id": "SKU123",
+            "category1": "Shoes",
+            "category2": "Sneakers",
+            "gender": "men",
+            "price": 123,
+            "brand": "BrandX",
+        },
+        "originalPrice": "123 AED",
+    }
+
+    request = list(spider._handle_item(item))[0]
+
+    data_dict = request.meta["data_dict"]
+    assert "run_id" not in data_dict and "crawl_date" not in data_dict
+    # Same round trip as Scrapy's pickle disk queues.
+    restored = request_from_dict(pickle.loads(pickle.dumps(request.to_dict(spider=spider))), spider=spider)
+    assert restored.callback == spider.parse_pdp
+    assert restored.meta["data_dict"] == data_dict
+
+
+def test_parse_pdp_keeps_listing_key_order_when_color_and_language_are_none(monkeypatch):
+    from scrapy.http import HtmlResponse
+
+    spider = LevelSpider()
+    url = "https://www.levelshoes.com/p/sneaker.html"
+    item = {
+        "action": {"url": url},
+        "name": "Sneaker",
+        "analytics": {
+            "item_id": "SKU123",
+            "category1": "Shoes",
+            "category2": "Sneakers",
+            "gender": "men",
+            "price": 123,
+            "brand": "BrandX",
+        },
+        "originalPrice": "123 AED",
+    }
+    monkeypatch.setattr("ecommercecrawl.rules.level_rules.get_language", lambda url: None)
+    monkeypatch.setattr("ecommercecrawl.rules.level_rules.get_color_from_item", lambda item: None)
+
+    request = list(spider._handle_item(item))[0]
+    response = HtmlResponse(url=url, body=b"<html></html>", request=request)
+    pdp_item = next(spider.parse_pdp(response))
+
+    assert list(pdp_item) == [
+        "run_id", "site", "crawl_date", "url", "language", "country", "portal_itemid", "product_name",
+        "gender", "brand", "color", "category", "subcategory", "price", "currency", "price_discount",
+        "primary_label", "image_urls", "text", "out_of_stock", "level_category_id",
+    ]
+    assert pdp_item["color"] is None and pdp_item["language"] is None
+    assert pdp_item["run_id"] == spider.run_id
+
+
+def _api_product(sku):
+    return {
+        "action": {"url": f"https://www.levelshoes.com/p/{sku.lower()}.html"},
+        "name": sku,
+        "analytics": {
+            "item_id": sku,
+            "category1": "Shoes",
+            "category2": "Sneakers",
+            "gender": "men",
+            "price": 100,
+            "brand": "BrandX",
+        },
+        "originalPrice": "100 AED",
+    }
+
+
+def test_get_api_params_for_pdp_enrichment():
+    spider = LevelSpider()
+
+    api, params, headers = spider.get_api_params_pdp("SKU1", "ae", "EN", "men")
+
+    assert api == f"{constants.API_BASE_URL}/ae/en/{constants.API_ENDPOINT_PDP}"
+    assert params["sku"] == "SKU1"
+    assert params["genderType"] == "men"
+    assert headers == constants.API_HEADERS
+
+
+def test_handle_plp_url_enriches_pdps_from_catalog_api(monkeypatch):
+    from scrapy.settings import Settings
+
+    spider = LevelSpider()
+    spider.settings = Settings({"LEVEL_PDP_API_ENRICHMENT": True})
+    listed = [_api_product("SKU1"), _api_product("SKU2"), _api_product("SKU3")]
+    # SKU3 misses PDP fields there and falls back to the HTML PDP.
+    with open("tests/level_api_fixtures/more_from_brand.json", "r") as f:
+        brand_page = json.load(f)["products"]
+    api_calls = []
+
+    def fake_fetch_pdp(sku, country, language, gender):
+        api_calls.append((sku, country, language, gender))
+        return {"products": brand_page}
+
+    monkeypatch.setattr(spider, "_fetch_plp_via_api", lambda url, page=0: {"products": listed if page == 0 else []})
+    monkeypatch.setattr(spider, "_fetch_pdp_via_api", fake_fetch_pdp)
+
+    results = list(spider.handle_plp_url("https://www.levelshoes.com/men/shoes"))
+
+    items = [obj for obj in results if isinstance(obj, dict)]
+    html_pdps = sorted(obj.meta["data_dict"]["portal_itemid"] for obj in results if isinstance(obj, scrapy.Request))
+    # SKU3 is still pending after the first call, so it anchors a second one.
+    assert [call[0] for call in api_calls] == ["SKU1", "SKU3"]
+    assert api_calls[0] == ("SKU1", "ae", "EN", "men")
+    assert html_pdps == ["SKU1", "SKU3"]
+    assert len(items) == 1
+    assert items[0]["portal_itemid"] == "SKU2"
+    assert items[0]["text"] == ["Calf leather", "Made in Italy"]
+    assert items[0]["out_of_stock"] is False
+    assert items[0]["level_category_id"] == 248
+    assert items[0]["run_id"] == spider.run_id
+    assert set(constants.PDP_FIELDS) <= set(items[0])
+
+    # Listed again on another PLP: not emitted twice.
+    assert list(spider._enrich_pdp_requests(spider._handle_item(listed[1]))) == []
+
+
+def test_pdp_enrichment_is_off_by_default(monkeypatch):
+    from scrapy.settings import Settings
+
+    spider = LevelSpider()
+    spider.settings = Settings({})
+    monkeypatch.setattr(spider, "_fetch_pdp_via_api", lambda *args: pytest.fail("catalog API called"))
+
+    results = list(spider._enrich_pdp_requests(spider._handle_item(_api_product("SKU1"))))
+
+    assert [obj.meta["data_dict"]["portal_itemid"] for obj in results] == ["SKU1"]
+
+
+def test_pdp_enrichment_turns_off_when_the_api_enriches_nothing(monkeypatch):
+    from scrapy.settings import Settings
+
+    spider = LevelSpider()
+    spider.settings = Settings({"LEVEL_PDP_API_ENRICHMENT": True, "LEVEL_PDP_API_PROBE_PRODUCTS": 2})
+    api_calls = []
+    monkeypatch.setattr(spider, "_fetch_pdp_via_api", lambda *args: api_calls.append(args) or {"products": []})
+
+    listed = [obj for sku in ("SKU1", "SKU2") for obj in spider._handle_item(_api_product(sku))]
+    first = list(spider._enrich_pdp_requests(listed))
+    later = list(spider._enrich_pdp_requests(spider._handle_item(_api_product("SKU3"))))
+
+    assert len(api_calls) == 1
+    assert not spider.is_pdp_api_enrichment_enabled()
+    assert all(isinstance(obj, scrapy.Request) for obj in first + later)
@@ -1,3 +1,4 @@
+import json
 import pytest
 from types import SimpleNamespace
 from scrapy.http import HtmlResponse, Request
@@ -298,3 +299,39 @@ def test_extract_level_category_id_returns_int():
     """
     response = make_response(html)
     assert rules.extract_level_category_id(response) == 2949
+
+
+@pytest.fixture
+def more_from_brand_products():
+    # moreFromBrand tiles: SKU2 is complete, SKU3 lacks stock and category,
+    # SKU4 is out of stock with a string category id.
+    with open("tests/level_api_fixtures/more_from_brand.json", "r") as f:
+        return {product["name"]: product for product in json.load(f)["products"]}
+
+
+def test_pdp_fields_from_catalog_api_item(more_from_brand_products):
+    item = more_from_brand_products["SKU2"]
+    assert rules.get_details_from_item(item) == ["Calf leather", "Made in Italy"]
+    assert rules.get_out_of_stock_from_item(item) is False
+    assert rules.get_level_category_id_from_item(item) == 248
+
+    item = more_from_brand_products["SKU4"]
+    assert rules.get_out_of_stock_from_item(item) is True
+    assert rules.get_level_category_id_from_item(item) == 251
+
+    item = more_from_brand_products["SKU3"]
+    assert rules.get_details_from_item(item) == ["Suede"]
+    assert rules.get_out_of_stock_from_item(item) is None
+    assert rules.get_level_category_id_from_item(item) is None
+
+
+def test_pdp_fields_from_catalog_api_item_missing():
+    item = {"analytics": {"item_id": "SKU1"}}
+    assert rules.get_details_from_item(item) is None
+    assert rules.get_out_of_stock_from_item(item) is None
+    assert rules.get_level_category_id_from_item(item) is None
+
+
+def test_get_total_pages_from_plp_payload():
+    assert rules.get_total_pages({"pagination": {"totalPages": 7}}) == 7
+    assert rules.get_total_pages({"products": []}) is None
@@ -36,4 +36,61 @@ class TestMasterCrawlUtils:
             mock_dt.now.return_value = fixed_dt
             run_id = MasterCrawl._generate_run_id()
 
-        assert run_id == expected_id
\ No newline at end of file
+        assert run_id == expected_id
+
+    def test_generate_run_id_is_unique_within_process(self):
+        """
+        Spiders started in the same millisecond by one run_crawler process get distinct run ids.
+        """
+        fixed_dt = datetime(2023, 10, 28, 10, 30, 5, 999000, tzinfo=timezone.utc)
+
+        with patch('ecommercecrawl.spiders.mastercrawl.datetime') as mock_dt:
+            mock_dt.now.return_value = fixed_dt
+            run_ids = [MasterCrawl._generate_run_id() for _ in range(2)]
+
+        assert run_ids == ["2023-10-28T10-30-05-999", "2023-10-28T10-30-06-000"]
+
+    def test_idle_fetches_country_rows_left_without_a_pdp(self):
+        """
+        Rows still parked when the crawl goes idle get their own PDP request and keep the spider open.
+        """
+        from scrapy.exceptions import DontCloseSpider
+        from scrapy.settings import Settings
+
+        spider = MasterCrawl()
+        spider.settings = Settings({'COALESCE_COUNTRIES': True})
+        spider.crawler = MagicMock()
+        assert spider.coalesce_country('ounass', 'https://www.ounass.ae/a.html', {'portal_itemid': '1'}) is None
+        assert spider.coalesce_country('ounass', 'https://www.ounass.qa/a.html', {'portal_itemid': '1'}) == []
+
+        with pytest.raises(DontCloseSpider):
+            spider._fetch_parked_country_rows(spider)
+
+        request = spider.crawler.engine.crawl.call_args.args[0]
+        assert request.url == 'https://www.ounass.qa/a.html'
+        spider._fetch_parked_country_rows(spider)
+
+    def test_start_requests_streams_urls_source_without_repeats(self, tmp_path):
+        """
+        Seeds from `urls_source` are read lazily and repeated URLs only yield one request.
+        """
+        csv_file = tmp_path / 'urls.csv'
+        csv_file.write_text('url\nhttps://example.com/a\nhttps://example.com/b\nhttps://example.com/a\n')
+        spider = MasterCrawl(urls_source=str(csv_file))
+
+        requests = spider.start_requests()
+        assert next(requests).url == 'https://example.com/a'
+        assert [request.url for request in requests] == ['https://example.com/b']
+
+    def test_early_stop_only_applies_to_newness_sorted_listings(self):
+        """
+        PLP_EARLY_STOP is ignored by spiders whose listings are not sorted newest first.
+        """
+        from scrapy.settings import Settings
+
+        spider = MasterCrawl()
+        spider.settings = Settings({'PLP_EARLY_STOP': True})
+        assert not spider.is_early_stop_enabled()
+
+        spider.plp_sorted_by_newness = True
+        assert spider.is_early_stop_enabled()
@@ -0,0 +1,31 @@
+from ecommercecrawl.metrics import Histogram, MetricFamily, render
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.5, 1.0))
+    for value in (0.2, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+    family = MetricFamily("latency_seconds", "histogram", "Latency")
+    histogram.add_samples(family, domain="www.ounass.ae")
+
+    text = render([family])
+
+    assert 'latency_seconds_bucket{domain="www.ounass.ae",le="0.5"} 2' in text
+    assert 'latency_seconds_bucket{domain="www.ounass.ae",le="1.0"} 3' in text
+    assert 'latency_seconds_bucket{domain="www.ounass.ae",le="+Inf"} 4' in text
+    assert 'latency_seconds_sum{domain="www.ounass.ae"} 4.4' in text
+
+
+def test_render_merges_families_by_name_and_escapes_labels():
+    first = MetricFamily("items", "counter", "Items").add(3, "_total", spider="level")
+    second = MetricFamily("items", "counter", "Items").add(5, "_total", spider='a"b')
+
+    lines = render([first, second]).splitlines()
+
+    assert lines == [
+        "# TYPE items counter",
+        "# HELP items Items",
+        'items_total{spider="level"} 3',
+        'items_total{spider="a\\"b"} 5',
+        "# EOF",
+    ]
@@ -0,0 +1,435 @@
+import base64
+import json
+from unittest.mock import MagicMock
+
+import pytest
+
+from scrapy.exceptions import DontCloseSpider, IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse, Request, Response, TextResponse
+from scrapy.settings import Settings
+from twisted.internet.task import Clock
+
+from ecommercecrawl.crawler_api import REQUEST_TYPE_HTTP_RESPONSE, build_crawler_api_request
+from ecommercecrawl.crawler_api.local_api import LOCAL_API_META_KEY
+from ecommercecrawl.middlewares import (
+    CIRCUIT_OPEN,
+    CanonicalPDPDedupeMiddleware,
+    CircuitBreakerMiddleware,
+    CrawlerAPIEscalationMiddleware,
+    LocalCrawlerAPIMiddleware,
+    PDPPriorityMiddleware,
+    RetryAfterMiddleware,
+    get_retry_after_seconds,
+)
+from ecommercecrawl.spiders.farfetch_crawl import FFSpider
+from ecommercecrawl.spiders.level_crawl import LevelSpider
+from ecommercecrawl.spiders.ounass_crawl import OunassSpider
+
+
+LOCAL_SETTINGS = Settings({"CRAWLER_API_SERVICE": "local"})
+
+
+def _local_api_request(url, request_type=REQUEST_TYPE_HTTP_RESPONSE):
+    return build_crawler_api_request(
+        url=url,
+        callback=lambda response: None,
+        settings=LOCAL_SETTINGS,
+        request_type=request_type,
+    )
+
+
+def _api_answer(request, payload, status=200):
+    return TextResponse(
+        url=request.url,
+        status=status,
+        body=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        request=request,
+    )
+
+
+def test_local_api_middleware_rebuilds_target_response():
+    url = "https://www.ounass.ae/api/women/bags"
+    request = _local_api_request(url)
+    answer = _api_answer(request, {
+        "url": url,
+        "statusCode": 200,
+        "httpResponseBody": base64.b64encode(b'{"routeType": "plp"}').decode("ascii"),
+        "httpResponseHeaders": [{"name": "Content-Type", "value": "application/json"}],
+    })
+
+    response = LocalCrawlerAPIMiddleware().process_response(request, answer, MagicMock())
+
+    assert isinstance(response, TextResponse)
+    assert response.url == url
+    assert response.status == 200
+    assert json.loads(response.text) == {"routeType": "plp"}
+    assert response.request.url == url
+    assert response.request.method == "GET"
+
+
+def test_local_api_middleware_uses_browser_html_and_target_status():
+    url = "https://www.ounass.ae/shop-product.html"
+    request = _local_api_request(url)
+    answer = _api_answer(request, {"url": url, "statusCode": 404, "browserHtml": "<html></html>"})
+
+    response = LocalCrawlerAPIMiddleware().process_response(request, answer, MagicMock())
+
+    assert isinstance(response, HtmlResponse)
+    assert response.status == 404
+
+
+def test_local_api_middleware_passes_through_api_errors_and_other_requests():
+    request = _local_api_request("https://www.ounass.ae/shop-product.html")
+    throttled = _api_answer(request, {"detail": "Rate limited"}, status=429)
+    middleware = LocalCrawlerAPIMiddleware()
+
+    assert middleware.process_response(request, throttled, MagicMock()) is throttled
+
+    plain_request = Request("https://www.farfetch.com/ae/shopping/women/items.aspx")
+    plain = Response(url=plain_request.url, request=plain_request)
+    assert middleware.process_response(plain_request, plain, MagicMock()) is plain
+
+
+def test_local_api_middleware_is_only_enabled_for_the_local_service():
+    crawler = MagicMock()
+    crawler.settings = Settings({"CRAWLER_API_SERVICE": "zyte"})
+    with pytest.raises(NotConfigured):
+        LocalCrawlerAPIMiddleware.from_crawler(crawler)
+
+    crawler.settings = Settings({"CRAWLER_API_SERVICE": "local"})
+    assert isinstance(LocalCrawlerAPIMiddleware.from_crawler(crawler), LocalCrawlerAPIMiddleware)
+
+
+def _dedupe_middleware():
+    crawler = MagicMock()
+    crawler.settings = Settings({"PDP_DEDUPE_ENABLED": True})
+    return CanonicalPDPDedupeMiddleware.from_crawler(crawler)
+
+
+def test_pdp_dedupe_is_off_by_default():
+    crawler = MagicMock()
+    crawler.settings = Settings()
+    with pytest.raises(NotConfigured):
+        CanonicalPDPDedupeMiddleware.from_crawler(crawler)
+
+
+def test_pdp_dedupe_drops_farfetch_duplicates_by_item_id():
+    middleware = _dedupe_middleware()
+    spider = FFSpider()
+    pdp = "https://www.farfetch.com/ae/shopping/women/ganni-boots-item-31313703.aspx"
+    output = [
+        Request(pdp + "?storeid=9359"),
+        Request("https://www.farfetch.com/ae/shopping/women/ganni-ankle-boots-item-31313703.aspx?sale=1"),
+        # Same item id in another country is a different product row.
+        Request("https://www.farfetch.com/uk/shopping/women/ganni-boots-item-31313703.aspx"),
+        Request("https://www.farfetch.com/ae/shopping/women/boots-1/items.aspx?page=2"),
+        {"url": pdp},
+    ]
+
+    kept = list(middleware.process_spider_output(None, output, spider))
+
+    assert [getattr(obj, "url", None) for obj in kept] == [
+        pdp + "?storeid=9359",
+        "https://www.farfetch.com/uk/shopping/women/ganni-boots-item-31313703.aspx",
+        "https://www.farfetch.com/ae/shopping/women/boots-1/items.aspx?page=2",
+        None,
+    ]
+    middleware.stats.inc_value.assert_any_call("dedupe/pdp_duplicates")
+
+
+def test_pdp_dedupe_uses_ounass_target_url_and_keeps_dont_filter_requests():
+    middleware = _dedupe_middleware()
+    spider = OunassSpider()
+    first = _local_api_request("https://www.ounass.ae/shop-bag-a.html")
+    duplicate = _local_api_request("https://www.ounass.ae/shop-bag-a.html?ref=sale")
+    retry = first.replace(dont_filter=True)
+    other_host = _local_api_request("https://www.ounass.qa/shop-bag-a.html")
+
+    kept = list(middleware.process_spider_output(None, [first, duplicate, retry, other_host], spider))
+
+    assert kept == [first, retry, other_host]
+
+
+def test_pdp_dedupe_uses_level_sku_from_start_requests():
+    middleware = _dedupe_middleware()
+    spider = LevelSpider()
+    start = [
+        Request("https://www.levelshoes.com/a-bag.html", meta={"data_dict": {"portal_itemid": "SKU1"}}),
+        Request("https://www.levelshoes.com/a-bag-black.html", meta={"data_dict": {"portal_itemid": "SKU1"}}),
+    ]
+
+    kept = list(middleware.process_start_requests(start, spider))
+
+    assert [request.url for request in kept] == ["https://www.levelshoes.com/a-bag.html"]
+
+
+
+def test_pdp_priority_schedules_pdps_ahead_of_pagination():
+    crawler = MagicMock()
+    crawler.settings = Settings()
+    middleware = PDPPriorityMiddleware.from_crawler(crawler)
+    pdp = _local_api_request("https://www.ounass.ae/shop-bag-a.html")
+    plp = _local_api_request("https://www.ounass.ae/api/women/bags?fh_sort_by=-newness_ae&p=1")
+
+    kept = list(middleware.process_spider_output(None, [plp, pdp, {"url": "x"}], OunassSpider()))
+
+    assert kept[:2] == [plp, pdp]
+    assert (plp.priority, pdp.priority) == (0, 10)
+
+
+def test_pdp_priority_can_be_disabled():
+    crawler = MagicMock()
+    crawler.settings = Settings({"PDP_REQUEST_PRIORITY": "0"})
+
+    with pytest.raises(NotConfigured):
+        PDPPriorityMiddleware.from_crawler(crawler)
+
+
+FF_PLP = "https://www.farfetch.com/ae/shopping/women/items.aspx?page={}"
+
+
+def _circuit_breaker(**settings):
+    crawler = MagicMock()
+    crawler.settings = Settings({
+        "CIRCUIT_BREAKER_MIN_REQUESTS": 4,
+        "CIRCUIT_BREAKER_OPEN_SECONDS": 30,
+        **settings,
+    })
+    clock = Clock()
+    return CircuitBreakerMiddleware(crawler, clock=clock), crawler, clock
+
+
+def _respond(middleware, request, status):
+    middleware.process_request(request, None)
+    return middleware.process_response(request, Response(request.url, status=status), None)
+
+
+def _trip(middleware):
+    for page in range(4):
+        _respond(middleware, Request(FF_PLP.format(page)), 403)
+
+
+def test_circuit_breaker_opens_on_error_rate_and_parks_requests():
+    middleware, crawler, _ = _circuit_breaker()
+    _respond(middleware, Request(FF_PLP.format(0)), 200)
+    for page in range(1, 3):
+        _respond(middleware, Request(FF_PLP.format(page)), 403)
+    assert middleware.circuits["www.farfetch.com"].state != CIRCUIT_OPEN
+
+    _respond(middleware, Request(FF_PLP.format(3)), 403)
+    assert middleware.circuits["www.farfetch.com"].state == CIRCUIT_OPEN
+    crawler.stats.inc_value.assert_any_call("circuit_breaker/www.farfetch.com/trips")
+
+    parked = Request(FF_PLP.format(4))
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(parked, None)
+    # Other domains keep downloading.
+    assert middleware.process_request(Request("https://www.ounass.ae/women"), None) is None
+    assert middleware.circuits["www.farfetch.com"].parked == [parked]
+    with pytest.raises(DontCloseSpider):
+        middleware.spider_idle(None)
+
+
+def test_circuit_breaker_probes_once_and_reschedules_parked_requests_on_success():
+    middleware, crawler, clock = _circuit_breaker()
+    _trip(middleware)
+    for page in (10, 11):
+        with pytest.raises(IgnoreRequest):
+            middleware.process_request(Request(FF_PLP.format(page)), None)
+
+    clock.advance(30)
+    probe = crawler.engine.crawl.call_args.args[0]
+    assert probe.url == FF_PLP.format(10)
+    assert probe.dont_filter
+    # Only the probe goes out while half-open.
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request(FF_PLP.format(12)), None)
+
+    _respond(middleware, probe, 200)
+
+    rescheduled = [call.args[0].url for call in crawler.engine.crawl.call_args_list[1:]]
+    assert rescheduled == [FF_PLP.format(11), FF_PLP.format(12)]
+    assert middleware.process_request(Request(FF_PLP.format(13)), None) is None
+    middleware.spider_idle(None)
+    crawler.stats.inc_value.assert_any_call("circuit_breaker/www.farfetch.com/open_seconds", 30)
+
+
+def test_circuit_breaker_backs_off_failed_probes_and_gives_up():
+    middleware, crawler, clock = _circuit_breaker(CIRCUIT_BREAKER_MAX_PROBES=2)
+    _trip(middleware)
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request(FF_PLP.format(10)), None)
+
+    clock.advance(30)
+    _respond(middleware, crawler.engine.crawl.call_args.args[0], 403)
+    clock.advance(30)
+    assert crawler.engine.crawl.call_count == 1
+    # The next request after the doubled open time is the probe.
+    clock.advance(30)
+    probe = Request(FF_PLP.format(11))
+    _respond(middleware, probe, 403)
+
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request(FF_PLP.format(12)), None)
+    assert middleware.circuits["www.farfetch.com"].given_up
+    middleware.spider_idle(None)
+    crawler.stats.inc_value.assert_any_call("circuit_breaker/www.farfetch.com/dropped_requests")
+
+
+def test_circuit_breaker_is_off_by_default():
+    crawler = MagicMock()
+    crawler.settings = Settings()
+
+    with pytest.raises(NotConfigured):
+        CircuitBreakerMiddleware.from_crawler(crawler)
+
+    crawler.settings = Settings({"CIRCUIT_BREAKER_ENABLED": True})
+    assert isinstance(CircuitBreakerMiddleware.from_crawler(crawler), CircuitBreakerMiddleware)
+
+
+def _escalation_middleware(**settings):
+    crawler = MagicMock()
+    crawler.settings = Settings({
+        "CRAWLER_API_ESCALATION_ENABLED": True,
+        "CRAWLER_API_SERVICE": "local",
+        "CRAWLER_API_ESCALATION_BLOCK_THRESHOLD": 2,
+        "CRAWLER_API_ESCALATION_COOLDOWN_SECONDS": 300,
+        **settings,
+    })
+    middleware = CrawlerAPIEscalationMiddleware.from_crawler(crawler)
+    middleware._clock = Clock()
+    return middleware, crawler
+
+
+def test_escalation_reissues_blocked_requests_through_the_crawler_api():
+    middleware, crawler = _escalation_middleware()
+    spider = MagicMock()
+    callback = MagicMock()
+    blocked = []
+    for page in range(2):
+        request = Request(FF_PLP.format(page), callback=callback, cb_kwargs={"page": page})
+        assert middleware.process_request(request, spider) is None
+        blocked.append(request)
+
+    assert middleware.process_response(blocked[0], Response(blocked[0].url, status=403), spider).status == 403
+    reissued = middleware.process_response(blocked[1], Response(blocked[1].url, status=403), spider)
+
+    assert reissued.meta[LOCAL_API_META_KEY]["url"] == FF_PLP.format(1)
+    assert reissued.meta[LOCAL_API_META_KEY]["httpResponseBody"] is True
+    assert reissued.callback is callback
+    assert reissued.cb_kwargs == {"page": 1}
+    assert reissued.dont_filter
+    crawler.stats.inc_value.assert_any_call("crawler_api/escalation/www.farfetch.com/escalations")
+
+    # New direct requests for the host go through the API; other hosts do not.
+    escalated = middleware.process_request(Request(FF_PLP.format(2)), spider)
+    assert escalated.meta[LOCAL_API_META_KEY]["url"] == FF_PLP.format(2)
+    assert middleware.process_request(escalated, spider) is None
+    assert middleware.process_request(Request("https://www.levelshoes.com/women"), spider) is None
+
+
+def test_escalation_steps_down_after_cooldown():
+    middleware, crawler = _escalation_middleware(CRAWLER_API_ESCALATION_BLOCK_THRESHOLD=1)
+    spider = MagicMock()
+    request = Request(FF_PLP.format(0))
+    middleware.process_request(request, spider)
+    middleware.process_response(request, Response(request.url, status=429), spider)
+
+    middleware.clock.advance(300)
+
+    assert middleware.process_request(Request(FF_PLP.format(1)), spider) is None
+    crawler.stats.inc_value.assert_any_call("crawler_api/escalation/www.farfetch.com/deescalations")
+
+
+def test_escalation_requires_a_crawler_api():
+    crawler = MagicMock()
+    crawler.settings = Settings({"CRAWLER_API_ESCALATION_ENABLED": True, "CRAWLER_API_SERVICE": "zyte"})
+
+    with pytest.raises(NotConfigured):
+        CrawlerAPIEscalationMiddleware.from_crawler(crawler)
+
+
+def test_retry_after_parses_seconds_and_http_dates():
+    def response(value):
+        return Response(FF_PLP.format(0), status=429, headers={"Retry-After": value})
+
+    assert get_retry_after_seconds(response("120")) == 120
+    now = 1445412480  # Wed, 21 Oct 2015 07:28:00 GMT
+    assert get_retry_after_seconds(response("Wed, 21 Oct 2015 07:30:00 GMT"), now=now) == 120
+    assert get_retry_after_seconds(response("Wed, 21 Oct 2015 07:00:00 GMT"), now=now) == 0
+    assert get_retry_after_seconds(response("soon")) is None
+    assert get_retry_after_seconds(Response(FF_PLP.format(0))) is None
+
+
+def _retry_after_middleware(**settings):
+    middleware = RetryAfterMiddleware(Settings({
+        "RETRY_ENABLED": True,
+        "RETRY_TIMES": 5,
+        "RETRY_HTTP_CODES": [429],
+        "RETRY_AFTER_RELEASE_RATE": 1.0,
+        "RETRY_AFTER_RELEASE_BURST": 2,
+        "RETRY_AFTER_JITTER": 0,
+        **settings,
+    }))
+    middleware._clock = Clock()
+    spider = MagicMock()
+    spider.crawler.engine.downloader.slots = {}
+    return middleware, spider
+
+
+def test_retry_after_releases_parked_retries_through_token_bucket():
+    middleware, spider = _retry_after_middleware()
+    released = []
+    for page in range(4):
+        request = Request(FF_PLP.format(page))
+        response = Response(request.url, status=429, headers={"Retry-After": "10"})
+        middleware.process_response(request, response, spider).addCallback(released.append)
+
+    middleware.clock.advance(9)
+    assert released == []
+    middleware.clock.advance(1)
+    assert [request.url for request in released] == [FF_PLP.format(0), FF_PLP.format(1)]
+    middleware.clock.advance(1)
+    assert len(released) == 3
+    middleware.clock.advance(1)
+    assert len(released) == 4
+    assert all(request.meta["retry_times"] == 1 for request in released)
+
+    stats = spider.crawler.stats
+    stats.max_value.assert_any_call("retry_after/www.farfetch.com/max_queue_depth", 4)
+    stats.max_value.assert_any_call("retry_after/www.farfetch.com/max_wait_seconds", 12)
+    stats.set_value.assert_called_with("retry_after/www.farfetch.com/queue_depth", 0)
+
+
+def test_retry_after_release_rate_has_a_positive_floor():
+    middleware, spider = _retry_after_middleware(RETRY_AFTER_RELEASE_RATE=0, RETRY_AFTER_RELEASE_BURST=1)
+    released = []
+    for page in range(2):
+        request = Request(FF_PLP.format(page))
+        response = Response(request.url, status=429, headers={"Retry-After": "1"})
+        middleware.process_response(request, response, spider).addCallback(released.append)
+
+    middleware.clock.advance(1)
+    assert len(released) == 1
+    middleware.clock.advance(100)
+    assert len(released) == 2
+
+
+def test_retry_after_new_throttling_pushes_back_the_queue():
+    middleware, spider = _retry_after_middleware()
+    released = []
+    first = Request(FF_PLP.format(0))
+    middleware.process_response(
+        first, Response(first.url, status=429, headers={"Retry-After": "5"}), spider,
+    ).addCallback(released.append)
+    middleware.clock.advance(3)
+    second = Request(FF_PLP.format(1))
+    middleware.process_response(
+        second, Response(second.url, status=429, headers={"Retry-After": "5"}), spider,
+    ).addCallback(released.append)
+
+    middleware.clock.advance(2)
+    assert released == []
+    middleware.clock.advance(3)
+    assert len(released) == 2
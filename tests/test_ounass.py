@@ -6,6 +6,7 @@ from scrapy.http import HtmlResponse
 from scrapy.settings import Settings
 from ecommercecrawl.spiders.ounass_crawl import OunassSpider
 from ecommercecrawl.constants import ounass_constants as constants
+from ecommercecrawl.crawler_api import ADAPTIVE_REQUEST_TYPE_META_KEY
 
 
 # Helper to create a mock Scrapy TextResponse object
@@ -272,3 +273,166 @@ def test_parse_plp_sorted_first_page(mock_rules, spider):
     mock_rules.get_pdps.assert_called_once_with(response)
     # It should have handled one pagination URL and one product URL
     assert spider._handle_seed_url.call_count == 2
+
+
+def test_parse_plp_listing_mode_fetches_only_new_pdps(spider, tmp_path):
+    known_url = "https://www.ounass.ae/shop-bag-a.html"
+    (tmp_path / "ounass.txt").write_text(known_url + "\n", encoding="utf-8")
+    configure_spider(spider, CRAWL_MODE="listing", KNOWN_PRODUCTS_DIR=str(tmp_path))
+    url = f"https://www.ounass.ae/api/women/bags?{constants.PLPSORT_KEY}={constants.PLPSORT}&p=1"
+    body = (
+        '{"page": 1, "currency": "AED", "hits": ['
+        '{"slug": "shop-bag-a", "name": "Bag A", "price": 4200},'
+        '{"slug": "shop-bag-b", "name": "Bag B", "price": 900,'
+        ' "configurableAttributes": [{"options": [{"attributeSpecificProperties": {"slug": "shop-bag-b-red"}}]}]}'
+        ']}'
+    )
+    response = scrapy.http.TextResponse(url=url, body=body, encoding="utf-8")
+
+    results = list(spider.parse_plp(response))
+
+    items = [r for r in results if isinstance(r, dict)]
+    requests_out = [r for r in results if isinstance(r, scrapy.Request)]
+    assert [item["url"] for item in items] == [known_url]
+    assert items[0]["crawl_mode"] == "listing"
+    assert items[0]["price"] == 4200
+    assert sorted(r.url for r in requests_out) == [
+        "https://www.ounass.ae/shop-bag-b-red.html",
+        "https://www.ounass.ae/shop-bag-b.html",
+    ]
+
+
+
+def test_incremental_mode_skips_unchanged_listings(tmp_path):
+    url = f"https://www.ounass.ae/api/women/bags?{constants.PLPSORT_KEY}={constants.PLPSORT}&p=1"
+    pdp_url = "https://www.ounass.ae/shop-bag-a.html"
+
+    def run(price):
+        spider = OunassSpider()
+        spider.crawler = MagicMock()
+        configure_spider(
+            spider, CRAWL_MODE="incremental", PRODUCT_STATE_DIR=str(tmp_path), KNOWN_PRODUCTS_DIR=str(tmp_path),
+        )
+        body = '{"page": 1, "currency": "AED", "hits": [{"slug": "shop-bag-a", "visibleSku": "123", "price": %d}]}'
+        results = list(spider.parse_plp(scrapy.http.TextResponse(url=url, body=body % price, encoding="utf-8")))
+        if results and isinstance(results[0], scrapy.Request):
+            spider.remember_product(pdp_url, {"url": pdp_url, "portal_itemid": "123", "price": price})
+        spider.closed("finished")
+        stat_keys = [call.args[0] for call in spider.crawler.stats.inc_value.call_args_list]
+        return results, stat_keys
+
+    # First run: the product is new, so its PDP is fetched and its state stored.
+    results, stat_keys = run(4200)
+    assert [r.url for r in results] == [pdp_url]
+    assert "incremental/pdp_new" in stat_keys
+
+    # Same listing signature: a "seen" row instead of a PDP request.
+    results, stat_keys = run(4200)
+    assert results[0]["seen"] is True
+    assert results[0]["crawl_mode"] == "incremental"
+    assert results[0]["country"] == "AE"
+    assert "incremental/pdp_skipped" in stat_keys
+
+    # Price change on the listing: the PDP is fetched again.
+    results, stat_keys = run(3900)
+    assert [r.url for r in results] == [pdp_url]
+    assert "incremental/pdp_changed" in stat_keys
+
+
+def test_parse_plp_early_stop_walks_pages_while_products_are_new(spider, tmp_path):
+    known_url = "https://www.ounass.ae/shop-bag-a.html"
+    (tmp_path / "ounass.txt").write_text(known_url + "\n", encoding="utf-8")
+    configure_spider(spider, PLP_EARLY_STOP=True, PLP_PAGE_WINDOW=2, KNOWN_PRODUCTS_DIR=str(tmp_path))
+    url = f"https://www.ounass.ae/api/women/bags?{constants.PLPSORT_KEY}={constants.PLPSORT}&p=1"
+
+    def page(slug):
+        body = '{"page": 1, "pagination": {"totalPages": 10}, "hits": [{"slug": "%s"}]}' % slug
+        return scrapy.http.TextResponse(url=url, body=body, encoding="utf-8")
+
+    page_requests = [
+        r.url for r in spider.parse_plp(page("shop-bag-b"))
+        if "/api/" in r.url
+    ]
+    assert page_requests == [
+        f"https://www.ounass.ae/api/women/bags?{constants.PLPSORT_KEY}={constants.PLPSORT}&p=2",
+        f"https://www.ounass.ae/api/women/bags?{constants.PLPSORT_KEY}={constants.PLPSORT}&p=3",
+    ]
+
+    spider._seen_fetch_urls.clear()
+    assert [r.url for r in spider.parse_plp(page("shop-bag-a"))] == [known_url]
+
+
+def test_coalesce_countries_fetches_one_pdp_per_sku(spider):
+    configure_spider(spider, COALESCE_COUNTRIES=True)
+    spider.crawler = MagicMock()
+    hits = '{"page": 1, "currency": "%s", "hits": [{"slug": "shop-bag-a", "visibleSku": "123", "price": %d}]}'
+    query = f"?{constants.PLPSORT_KEY}={constants.PLPSORT}&p=1"
+    ae_plp = scrapy.http.TextResponse(
+        url="https://www.ounass.ae/api/women/bags" + query, body=hits % ("AED", 4200), encoding="utf-8",
+    )
+    kw_plp = scrapy.http.TextResponse(
+        url="https://kuwait.ounass.com/api/women/bags" + query, body=hits % ("KWD", 350), encoding="utf-8",
+    )
+
+    ae_results = list(spider.parse_plp(ae_plp))
+    kw_results = list(spider.parse_plp(kw_plp))
+
+    assert [r.url for r in ae_results] == ["https://www.ounass.ae/shop-bag-a.html"]
+    assert kw_results == []
+
+    pdp_item = {
+        "url": "https://www.ounass.ae/shop-bag-a.html", "country": "AE", "language": "EN",
+        "portal_itemid": "123", "price": 4200, "currency": "AED", "text": "Leather bag",
+    }
+    merged = spider.resolve_coalesced(pdp_item["url"], pdp_item)
+
+    assert len(merged) == 1
+    assert merged[0]["url"] == "https://kuwait.ounass.com/shop-bag-a.html"
+    assert (merged[0]["country"], merged[0]["price"], merged[0]["currency"]) == ("KW", 350, "KWD")
+    assert merged[0]["text"] == "Leather bag"
+    assert merged[0]["coalesced_from"] == pdp_item["url"]
+
+
+def test_coalesce_countries_falls_back_when_primary_pdp_fails(spider):
+    configure_spider(spider, COALESCE_COUNTRIES=True)
+    spider.crawler = MagicMock()
+    spider.coalesce_country(constants.NAME, "https://www.ounass.ae/shop-bag-a.html", {"portal_itemid": "123"})
+    spider.coalesce_country(constants.NAME, "https://www.ounass.qa/shop-bag-a.html", {"portal_itemid": "123"})
+
+    with patch("ecommercecrawl.spiders.ounass_crawl.rules.get_state", return_value=None):
+        response = HtmlResponse(url="https://www.ounass.ae/shop-bag-a.html", body=b"<html></html>")
+        results = list(spider.parse_pdp(response))
+
+    assert [r.url for r in results] == ["https://www.ounass.qa/shop-bag-a.html"]
+
+# --- Tests for adaptive PDP request types ---
+
+def test_handle_seed_url_adaptive_pdp_starts_with_http_response(spider):
+    configure_spider(spider, OUNASS_CRAWLER_API_PDP_REQUEST_TYPE="adaptive")
+    url = "https://www.ounass.ae/shop-product.html"
+
+    results = list(spider._handle_seed_url(url))
+
+    assert results[0].meta["zyte_api"] == {
+        "httpResponseBody": True,
+        "httpResponseHeaders": True,
+    }
+    assert results[0].meta[ADAPTIVE_REQUEST_TYPE_META_KEY] == "http_response"
+
+
+@patch('ecommercecrawl.spiders.ounass_crawl.rules.get_state', return_value=None)
+def test_parse_pdp_reissues_failed_cheap_attempt_as_rendered_html(mock_get_state, spider):
+    configure_spider(spider, OUNASS_CRAWLER_API_PDP_REQUEST_TYPE="adaptive")
+    url = "https://www.ounass.ae/shop-product.html"
+    request = list(spider._handle_seed_url(url))[0]
+    response = HtmlResponse(url=url, body=b"<html></html>", encoding="utf-8", request=request)
+
+    results = list(spider.parse_pdp(response))
+
+    assert len(results) == 1
+    retry = results[0]
+    assert retry.url == url
+    assert retry.dont_filter is True
+    assert retry.meta["zyte_api"] == {"browserHtml": True}
+    assert spider._adaptive_policy.attempts["www.ounass.ae"] == 1
+    assert spider._adaptive_policy.successes["www.ounass.ae"] == 0
@@ -289,3 +289,42 @@ def test_get_data_collects_expected_fields():
         "out_of_stock": False,
         "text": {"design_details": "Leather upper", "size_fit": "True to size"},
     }
+
+
+# --- Tests for get_listing_items ---
+
+def test_get_listing_items_maps_hits_to_price_fields():
+    response = create_mock_response(
+        {
+            "currency": "AED",
+            "hits": [
+                {
+                    "slug": "shop-bag-a",
+                    "name": "Bag A",
+                    "designerCategoryName": "Toteme",
+                    "visibleSku": "217000001",
+                    "price": 4200,
+                    "discountPercent": 30,
+                    "stockStatus": "OUT OF STOCK",
+                },
+                {"slug": "shop-bag-b", "name": "Bag B"},
+                {"name": "No slug"},
+            ],
+        },
+        url="https://www.ounass.ae/api/women/bags?fh_sort_by=-newness_ae&p=0",
+    )
+
+    items = rules.get_listing_items(response)
+
+    assert [item["url"] for item in items] == [
+        "https://www.ounass.ae/shop-bag-a.html",
+        "https://www.ounass.ae/shop-bag-b.html",
+    ]
+    assert items[0]["portal_itemid"] == "217000001"
+    assert items[0]["brand"] == "Toteme"
+    assert items[0]["price"] == 4200
+    assert items[0]["currency"] == "AED"
+    assert items[0]["price_discount"] == 30
+    assert items[0]["out_of_stock"] is True
+    assert items[1]["out_of_stock"] is False
+    assert items[1]["language"] == "EN"
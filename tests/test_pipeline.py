@@ -101,6 +101,17 @@ class TestJsonlWriterPipeline:
             line = f.readline()
             assert json.loads(line) == item
 
+    def test_process_item_counts_write_throughput(self, jsonl_writer_setup):
+        """Tests that written rows and bytes are counted in stats."""
+        pipeline, spider, mock_crawler = jsonl_writer_setup
+
+        pipeline.spider_opened(spider)
+        pipeline.process_item({'data': 'é'}, spider)
+        pipeline.file.close()
+
+        mock_crawler.stats.inc_value.assert_any_call("output/rows_written")
+        mock_crawler.stats.inc_value.assert_any_call("output/bytes_written", len('{"data": "é"}\n'.encode("utf-8")))
+
     def test_spider_closed(self, jsonl_writer_setup):
         """Tests that spider_closed finalizes spider attributes."""
         pipeline, spider, _ = jsonl_writer_setup
@@ -194,6 +205,21 @@ class TestManifestPipeline:
         }
         assert manifest_data['stats'] == expected_stats
 
+    def test_manifest_stats_include_optional_sections(self, helpers_test_setup):
+        """Optional stats sections are only written when matching stats exist."""
+        pipeline, _ = helpers_test_setup
+        stats = {
+            'crawler_api/adaptive/www.ounass.ae/chosen/http_response': 4,
+            'crawler_api/adaptive/www.ounass.ae/http_response/failure': 1,
+        }
+
+        manifest_stats = pipeline._build_manifest_stats(stats)
+
+        assert manifest_stats['crawler_api_adaptive'] == {
+            'www.ounass.ae/chosen/http_response': 4,
+            'www.ounass.ae/http_response/failure': 1,
+        }
+
     def test_manifest_artifacts_section(self, manifest_test_setup):
         """Tests the 'artifacts' section of the manifest."""
         manifest_data = manifest_test_setup['manifest_data']
@@ -377,3 +403,59 @@ class TestS3Upload:
         }
 
         assert uploaded_keys == expected_keys
+
+
+def test_quality_gate_ignores_pdp_only_fields_in_listing_mode(helpers_test_setup, tmp_path):
+    from scrapy.settings import Settings
+
+    pipeline, spider = helpers_test_setup
+    rows = [
+        {"site": "ounass", "url": f"https://www.ounass.ae/shop-{i}.html", "price": 100 + i, "text": None}
+        for i in range(3)
+    ]
+    with open(pipeline.output_filepath, "w", encoding="utf-8") as f:
+        f.write("\n".join(json.dumps(row) for row in rows))
+
+    settings = {
+        "QUALITY_GATE_BLANK_THRESHOLD": "0.5",
+        "QUALITY_GATE_MIN_ROWS_FOR_BLANK_CHECK": "1",
+        "QUALITY_GATE_EXCEPTIONS_FILE": "",
+    }
+    pipeline.crawler.settings = Settings(settings)
+    pipeline._run_quality_gate(spider)
+    assert pipeline.quality_gate_report["status"] == "fail_quality"
+
+    pipeline.crawler.settings = Settings({**settings, "CRAWL_MODE": "listing"})
+    pipeline._run_quality_gate(spider)
+    assert pipeline.quality_gate_report["status"] == "pass"
+
+
+def test_last_shard_writes_tagged_and_merged_manifests(pipeline_setup, tmp_path):
+    from ecommercecrawl.sharding import ShardFrontier, ShardSpec
+
+    pipeline, spider, mock_crawler = pipeline_setup
+    mock_crawler.stats.get_stats.return_value = {
+        'start_time': datetime(2026, 1, 1, tzinfo=timezone.utc),
+        'finish_time': datetime(2026, 1, 1, 1, tzinfo=timezone.utc),
+    }
+    spider.shard = ShardSpec(1, 2)
+    spider.shard_frontier = ShardFrontier(MagicMock(), "test", spider.shard)
+    other_shard = {
+        "run_id": spider.run_id,
+        "crawler_name": spider.name,
+        "exit_reason": "finished",
+        "start_time": "2026-01-01T00:00:00+00:00",
+        "finish_time": "2026-01-01T00:30:00+00:00",
+        "shard": {"index": 0, "count": 2},
+        "stats": {"items_scraped": 3},
+        "artifacts": {"rows": 3, "file_path": "output/test_spider.shard-0-of-2.jsonl.gz"},
+    }
+    with patch.object(ShardFrontier, "finish", side_effect=lambda manifest: [other_shard, manifest]):
+        pipeline.spider_closed(spider=spider, reason='finished')
+
+    shard_manifest = json.loads((tmp_path / 'metadata' / 'manifest.shard-1-of-2.json').read_text())
+    assert shard_manifest['shard'] == {"index": 1, "count": 2}
+    assert (tmp_path / 'metadata' / 'quality_report.shard-1-of-2.json').exists()
+    merged = json.loads((tmp_path / 'metadata' / 'manifest.json').read_text())
+    assert merged['artifacts']['rows'] == 8
+    assert len(merged['artifacts']['parts']) == 2
@@ -0,0 +1,106 @@
+import pytest
+from scrapy.settings import Settings
+
+from ecommercecrawl.product_state import (
+    ProductStateStore,
+    content_hash,
+    listing_signature,
+    product_key,
+)
+
+
+URL = "https://www.ounass.ae/shop-bag-a.html"
+
+
+def test_listing_signature_normalizes_price_and_stock_fields():
+    ounass = {"price": 4200, "price_discount": None, "out_of_stock": False}
+    farfetch = {"price": "4,200.00", "sold_out": False}
+
+    assert listing_signature(ounass) == listing_signature(farfetch)
+    assert listing_signature(ounass) != listing_signature({**ounass, "price": 3900})
+    assert listing_signature(ounass) != listing_signature({**ounass, "out_of_stock": True})
+
+
+def test_product_key_falls_back_to_canonical_url():
+    assert product_key("ounass", URL, {"country": "AE", "language": "EN", "portal_itemid": "123"}) == (
+        "ounass", "AE", "EN", "123",
+    )
+    assert product_key("ounass", URL + "?utm=1", {}) == ("ounass", "", "", URL)
+
+
+def test_content_hash_ignores_per_run_fields():
+    item = {"url": URL, "price": 4200, "run_id": "a", "crawl_date": "2025-01-01"}
+
+    assert content_hash(item) == content_hash({**item, "run_id": "b", "crawl_date": "2025-01-02"})
+    assert content_hash(item) != content_hash({**item, "price": 3900})
+
+
+def test_store_round_trip_and_touch(tmp_path):
+    store = ProductStateStore.from_settings(Settings({"PRODUCT_STATE_DIR": str(tmp_path)}), "ounass")
+    key = ("ounass", "AE", "EN", "123")
+    item = {"url": URL, "price": 4200, "price_discount": 10, "out_of_stock": False}
+
+    assert store.update(key, URL, item, "sig-1", "run-1") is None
+    store.touch(key, "run-2")
+    store.close()
+
+    reloaded = ProductStateStore(str(tmp_path / "ounass.sqlite"))
+    state = reloaded.get(key)
+    assert len(reloaded) == 1
+    assert state["listing_signature"] == "sig-1"
+    assert state["price"] == "4200.00"
+    assert state["out_of_stock"] == 0
+    assert state["last_crawled_run_id"] == "run-1"
+    assert state["last_seen_run_id"] == "run-2"
+    assert reloaded.update(key, URL, item, "sig-2", "run-3") == content_hash(item)
+
+
+def test_store_snapshots_to_s3(monkeypatch, tmp_path):
+    from unittest.mock import MagicMock
+
+    from botocore.exceptions import ClientError
+
+    s3_client = MagicMock()
+    s3_client.download_file.side_effect = ClientError({"Error": {"Code": "404"}}, "HeadObject")
+    monkeypatch.setattr("boto3.client", lambda service: s3_client)
+    settings = Settings({
+        "PRODUCT_STATE_DIR": str(tmp_path),
+        "PRODUCT_STATE_S3_PREFIX": "s3://state-bucket/product_state/",
+    })
+
+    store = ProductStateStore.from_settings(settings, "farfetch")
+    store.close()
+    store.close()
+
+    s3_client.upload_file.assert_called_once_with(
+        str(tmp_path / "farfetch.sqlite"), "state-bucket", "product_state/farfetch.sqlite",
+    )
+
+
+def test_store_snapshot_errors_other_than_missing_are_raised(monkeypatch, tmp_path):
+    from unittest.mock import MagicMock
+
+    from botocore.exceptions import ClientError
+
+    s3_client = MagicMock()
+    s3_client.download_file.side_effect = ClientError({"Error": {"Code": "403"}}, "HeadObject")
+    monkeypatch.setattr("boto3.client", lambda service: s3_client)
+
+    with pytest.raises(ClientError):
+        ProductStateStore(str(tmp_path / "farfetch.sqlite"), s3_uri="s3://state-bucket/product_state/farfetch.sqlite")
+    s3_client.upload_file.assert_not_called()
+
+
+def test_store_commits_in_batches(monkeypatch, tmp_path):
+    monkeypatch.setattr("ecommercecrawl.product_state.COMMIT_EVERY_ROWS", 2)
+    path = str(tmp_path / "ounass.sqlite")
+    store = ProductStateStore(path)
+    item = {"url": URL, "price": 4200}
+
+    store.update(("ounass", "AE", "EN", "1"), URL, item, "sig", "run-1")
+    assert len(ProductStateStore(path)) == 0
+    store.touch(("ounass", "AE", "EN", "1"), "run-1")
+    store.update(("ounass", "AE", "EN", "2"), URL, item, "sig", "run-1")
+
+    # A crawl killed now still has the first batch on disk.
+    assert len(ProductStateStore(path)) == 1
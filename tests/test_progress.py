@@ -0,0 +1,57 @@
+from ecommercecrawl.progress import CrawlProgress
+
+SEED = "https://www.farfetch.com/ae/shopping/women/bags-1/items.aspx"
+
+
+def _pdps(*names):
+    return [f"https://www.farfetch.com/ae/shopping/women/{name}.aspx" for name in names]
+
+
+def test_expected_pdps_extrapolate_unparsed_pages():
+    progress = CrawlProgress(started_at=0)
+    progress.listing_page(SEED, 4, _pdps("a", "b"))
+    progress.listing_page(f"{SEED}?page=2", 4, _pdps("c", "d"))
+
+    totals = progress.totals()
+    assert totals["plp_pages_expected"] == 4
+    assert totals["plp_pages_completed"] == 2
+    # Two more pages of two products each.
+    assert totals["pdps_expected"] == 8
+
+
+def test_items_count_for_the_seed_that_listed_them():
+    progress = CrawlProgress(started_at=0)
+    progress.listing_page(SEED, 1, _pdps("a", "b"))
+    other = "https://www.farfetch.com/ae/shopping/men/shoes-2/items.aspx"
+    # Listed again under another seed: still counts for the first one.
+    progress.listing_page(other, 1, _pdps("b"))
+
+    progress.item_scraped({"url": _pdps("a")[0] + "?storeid=1"})
+    progress.item_scraped({"url": _pdps("a")[0]})
+    progress.item_scraped({"url": "https://www.farfetch.com/ae/shopping/women/seed.aspx"})
+
+    seeds = {seed["seed"]: seed for seed in progress.snapshot(now=10)["seeds"]}
+    assert seeds[SEED]["pdps_completed"] == 1
+    assert seeds[other]["pdps_expected"] == 0
+    # Repeats and items of products no listing page listed count as their own PDPs.
+    assert progress.unlisted_items == 2
+
+
+def test_snapshot_reports_throughput_eta_and_stalls():
+    progress = CrawlProgress(started_at=0)
+    progress.listing_page(SEED, 2, _pdps("a", "b", "c"))
+    for name in ("a", "b"):
+        progress.item_scraped({"url": _pdps(name)[0]})
+
+    snapshot = progress.snapshot(now=10)
+    # 3 of 8 units (2 pages, 6 expected PDPs) done at 0.3 units/s.
+    assert snapshot["items_per_second"] == 0.2
+    assert snapshot["percent_complete"] == 37.5
+    assert snapshot["eta_seconds"] == round(5 / 0.3)
+    assert not snapshot["stalled"]
+
+    stalled = progress.snapshot(now=20)
+    assert stalled["stalled"]
+    assert stalled["recent_items_per_second"] == 0.0
+    # The ETA falls back to the run's throughput.
+    assert stalled["eta_seconds"] == round(5 / 0.15)
@@ -0,0 +1,122 @@
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy.settings import Settings
+
+from ecommercecrawl import response_archive
+from ecommercecrawl.response_archive import (
+    MODE_RECORD,
+    MODE_REPLAY,
+    RecordResponsesMiddleware,
+    ReplayDownloadHandler,
+    ResponseArchive,
+)
+
+
+def _crawler(path, mode):
+    crawler = MagicMock()
+    crawler.settings = Settings({"RESPONSE_ARCHIVE_MODE": mode, "RESPONSE_ARCHIVE_PATH": str(path)})
+    return crawler
+
+
+def test_recorded_response_is_replayed_with_status_headers_and_body(tmp_path):
+    path = tmp_path / "archive.sqlite"
+    request = Request("https://www.farfetch.com/ae/shopping/women/items.aspx?page=2")
+    response = HtmlResponse(
+        url=request.url,
+        status=200,
+        headers={"Content-Type": "text/html; charset=utf-8"},
+        body=b"<html><p>page 2</p></html>",
+        request=request,
+    )
+
+    recorder = RecordResponsesMiddleware.from_crawler(_crawler(path, MODE_RECORD))
+    assert recorder.process_response(request, response, MagicMock()) is response
+    recorder.spider_closed(MagicMock())
+
+    handler = ReplayDownloadHandler.from_crawler(_crawler(path, MODE_REPLAY))
+    replayed = handler.download_request(Request(request.url), MagicMock()).result
+
+    assert isinstance(replayed, HtmlResponse)
+    assert replayed.status == 200
+    assert replayed.xpath("//p/text()").get() == "page 2"
+    assert "replay" in replayed.flags
+    handler.close()
+
+
+def test_replay_keeps_crawler_api_request_types_apart(tmp_path):
+    archive = ResponseArchive(str(tmp_path / "archive.sqlite"), MODE_RECORD)
+    url = "https://www.ounass.ae/shop-product.html"
+    cheap = Request(url, meta={"zyte_api": {"httpResponseBody": True}})
+    rendered = Request(url, meta={"zyte_api": {"browserHtml": True}})
+    archive.put_response(cheap, TextResponse(url=url, body=b"cheap", request=cheap))
+    archive.put_response(rendered, TextResponse(url=url, body=b"rendered", request=rendered))
+
+    assert archive.get_response(cheap).body == b"cheap"
+    assert archive.get_response(rendered).body == b"rendered"
+    archive.close()
+
+
+def test_replay_miss_fails_request(tmp_path):
+    ResponseArchive(str(tmp_path / "archive.sqlite"), MODE_RECORD).close()
+    crawler = _crawler(tmp_path / "archive.sqlite", MODE_REPLAY)
+    handler = ReplayDownloadHandler.from_crawler(crawler)
+
+    failures = []
+    handler.download_request(Request("https://example.com/missing"), MagicMock()).addErrback(
+        failures.append
+    )
+
+    assert failures[0].check(IgnoreRequest)
+    crawler.stats.inc_value.assert_called_with("response_archive/replay_miss")
+    handler.close()
+
+
+def test_requests_get_replays_recorded_api_payload(tmp_path, monkeypatch):
+    path = str(tmp_path / "archive.sqlite")
+    live = requests.models.Response()
+    live.status_code = 200
+    live.headers["Content-Type"] = "application/json"
+    live._content = b'{"products": [{"id": 1}]}'
+    monkeypatch.setattr(response_archive.requests, "get", lambda *a, **kw: live)
+
+    recorder = ResponseArchive(path, MODE_RECORD)
+    recorder.requests_get("https://api.levelshoes.digital/catalog", params={"page": 0})
+    recorder.close()
+
+    replayer = ResponseArchive(path, MODE_REPLAY)
+    replayed = replayer.requests_get("https://api.levelshoes.digital/catalog", params={"page": 0})
+    assert replayed.json() == {"products": [{"id": 1}]}
+    with pytest.raises(requests.exceptions.ConnectionError):
+        replayer.requests_get("https://api.levelshoes.digital/catalog", params={"page": 1})
+    replayer.close()
+
+
+def test_recorder_is_disabled_outside_record_mode():
+    with pytest.raises(NotConfigured):
+        RecordResponsesMiddleware.from_crawler(MagicMock(settings=Settings({})))
+
+
+def test_configure_settings_for_replay_swaps_handlers_and_drops_zyte():
+    settings = Settings({
+        "DOWNLOADER_MIDDLEWARES": {
+            "ecommercecrawl.middlewares.RetryAfterMiddleware": 550,
+            "scrapy_zyte_api.ScrapyZyteAPIDownloaderMiddleware": 1000,
+        },
+        "DOWNLOAD_DELAY": 1,
+    })
+
+    response_archive.configure_settings(settings, MODE_REPLAY, "archive.sqlite")
+
+    assert settings["RESPONSE_ARCHIVE_MODE"] == MODE_REPLAY
+    assert settings.getdict("DOWNLOAD_HANDLERS")["https"] == (
+        "ecommercecrawl.response_archive.ReplayDownloadHandler"
+    )
+    assert "scrapy_zyte_api.ScrapyZyteAPIDownloaderMiddleware" not in settings.getdict(
+        "DOWNLOADER_MIDDLEWARES"
+    )
+    assert settings.getfloat("DOWNLOAD_DELAY") == 0
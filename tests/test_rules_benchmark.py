@@ -0,0 +1,163 @@
+import json
+
+import pytest
+
+from ecommercecrawl.response_archive import MODE_RECORD, ResponseArchive
+from ecommercecrawl.rules_benchmark import (
+    BenchmarkParams,
+    compare_to_baseline,
+    load_corpus,
+    run_benchmark,
+)
+
+
+OUNASS_PDP_URL = "https://www.ounass.ae/shop-test-bag.html"
+LEVEL_PDP_URL = "https://www.levelshoes.com/toteme-t-lock-bag.html"
+
+
+def _ounass_pdp_html():
+    state = {
+        "routeType": "new-pdp",
+        "country": "AE",
+        "currency": "AED",
+        "pdp": {"name": "Test Bag", "visibleSku": "123", "price": 1000},
+    }
+    script = f"window.initialState = {json.dumps(state, separators=(',', ':'))};"
+    return f"<html><body><script>{script}</script></body></html>"
+
+
+def _write_corpus(path):
+    rows = [
+        {"url": OUNASS_PDP_URL, "status": 200, "body": _ounass_pdp_html()},
+        {"url": LEVEL_PDP_URL, "status": 200, "body": "<html><h1>T-Lock bag</h1></html>"},
+        # PLPs and failed fetches are not part of the PDP corpus.
+        {"url": "https://www.ounass.ae/api/women/bags?p=0", "status": 200, "body": "{}"},
+        {"url": "https://www.ounass.ae/shop-missing.html", "status": 404, "body": ""},
+    ]
+    path.write_text("\n".join(json.dumps(row) for row in rows), encoding="utf-8")
+
+
+def test_load_corpus_keeps_only_pdps(tmp_path):
+    corpus_path = tmp_path / "corpus.jsonl"
+    _write_corpus(corpus_path)
+
+    pages = load_corpus([str(corpus_path)])
+
+    assert [(page.site, page.url) for page in pages] == [
+        ("ounass", OUNASS_PDP_URL),
+        ("level-shoes", LEVEL_PDP_URL),
+    ]
+
+
+def test_load_corpus_reads_response_archive(tmp_path):
+    archive_path = str(tmp_path / "archive.sqlite")
+    archive = ResponseArchive(archive_path, MODE_RECORD)
+    archive.put("GET", OUNASS_PDP_URL, b"", 200, {}, _ounass_pdp_html().encode("utf-8"))
+    archive.close()
+
+    pages = load_corpus([archive_path])
+
+    assert len(pages) == 1
+    assert pages[0].site == "ounass"
+    assert b"new-pdp" in pages[0].body
+
+
+def test_run_benchmark_reports_fields_full_path_and_allocations(tmp_path):
+    corpus_path = tmp_path / "corpus.jsonl"
+    _write_corpus(corpus_path)
+
+    report = run_benchmark(
+        load_corpus([str(corpus_path)]),
+        params=BenchmarkParams(iterations=2, warmup=0),
+    )
+
+    ounass = report["sites"]["ounass"]
+    assert ounass["pages"] == 1
+    assert ounass["fields"]["state"]["samples"] == 2
+    assert ounass["fields"]["state"]["errors"] == 0
+    assert ounass["full_path"]["pages_per_second"] > 0
+    assert ounass["allocations"]["peak_kb_max"] > 0
+    assert "product_name" in report["sites"]["level-shoes"]["fields"]
+    json.dumps(report)
+
+
+def test_run_benchmark_filters_sites(tmp_path):
+    corpus_path = tmp_path / "corpus.jsonl"
+    _write_corpus(corpus_path)
+
+    report = run_benchmark(
+        load_corpus([str(corpus_path)]),
+        params=BenchmarkParams(iterations=1, warmup=0, measure_allocations=False),
+        sites=["ounass"],
+    )
+
+    assert list(report["sites"]) == ["ounass"]
+    assert "allocations" not in report["sites"]["ounass"]
+
+
+def test_compare_to_baseline_flags_slower_and_erroring_fields():
+    baseline = {"sites": {"ounass": {
+        "fields": {"state": {"mean_us": 100.0, "errors": 0}, "price": {"mean_us": 1.0, "errors": 0}},
+        "full_path": {"mean_us": 200.0, "errors": 0},
+    }}}
+    report = {"sites": {"ounass": {
+        "fields": {"state": {"mean_us": 150.0, "errors": 0}, "price": {"mean_us": 1.05, "errors": 1}},
+        "full_path": {"mean_us": 210.0, "errors": 0},
+    }}}
+
+    regressions = compare_to_baseline(report, baseline, tolerance=0.10)
+
+    assert [(r["name"], r["reason"]) for r in regressions] == [
+        ("price", "errors"),
+        ("state", "slower"),
+    ]
+
+
+def test_compare_to_baseline_rejects_negative_tolerance():
+    with pytest.raises(ValueError):
+        compare_to_baseline({}, {}, tolerance=-0.1)
+
+
+def test_main_writes_report_and_fails_on_regression(monkeypatch, tmp_path):
+    import run_rules_benchmark
+
+    corpus_path = tmp_path / "corpus.jsonl"
+    _write_corpus(corpus_path)
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(json.dumps({"sites": {"ounass": {
+        "fields": {"state": {"mean_us": 0.001, "errors": 0}},
+    }}}), encoding="utf-8")
+    report_path = tmp_path / "report.json"
+    monkeypatch.setattr(
+        "sys.argv",
+        [
+            "run_rules_benchmark.py",
+            "--corpus", str(corpus_path),
+            "--iterations", "1",
+            "--no-allocations",
+            "--baseline", str(baseline_path),
+            "--report-path", str(report_path),
+        ],
+    )
+
+    assert run_rules_benchmark.main() == 1
+    report = json.loads(report_path.read_text(encoding="utf-8"))
+    assert report["regressions"][0]["name"] == "state"
+
+
+def test_run_benchmark_compares_farfetch_xpath_program(tmp_path):
+    from test_farfetch_rules import PROGRAM_PDP_HTML
+
+    corpus_path = tmp_path / "corpus.jsonl"
+    url = "https://www.farfetch.com/ae/shopping/women/christopher-esber-gown-item-29397648.aspx"
+    corpus_path.write_text(json.dumps({"url": url, "status": 200, "body": PROGRAM_PDP_HTML}), encoding="utf-8")
+
+    report = run_benchmark(
+        load_corpus([str(corpus_path)]),
+        params=BenchmarkParams(iterations=2, warmup=0, measure_allocations=False),
+    )
+
+    program = report["sites"]["farfetch"]["xpath_program"]
+    assert program["mismatched_pages"] == 0
+    assert program["compiled_program"]["samples"] == 2
+    assert program["speedup"] > 0
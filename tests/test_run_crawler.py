@@ -1,4 +1,5 @@
 import sys
+from datetime import datetime, timedelta, timezone
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -6,69 +7,153 @@ import pytest
 import run_crawler
 
 
-def test_urls_from_csv_text_reads_first_column_and_skips_header():
-    csv_text = "url,label\nhttps://example.com/a,A\n\n https://example.com/b ,B\n"
-
-    urls = run_crawler._urls_from_csv_text(csv_text)
+def test_main_passes_urls_source_to_spider_without_loading_it(tmp_path, monkeypatch):
+    csv_file = tmp_path / "urls.csv"
+    csv_file.write_text("url\nhttps://example.com/a\n", encoding="utf-8")
+    process = MagicMock()
 
-    assert urls == ["https://example.com/a", "https://example.com/b"]
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "run_crawler.py",
+            "farfetch",
+            "--urls-source",
+            str(csv_file),
+            "--env",
+            "prod",
+        ],
+    )
 
+    with patch("run_crawler.CrawlerProcess", return_value=process), patch(
+        "run_crawler.get_project_settings",
+        return_value=MagicMock(),
+    ):
+        run_crawler.main()
 
-def test_load_urls_source_reads_local_csv(tmp_path):
-    csv_file = tmp_path / "urls.csv"
-    csv_file.write_text("url\nhttps://example.com/a\n", encoding="utf-8")
+    _, kwargs = process.crawl.call_args
+    assert "urls" not in kwargs
+    assert kwargs["urls_source"] == str(csv_file)
+    process.start.assert_called_once()
 
-    urls = run_crawler.load_urls_source(str(csv_file))
 
-    assert urls == ["https://example.com/a"]
+def test_summarize_crawl_throughput_reports_rates():
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    stats = {
+        "start_time": start,
+        "finish_time": start + timedelta(seconds=4),
+        "response_received_count": 100,
+        "item_scraped_count": 80,
+    }
 
+    summary = run_crawler.summarize_crawl_throughput(stats)
 
-def test_load_urls_source_reads_s3_csv():
-    body = MagicMock()
-    body.read.return_value = b"url\nhttps://example.com/a\n"
-    s3_client = MagicMock()
-    s3_client.get_object.return_value = {"Body": body}
+    assert summary["pages_per_second"] == 25.0
+    assert summary["items_per_second"] == 20.0
+    assert summary["replay_misses"] == 0
 
-    with patch("boto3.client", return_value=s3_client):
-        urls = run_crawler.load_urls_source("s3://seed-bucket/prod/farfetch.csv")
 
-    assert urls == ["https://example.com/a"]
-    s3_client.get_object.assert_called_once_with(
-        Bucket="seed-bucket",
-        Key="prod/farfetch.csv",
+def test_main_replay_configures_response_archive(monkeypatch):
+    process = MagicMock()
+    settings = MagicMock()
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["run_crawler.py", "level", "--urls", "https://www.levelshoes.com/women/bags", "--replay", "a.sqlite"],
     )
 
+    with patch("run_crawler.CrawlerProcess", return_value=process), patch(
+        "run_crawler.get_project_settings",
+        return_value=settings,
+    ), patch("run_crawler.response_archive.configure_settings") as configure:
+        run_crawler.main()
 
-def test_load_urls_source_rejects_invalid_s3_source():
-    with pytest.raises(ValueError, match="Invalid S3 URL source"):
-        run_crawler.load_urls_source("s3://seed-bucket")
+    configure.assert_called_once_with(settings, "replay", "a.sqlite")
 
 
-def test_main_passes_urls_source_urls_to_spider(tmp_path, monkeypatch):
-    csv_file = tmp_path / "urls.csv"
-    csv_file.write_text("url\nhttps://example.com/a\n", encoding="utf-8")
+def test_main_sets_listing_crawl_mode(monkeypatch):
     process = MagicMock()
+    settings = MagicMock()
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["run_crawler.py", "ounass", "--urls", "https://www.ounass.ae/api/women/bags", "--mode", "listing"],
+    )
+
+    with patch("run_crawler.CrawlerProcess", return_value=process), patch(
+        "run_crawler.get_project_settings",
+        return_value=settings,
+    ):
+        run_crawler.main()
+
+    settings.set.assert_any_call("CRAWL_MODE", "listing")
 
+
+def test_main_resume_enables_checkpoints_for_run(monkeypatch):
+    process = MagicMock()
+    settings = MagicMock()
     monkeypatch.setattr(
         sys,
         "argv",
-        [
-            "run_crawler.py",
-            "farfetch",
-            "--urls-source",
-            str(csv_file),
-            "--env",
-            "prod",
-        ],
+        ["run_crawler.py", "ounass", "--urls", "https://www.ounass.ae/api/women/bags", "--resume", "2026-01-01T00-00-00-000"],
     )
 
     with patch("run_crawler.CrawlerProcess", return_value=process), patch(
         "run_crawler.get_project_settings",
-        return_value=MagicMock(),
+        return_value=settings,
     ):
         run_crawler.main()
 
-    _, kwargs = process.crawl.call_args
-    assert kwargs["urls"] == ["https://example.com/a"]
-    assert kwargs["urls_source"] == str(csv_file)
+    settings.set.assert_any_call("CHECKPOINT_ENABLED", True)
+    settings.set.assert_any_call("RESUME_RUN_ID", "2026-01-01T00-00-00-000")
+
+
+def test_main_runs_every_spider_in_one_process(monkeypatch):
+    process = MagicMock()
+    settings = MagicMock()
+    monkeypatch.setattr(sys, "argv", ["run_crawler.py", "all", "--max-concurrency", "24"])
+
+    with patch("run_crawler.CrawlerProcess", return_value=process), patch(
+        "run_crawler.get_project_settings",
+        return_value=settings,
+    ):
+        run_crawler.main()
+
+    created = [call.args[0] for call in process.create_crawler.call_args_list]
+    assert created == list(run_crawler.spider_map.values())
+    assert process.crawl.call_count == len(run_crawler.spider_map)
     process.start.assert_called_once()
+    settings.set.assert_any_call("GLOBAL_CONCURRENT_REQUESTS", 24)
+    settings.set.assert_any_call("DOWNLOADER", "ecommercecrawl.downloader.GlobalConcurrencyDownloader")
+
+
+def test_main_rejects_seed_urls_for_several_spiders(monkeypatch):
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["run_crawler.py", "ounass", "level", "--urls", "https://www.ounass.ae/api/women/bags"],
+    )
+
+    with patch("run_crawler.CrawlerProcess") as process_class, pytest.raises(SystemExit):
+        run_crawler.main()
+
+    process_class.assert_not_called()
+
+
+def test_main_shard_sets_shared_run_id(monkeypatch):
+    process = MagicMock()
+    settings = MagicMock()
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        ["run_crawler.py", "level", "--shard", "1/4", "--run-id", "2026-01-01T00-00-00-000"],
+    )
+
+    with patch("run_crawler.CrawlerProcess", return_value=process), patch(
+        "run_crawler.get_project_settings",
+        return_value=settings,
+    ):
+        run_crawler.main()
+
+    settings.set.assert_any_call("SHARD", "1/4")
+    settings.set.assert_any_call("RUN_ID", "2026-01-01T00-00-00-000")
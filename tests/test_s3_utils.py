@@ -0,0 +1,22 @@
+import pytest
+
+from ecommercecrawl.s3_utils import is_missing_object, split_s3_uri
+
+
+def test_split_s3_uri():
+    assert split_s3_uri("s3://bucket/state/ounass.sqlite") == ("bucket", "state/ounass.sqlite")
+    assert split_s3_uri("s3://bucket/prefix/") == ("bucket", "prefix")
+
+
+def test_split_s3_uri_rejects_other_schemes():
+    with pytest.raises(ValueError, match="Invalid S3 URI"):
+        split_s3_uri("/tmp/state/ounass.sqlite")
+
+
+def test_is_missing_object():
+    from botocore.exceptions import ClientError
+
+    for code in ("404", "NoSuchKey", "NoSuchBucket"):
+        assert is_missing_object(ClientError({"Error": {"Code": code}}, "GetObject"))
+    for code in ("403", "AccessDenied", "SlowDown"):
+        assert not is_missing_object(ClientError({"Error": {"Code": code}}, "GetObject"))
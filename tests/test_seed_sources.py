@@ -0,0 +1,76 @@
+import gzip
+import io
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from ecommercecrawl.seed_sources import dedupe_urls, iter_seed_urls, urls_from_csv_lines
+
+
+def test_urls_from_csv_lines_reads_first_column_and_skips_header():
+    lines = io.StringIO("url,label\nhttps://example.com/a,A\n\n https://example.com/b ,B\n")
+
+    assert list(urls_from_csv_lines(lines)) == ["https://example.com/a", "https://example.com/b"]
+
+
+def test_iter_seed_urls_reads_local_csv_with_bom(tmp_path):
+    csv_file = tmp_path / "urls.csv"
+    csv_file.write_text("url\nhttps://example.com/a\n", encoding="utf-8-sig")
+
+    assert list(iter_seed_urls(str(csv_file))) == ["https://example.com/a"]
+
+
+def test_iter_seed_urls_reads_local_gzip_csv(tmp_path):
+    csv_file = tmp_path / "urls.csv.gz"
+    with gzip.open(csv_file, "wt", encoding="utf-8") as handle:
+        handle.write("url\nhttps://example.com/a\nhttps://example.com/b\n")
+
+    assert list(iter_seed_urls(str(csv_file))) == ["https://example.com/a", "https://example.com/b"]
+
+
+def test_iter_seed_urls_is_lazy(tmp_path):
+    csv_file = tmp_path / "urls.csv"
+    csv_file.write_text("https://example.com/a\nhttps://example.com/b\n", encoding="utf-8")
+
+    urls = iter_seed_urls(str(csv_file))
+
+    assert next(urls) == "https://example.com/a"
+    csv_file.unlink()
+    # The open handle keeps streaming the rest of the file.
+    assert list(urls) == ["https://example.com/b"]
+
+
+def test_iter_seed_urls_streams_s3_csv():
+    s3_client = MagicMock()
+    s3_client.get_object.return_value = {"Body": io.BytesIO(b"url\nhttps://example.com/a\n")}
+
+    with patch("boto3.client", return_value=s3_client):
+        urls = list(iter_seed_urls("s3://seed-bucket/prod/farfetch.csv"))
+
+    assert urls == ["https://example.com/a"]
+    s3_client.get_object.assert_called_once_with(
+        Bucket="seed-bucket",
+        Key="prod/farfetch.csv",
+    )
+
+
+def test_iter_seed_urls_streams_s3_gzip_csv():
+    s3_client = MagicMock()
+    body = io.BytesIO(gzip.compress(b"url\nhttps://example.com/a\n"))
+    s3_client.get_object.return_value = {"Body": body}
+
+    with patch("boto3.client", return_value=s3_client):
+        urls = list(iter_seed_urls("s3://seed-bucket/prod/farfetch.csv.gz"))
+
+    assert urls == ["https://example.com/a"]
+
+
+def test_iter_seed_urls_rejects_invalid_s3_source():
+    with pytest.raises(ValueError, match="Invalid S3 URL source"):
+        list(iter_seed_urls("s3://seed-bucket"))
+
+
+def test_dedupe_urls_drops_repeats_in_order():
+    urls = ["https://example.com/a", "https://example.com/b", "https://example.com/a"]
+
+    assert list(dedupe_urls(urls)) == ["https://example.com/a", "https://example.com/b"]
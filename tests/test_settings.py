@@ -10,6 +10,9 @@ def restore_settings_module(monkeypatch):
     yield
     monkeypatch.delenv("ZYTE_API_KEY", raising=False)
     monkeypatch.delenv("ZYTE_API_ENABLED", raising=False)
+    monkeypatch.delenv("GLOBAL_CONCURRENT_REQUESTS", raising=False)
+    # reload() keeps attributes the module no longer defines.
+    vars(settings).pop("DOWNLOADER", None)
     importlib.reload(settings)
 
 
@@ -32,8 +35,15 @@ def test_zyte_scrapy_handlers_are_disabled_without_key_or_flag(monkeypatch):
 
     assert loaded.ZYTE_API_ENABLED is False
     assert "scrapy_zyte_api.ScrapyZyteAPIDownloaderMiddleware" not in loaded.DOWNLOADER_MIDDLEWARES
+    # Registered for every service; it disables itself unless the service is local.
+    assert loaded.DOWNLOADER_MIDDLEWARES["ecommercecrawl.middlewares.LocalCrawlerAPIMiddleware"] == 600
     assert loaded.DOWNLOAD_HANDLERS == {}
-    assert loaded.SPIDER_MIDDLEWARES == {}
+    assert loaded.SPIDER_MIDDLEWARES == {
+        "ecommercecrawl.middlewares.CanonicalPDPDedupeMiddleware": 550,
+        "ecommercecrawl.middlewares.PDPPriorityMiddleware": 560,
+        "ecommercecrawl.middlewares.CheckpointMiddleware": 500,
+        "ecommercecrawl.middlewares.ShardMiddleware": 540,
+    }
     assert loaded.REQUEST_FINGERPRINTER_CLASS == "scrapy.utils.request.RequestFingerprinter"
 
 
@@ -46,4 +56,15 @@ def test_zyte_scrapy_handlers_are_enabled_with_key(monkeypatch):
     ] == 1000
     assert loaded.DOWNLOAD_HANDLERS["https"] == "scrapy_zyte_api.ScrapyZyteAPIDownloadHandler"
     assert loaded.SPIDER_MIDDLEWARES["scrapy_zyte_api.ScrapyZyteAPISpiderMiddleware"] == 100
+    assert loaded.SPIDER_MIDDLEWARES["ecommercecrawl.middlewares.CanonicalPDPDedupeMiddleware"] == 550
     assert loaded.REQUEST_FINGERPRINTER_CLASS == "scrapy_zyte_api.ScrapyZyteAPIRequestFingerprinter"
+
+
+def test_global_concurrency_downloader_is_only_installed_with_a_limit(monkeypatch):
+    vars(settings).pop("DOWNLOADER", None)
+    loaded = _reload_settings(monkeypatch)
+    assert not hasattr(loaded, "DOWNLOADER")
+
+    monkeypatch.setenv("GLOBAL_CONCURRENT_REQUESTS", "24")
+    loaded = importlib.reload(settings)
+    assert loaded.DOWNLOADER == "ecommercecrawl.downloader.GlobalConcurrencyDownloader"
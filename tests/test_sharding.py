@@ -0,0 +1,268 @@
+import json
+from collections import defaultdict, deque
+from unittest.mock import MagicMock
+
+import pytest
+from scrapy.exceptions import DontCloseSpider
+from scrapy.http import Request, TextResponse
+from twisted.internet.task import Clock
+
+from ecommercecrawl.middlewares import ShardMiddleware
+from ecommercecrawl.sharding import ShardFrontier, ShardSpec, merge_shard_manifests
+from ecommercecrawl.spiders.level_crawl import LevelSpider
+
+
+class _FakeRedis:
+    """The few Redis commands ShardFrontier uses, in memory."""
+
+    def __init__(self):
+        self.sets = defaultdict(set)
+        self.lists = defaultdict(deque)
+        self.hashes = defaultdict(dict)
+        self.counters = defaultdict(int)
+        self.expiring = set()
+
+    def sadd(self, key, value):
+        added = value not in self.sets[key]
+        self.sets[key].add(value)
+        return int(added)
+
+    def rpush(self, key, value):
+        self.lists[key].append(value)
+
+    def lpop(self, key):
+        return self.lists[key].popleft() if self.lists[key] else None
+
+    def llen(self, key):
+        return len(self.lists[key])
+
+    def hset(self, key, field, value):
+        self.hashes[key][str(field).encode()] = str(value).encode()
+
+    def hgetall(self, key):
+        return dict(self.hashes[key])
+
+    def incr(self, key):
+        self.counters[key] += 1
+        return self.counters[key]
+
+    def expire(self, key, seconds):
+        self.expiring.add(key)
+
+
+def _frontiers(count, client=None):
+    client = client or _FakeRedis()
+    return [ShardFrontier(client, "test:level:run", ShardSpec(index, count)) for index in range(count)]
+
+
+def test_shard_spec_parses_and_validates():
+    assert ShardSpec.parse("2/4") == ShardSpec(2, 4)
+    assert ShardSpec.parse("0/1").tag == "shard-0-of-1"
+    for value in ("4/4", "-1/4", "1", "a/b", "0/0"):
+        with pytest.raises(ValueError):
+            ShardSpec.parse(value)
+
+
+def test_owners_split_keys_and_move_few_when_a_shard_is_added():
+    keys = [f"www.levelshoes.com/sku-{index}" for index in range(4000)]
+    four = [ShardSpec(0, 4).owner(key) for key in keys]
+    five = [ShardSpec(0, 5).owner(key) for key in keys]
+
+    assert all(sum(1 for owner in four if owner == index) > 800 for index in range(4))
+    moved = [old for old, new in zip(four, five) if old != new]
+    # Only keys that move to the new shard change owner.
+    assert all(new == 4 for old, new in zip(four, five) if old != new)
+    assert len(moved) < len(keys) * 0.25
+
+
+def test_frontier_hands_requests_to_their_owner_and_detects_the_end():
+    first, second = _frontiers(2)
+
+    assert first.claim("www.levelshoes.com/sku-1")
+    assert not second.claim("www.levelshoes.com/sku-1")
+    first.push(1, {"url": "https://www.levelshoes.com/a.html"})
+
+    for frontier in (first, second):
+        frontier.set_idle(True)
+    assert not first.all_idle()
+    assert second.pop(10) == [{"url": "https://www.levelshoes.com/a.html"}]
+    assert first.all_idle()
+
+
+def test_last_shard_to_finish_gets_every_manifest():
+    first, second = _frontiers(2)
+
+    assert second.finish({"shard": {"index": 1}}) is None
+    manifests = first.finish({"shard": {"index": 0}})
+
+    assert [manifest["shard"]["index"] for manifest in manifests] == [0, 1]
+    assert "test:level:run:claimed" in first.client.expiring
+
+
+def _shard_manifest(index, rows, status="pass", reason="finished"):
+    return {
+        "run_id": "2026-01-01T00-00-00-000",
+        "crawler_name": "level",
+        "exit_reason": reason,
+        "entry_points": {},
+        "start_time": f"2026-01-01T00:0{index}:00+00:00",
+        "finish_time": f"2026-01-01T01:0{index}:00+00:00",
+        "duration_seconds": 3600,
+        "shard": {"index": index, "count": 2},
+        "stats": {
+            "items_scraped": rows,
+            "requests_made": rows * 2,
+            "errors_count": 0,
+            "status_code_counts": {"200": rows * 2},
+            "shard": {"pdp_owned": rows},
+        },
+        "artifacts": {
+            "rows": rows,
+            "file_path": f"output/level.shard-{index}-of-2.jsonl.gz",
+            "file_size_bytes": 100,
+            "hashes": {"sha256": f"hash-{index}"},
+        },
+        "quality_gate": {"status": status, "reason": None, "violations_count": 0 if status == "pass" else 2},
+    }
+
+
+def test_merge_shard_manifests_covers_every_part():
+    merged = merge_shard_manifests([_shard_manifest(1, 5, status="fail_quality"), _shard_manifest(0, 3)])
+
+    assert merged["start_time"] == "2026-01-01T00:00:00+00:00"
+    assert merged["finish_time"] == "2026-01-01T01:01:00+00:00"
+    assert merged["duration_seconds"] == 3660
+    assert merged["exit_reason"] == "finished"
+    assert merged["stats"]["items_scraped"] == 8
+    assert merged["stats"]["status_code_counts"] == {"200": 16}
+    assert merged["artifacts"]["rows"] == 8
+    assert [part["file_path"] for part in merged["artifacts"]["parts"]] == [
+        "output/level.shard-0-of-2.jsonl.gz",
+        "output/level.shard-1-of-2.jsonl.gz",
+    ]
+    assert merged["quality_gate"]["status"] == "fail_quality"
+    assert merged["quality_gate"]["violations_count"] == 2
+    assert merged["shards"][1]["stats"]["shard"] == {"pdp_owned": 5}
+    json.dumps(merged)
+
+
+LEVEL_PDP = "https://www.levelshoes.com/{}.html"
+
+
+def _level_spider(shard, frontier=None):
+    spider = LevelSpider()
+    spider.shard = shard
+    spider.shard_frontier = frontier
+    return spider
+
+
+def _sku_owned_by(shard, index):
+    return next(f"SKU{n}" for n in range(1000) if shard.owner(f"www.levelshoes.com/SKU{n}") == index)
+
+
+def _url_owned_by(spider, index):
+    return next(
+        url for url in (LEVEL_PDP.format(f"p{n}") for n in range(1000))
+        if spider.shard.owner(spider.get_canonical_product_id(Request(url))) == index
+    )
+
+
+def _pdp_request(spider, sku):
+    return Request(
+        LEVEL_PDP.format(sku.lower()), callback=spider.parse_pdp, meta={"data_dict": {"portal_itemid": sku}},
+    )
+
+
+def test_shard_without_frontier_keeps_only_its_products():
+    shard = ShardSpec(0, 2)
+    spider = _level_spider(shard)
+    middleware = ShardMiddleware(MagicMock(), shard)
+    own_sku, other_sku = _sku_owned_by(shard, 0), _sku_owned_by(shard, 1)
+    listing = Request("https://www.levelshoes.com/women/bags")
+    own_row, other_row = ({"url": _url_owned_by(spider, index)} for index in (0, 1))
+
+    start = [_pdp_request(spider, own_sku), _pdp_request(spider, other_sku), listing, own_row, other_row]
+    kept = list(middleware.process_start_requests(start, spider))
+
+    assert kept == [start[0], listing, own_row]
+    middleware.stats.inc_value.assert_any_call("shard/pdp_foreign")
+    # Every row parsed from an owned PDP is kept.
+    pdp_response = TextResponse(start[0].url, request=start[0])
+    assert list(middleware.process_spider_output(pdp_response, [other_row], spider)) == [other_row]
+
+
+def test_seeds_are_split_by_product_and_by_url_with_a_frontier():
+    shard = ShardSpec(0, 2)
+    spider = _level_spider(shard)
+    pdp_seeds = [LEVEL_PDP.format(f"p{n}") for n in range(20)]
+    listing_seeds = [f"https://www.levelshoes.com/women/brands/b{n}/bags" for n in range(20)]
+
+    assert 0 < sum(map(spider.owns_seed, pdp_seeds)) < 20
+    assert all(map(spider.owns_seed, listing_seeds))
+
+    spider.shard_frontier = ShardFrontier(_FakeRedis(), "test", shard)
+    assert 0 < sum(map(spider.owns_seed, listing_seeds)) < 20
+
+
+def test_frontier_hands_foreign_pdps_to_their_owner():
+    client = _FakeRedis()
+    shards = [ShardSpec(0, 2), ShardSpec(1, 2)]
+    frontiers = [ShardFrontier(client, "test", shard) for shard in shards]
+    spiders = [_level_spider(shard, frontier) for shard, frontier in zip(shards, frontiers)]
+    first, second = (ShardMiddleware(MagicMock(), shard, frontier) for shard, frontier in zip(shards, frontiers))
+    for middleware in (first, second):
+        middleware._clock = Clock()
+    other_sku = _sku_owned_by(shards[0], 1)
+
+    # Listed on shard 0, fetched by shard 1; shard 1 listing it too does not fetch it twice.
+    assert list(first.process_start_requests([_pdp_request(spiders[0], other_sku)], spiders[0])) == []
+    assert list(second.process_start_requests([_pdp_request(spiders[1], other_sku)], spiders[1])) == []
+    second.stats.inc_value.assert_any_call("shard/pdp_claimed_elsewhere")
+
+    with pytest.raises(DontCloseSpider):
+        second.spider_idle(spiders[1])
+    scheduled = second.crawler.engine.crawl.call_args.args[0]
+    assert scheduled.url == LEVEL_PDP.format(other_sku.lower())
+    assert scheduled.callback == spiders[1].parse_pdp
+
+    # Shard 0 has not reported idle yet, so shard 1 waits for it.
+    with pytest.raises(DontCloseSpider):
+        second.spider_idle(spiders[1])
+    first.spider_idle(spiders[0])
+    second.spider_idle(spiders[1])
+
+
+def test_shard_stops_waiting_after_the_idle_timeout():
+    shard = ShardSpec(0, 2)
+    frontier = ShardFrontier(_FakeRedis(), "test", shard)
+    middleware = ShardMiddleware(MagicMock(), shard, frontier, idle_timeout=60)
+    middleware._clock = Clock()
+    spider = _level_spider(shard, frontier)
+
+    with pytest.raises(DontCloseSpider):
+        middleware.spider_idle(spider)
+    middleware._clock.advance(60)
+    middleware.spider_idle(spider)
+
+    middleware.stats.set_value.assert_called_once_with("shard/idle_timeout", 1)
+
+
+def test_rows_with_a_sku_belong_to_the_owner_of_their_pdp_request():
+    shard = ShardSpec(0, 2)
+    spider = _level_spider(shard)
+    middleware = ShardMiddleware(MagicMock(), shard)
+    own_sku, other_sku = _sku_owned_by(shard, 0), _sku_owned_by(shard, 1)
+    rows = [{"url": LEVEL_PDP.format(sku.lower()), "portal_itemid": sku} for sku in (own_sku, other_sku)]
+
+    assert list(middleware.process_start_requests(rows, spider)) == rows[:1]
+
+
+def test_shards_keep_their_own_state_files(tmp_path):
+    from scrapy.settings import Settings
+
+    spider = _level_spider(ShardSpec(1, 4))
+    spider.settings = Settings({"KNOWN_PRODUCTS_DIR": str(tmp_path), "PRODUCT_STATE_DIR": str(tmp_path)})
+
+    assert spider._get_known_products().path == str(tmp_path / "level-shoes.shard-1-of-4.txt")
+    assert spider._get_product_state().path == str(tmp_path / "level-shoes.shard-1-of-4.sqlite")
+    spider._get_product_state().close()